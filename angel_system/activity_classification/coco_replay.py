@@ -0,0 +1,173 @@
+"""
+Replay of the object detections of a kwcoco video, frame by frame, for
+running activity classification offline.
+
+The file is read once into plain JSON structures, without building a kwcoco
+index. Annotations are gathered into columns grouped by image up front, and
+each frame's detections are sliced out of those columns only as the frame is
+reached.
+"""
+from collections import deque
+import json
+from pathlib import Path
+from typing import Deque
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+from typing import TypeVar
+from typing import Union
+
+from kwcoco.coco_dataset import CocoIndex
+import numpy as np
+import numpy.typing as npt
+
+from angel_system.data.common.annotation_table import AnnotationTable
+
+
+T = TypeVar("T")
+
+
+class ReplayFrame(NamedTuple):
+    """
+    Object detections of one video frame.
+    """
+
+    image_id: int
+    frame_index: int
+    # Image width and height, if given.
+    width: Optional[int]
+    height: Optional[int]
+    # Boxes in ltrb format, of shape [n, 4], in single precision as they would
+    # be in ROS messages.
+    ltrb: npt.NDArray[np.float32]
+    # Category ID of each detection, of shape [n].
+    category_ids: npt.NDArray[np.int64]
+    # Confidence of each detection, of shape [n].
+    confidences: npt.NDArray[np.float64]
+
+    def confidence_matrix(self, n_labels: int) -> npt.NDArray[np.float64]:
+        """
+        Get the confidences as a [n, n_labels] matrix, with each detection's
+        confidence in the column of its category ID and zeros elsewhere.
+        """
+        conf_mat = np.zeros((len(self.confidences), n_labels), dtype=np.float64)
+        conf_mat[np.arange(len(self.confidences)), self.category_ids] = self.confidences
+        return conf_mat
+
+
+class CocoReplaySource:
+    """
+    Frames of object detections of a single-video kwcoco file, in frame
+    order.
+
+    >>> import io
+    >>> src = CocoReplaySource(io.StringIO(json.dumps({
+    ...     "categories": [{"id": 0, "name": "cup"}, {"id": 1, "name": "bowl"}],
+    ...     "videos": [{"id": 1, "name": "video"}],
+    ...     "images": [
+    ...         {"id": 1, "video_id": 1, "frame_index": 1},
+    ...         {"id": 2, "video_id": 1, "frame_index": 0},
+    ...     ],
+    ...     "annotations": [
+    ...         {"id": 1, "image_id": 1, "category_id": 1,
+    ...          "bbox": [1, 2, 3, 4], "confidence": 0.5},
+    ...     ],
+    ... })))
+    >>> src.labels
+    ['cup', 'bowl']
+    >>> frames = list(src)
+    >>> [(f.frame_index, len(f.confidences)) for f in frames]
+    [(0, 0), (1, 1)]
+    >>> frames[1].ltrb.tolist()
+    [[1.0, 2.0, 4.0, 6.0]]
+    """
+
+    def __init__(self, coco: Union[str, Path, Iterable[str]]):
+        """
+        :param coco: Path to the kwcoco file, or an open text file of it.
+
+        :raises ValueError: The file does not have exactly one video.
+        """
+        if isinstance(coco, (str, Path)):
+            with open(coco) as f:
+                dataset = json.load(f)
+        else:
+            dataset = json.load(coco)
+
+        self.videos: List[dict] = dataset.get("videos", [])
+        if len(self.videos) != 1:
+            raise ValueError(
+                f"Input object detections COCO file did not have, or had more "
+                f"than, one video's worth of detections. Had: {len(self.videos)}"
+            )
+        # Category names in ascending ID order, as `CocoDataset.categories`
+        # gives them.
+        self.labels: List[str] = [
+            c["name"] for c in sorted(dataset["categories"], key=lambda c: c["id"])
+        ]
+        # Python's sort is stable, so images of equal frame indices keep
+        # their file order.
+        self.images: List[dict] = sorted(
+            dataset["images"], key=lambda img: img["frame_index"]
+        )
+
+        # Grouped by image, in file order within an image.
+        table = AnnotationTable.from_annotations(dataset["annotations"])
+        table = table.take(np.argsort(table.image_id, kind="stable"))
+        self._image_ids = table.image_id
+        self._aids = table.aid
+        self._category_ids = table.category_id
+        self._confidences = table.confidence
+        xywh = table.bbox
+        self._ltrb = np.concatenate([xywh[:, :2], xywh[:, :2] + xywh[:, 2:]], axis=1)
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    def __iter__(self) -> Iterator[ReplayFrame]:
+        for img in self.images:
+            gid = img["id"]
+            start, stop = np.searchsorted(self._image_ids, [gid, gid + 1])
+            idxs = start + self._index_order(self._aids[start:stop].tolist())
+            yield ReplayFrame(
+                image_id=gid,
+                frame_index=img["frame_index"],
+                width=img.get("width"),
+                height=img.get("height"),
+                ltrb=self._ltrb[idxs].astype(np.float32),
+                category_ids=self._category_ids[idxs],
+                confidences=self._confidences[idxs],
+            )
+
+    @staticmethod
+    def _index_order(aids: List[int]) -> npt.NDArray[np.intp]:
+        """
+        Get the order in which a kwcoco index gives the annotations of an
+        image, from their IDs in file order.
+
+        The index collects these in a set by adding them in file order, so
+        making one the same way gives the same iteration order.
+        """
+        position = {aid: i for i, aid in enumerate(aids)}
+        return np.fromiter(
+            (position[aid] for aid in CocoIndex._set(aids)), np.intp, len(position)
+        )
+
+
+def sliding_windows(items: Iterable[T], size: int) -> Iterator[Tuple[T, Tuple[T, ...]]]:
+    """
+    Pair each item with the window of up to ``size`` items ending with it.
+
+    >>> [w for _, w in sliding_windows(range(4), 3)]
+    [(0,), (0, 1), (0, 1, 2), (1, 2, 3)]
+
+    :param items: Items in order.
+    :param size: Maximum number of items in a window.
+    """
+    window: Deque[T] = deque(maxlen=size)
+    for item in items:
+        window.append(item)
+        yield item, tuple(window)
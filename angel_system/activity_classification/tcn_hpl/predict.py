@@ -1,13 +1,30 @@
+from collections import OrderedDict
 from dataclasses import dataclass
+import json
+import logging
+import os
 from pathlib import Path
+import queue
 from threading import RLock
+from threading import Thread
+import time
+from typing import Any
+from typing import IO
+from typing import Iterable
+from typing import Iterator
 from typing import List
 from typing import Dict
 from typing import Mapping
 from typing import Optional
 from typing import Sequence
+from typing import Tuple
 
 import kwcoco
+import numpy as np
+import numpy.typing as npt
+
+
+LOG = logging.getLogger(__name__)
 
 
 @dataclass
@@ -128,3 +145,416 @@ class ResultsCollector:
         with self._lock:
             dset = self._dset
             dset.dump(dset.fpath, newlines=True)
+
+
+# Name of the file, in a chunk directory, of the parts of the output COCO
+# file known up front.
+CHUNK_HEADER_NAME = "header.json"
+
+
+def _chunk_paths(chunk_dir: Path, chunk_index: int) -> Tuple[Path, Path]:
+    """
+    Paths of the records and probability vectors files of a results chunk.
+    """
+    stem = f"chunk_{chunk_index:06d}"
+    return chunk_dir / f"{stem}.jsonl", chunk_dir / f"{stem}.npy"
+
+
+def _write_atomic(path: Path, write_fn) -> None:
+    """
+    Write a file via a temporary path, so it only exists once complete.
+    """
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        write_fn(f)
+    os.replace(tmp_path, path)
+
+
+def write_results_chunk(
+    chunk_dir: Path,
+    chunk_index: int,
+    records: Sequence[Tuple[str, dict]],
+    probs: Sequence[npt.ArrayLike],
+) -> None:
+    """
+    Write a chunk of collected results.
+
+    :param chunk_dir: Directory of the session's chunks.
+    :param chunk_index: Index of the chunk in the session.
+    :param records: Pairs of the COCO section, e.g. "images", and the item to
+        add to it, in collection order. Annotations refer to their
+        probability vector by its index in ``probs``, as "prob_index".
+    :param probs: Activity class probability vector of each annotation.
+    """
+    records_path, probs_path = _chunk_paths(chunk_dir, chunk_index)
+    probs_arr = np.asarray(probs, dtype=np.float64)
+    # The records file is written last, marking the chunk complete.
+    _write_atomic(probs_path, lambda f: np.save(f, probs_arr))
+    _write_atomic(
+        records_path,
+        lambda f: f.writelines(
+            json.dumps([section, item]).encode() + b"\n" for section, item in records
+        ),
+    )
+
+
+def _remove_results_chunks(chunk_dir: Path) -> None:
+    """
+    Remove the chunks and header of a session, and the chunk directory if
+    nothing else is left in it.
+    """
+    for path in chunk_dir.glob("chunk_*"):
+        path.unlink()
+    # Temporary files of writes that were interrupted.
+    for path in chunk_dir.glob(".*.tmp"):
+        path.unlink()
+    (chunk_dir / CHUNK_HEADER_NAME).unlink(missing_ok=True)
+    try:
+        chunk_dir.rmdir()
+    except OSError:
+        pass
+
+
+def _chunks_assembled(chunk_dir: Path, output_filepath: Path) -> bool:
+    """
+    If the output file was written after all the chunks in a directory, i.e.
+    they were assembled but not yet removed.
+    """
+    if not output_filepath.is_file():
+        return False
+    output_mtime = output_filepath.stat().st_mtime
+    return all(
+        p.stat().st_mtime <= output_mtime for p in chunk_dir.glob("chunk_*.jsonl")
+    )
+
+
+def _iter_chunk_sections(
+    chunk_dir: Path, section: str
+) -> Iterator[Tuple[dict, Optional[npt.NDArray[np.float64]]]]:
+    """
+    Iterate the items of one COCO section over all complete chunks, in order,
+    with the probability vectors of their chunk if the section is
+    "annotations".
+    """
+    chunk_index = 0
+    while True:
+        records_path, probs_path = _chunk_paths(chunk_dir, chunk_index)
+        if not records_path.is_file():
+            return
+        probs = np.load(probs_path) if section == "annotations" else None
+        with open(records_path) as f:
+            for line in f:
+                rec_section, item = json.loads(line)
+                if rec_section == section:
+                    yield item, probs
+        chunk_index += 1
+
+
+def _write_json_section(
+    f: IO[str], key: str, items: Iterable[Any], last: bool = False
+) -> None:
+    """
+    Write a list-valued key of a JSON object, one item per line, as kwcoco
+    does with ``newlines=True``.
+    """
+    f.write(f"{json.dumps(key)}: [")
+    sep = "\n"
+    for item in items:
+        f.write(sep)
+        f.write(json.dumps(item))
+        sep = ",\n"
+    f.write("\n]" if sep != "\n" else "]")
+    f.write("\n" if last else ",\n")
+
+
+def assemble_results_chunks(chunk_dir: Path, output_filepath: Path) -> None:
+    """
+    Assemble the chunks written by a :class:`StreamingResultsCollector` into
+    a COCO file, streaming one chunk at a time so memory use does not grow
+    with the number of results.
+
+    This may also be used to recover the results flushed by a session that
+    ended without writing its output, e.g. one that crashed.
+
+    :param chunk_dir: Directory of the session's chunks.
+    :param output_filepath: Path of the COCO file to write.
+    """
+    with open(chunk_dir / CHUNK_HEADER_NAME) as f:
+        header = json.load(f)
+
+    def annotations() -> Iterator[dict]:
+        for ann, probs in _iter_chunk_sections(chunk_dir, "annotations"):
+            ann["prob"] = probs[ann.pop("prob_index")].tolist()
+            yield ann
+
+    with open(output_filepath, "w") as f:
+        f.write("{\n")
+        _write_json_section(f, "info", header["info"])
+        _write_json_section(f, "licenses", [])
+        _write_json_section(f, "categories", header["categories"])
+        _write_json_section(
+            f, "videos", (v for v, _ in _iter_chunk_sections(chunk_dir, "videos"))
+        )
+        _write_json_section(
+            f, "images", (i for i, _ in _iter_chunk_sections(chunk_dir, "images"))
+        )
+        _write_json_section(f, "annotations", annotations(), last=True)
+        f.write("}\n")
+
+
+class StreamingResultsCollector:
+    """
+    Collects TCN-HPL prediction results like :class:`ResultsCollector`, but
+    with memory use that stays flat over long sessions.
+
+    Results are buffered in memory until ``flush_every`` annotations have
+    been collected, at which point the buffer is handed to a background
+    thread that writes it to a chunk file in ``chunk_dir``. Collecting
+    therefore never waits on the filesystem: if ``max_pending_chunks`` chunks
+    are already waiting to be written, the flush is deferred and the results
+    stay buffered until a later one. ``write_file`` assembles the chunks into
+    the same COCO file ``ResultsCollector`` would write.
+
+    Unlike ``ResultsCollector``, duplicate images are only detected among
+    the most recent ``recent_images`` added, since remembering every image
+    name would grow without bound. Also unlike it, ``write_file`` may only be
+    called once, as it removes the chunks once they are assembled.
+    """
+
+    def __init__(
+        self,
+        output_filepath: Path,
+        id_to_action: Mapping[int, str],
+        chunk_dir: Optional[Path] = None,
+        flush_every: int = 1000,
+        recent_images: int = 4096,
+        max_pending_chunks: int = 8,
+    ):
+        """
+        :param output_filepath: Path of the COCO file to write.
+        :param id_to_action: Activity class names by ID.
+        :param chunk_dir: Directory to write chunks to, by default next to
+            the output file, with a ".chunks" suffix.
+        :param flush_every: Number of annotations to collect before
+            flushing them, with their images and videos, to a chunk.
+        :param recent_images: Number of recent image names to check new
+            images against for duplicates.
+        :param max_pending_chunks: Number of flushed chunks that may wait to
+            be written. Further flushes are deferred until writing catches
+            up, keeping results buffered in place of queueing more chunks.
+
+        :raises FileExistsError: The chunk directory already holds chunks
+            that were not assembled into the output file, e.g. of a session
+            that crashed.
+        """
+        if flush_every < 1:
+            raise ValueError(f"Must flush every 1 or more results, got {flush_every}.")
+        self._lock = RLock()  # for thread safety
+        self.fpath = output_filepath
+        self.chunk_dir = chunk_dir or output_filepath.with_name(
+            f"{output_filepath.name}.chunks"
+        )
+        if _chunk_paths(self.chunk_dir, 0)[0].exists():
+            if not _chunks_assembled(self.chunk_dir, output_filepath):
+                raise FileExistsError(
+                    f"Chunk directory {self.chunk_dir} already holds results "
+                    f"chunks. Assemble them with `assemble_results_chunks` or "
+                    f"remove them."
+                )
+            # Left over by a session that stopped between assembling and
+            # removing its chunks.
+            _remove_results_chunks(self.chunk_dir)
+        self.chunk_dir.mkdir(parents=True, exist_ok=True)
+        header = {
+            "info": [{"activity_labels": dict(id_to_action)}],
+            "categories": [
+                {"id": act_id, "name": act_name}
+                for act_id, act_name in id_to_action.items()
+            ],
+        }
+        _write_atomic(
+            self.chunk_dir / CHUNK_HEADER_NAME,
+            lambda f: f.write(json.dumps(header).encode()),
+        )
+        self._flush_every = flush_every
+        self._recent_images = recent_images
+
+        self._vid: Optional[int] = None
+        # Videos are few, so all of their IDs are kept.
+        self._video_ids: Dict[str, int] = {}
+        self._next_gid = 1
+        self._next_aid = 1
+        # Recently added image names, as an ordered set.
+        self._recent_names: "OrderedDict[str, None]" = OrderedDict()
+
+        # Results collected since the last flush.
+        self._records: List[Tuple[str, dict]] = []
+        self._probs: List[npt.NDArray[np.float64]] = []
+        self._chunk_index = 0
+        self._written = False
+        # Flushes deferred as the write queue was full, and when that was
+        # last warned about.
+        self._n_deferred_flushes = 0
+        self._deferred_warn_time: Optional[float] = None
+
+        self._write_queue: "queue.Queue[Tuple[int, list, list]]" = queue.Queue(
+            maxsize=max(max_pending_chunks, 1)
+        )
+        self._write_error: Optional[BaseException] = None
+        self._writer = Thread(
+            target=self._write_loop, name="results_chunk_writer", daemon=True
+        )
+        self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            chunk_index, records, probs = self._write_queue.get()
+            try:
+                if self._write_error is None:
+                    write_results_chunk(self.chunk_dir, chunk_index, records, probs)
+            except BaseException as ex:
+                # Raised on the next `write_file`. Later chunks are dropped
+                # so the written chunks stay contiguous.
+                self._write_error = ex
+            finally:
+                self._write_queue.task_done()
+
+    def set_video(self, video_name: str) -> None:
+        """
+        Set the video for which we are currently collecting results for.
+
+        :param video_name: Semantic name of the video.
+        """
+        with self._lock:
+            vid = self._video_ids.get(video_name)
+            if vid is None:
+                vid = self._video_ids[video_name] = len(self._video_ids) + 1
+                self._records.append(("videos", {"id": vid, "name": video_name}))
+            self._vid = vid
+
+    def add_image(
+        self,
+        frame_index: int,
+        name: Optional[str] = None,
+        file_name: Optional[str] = None,
+    ) -> int:
+        """
+        Add an image to the dataset. Returns the global image id.
+        If the image was recently added (by name or file name), returns -1.
+        """
+        with self._lock:
+            if self._vid is None:
+                raise RuntimeError(
+                    "No video set before results collection. See `set_video` method."
+                )
+            keys = [k for k in (name, file_name) if k is not None]
+            if any(k in self._recent_names for k in keys):
+                return -1  # image already exists
+            for k in keys:
+                self._recent_names[k] = None
+            while len(self._recent_names) > self._recent_images:
+                self._recent_names.popitem(last=False)
+
+            gid = self._next_gid
+            self._next_gid += 1
+            # As `CocoDataset.add_image` writes it, with a null file name if
+            # not given.
+            img = dict(
+                id=gid, file_name=file_name, video_id=self._vid, frame_index=frame_index
+            )
+            if name is not None:
+                img["name"] = name
+            self._records.append(("images", img))
+            return gid
+
+    def collect(
+        self,
+        gid: int,
+        activity_pred: int,
+        activity_conf_vec: Sequence[float],
+    ) -> None:
+        """
+        Collect the prediction for an image, flushing collected results in
+        the background every ``flush_every`` predictions.
+
+        :param gid: Global image id.
+        :param activity_pred: Predicted activity class index.
+        :param activity_conf_vec: Confidence vector for all activity classes.
+        """
+        with self._lock:
+            if self._vid is None:
+                raise RuntimeError(
+                    "No video set before results collection. See `set_video` method."
+                )
+            aid = self._next_aid
+            self._next_aid += 1
+            self._records.append(
+                (
+                    "annotations",
+                    dict(
+                        id=aid,
+                        image_id=gid,
+                        category_id=activity_pred,
+                        score=float(activity_conf_vec[activity_pred]),
+                        prob_index=len(self._probs),
+                    ),
+                )
+            )
+            self._probs.append(np.asarray(activity_conf_vec, dtype=np.float64))
+            if len(self._probs) >= self._flush_every:
+                self._flush()
+
+    def _flush(self, block: bool = False) -> None:
+        """
+        Hand the results collected since the last flush to the writer thread.
+
+        :param block: Wait for the writer thread if ``max_pending_chunks``
+            chunks are already pending. Otherwise, the flush is deferred and
+            the results are kept buffered, to be flushed by a later call.
+        """
+        with self._lock:
+            if self._written:
+                raise RuntimeError("Results were already written.")
+            if not self._records:
+                return
+            chunk = (self._chunk_index, self._records, self._probs)
+            if block:
+                self._write_queue.put(chunk)
+            else:
+                try:
+                    self._write_queue.put_nowait(chunk)
+                except queue.Full:
+                    self._n_deferred_flushes += 1
+                    now = time.monotonic()
+                    if (
+                        self._deferred_warn_time is None
+                        or now - self._deferred_warn_time >= 1.0
+                    ):
+                        self._deferred_warn_time = now
+                        LOG.warning(
+                            f"Results chunk writing is falling behind, "
+                            f"{len(self._probs)} results are buffered "
+                            f"({self._n_deferred_flushes} flushes deferred)."
+                        )
+                    return
+            self._chunk_index += 1
+            self._records = []
+            self._probs = []
+
+    def write_file(self):
+        """
+        Flush the remaining results, wait for all chunks to be written, and
+        assemble them into the COCO file at the set output path. The chunks
+        are then removed, so no more results may be collected.
+
+        :raises BaseException: Writing a chunk failed. The chunks written are
+            kept, to be recovered with `assemble_results_chunks`.
+        """
+        with self._lock:
+            self._flush(block=True)
+            self._write_queue.join()
+            if self._write_error is not None:
+                raise self._write_error
+            assemble_results_chunks(self.chunk_dir, self.fpath)
+            self._written = True
+            _remove_results_chunks(self.chunk_dir)
@@ -0,0 +1,216 @@
+"""
+Scheduling of which temporal windows an activity classifier processes when
+windows become ready faster than they can be processed.
+
+A window is ready when its leading frame, and the data it needs, has been
+received. The classifier considers the latest ready window whenever it is
+free, so windows led by frames received in the meantime are never considered
+at all. The scheduler decides whether the window considered is processed,
+and accounts for the windows that were not.
+
+Policies:
+
+* ``latest``: Always process the latest window.
+* ``every_nth``: Process a window only if its leading frame is at least
+  ``every_n`` frames after that of the last processed window, bounding the
+  processing rate to a fraction of the frame rate.
+* ``deadline``: Drop the latest window, rather than process it, if it has
+  been ready for longer than ``deadline_ns``, so processing time is not spent
+  on results that would already be too stale.
+"""
+from collections import OrderedDict
+from threading import Lock
+import time
+from typing import NamedTuple
+from typing import Optional
+
+
+# Policy names.
+POLICY_LATEST = "latest"
+POLICY_EVERY_NTH = "every_nth"
+POLICY_DEADLINE = "deadline"
+POLICIES = (POLICY_LATEST, POLICY_EVERY_NTH, POLICY_DEADLINE)
+
+# Actions decided for a window.
+ACTION_PROCESS = "process"
+ACTION_SKIP = "skip"
+ACTION_DROP = "drop"
+
+
+class WindowDecision(NamedTuple):
+    """
+    What to do with a window, with the accounting of why.
+    """
+
+    # One of the ACTION_* values.
+    action: str
+    # Frame number of the window's leading frame.
+    frame_number: int
+    # Nanoseconds between the window becoming ready and being considered, if
+    # it is known when the window became ready.
+    queue_delay_ns: Optional[int]
+    # Number of frames between the leading frames of the last processed
+    # window and this one, i.e. that did not lead a processed window.
+    skipped: int
+
+
+class WindowMetrics(NamedTuple):
+    """
+    Accounting of a window that was processed or dropped, as reported per
+    window.
+    """
+
+    # One of the ACTION_* values.
+    action: str
+    frame_number: int
+    # Milliseconds between the window becoming ready and being considered.
+    queue_delay_ms: Optional[float]
+    # Milliseconds spent processing the window, if it was.
+    processing_ms: Optional[float]
+    # Frames that did not lead a processed window since the last one that
+    # did, as in `WindowDecision.skipped`.
+    skipped: int
+    # Totals over the scheduler's lifetime. Skipped frames include those
+    # leading dropped windows.
+    total_processed: int
+    total_skipped: int
+    total_dropped: int
+
+
+class WindowScheduler:
+    """
+    Decides which windows to process under a policy, and keeps count of the
+    windows that were not.
+
+    Ready times may be marked from other threads than the one deciding.
+
+    >>> sched = WindowScheduler(POLICY_EVERY_NTH, every_n=3)
+    >>> actions = []
+    >>> for n in range(7):
+    ...     decision = sched.decide(n, frame_time_ns=n)
+    ...     actions.append(sched.record(decision).action)
+    >>> actions
+    ['process', 'skip', 'skip', 'process', 'skip', 'skip', 'process']
+    >>> sched.total_processed, sched.total_skipped
+    (3, 4)
+    """
+
+    def __init__(
+        self,
+        policy: str = POLICY_LATEST,
+        every_n: int = 1,
+        deadline_ns: int = 0,
+        max_tracked_frames: int = 1024,
+    ):
+        """
+        :param policy: One of the policy names in `POLICIES`.
+        :param every_n: Minimum frame number difference between the leading
+            frames of processed windows, for the "every_nth" policy.
+        :param deadline_ns: Maximum nanoseconds a window may have been ready
+            for to be processed, for the "deadline" policy.
+        :param max_tracked_frames: Number of most recent frames to remember
+            the ready time of.
+        """
+        if policy not in POLICIES:
+            raise ValueError(
+                f"Unknown window policy '{policy}'. Must be one of: {POLICIES}"
+            )
+        if every_n < 1:
+            raise ValueError(f"Must process every 1 or more frames, got {every_n}.")
+        if policy == POLICY_DEADLINE and deadline_ns <= 0:
+            raise ValueError(f"Deadline must be positive, got {deadline_ns} ns.")
+        self.policy = policy
+        self.every_n = every_n
+        self.deadline_ns = deadline_ns
+        self._max_tracked_frames = max_tracked_frames
+
+        self._ready_lock = Lock()
+        # Monotonic nanoseconds each recent frame became ready at, keyed by
+        # the frame's time.
+        self._ready_ns: "OrderedDict[int, int]" = OrderedDict()
+        # Frame number of the leading frame of the last processed window.
+        self._last_processed: Optional[int] = None
+
+        self.total_processed = 0
+        self.total_skipped = 0
+        self.total_dropped = 0
+
+    def mark_ready(self, frame_time_ns: int, ready_ns: Optional[int] = None) -> None:
+        """
+        Mark when a frame's data was received, making a window led by it
+        ready. If marked more than once, e.g. for the image and then for the
+        object detections of the frame, the latest time is kept.
+
+        :param frame_time_ns: Time of the frame, as keyed in the input buffer.
+        :param ready_ns: Monotonic nanoseconds the data was received at.
+            Defaults to now.
+        """
+        if ready_ns is None:
+            ready_ns = time.monotonic_ns()
+        with self._ready_lock:
+            ready = self._ready_ns
+            ready[frame_time_ns] = max(ready.get(frame_time_ns, ready_ns), ready_ns)
+            while len(ready) > self._max_tracked_frames:
+                ready.popitem(last=False)
+
+    def decide(
+        self, frame_number: int, frame_time_ns: int, now_ns: Optional[int] = None
+    ) -> WindowDecision:
+        """
+        Decide what to do with the latest ready window.
+
+        :param frame_number: Frame number of the window's leading frame.
+        :param frame_time_ns: Time of the window's leading frame.
+        :param now_ns: Monotonic nanoseconds now, as for `mark_ready`.
+            Defaults to now.
+        """
+        if now_ns is None:
+            now_ns = time.monotonic_ns()
+        with self._ready_lock:
+            ready_ns = self._ready_ns.get(frame_time_ns)
+        queue_delay_ns = None if ready_ns is None else max(now_ns - ready_ns, 0)
+
+        last = self._last_processed
+        skipped = 0 if last is None else max(frame_number - last - 1, 0)
+        action = ACTION_PROCESS
+        if self.policy == POLICY_EVERY_NTH:
+            if last is not None and frame_number - last < self.every_n:
+                action = ACTION_SKIP
+        elif self.policy == POLICY_DEADLINE:
+            if queue_delay_ns is not None and queue_delay_ns > self.deadline_ns:
+                action = ACTION_DROP
+        return WindowDecision(action, frame_number, queue_delay_ns, skipped)
+
+    def record(
+        self, decision: WindowDecision, processing_ns: Optional[int] = None
+    ) -> WindowMetrics:
+        """
+        Record the outcome of a decision, updating the totals.
+
+        Skipped windows need not be recorded, as they are accounted for when
+        the next window is processed.
+
+        :param decision: Decision acted upon.
+        :param processing_ns: Nanoseconds spent processing the window, if it
+            was.
+        """
+        if decision.action == ACTION_PROCESS:
+            self.total_processed += 1
+            self.total_skipped += decision.skipped
+            self._last_processed = decision.frame_number
+        elif decision.action == ACTION_DROP:
+            self.total_dropped += 1
+        return WindowMetrics(
+            action=decision.action,
+            frame_number=decision.frame_number,
+            queue_delay_ms=(
+                None
+                if decision.queue_delay_ns is None
+                else decision.queue_delay_ns / 1e6
+            ),
+            processing_ms=None if processing_ns is None else processing_ns / 1e6,
+            skipped=decision.skipped,
+            total_processed=self.total_processed,
+            total_skipped=self.total_skipped,
+            total_dropped=self.total_dropped,
+        )
@@ -0,0 +1,250 @@
+"""
+Columnar view of the annotations of a kwcoco dataset, for filtering and
+remapping many annotations with vectorized array operations instead of
+walking annotation dictionaries.
+
+Typical use is to build the table once, derive a boolean mask or ID remapping
+from its columns, and write the resulting annotations back to a dataset
+once, at the end:
+
+>>> import kwcoco
+>>> dset = kwcoco.CocoDataset()
+>>> gid = dset.add_image(file_name="frame.png")
+>>> cid = dset.add_category(name="cup")
+>>> for conf in (0.9, 0.2, 0.6):
+...     _ = dset.add_annotation(image_id=gid, category_id=cid, score=conf)
+>>> table = AnnotationTable.from_kwcoco(dset)
+>>> replace_annotations(dset, table.take(table.confidence >= 0.5))
+>>> sorted(dset.index.anns)
+[1, 3]
+"""
+from itertools import chain
+from operator import itemgetter
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+import kwcoco
+import numpy as np
+import numpy.typing as npt
+
+
+def lookup_array(
+    mapping: Dict[int, int], keys: npt.ArrayLike, missing: int = -1
+) -> npt.NDArray[np.int64]:
+    """
+    Map integer keys through a dictionary, vectorized.
+
+    >>> lookup_array({1: 10, 3: 30}, [3, 1, 2, 3]).tolist()
+    [30, 10, -1, 30]
+
+    :param mapping: Mapping of non-negative integer keys to values.
+    :param keys: Keys to map.
+    :param missing: Value of keys not in the mapping.
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    size = max(max(mapping, default=-1), int(keys.max(initial=-1))) + 1
+    table = np.full(size, missing, dtype=np.int64)
+    if mapping:
+        table[np.fromiter(mapping.keys(), np.int64, len(mapping))] = np.fromiter(
+            mapping.values(), np.int64, len(mapping)
+        )
+    return table[keys]
+
+
+class AnnotationTable:
+    """
+    Annotations of a kwcoco dataset as columns of parallel arrays.
+
+    Each row refers back to the annotation dictionary it was read from by its
+    index into ``dset.dataset["annotations"]``, so fields without a column
+    are carried over untouched when writing back with :meth:`to_annotations`.
+    Only the ID columns are written back; the other columns are read-only.
+    """
+
+    def __init__(
+        self,
+        row: npt.NDArray[np.int64],
+        aid: npt.NDArray[np.int64],
+        image_id: npt.NDArray[np.int64],
+        category_id: npt.NDArray[np.int64],
+        confidence: npt.NDArray[np.float64],
+        bbox: npt.NDArray[np.float64],
+        keypoints: npt.NDArray[np.float64],
+        keypoint_offsets: npt.NDArray[np.int64],
+    ):
+        """
+        :param row: Index of each annotation in the source annotation list.
+        :param aid: Annotation IDs.
+        :param image_id: Image IDs.
+        :param category_id: Category IDs.
+        :param confidence: Confidences, NaN where not given.
+        :param bbox: Boxes in xywh format, of shape [n, 4], NaN where not
+            given.
+        :param keypoints: Flat keypoint values of all annotations.
+        :param keypoint_offsets: Start of the keypoints of each annotation in
+            ``keypoints``, with the end of the last one appended, i.e. of
+            shape [n + 1].
+        """
+        self.row = row
+        self.aid = aid
+        self.image_id = image_id
+        self.category_id = category_id
+        self.confidence = confidence
+        self.bbox = bbox
+        self.keypoints = keypoints
+        self.keypoint_offsets = keypoint_offsets
+
+    @classmethod
+    def from_annotations(cls, anns: Sequence[dict]) -> "AnnotationTable":
+        """
+        Make a table from kwcoco annotation dictionaries.
+
+        Confidences are read from the "confidence" field, falling back to
+        "score", as written by our detection scripts.
+        """
+        n = len(anns)
+        nan = float("nan")
+        no_bbox = [nan] * 4
+
+        def column(fn, dtype) -> np.ndarray:
+            return np.fromiter(map(fn, anns), dtype, n)
+
+        bbox = np.fromiter(
+            chain.from_iterable([a.get("bbox") or no_bbox for a in anns]),
+            np.float64,
+            4 * n,
+        ).reshape(n, 4)
+        kp_lists = [a.get("keypoints") or () for a in anns]
+        keypoint_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(
+            np.fromiter(map(len, kp_lists), np.int64, n), out=keypoint_offsets[1:]
+        )
+        keypoints = np.fromiter(
+            chain.from_iterable(kp_lists), np.float64, int(keypoint_offsets[-1])
+        )
+        return cls(
+            row=np.arange(n, dtype=np.int64),
+            aid=column(itemgetter("id"), np.int64),
+            image_id=column(itemgetter("image_id"), np.int64),
+            category_id=column(itemgetter("category_id"), np.int64),
+            confidence=column(
+                lambda a: a.get("confidence", a.get("score", nan)), np.float64
+            ),
+            bbox=bbox,
+            keypoints=keypoints,
+            keypoint_offsets=keypoint_offsets,
+        )
+
+    @classmethod
+    def from_kwcoco(cls, dset: kwcoco.CocoDataset) -> "AnnotationTable":
+        """
+        Make a table of all the annotations of a dataset.
+        """
+        return cls.from_annotations(dset.dataset["annotations"])
+
+    def __len__(self) -> int:
+        return len(self.row)
+
+    def keypoints_of(self, i: int) -> npt.NDArray[np.float64]:
+        """
+        Get the flat keypoints of the ``i``-th annotation of the table.
+        """
+        return self.keypoints[self.keypoint_offsets[i] : self.keypoint_offsets[i + 1]]
+
+    def take(self, indices: npt.ArrayLike) -> "AnnotationTable":
+        """
+        Get a table of some of the annotations.
+
+        :param indices: Indices of the annotations to take, or a boolean
+            mask over the annotations.
+        """
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        indices = indices.astype(np.intp, copy=False)
+        kp_starts = self.keypoint_offsets[indices]
+        kp_lengths = self.keypoint_offsets[indices + 1] - kp_starts
+        keypoint_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(kp_lengths, out=keypoint_offsets[1:])
+        # Index of every kept keypoint value in the flat keypoints.
+        kp_idxs = np.repeat(kp_starts - keypoint_offsets[:-1], kp_lengths) + np.arange(
+            keypoint_offsets[-1]
+        )
+        return AnnotationTable(
+            row=self.row[indices],
+            aid=self.aid[indices],
+            image_id=self.image_id[indices],
+            category_id=self.category_id[indices],
+            confidence=self.confidence[indices],
+            bbox=self.bbox[indices],
+            keypoints=self.keypoints[kp_idxs],
+            keypoint_offsets=keypoint_offsets,
+        )
+
+    def replace(self, **columns: np.ndarray) -> "AnnotationTable":
+        """
+        Get a table with some columns replaced, sharing the others.
+
+        >>> table = AnnotationTable.from_annotations(
+        ...     [{"id": 1, "image_id": 2, "category_id": 3}]
+        ... )
+        >>> table.replace(category_id=np.array([4])).category_id.tolist()
+        [4]
+        """
+        return AnnotationTable(**{**vars(self), **columns})
+
+    def sort_by_image(self) -> "AnnotationTable":
+        """
+        Get the annotations ordered by image ID, then annotation ID.
+        """
+        return self.take(np.lexsort((self.aid, self.image_id)))
+
+    def to_annotations(
+        self, src_anns: Sequence[dict], renumber: bool = False
+    ) -> List[dict]:
+        """
+        Make annotation dictionaries to write back to a dataset.
+
+        Each is a shallow copy of its source annotation, with the image and
+        category IDs of the table.
+
+        :param src_anns: Annotations the table was made from.
+        :param renumber: Give the annotations new IDs, from 1 in table order,
+            instead of their IDs in the table.
+        """
+        aids: Iterable[int] = range(1, len(self) + 1) if renumber else self.aid.tolist()
+        return [
+            {**src_anns[r], "id": aid, "image_id": gid, "category_id": cid}
+            for r, aid, gid, cid in zip(
+                self.row.tolist(),
+                aids,
+                self.image_id.tolist(),
+                self.category_id.tolist(),
+            )
+        ]
+
+
+def replace_annotations(
+    dset: kwcoco.CocoDataset,
+    table: AnnotationTable,
+    src_anns: Optional[Sequence[dict]] = None,
+    renumber: bool = False,
+) -> None:
+    """
+    Replace all annotations of a dataset with those of a table, rebuilding
+    the dataset index once.
+
+    :param dset: Dataset to modify.
+    :param table: Annotations to set.
+    :param src_anns: Annotations the table was made from, by default those
+        of ``dset``.
+    :param renumber: Give the annotations new IDs, as in
+        :meth:`AnnotationTable.to_annotations`.
+    """
+    if src_anns is None:
+        src_anns = dset.dataset["annotations"]
+    dset.dataset["annotations"] = table.to_annotations(src_anns, renumber)
+    dset.index.build(dset)
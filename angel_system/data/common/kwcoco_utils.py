@@ -23,6 +23,10 @@ from sklearn.preprocessing import normalize
 from pathlib import Path
 from PIL import Image
 
+from angel_system.data.common.annotation_table import (
+    AnnotationTable,
+    lookup_array,
+)
 from angel_system.data.common.load_data import (
     activities_from_dive_csv,
     objs_as_dataframe,
@@ -49,6 +53,116 @@ def load_kwcoco(dset):
     return dset
 
 
+def copy_with_annotations(
+    dset, new_dset, table, drop_empty_images=False, build_index=True
+):
+    """Copy the videos and images of a kwcoco dataset to another, with the
+    annotations of a table.
+
+    Images are given new IDs, counting from 1 in order of their old IDs, and
+    annotations new IDs in order of image. The index of ``new_dset`` is built
+    once, at the end, if at all.
+
+    :param dset: kwcoco object to copy from
+    :param new_dset: kwcoco object to copy to, without images or annotations
+    :param table: ``AnnotationTable`` of annotations of ``dset`` to copy,
+        with category IDs of ``new_dset``
+    :param drop_empty_images: Do not copy images without annotations in
+        ``table``
+    :param build_index: Build the index of ``new_dset``. This may be skipped
+        when ``new_dset`` is only to be dumped, which is much faster for large
+        datasets.
+
+    :return: Number of images dropped
+    """
+    for video_id, video in dset.index.videos.items():
+        new_dset.add_video(**video)
+
+    old_gids = np.array(sorted(dset.index.imgs), dtype=np.int64)
+    new_dset.dataset["images"] = [
+        {**dset.imgs[gid], "id": new_gid}
+        for new_gid, gid in enumerate(old_gids.tolist(), start=1)
+    ]
+    table = table.replace(image_id=np.searchsorted(old_gids, table.image_id) + 1)
+    n_dropped = 0
+    if drop_empty_images:
+        annotated = set(np.unique(table.image_id).tolist())
+        n_dropped = len(old_gids) - len(annotated)
+        new_dset.dataset["images"] = [
+            im for im in new_dset.dataset["images"] if im["id"] in annotated
+        ]
+    new_dset.dataset["annotations"] = table.sort_by_image().to_annotations(
+        dset.dataset["annotations"], renumber=True
+    )
+    if build_index:
+        new_dset.index.build(new_dset)
+    return n_dropped
+
+
+def gt_matches(gt, frame_idxs, times):
+    """Find the ground truth activities covering each of some frames
+
+    Frames with a time are matched on the ``start`` and ``end`` times of the
+    activities, others on their ``start_frame`` and ``end_frame``.
+
+    :param gt: Activity ground truth dataframe
+    :param frame_idxs: Frame index of each frame
+    :param times: Time of each frame, or None
+
+    :return: Boolean matrix of shape [num frames, len(gt)]
+    """
+    matches = np.zeros((len(frame_idxs), len(gt)), dtype=bool)
+    has_time = np.array([bool(t) for t in times], dtype=bool)
+    if has_time.any():
+        t = np.array(times, dtype=object)[has_time].astype(float)[:, None]
+        matches[has_time] = (gt["start"].to_numpy() <= t) & (gt["end"].to_numpy() >= t)
+    if not has_time.all():
+        f = np.array(frame_idxs, dtype=object)[~has_time].astype(float)[:, None]
+        matches[~has_time] = (gt["start_frame"].to_numpy() <= f) & (
+            gt["end_frame"].to_numpy() >= f
+        )
+    return matches
+
+
+def activity_label_of(class_labels, activity_labels):
+    """Get the activity label of a frame from the class labels of the
+    ground truth activities covering it
+
+    :param class_labels: Class labels of the matching ground truth rows, in
+        ground truth order
+    :param activity_labels: Activity labels config entries
+
+    :return: Activity label, or "background"
+    """
+    if not class_labels:
+        return "background"
+
+    label = class_labels[0]  # default to the first gt
+
+    # Hacky temporary fix
+    # In the medical data, step 1 can cover the same frames as other steps,
+    # So we use the highest step available as ground truth to avoid
+    # only getting step 1 as most of our ground truth
+    if len(class_labels) > 1:
+        label = max(class_labels)
+
+    if type(label) == float or type(label) == int:
+        label = int(label)
+    label = str(label)
+
+    try:
+        activity = [x for x in activity_labels if int(x["id"]) == int(float(label))]
+    except:
+        activity = []
+
+    if not activity:
+        warnings.warn(f"Label: {label} is not in the activity labels config, ignoring")
+        print(f"LABEL: {label}, {type(label)}")
+
+        return "background"
+    return activity[0]["label"]
+
+
 def add_activity_gt_to_kwcoco(topic, task, dset, activity_config_fn):
     """Takes an existing kwcoco file and fills in the "activity_gt"
     field on each image based on the activity annotations.
@@ -87,61 +201,24 @@ def add_activity_gt_to_kwcoco(topic, task, dset, activity_config_fn):
         gt = activities_from_dive_csv(topic, activity_gt_fn)
         gt = objs_as_dataframe(gt)
 
-        image_ids = dset.index.vidid_to_gids[video_id]
-
-        # Update the activity gt for each image
-        for gid in sorted(image_ids):
-            im = dset.imgs[gid]
-
-            frame_idx, time = time_from_name(im["file_name"], topic)
-
-            if time:
-                matching_gt = gt.loc[(gt["start"] <= time) & (gt["end"] >= time)]
-            else:
-                matching_gt = gt.loc[
-                    (gt["start_frame"] <= frame_idx) & (gt["end_frame"] >= frame_idx)
-                ]
-
-            if matching_gt.empty:
-                label = "background"
-                activity_label = label
-            else:
-                label = matching_gt.iloc[0]["class_label"]  # default to the first gt
-
-                # Hacky temporary fix
-                # In the medical data, step 1 can cover the same frames as other steps,
-                # So we use the highest step available as ground truth to avoid
-                # only getting step 1 as most of our ground truth
-                if len(matching_gt) > 1:
-                    possible_labels = []
-                    for i, row in matching_gt.iterrows():
-                        possible_labels.append(row["class_label"])
-                    label = max(possible_labels)
-
-                if type(label) == float or type(label) == int:
-                    label = int(label)
-                label = str(label)
-
-                try:
-                    activity = [
-                        x for x in activity_labels if int(x["id"]) == int(float(label))
-                    ]
-                except:
-                    activity = []
-
-                if not activity:
-                    warnings.warn(
-                        f"Label: {label} is not in the activity labels config, ignoring"
-                    )
-                    print(f"LABEL: {label}, {type(label)}")
-
-                    label = "background"
-                    activity_label = label
-                else:
-                    activity = activity[0]
-                    activity_label = activity["label"]
-
-            dset.imgs[gid]["activity_gt"] = activity_label
+        image_ids = sorted(dset.index.vidid_to_gids[video_id])
+        frame_idxs, times = [], []
+        for gid in image_ids:
+            frame_idx, time = time_from_name(dset.imgs[gid]["file_name"], topic)
+            frame_idxs.append(frame_idx)
+            times.append(time)
+
+        # Update the activity gt for each image. Frames covered by the same
+        # set of ground truth rows share a label, so only resolve the label
+        # of each distinct set.
+        matches = gt_matches(gt, frame_idxs, times)
+        patterns, pattern_idxs = np.unique(matches, axis=0, return_inverse=True)
+        pattern_labels = [
+            activity_label_of(gt["class_label"][row_mask].tolist(), activity_labels)
+            for row_mask in patterns
+        ]
+        for gid, pattern_idx in zip(image_ids, pattern_idxs.reshape(-1).tolist()):
+            dset.imgs[gid]["activity_gt"] = pattern_labels[pattern_idx]
 
     # dset.fpath = dset.fpath.split(".")[0] + "_fixed.mscoco.json"
     dset.dump(dset.fpath, newlines=True)
@@ -294,26 +371,18 @@ def imgs_to_video(imgs_dir, topic):
 def filter_kwcoco_by_conf(dset, conf_thr=0.4):
     """Filter the kwcoco dataset by confidence
 
+    Annotations without a "confidence" (or "score") are removed.
+
     :param dset: kwcoco object or a string pointing to a kwcoco file
     :param conf_thr: Minimum confidence to be left in the dataset
     """
     # Load kwcoco file
     dset = load_kwcoco(dset)
 
-    gid_to_aids = dset.index.gid_to_aids
-    gids = ub.argsort(ub.map_vals(len, gid_to_aids))
-
-    remove_anns = []
-    for gid in sorted(gids):
-        aids = gid_to_aids[gid]
-        anns = ub.dict_subset(dset.anns, aids)
-
-        for aid, ann in anns.items():
-            conf = ann["confidence"]
-
-            if conf < conf_thr:
-                remove_anns.append(aid)
+    table = AnnotationTable.from_kwcoco(dset)
+    keep = table.confidence >= conf_thr
 
+    remove_anns = table.aid[~keep].tolist()
     print(f"removing {len(remove_anns)} annotations")
     dset.remove_annotations(remove_anns)
 
@@ -578,41 +647,24 @@ def update_obj_labels(dset, object_config_fn):
     for object_label in object_labels:
         new_dset.add_category(name=object_label["label"], id=object_label["id"])
 
-    for video_id, video in dset.index.videos.items():
-        new_dset.add_video(**video)
-
-    gid_to_aids = dset.index.gid_to_aids
-    gids = ub.argsort(ub.map_vals(len, gid_to_aids))
-
-    for gid in sorted(gids):
-        im = dset.imgs[gid]
-        new_im = im.copy()
-
-        aids = gid_to_aids[gid]
-        anns = ub.dict_subset(dset.anns, aids)
-
-        # Add video
-        if hasattr(im, "video_id"):
-            old_video = dset.index.videos[im["video_id"]]["name"]
-            new_video = new_dset.index.name_to_video[old_video]
-            new_im["video_id"] = new_video["id"]
-
-        del new_im["id"]
-        new_im["file_name"] = im["file_name"]
-        new_gid = new_dset.add_image(**new_im)
-
-        for aid, ann in anns.items():
-            old_cat = dset.cats[ann["category_id"]]["name"]
-
-            new_cat = new_dset.index.name_to_cat[old_cat]
-
-            new_ann = ann.copy()
-
-            del new_ann["id"]
-            new_ann["category_id"] = new_cat["id"]
-            new_ann["image_id"] = new_gid
-
-            new_dset.add_annotation(**new_ann)
+    # Map old category IDs to new ones by name
+    cid_map = {
+        cid: new_dset.index.name_to_cat[cat["name"]]["id"]
+        for cid, cat in dset.cats.items()
+        if cat["name"] in new_dset.index.name_to_cat
+    }
+    table = AnnotationTable.from_kwcoco(dset)
+    new_cids = lookup_array(cid_map, table.category_id)
+    if (new_cids < 0).any():
+        missing = {
+            dset.cats[c]["name"] for c in np.unique(table.category_id[new_cids < 0])
+        }
+        raise KeyError(f"Object labels not in the new labels config: {missing}")
+
+    # Only dumped, so skip building its index
+    copy_with_annotations(
+        dset, new_dset, table.replace(category_id=new_cids), build_index=False
+    )
 
     fpath = dset.fpath.split(".mscoco")[0]
     new_dset.fpath = f"{fpath}_new_obj_labels.mscoco.json"
@@ -668,55 +720,23 @@ def filter_kwcoco_by_class(dset, good_classes=[], bad_classes=[]):
     for object_label in classes:
         new_dset.add_category(name=object_label)
 
-    for video_id, video in dset.index.videos.items():
-        new_dset.add_video(**video)
-
-    gid_to_aids = dset.index.gid_to_aids
-    gids = ub.argsort(ub.map_vals(len, gid_to_aids))
-
-    for gid in sorted(gids):
-        im = dset.imgs[gid]
-        new_im = im.copy()
-
-        aids = gid_to_aids[gid]
-        anns = ub.dict_subset(dset.anns, aids)
-
-        # Add video
-        if hasattr(im, "video_id"):
-            old_video = dset.index.videos[im["video_id"]]["name"]
-            new_video = new_dset.index.name_to_video[old_video]
-            new_im["video_id"] = new_video["id"]
-
-        del new_im["id"]
-        new_im["file_name"] = im["file_name"]
-        new_gid = new_dset.add_image(**new_im)
-
-        for aid, ann in anns.items():
-            old_cat = dset.cats[ann["category_id"]]["name"]
-            if old_cat not in classes:
-                continue
-
-            new_cat = new_dset.index.name_to_cat[old_cat]
-
-            new_ann = ann.copy()
-
-            del new_ann["id"]
-            new_ann["category_id"] = new_cat["id"]
-            new_ann["image_id"] = new_gid
-
-            new_dset.add_annotation(**new_ann)
-
-    # Remove any images without annotations now
-    gid_to_aids = new_dset.index.gid_to_aids
-    gids = ub.argsort(ub.map_vals(len, gid_to_aids))
-    remove_imgs = []
-    for gid in sorted(gids):
-        aids = gid_to_aids[gid]
-        if len(aids) == 0:
-            remove_imgs.append(gid)
-
-    print(f"removing {len(remove_imgs)} images that no longer have annotations")
-    new_dset.remove_images(remove_imgs)
+    # Map old category IDs to new ones by name, dropping other classes
+    cid_map = {
+        cid: new_dset.index.name_to_cat[cat["name"]]["id"]
+        for cid, cat in dset.cats.items()
+        if cat["name"] in classes
+    }
+    table = AnnotationTable.from_kwcoco(dset)
+    new_cids = lookup_array(cid_map, table.category_id)
+    keep = new_cids >= 0
+    table = table.take(keep).replace(category_id=new_cids[keep])
+
+    # Leave out any images without annotations now. Only dumped, so skip
+    # building its index
+    n_removed = copy_with_annotations(
+        dset, new_dset, table, drop_empty_images=True, build_index=False
+    )
+    print(f"removing {n_removed} images that no longer have annotations")
 
     fpath = dset.fpath.split(".mscoco")[0]
     if good_classes:
@@ -737,22 +757,18 @@ def filter_kwcoco_by_filename(dset, good_files_fn):
     # Load kwcoco file
     dset = load_kwcoco(dset)
 
-    gid_to_aids = dset.index.gid_to_aids
-    gids = ub.argsort(ub.map_vals(len, gid_to_aids))
-
     # Load good image names
     with open(good_files_fn, "r") as good_names_f:
         lines = good_names_f.readlines()
         good_names = [os.path.basename(l.strip()) for l in lines]
         print(good_names)
 
-    remove_imgs = []
-    for gid in sorted(gids):
-        im = dset.imgs[gid]
-        img_fn = im["file_name"]
-
-        if os.path.basename(img_fn) not in good_names:
-            remove_imgs.append(gid)
+    good_names = set(good_names)
+    remove_imgs = [
+        im["id"]
+        for im in dset.dataset["images"]
+        if os.path.basename(im["file_name"]) not in good_names
+    ]
 
     print(f"removing {len(remove_imgs)} images")
     dset.remove_images(remove_imgs)
@@ -0,0 +1,224 @@
+"""
+Vectorized activation engine for the GlobalStepPredictor.
+
+The per-frame loop in ``GlobalStepPredictor.process_new_confidences``
+recomputes a dozen index sets per frame. The functions here instead compute
+all threshold comparisons for a whole ``[n_frames, n_acts]`` block of
+confidences up front and then advance the strong/weak activation counters with
+boolean masks, producing per-frame "flip" masks that the tracker stage can look
+up in O(1).
+
+State arrays may carry arbitrary leading dimensions (e.g. ``[n_sessions,
+n_acts]``) so that several independent predictors can be advanced in a single
+pass.
+"""
+from typing import NamedTuple
+from typing import Tuple
+
+import numpy as np
+
+
+class ThresholdMasks(NamedTuple):
+    """
+    Boolean masks of shape ``[n_frames, ..., n_acts]`` describing how each
+    confidence compares against the activity-specific thresholds.
+    """
+
+    # conf > threshold_multiplier * avg_probs
+    above_pos: np.ndarray
+    # conf < threshold_multiplier * avg_probs
+    below_pos: np.ndarray
+    # conf > deactivate_thresh_mult * avg_probs
+    above_neg: np.ndarray
+    # conf < deactivate_thresh_mult * avg_probs
+    below_neg: np.ndarray
+    # conf > threshold_multiplier_weak * avg_probs
+    above_weak_pos: np.ndarray
+    # conf < deactivate_weak_thresh_mult * avg_probs
+    below_weak_neg: np.ndarray
+
+
+class FlipMasks(NamedTuple):
+    """
+    Boolean masks of shape ``[n_frames, ..., n_acts]`` recording which
+    activities flipped state on each frame.
+    """
+
+    on: np.ndarray
+    off: np.ndarray
+    weak_on: np.ndarray
+    weak_off: np.ndarray
+
+
+def _compare(
+    activity_confs: np.ndarray,
+    threshold: np.ndarray,
+    num_activities: int,
+    greater: bool,
+) -> np.ndarray:
+    """
+    Compare confidences to a threshold vector and fit the trailing dimension
+    to ``num_activities``, treating columns that have no confidence as never
+    satisfying the comparison.
+    """
+    if greater:
+        mask = activity_confs > threshold
+    else:
+        mask = activity_confs < threshold
+    width = mask.shape[-1]
+    if width >= num_activities:
+        return mask[..., :num_activities]
+    pad = np.zeros(mask.shape[:-1] + (num_activities - width,), dtype=bool)
+    return np.concatenate([mask, pad], axis=-1)
+
+
+def compute_threshold_masks(
+    activity_confs: np.ndarray,
+    avg_probs: np.ndarray,
+    num_activities: int,
+    threshold_multiplier: float,
+    deactivate_thresh_mult: float,
+    threshold_multiplier_weak: float,
+    deactivate_weak_thresh_mult: float,
+) -> ThresholdMasks:
+    """
+    Compute every threshold comparison needed by the activation state machine
+    for a whole block of confidences at once.
+
+    :param activity_confs: Confidences of shape ``[n_frames, ..., n_classes]``.
+    :param avg_probs: Average true-positive activation per class, broadcastable
+        against a single frame of ``activity_confs``.
+    :param num_activities: Number of activity ids tracked by the state arrays.
+        Confidence columns past this are ignored, missing columns never
+        activate.
+
+    :returns: Masks of shape ``[n_frames, ..., num_activities]``.
+    """
+    activity_confs = np.asarray(activity_confs, dtype=float)
+    # The multiplications are done first, exactly as in the per-frame loop, so
+    # the comparisons are bit-for-bit the same.
+    pos = threshold_multiplier * avg_probs
+    neg = deactivate_thresh_mult * avg_probs
+    weak_pos = threshold_multiplier_weak * avg_probs
+    weak_neg = deactivate_weak_thresh_mult * avg_probs
+    return ThresholdMasks(
+        above_pos=_compare(activity_confs, pos, num_activities, True),
+        below_pos=_compare(activity_confs, pos, num_activities, False),
+        above_neg=_compare(activity_confs, neg, num_activities, True),
+        below_neg=_compare(activity_confs, neg, num_activities, False),
+        above_weak_pos=_compare(activity_confs, weak_pos, num_activities, True),
+        below_weak_neg=_compare(activity_confs, weak_neg, num_activities, False),
+    )
+
+
+def advance_activation_states(
+    masks: ThresholdMasks,
+    active: np.ndarray,
+    count: np.ndarray,
+    weak_active: np.ndarray,
+    weak_count: np.ndarray,
+    threshold_frame_count: float,
+    deactivate_thresh_frame_count: float,
+    threshold_frame_count_weak: float,
+    deactivate_thresh_frame_count_weak: float,
+) -> FlipMasks:
+    """
+    Advance the strong and weak activation state over a block of frames.
+
+    The state arrays are updated in place and must share the trailing shape of
+    a single frame of ``masks``.
+
+    This reproduces the per-frame loop of
+    ``GlobalStepPredictor.process_new_confidences`` exactly, including the
+    weak counters being reset by the *strong* reset conditions.
+
+    :param masks: Threshold comparisons from :func:`compute_threshold_masks`.
+    :param active: Boolean strong activation state per activity.
+    :param count: Integer count of consecutive frames toward a strong flip.
+    :param weak_active: Boolean weak activation state per activity.
+    :param weak_count: Integer count of consecutive frames toward a weak flip.
+
+    :returns: Per-frame masks of the activities that flipped on or off.
+    """
+    n_frames = masks.above_pos.shape[0]
+    flips = FlipMasks(
+        on=np.zeros(masks.above_pos.shape, dtype=bool),
+        off=np.zeros(masks.above_pos.shape, dtype=bool),
+        weak_on=np.zeros(masks.above_pos.shape, dtype=bool),
+        weak_off=np.zeros(masks.above_pos.shape, dtype=bool),
+    )
+    for i in range(n_frames):
+        # State at the start of the frame.
+        act = active.copy()
+        deact = ~act
+        weak_act = weak_active.copy()
+        weak_deact = ~weak_act
+
+        # Increment counters of activities moving toward a flip.
+        count += (deact & masks.above_pos[i]) | (act & masks.below_neg[i])
+        weak_count += (weak_deact & masks.above_weak_pos[i]) | (
+            weak_act & masks.below_weak_neg[i]
+        )
+
+        # Reset counters of activities that fell back. The weak counters are
+        # intentionally reset with the strong conditions.
+        reset = (deact & masks.below_pos[i]) | (act & masks.above_neg[i])
+        count[reset] = 0
+        weak_count[reset] = 0
+
+        # Flip classes that have met their condition for enough frames.
+        on = flips.on[i]
+        off = flips.off[i]
+        np.logical_and(deact, count >= threshold_frame_count, out=on)
+        np.logical_and(act, count >= deactivate_thresh_frame_count, out=off)
+        active[on] = True
+        active[off] = False
+        count[on | off] = 0
+
+        weak_on = flips.weak_on[i]
+        weak_off = flips.weak_off[i]
+        np.logical_and(
+            weak_deact, weak_count >= threshold_frame_count_weak, out=weak_on
+        )
+        np.logical_and(
+            weak_act, weak_count >= deactivate_thresh_frame_count_weak, out=weak_off
+        )
+        weak_active[weak_on] = True
+        weak_active[weak_off] = False
+        weak_count[weak_on | weak_off] = 0
+    return flips
+
+
+def first_frame_at_or_after(
+    frames_per_activity: Tuple[np.ndarray, ...],
+    activity_id: int,
+    start: int,
+    stop: int,
+) -> int:
+    """
+    Find the first frame index in ``[start, stop)`` at which the given
+    activity has an event, using a binary search over its sorted event frames.
+
+    :param frames_per_activity: Sorted event frame indices for each activity.
+    :param activity_id: Activity to look up.
+    :param start: First frame index to consider.
+    :param stop: Value returned when there is no event before this frame.
+    """
+    frames = frames_per_activity[activity_id]
+    idx = np.searchsorted(frames, start)
+    if idx < len(frames) and frames[idx] < stop:
+        return int(frames[idx])
+    return stop
+
+
+def event_frames_per_activity(mask: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """
+    Convert a ``[n_frames, n_acts]`` mask into the sorted frame indices at
+    which each activity is set.
+    """
+    n_acts = mask.shape[1]
+    if not mask.any():
+        # The common case when streaming a few frames at a time.
+        return (np.empty(0, dtype=np.intp),) * n_acts
+    acts, frames = np.nonzero(mask.T)
+    return tuple(np.split(frames, np.cumsum(np.bincount(acts, minlength=n_acts))[:-1]))
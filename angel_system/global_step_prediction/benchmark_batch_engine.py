@@ -0,0 +1,153 @@
+"""
+Benchmark the per-frame ``GlobalStepPredictor.process_new_confidences`` loop
+against the batched ``process_new_confidences_batch`` engine on long synthetic
+confidence streams, verifying that both produce identical tracker state.
+
+Example::
+
+    python -m angel_system.global_step_prediction.benchmark_batch_engine \\
+        --n-frames 5000 --n-frames 27000
+"""
+import contextlib
+import io
+import time
+from pathlib import Path
+from typing import Tuple
+
+import click
+import numpy as np
+import yaml
+
+from angel_system.global_step_prediction.global_step_predictor import (
+    GlobalStepPredictor,
+)
+from angel_system.utils.history_buffer import HistoryBuffer
+
+
+def build_predictor(task_config: Path, activity_config: Path) -> GlobalStepPredictor:
+    """
+    Create a predictor for all active tasks in a multi-task config, with a flat
+    average true-positive activation profile.
+    """
+    with open(task_config, "r") as stream:
+        config = yaml.safe_load(stream)
+    recipe_config_dict = {
+        task["label"]: task["config_file"] for task in config["tasks"] if task["active"]
+    }
+    # Keep the constructor's chatter out of the benchmark output.
+    with contextlib.redirect_stdout(io.StringIO()):
+        gsp = GlobalStepPredictor(
+            recipe_types=list(recipe_config_dict),
+            recipe_config_dict=recipe_config_dict,
+            activity_config_fpath=activity_config.as_posix(),
+        )
+    gsp.get_average_TP_activations_from_array(
+        np.full(gsp.activity_conf_history.shape[1], 0.5)
+    )
+    return gsp
+
+
+def synthetic_confidences(
+    gsp: GlobalStepPredictor, n_frames: int, seed: int = 0
+) -> np.ndarray:
+    """
+    Confidence stream that steps through each tracker's activities in order
+    with random dwell times, background noise and spurious activations.
+    """
+    rng = np.random.default_rng(seed)
+    n_classes = gsp.activity_conf_history.shape[1]
+    order = np.concatenate(
+        [t["granular_step_to_activity_id"] for t in gsp.trackers]
+    ).astype(int)
+    confs = rng.uniform(0, 0.2, size=(n_frames, n_classes))
+    i = 0
+    pos = 0
+    while i < n_frames:
+        dwell = int(rng.integers(1, 40))
+        if rng.uniform() < 0.2:
+            act = int(rng.integers(0, n_classes))
+        else:
+            act = order[pos % len(order)]
+            pos += 1
+        seg = confs[i : i + dwell]
+        seg[:, act] = rng.uniform(0.3, 1.0, size=len(seg))
+        i += dwell
+    return confs
+
+
+def time_method(gsp: GlobalStepPredictor, method: str, confs: np.ndarray) -> float:
+    with contextlib.redirect_stdout(io.StringIO()):
+        s = time.perf_counter()
+        getattr(gsp, method)(confs)
+        return time.perf_counter() - s
+
+
+def check_same_state(
+    a: GlobalStepPredictor, b: GlobalStepPredictor
+) -> Tuple[bool, str]:
+    if not np.array_equal(a.activated_activities, b.activated_activities):
+        return False, "activated_activities"
+    if not np.array_equal(a.weak_activated_activities, b.weak_activated_activities):
+        return False, "weak_activated_activities"
+    for i, (ta, tb) in enumerate(zip(a.trackers, b.trackers)):
+        for k in ta:
+            if isinstance(ta[k], HistoryBuffer):
+                # Compared through the "*_history" views.
+                continue
+            if isinstance(ta[k], np.ndarray):
+                same = np.array_equal(ta[k], tb[k])
+            else:
+                same = ta[k] == tb[k]
+            if not same:
+                return False, f"tracker {i} '{k}'"
+    return True, ""
+
+
+@click.command(context_settings={"help_option_names": ["-h", "--help"]})
+@click.option(
+    "--task-config",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default="config/tasks/medical/multi-task-config-medical-r18.yaml",
+    show_default=True,
+    help="Multi-task configuration listing the recipes to track.",
+)
+@click.option(
+    "--activity-config",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default="config/activity_labels/medical/r18.yaml",
+    show_default=True,
+    help="Activity label configuration matching the task configuration.",
+)
+@click.option(
+    "--n-frames",
+    type=int,
+    multiple=True,
+    default=[1000, 5000, 27000],
+    show_default=True,
+    help="Stream lengths to benchmark. May be given multiple times.",
+)
+@click.option("--seed", type=int, default=0, show_default=True)
+def main(task_config, activity_config, n_frames, seed):
+    """
+    Compare per-frame and batched confidence processing.
+    """
+    print(
+        f"{'frames':>8} {'per-frame (s)':>14} {'batch (s)':>10} "
+        f"{'speedup':>8} {'identical':>10}"
+    )
+    for n in n_frames:
+        per_frame = build_predictor(task_config, activity_config)
+        batch = build_predictor(task_config, activity_config)
+        confs = synthetic_confidences(per_frame, n, seed)
+
+        t_loop = time_method(per_frame, "process_new_confidences", confs)
+        t_batch = time_method(batch, "process_new_confidences_batch", confs)
+        same, where = check_same_state(per_frame, batch)
+        print(
+            f"{n:>8} {t_loop:>14.4f} {t_batch:>10.4f} "
+            f"{t_loop / t_batch:>7.1f}x {str(same):>10} {where}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark a GlobalStepPredictorPool against the same number of independent
+GlobalStepPredictors as the number of concurrent sessions grows, streaming
+short blocks of confidences per session the way the task monitor receives
+them.
+
+Example::
+
+    python -m angel_system.global_step_prediction.benchmark_predictor_pool \\
+        --n-sessions 1 --n-sessions 16 --n-sessions 64
+"""
+import contextlib
+import io
+import time
+from pathlib import Path
+
+import click
+import numpy as np
+import yaml
+
+from angel_system.global_step_prediction.benchmark_batch_engine import (
+    build_predictor,
+    check_same_state,
+    synthetic_confidences,
+)
+from angel_system.global_step_prediction.predictor_pool import (
+    GlobalStepPredictorPool,
+)
+
+
+def build_pool(
+    task_config: Path, activity_config: Path, n_sessions: int, avg_probs: np.ndarray
+) -> GlobalStepPredictorPool:
+    with open(task_config, "r") as stream:
+        config = yaml.safe_load(stream)
+    recipe_config_dict = {
+        task["label"]: task["config_file"] for task in config["tasks"] if task["active"]
+    }
+    pool = GlobalStepPredictorPool(
+        avg_probs=avg_probs,
+        max_sessions=n_sessions,
+        recipe_types=list(recipe_config_dict),
+        recipe_config_dict=recipe_config_dict,
+        activity_config_fpath=activity_config.as_posix(),
+    )
+    # Keep the constructor's chatter out of the benchmark output.
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(n_sessions):
+            pool.add_session(i)
+    return pool
+
+
+@click.command(context_settings={"help_option_names": ["-h", "--help"]})
+@click.option(
+    "--task-config",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default="config/tasks/medical/multi-task-config-medical-r18.yaml",
+    show_default=True,
+    help="Multi-task configuration listing the recipes to track.",
+)
+@click.option(
+    "--activity-config",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default="config/activity_labels/medical/r18.yaml",
+    show_default=True,
+    help="Activity label configuration matching the task configuration.",
+)
+@click.option(
+    "--n-sessions",
+    type=int,
+    multiple=True,
+    default=[1, 2, 4, 8, 16, 32, 64],
+    show_default=True,
+    help="Numbers of concurrent sessions to benchmark. May be given multiple times.",
+)
+@click.option(
+    "--n-frames",
+    type=int,
+    default=2000,
+    show_default=True,
+    help="Number of frames streamed to each session.",
+)
+@click.option(
+    "--block-size",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of frames per session in each update.",
+)
+@click.option("--seed", type=int, default=0, show_default=True)
+def main(task_config, activity_config, n_sessions, n_frames, block_size, seed):
+    """
+    Compare a predictor pool with independent predictors per session.
+    """
+    print(
+        f"{'sessions':>8} {'independent (ms)':>17} {'pool (ms)':>10} "
+        f"{'speedup':>8} {'identical':>10}"
+    )
+    for n in n_sessions:
+        independent = [build_predictor(task_config, activity_config) for _ in range(n)]
+        pool = build_pool(task_config, activity_config, n, independent[0].avg_probs)
+        confs = [
+            synthetic_confidences(independent[0], n_frames, seed + i) for i in range(n)
+        ]
+
+        t_independent = 0.0
+        t_pool = 0.0
+        with contextlib.redirect_stdout(io.StringIO()):
+            for start in range(0, n_frames, block_size):
+                blocks = [c[start : start + block_size] for c in confs]
+
+                s = time.perf_counter()
+                for gsp, block in zip(independent, blocks):
+                    gsp.process_new_confidences_batch(block)
+                t_independent += time.perf_counter() - s
+
+                s = time.perf_counter()
+                pool.process_new_confidences(dict(enumerate(blocks)))
+                t_pool += time.perf_counter() - s
+
+        same = all(
+            check_same_state(gsp, pool.get(i))[0] for i, gsp in enumerate(independent)
+        )
+        # Report the mean time of one update across all sessions.
+        n_updates = -(-n_frames // block_size)
+        ms_independent = 1e3 * t_independent / n_updates
+        ms_pool = 1e3 * t_pool / n_updates
+        print(
+            f"{n:>8} {ms_independent:>17.3f} {ms_pool:>10.3f} "
+            f"{ms_independent / ms_pool:>7.1f}x {str(same):>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
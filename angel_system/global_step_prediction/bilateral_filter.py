@@ -0,0 +1,205 @@
+"""
+Vectorized and streaming versions of the 1D bilateral filter
+``global_step_predictor.bilateralFtr1D`` used to smooth activity confidence
+traces.
+
+Both produce the same output as ``bilateralFtr1D``, including its window
+conventions: the output at sample ``i`` is the weighted mean of samples
+``j`` in ``[max(i - radius, 1), min(i + radius, n))``, with spatial weight
+``gauss[j - i + radius + 1]`` and intensity weight
+``exp(-(y[j] - y[i]) ** 2 / s_intensity ** 2)``. Samples with an empty window
+are 0.
+
+Inputs may be a single trace of shape ``[n]`` or several traces filtered
+independently along the first axis, e.g. ``[n_frames, n_classes]``.
+"""
+from collections import deque
+
+import numpy as np
+import scipy.ndimage as ndi
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# Number of samples filtered at once by bilateral_filter_1d, bounding the size
+# of the temporary window arrays.
+CHUNK_SIZE = 4096
+
+
+def filter_radius(s_spatial: float) -> int:
+    """
+    Radius of the filter window for the given spatial sigma.
+    """
+    return int(np.floor(2 * s_spatial))
+
+
+def spatial_weights(s_spatial: float) -> np.ndarray:
+    """
+    Gaussian weights for the window offsets ``-radius .. radius - 1``.
+    """
+    radius = filter_radius(s_spatial)
+    impulse = np.zeros(2 * radius + 1)
+    impulse[radius] = 1
+    return ndi.gaussian_filter1d(impulse, s_spatial)[1:]
+
+
+def _weighted_mean(
+    center: np.ndarray,
+    window: np.ndarray,
+    valid: np.ndarray,
+    exp_s: np.ndarray,
+    s_intensity: float,
+) -> np.ndarray:
+    """
+    Bilateral weighted mean of windows of samples.
+
+    :param center: Center samples of shape ``[..., c]``.
+    :param window: Windows of shape ``[..., c, w]``.
+    :param valid: Boolean mask of window positions to use, broadcastable to
+        ``[..., 1, w]``.
+    :param exp_s: Spatial weights of shape ``[w]``.
+    :param s_intensity: Intensity sigma.
+    """
+    dy = window - center[..., None]
+    weights = np.exp(-(dy * dy) / (s_intensity * s_intensity)) * (exp_s * valid)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ret = (weights * window).sum(axis=-1) / weights.sum(axis=-1)
+    # An empty window gives 0, as in bilateralFtr1D.
+    return np.where(valid.any(axis=-1), ret, 0)
+
+
+def bilateral_filter_1d(
+    y: np.ndarray, s_spatial: float = 5, s_intensity: float = 1
+) -> np.ndarray:
+    """
+    Vectorized equivalent of ``bilateralFtr1D``.
+
+    :param y: Trace of shape ``[n]``, or traces of shape ``[n, ...]`` to be
+        filtered independently along the first axis.
+    :param s_spatial: Spatial sigma, in samples.
+    :param s_intensity: Intensity sigma.
+
+    :returns: Filtered trace(s) with the shape of ``y``.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    radius = filter_radius(s_spatial)
+    width = 2 * radius
+    exp_s = spatial_weights(s_spatial)
+
+    flat = y.reshape(n, int(np.prod(y.shape[1:])))
+    padded = np.pad(flat, ((radius, radius), (0, 0)))
+    # windows[i, :, k] is y[i - radius + k].
+    windows = sliding_window_view(padded, width, axis=0)
+    offsets = np.arange(-radius, radius)
+
+    ret = np.zeros_like(flat)
+    for start in range(0, n, CHUNK_SIZE):
+        stop = min(start + CHUNK_SIZE, n)
+        j = np.arange(start, stop)[:, None] + offsets
+        valid = ((j >= 1) & (j < n))[:, None, :]
+        ret[start:stop] = _weighted_mean(
+            flat[start:stop], windows[start:stop], valid, exp_s, s_intensity
+        )
+    return ret.reshape(y.shape)
+
+
+class StreamingBilateralFilter:
+    """
+    Incremental equivalent of ``bilateralFtr1D`` for samples arriving one at a
+    time, e.g. the ``conf_vec`` of each new ``ActivityDetection``.
+
+    The output for a sample depends on the ``radius - 1`` samples after it, so
+    each call to :meth:`push` returns the outputs that have become final,
+    ``radius - 1`` samples behind the input. :meth:`flush` returns the rest
+    once the stream has ended. Only the last ``2 * radius`` samples are kept.
+
+    >>> y = np.random.default_rng(0).uniform(size=50)
+    >>> f = StreamingBilateralFilter(s_spatial=2)
+    >>> out = [f.push(v) for v in y]
+    >>> out.append(f.flush())
+    >>> np.allclose(np.concatenate(out), bilateral_filter_1d(y, s_spatial=2))
+    True
+    """
+
+    def __init__(self, s_spatial: float = 5, s_intensity: float = 1):
+        """
+        :param s_spatial: Spatial sigma, in samples.
+        :param s_intensity: Intensity sigma.
+        """
+        self.s_spatial = s_spatial
+        self.s_intensity = s_intensity
+        self.radius = filter_radius(s_spatial)
+        self._exp_s = spatial_weights(s_spatial)
+        # The most recent samples, the oldest being that at index
+        # _num_pushed - len(_samples).
+        self._samples = deque(maxlen=max(2 * self.radius, 1))
+        self._num_pushed = 0
+        # Index of the next sample to output.
+        self._num_output = 0
+        self._sample_shape = None
+
+    @property
+    def delay(self) -> int:
+        """
+        Number of samples the output lags behind the input.
+        """
+        return max(self.radius - 1, 0)
+
+    def reset(self) -> None:
+        """
+        Start a new stream.
+        """
+        self._samples.clear()
+        self._num_pushed = 0
+        self._num_output = 0
+        self._sample_shape = None
+
+    def push(self, sample: np.ndarray) -> np.ndarray:
+        """
+        Add the next sample of the stream.
+
+        :param sample: Scalar or array sample, e.g. a confidence vector.
+
+        :returns: Array of the outputs that became final, of shape ``[k,
+            *sample.shape]`` with ``k`` being 0 or 1.
+        """
+        sample = np.asarray(sample, dtype=float)
+        if self._sample_shape is None:
+            self._sample_shape = sample.shape
+        self._samples.append(sample.reshape(-1))
+        self._num_pushed += 1
+        # Sample i is final once sample i + radius - 1 has arrived.
+        return self._output_until(self._num_pushed - self.delay)
+
+    def flush(self) -> np.ndarray:
+        """
+        End the stream, returning the outputs of its last samples.
+        """
+        out = self._output_until(self._num_pushed)
+        self.reset()
+        return out
+
+    def _output_until(self, stop: int) -> np.ndarray:
+        """
+        Output samples ``_num_output .. stop - 1`` of the stream so far.
+        """
+        shape = self._sample_shape if self._sample_shape is not None else ()
+        out = []
+        first = self._num_pushed - len(self._samples)
+        buf = np.array(self._samples)
+        while self._num_output < stop:
+            i = self._num_output
+            lo = max(i - self.radius, 1)
+            hi = max(min(i + self.radius, self._num_pushed), lo)
+            ret = _weighted_mean(
+                buf[i - first],
+                buf[lo - first : hi - first].T,
+                np.ones((1, hi - lo), dtype=bool),
+                self._exp_s[lo - i + self.radius : hi - i + self.radius],
+                self.s_intensity,
+            )
+            out.append(ret.reshape(shape))
+            self._num_output += 1
+        if not out:
+            return np.zeros((0,) + shape)
+        return np.stack(out)
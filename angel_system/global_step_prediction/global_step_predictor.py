@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Dict, List, Optional
 
 import yaml
 import seaborn as sn
@@ -8,6 +8,19 @@ import matplotlib.pyplot as plt
 import scipy.ndimage as ndi
 import kwcoco
 
+from angel_system.global_step_prediction.batch_engine import (
+    FlipMasks,
+    advance_activation_states,
+    compute_threshold_masks,
+    event_frames_per_activity,
+    first_frame_at_or_after,
+)
+from angel_system.global_step_prediction.recipe_tracker import (
+    RecipeTable,
+    RecipeTracker,
+)
+from angel_system.utils.history_buffer import HistoryBuffer
+
 
 class GlobalStepPredictor:
     def __init__(
@@ -25,10 +38,15 @@ class GlobalStepPredictor:
         recipe_config_dict={},
         background_threshold=0.3,
         activity_config_fpath="config/activity_labels/all_recipe_labels.yaml",
+        history_max_len=None,
     ):
         """
         GlobalStepPredctor: based on a TCN activity classifier's activity classification
         outputs + a set of recipes, track what step a user is on for multiple recipes.
+
+        history_max_len: optional maximum number of most recent frames to retain
+        in the activity confidence and step prediction histories. When None, the
+        full history is kept.
         """
         # TODO: make use of angel_system.data.config_structs instead of
         #       manually loading and accessing by string keys.
@@ -38,6 +56,15 @@ class GlobalStepPredictor:
             self.activity_config = yaml.safe_load(stream)
         num_activity_classes = len(self.activity_config["labels"])
 
+        # Activity id -> full string lookup table. Unknown ids map to None.
+        max_activity_id = max(a["id"] for a in self.activity_config["labels"])
+        self._activity_id_to_full_str: List[Optional[str]] = [None] * (
+            max_activity_id + 1
+        )
+        # Match the first entry for an id, as a linear search would.
+        for activity in reversed(self.activity_config["labels"]):
+            self._activity_id_to_full_str[activity["id"]] = activity["full_str"]
+
         # maximum number of steps that can be "jumped" to.
         # i.e. if max_step_jump is 1, from step 2, you can only jump to 3.
         self.max_step_jump = max_step_jump
@@ -71,15 +98,21 @@ class GlobalStepPredictor:
         # all start at frame 30, since the TCN takes in 30 frames.
         self.current_frame = 30
 
-        self.activity_conf_history = np.empty((0, num_activity_classes))
+        self.history_max_len = history_max_len
+        self._activity_conf_history = HistoryBuffer(
+            row_shape=(num_activity_classes,), max_len=history_max_len
+        )
 
         self.recipe_types = recipe_types
         # TODO: Expect use of angel_system.data.config_structs instead of
         #       a raw dictionary with no enumeration of possible values.
         self.recipe_configs = recipe_config_dict
 
-        # Array of tracker dicts
-        self.trackers: List[Dict[str, Any]] = []
+        # Compiled step structure per recipe, shared by trackers of that recipe.
+        self._recipe_tables: Dict[str, RecipeTable] = {}
+        # Array of trackers. These may be read like dictionaries, see
+        # RecipeTracker.
+        self.trackers: List[RecipeTracker] = []
         for recipe in recipe_types:
             self.initialize_new_recipe_tracker(recipe)
 
@@ -93,7 +126,7 @@ class GlobalStepPredictor:
         # previous frames in a row that have been "DEactivated".
         max_activity_id_per_recipe = np.array(
             [
-                np.max(np.array(tracker["granular_step_to_activity_id"]))
+                np.max(tracker.table.granular_step_to_activity_id)
                 for tracker in self.trackers
             ]
         )
@@ -119,6 +152,14 @@ class GlobalStepPredictor:
         # Example: ["tea", "coffee"]
         self.tracker_resets = []
 
+    @property
+    def activity_conf_history(self):
+        """
+        Read-only ``[n_frames, n_acts]`` array of the activity confidences
+        processed so far (at most ``history_max_len`` most recent frames).
+        """
+        return self._activity_conf_history.view()
+
     def get_activity_order_from_config(self, config_fn):
         """
         Get the order of activity_ids (mapping to granular step
@@ -149,50 +190,28 @@ class GlobalStepPredictor:
         # For each activity, given the Ground Truth-specified
         # frame subset where that activity is happening, get the
         # average activation of that class.
-
-        all_activity_ids = coco_preds.categories().get("id")
-        print(f"all_activity_ids: {all_activity_ids}")
-
-        # create a mapping of all the annots ids to image ids in the training set
-        tr_aid_to_gid = coco_preds.annots().get("image_id", keepid=True)
-        print(f"training set annotations: {len(tr_aid_to_gid)}")
-
-        all_vid_ids = coco_preds.videos().get("id")
-        print(
-            f"Computing average true positive activations for {len(all_vid_ids)} video(s)."
-        )
-
-        # Don't use len() here... There might be skipped indexes.
-        avg_probs = np.zeros(max(all_activity_ids) + 1)
-
-        for activity_id in all_activity_ids:
-            probs_for_true_inds = np.array([])
-
-            for ann_id in coco_truth.index.anns:
-                ann = coco_truth.index.anns[ann_id]
-                if ann["category_id"] == activity_id:
-                    referenced_img_id = ann["image_id"]
-                    pred_ann = coco_preds.annots(image_id=referenced_img_id).objs
-                    assert len(pred_ann) == 1
-                    pred_ann = pred_ann[0]
-                    TP_prob = pred_ann["prob"][activity_id]
-                    probs_for_true_inds = np.append(probs_for_true_inds, TP_prob)
-
-            avg_prob = np.mean(probs_for_true_inds)
-            avg_probs[activity_id] = avg_prob
-
-        self.avg_probs = avg_probs
+        self.avg_probs = compute_average_TP_activations(coco_preds, coco_truth)
         return self.avg_probs
 
-    def get_average_TP_activations_from_file(self, fpath):
-        self.avg_probs = np.load(fpath)
+    def get_average_TP_activations_from_file(self, fpath, mmap_mode=None):
+        """
+        Load average true positive activations from a ``.npy`` file.
+
+        :param fpath: Path to the file.
+        :param mmap_mode: Optional ``numpy.load`` memory-map mode, e.g. "r"
+            to map the file read-only instead of reading it.
+        """
+        self.avg_probs = np.load(fpath, mmap_mode=mmap_mode)
 
     def get_average_TP_activations_from_array(self, avg_probs):
         self.avg_probs = avg_probs
 
     def initialize_new_recipe_tracker(self, recipe, config_fn=None):
         """
-        tracker dict fields:
+        Add a new RecipeTracker for the given recipe. The recipe's config is
+        compiled into a RecipeTable once and shared between its trackers.
+
+        tracker fields (readable as attributes, or as dict keys):
             {
             "recipe":"coffee"
                 - all cooking options: ["coffee", "tea", "dessert_quesadilla",
@@ -223,8 +242,18 @@ class GlobalStepPredictor:
                   or checking for a next step.
 
         """
-        tracker_dict = {}
         print(f"self.recipe_configs[recipe]: {self.recipe_configs}")
+        if recipe not in self._recipe_tables:
+            self._recipe_tables[recipe] = self.compile_recipe_table(recipe)
+        self.trackers.append(
+            RecipeTracker(self._recipe_tables[recipe], self.history_max_len)
+        )
+
+    def compile_recipe_table(self, recipe):
+        """
+        Read a recipe's task config and compile its step structure into a
+        RecipeTable.
+        """
         config_fn = self.recipe_configs[recipe]
 
         # Read in task config
@@ -232,7 +261,6 @@ class GlobalStepPredictor:
         #       manually loading and accessing by string keys.
         with open(config_fn, "r") as stream:
             config = yaml.safe_load(stream)
-        labels = [self.sanitize_str(l["full_str"]) for l in config["labels"]]
         broad_steps = config["labels"]
         if broad_steps[0]["id"] == 1:
             config["labels"].insert(
@@ -245,51 +273,23 @@ class GlobalStepPredictor:
                 },
             )
 
-        tracker_dict[
-            "last_granular_step_per_broad_step"
-        ] = self.get_last_granular_step_per_broad_step(broad_steps)
-        tracker_dict["recipe"] = recipe
-
-        tracker_dict["current_broad_step"] = 0
-        tracker_dict["current_granular_step"] = 0
-
-        tracker_dict["total_num_broad_steps"] = len(broad_steps)
-        tracker_dict["total_num_granular_steps"] = np.sum(
-            [len(self.get_unique(step["activity_ids"])) for step in config["labels"]]
+        granular_step_to_activity_id = self.get_activity_per_granular_step(broad_steps)
+        return RecipeTable(
+            recipe=recipe,
+            broad_steps=broad_steps,
+            broad_step_to_activity_ids=[
+                self.get_unique(step["activity_ids"]) for step in broad_steps
+            ],
+            last_granular_step_per_broad_step=(
+                self.get_last_granular_step_per_broad_step(broad_steps)
+            ),
+            granular_step_to_activity_id=granular_step_to_activity_id,
+            granular_step_to_full_str=[
+                self.get_activity_str_from_id(act_id)
+                for act_id in granular_step_to_activity_id
+            ],
         )
 
-        tracker_dict["skipped_granular_steps"] = []
-
-        # Activity ids
-        tracker_dict["broad_step_to_activity_ids"] = [
-            self.get_unique(step["activity_ids"]) for step in broad_steps
-        ]
-        tracker_dict[
-            "granular_step_to_activity_id"
-        ] = self.get_activity_per_granular_step(broad_steps)
-
-        # Labels
-        tracker_dict["broad_step_to_label"] = [step["label"] for step in broad_steps]
-
-        # Full strings
-        tracker_dict["broad_step_to_full_str"] = [
-            step["full_str"] for step in broad_steps
-        ]
-        tracker_dict["granular_step_to_full_str"] = [
-            self.get_activity_str_from_id(act_id)
-            for act_id in tracker_dict["granular_step_to_activity_id"]
-        ]
-
-        # Prediction History
-        tracker_dict["broad_step_prediction_history"] = np.array([])
-        tracker_dict["granular_step_prediction_history"] = np.array([])
-
-        tracker_dict["active"] = True
-        tracker_dict["broad_steps"] = broad_steps
-        tracker_dict["can_skip"] = False
-
-        self.trackers.append(tracker_dict)
-
     def get_activity_per_granular_step(self, broad_steps):
         activity_id_per_granular_step = []
         for broad_step in broad_steps:
@@ -305,20 +305,20 @@ class GlobalStepPredictor:
         increment may or may not entail a broad step increment.)
         """
         tracker = self.trackers[tracker_ind]
-        current_granular_step = tracker["current_granular_step"]
-        num_granular_steps = tracker["total_num_granular_steps"] - 1
+        current_granular_step = tracker.current_granular_step
+        num_granular_steps = tracker.table.total_num_granular_steps - 1
 
         if current_granular_step < num_granular_steps:
-            self.trackers[tracker_ind]["current_granular_step"] += 1
-            self.trackers[tracker_ind][
-                "current_broad_step"
-            ] = self.granular_to_broad_step(tracker, current_granular_step)
-        elif current_granular_step == num_granular_steps and tracker["active"] == True:
-            self.trackers[tracker_ind]["active"] = False
+            tracker.current_granular_step += 1
+            tracker.current_broad_step = self.granular_to_broad_step(
+                tracker, current_granular_step
+            )
+        elif current_granular_step == num_granular_steps and tracker.active:
+            tracker.active = False
         else:
             raise Exception(
                 f"Tried to increment tracker #{tracker_ind}: "
-                f"{tracker['recipe']} past last step."
+                f"{tracker.recipe} past last step."
             )
 
         self.conditionally_reset_irrational_trackers(tracker)
@@ -333,25 +333,22 @@ class GlobalStepPredictor:
         """
         tracker = self.trackers[tracker_ind]
 
-        num_granular_steps = tracker["total_num_granular_steps"] - 1
-        current_granular_step = tracker["current_granular_step"]
+        num_granular_steps = tracker.table.total_num_granular_steps - 1
+        current_granular_step = tracker.current_granular_step
 
-        if (
-            current_granular_step == num_granular_steps
-            and not self.trackers[tracker_ind]["active"]
-        ):
-            self.trackers[tracker_ind]["active"] = True
+        if current_granular_step == num_granular_steps and not tracker.active:
+            tracker.active = True
             return self.trackers
 
         if current_granular_step > 0:
-            self.trackers[tracker_ind]["current_granular_step"] -= 1
-            self.trackers[tracker_ind][
-                "current_broad_step"
-            ] = self.granular_to_broad_step(tracker, current_granular_step)
+            tracker.current_granular_step -= 1
+            tracker.current_broad_step = self.granular_to_broad_step(
+                tracker, current_granular_step
+            )
         else:
             raise Exception(
                 f"Tried to decrement tracker #{tracker_ind}: "
-                f"{tracker['recipe']} already on step 0."
+                f"{tracker.recipe} already on step 0."
             )
         return self.trackers
 
@@ -365,10 +362,11 @@ class GlobalStepPredictor:
         to see zeros in your prediction history.
         """
         print(f"RESETTING tracker {tracker_ind}")
-        self.trackers[tracker_ind]["current_broad_step"] = 0
-        self.trackers[tracker_ind]["current_granular_step"] = 0
-        self.trackers[tracker_ind]["active"] = True
-        self.tracker_resets.append(self.trackers[tracker_ind]["recipe"])
+        tracker = self.trackers[tracker_ind]
+        tracker.current_broad_step = 0
+        tracker.current_granular_step = 0
+        tracker.active = True
+        self.tracker_resets.append(tracker.recipe)
         return self.trackers
 
     def granular_to_broad_step(self, tracker, granular_step):
@@ -378,8 +376,7 @@ class GlobalStepPredictor:
         Ex: [0, 2, 5, 6, 7]
         granular_step_4
         """
-        lgspbs = np.array(tracker["last_granular_step_per_broad_step"])
-        return len(np.nonzero(lgspbs < granular_step)[0])
+        return int(tracker.table.granular_step_to_broad_step[granular_step])
 
     def get_unique(self, activity_ids):
         """
@@ -581,98 +578,229 @@ class GlobalStepPredictor:
             self.weak_activated_activities[flipping_off_weak_indexes, 0] = 0
             self.weak_activated_activities[flipping_off_weak_indexes, 1] = 0
 
-            # Now, go through ACTIVE trackers and see which corresponds to "flipping_on_indexes."
-            # If a tracker's last step is ACTIVE and its last step is in "flipping_off_indexes",
-            # then deactivate the tracker.
-            for tracker_ind, tracker in enumerate(self.trackers):
-                if not tracker["active"]:
-                    continue
+            self._update_trackers_from_flips(
+                flipping_on_indexes, flipping_off_indexes, flipping_on_weak_indexes
+            )
+        # Update the current_frame
+        self.current_frame += len(activity_confs)
 
-                # TODO: For now the tracker can jump 1 or 2 steps, if base
-                # jump criteria is met. Add "weak" threshold too.
-                current_granular_step = tracker["current_granular_step"]
-                current_activity = tracker["granular_step_to_activity_id"][
-                    current_granular_step
-                ]
-                if current_granular_step == tracker["total_num_granular_steps"] - 1:
-                    if current_activity in flipping_off_indexes:
-                        tracker["active"] = False
-                    continue
+        self._activity_conf_history.append(activity_confs)
 
-                next_granular_step = current_granular_step + 1
-                next_next_granular_step = min(
-                    next_granular_step + 1, tracker["total_num_granular_steps"] - 1
-                )
-                next_activity = tracker["granular_step_to_activity_id"][
-                    next_granular_step
-                ]
-                next_next_activity = tracker["granular_step_to_activity_id"][
-                    next_next_granular_step
-                ]
+        return self.trackers
 
-                # TODO: prioritize a 1-step jump over a 2-step jump. Create a
-                # second loop just for the 2-step jumps, after this loop has completed
-                # searching for one-step jumps.
-                if next_activity in flipping_on_indexes:
-                    self.increment_granular_step(tracker_ind)
-                    self.conditionally_reset_irrational_trackers(tracker)
-                    self.trackers[tracker_ind]["can_skip"] = False
-                    # Each activity activation can only be used once.
-                    # Delete activity from flipping_on_indexes
-                    next_act_ind = np.argwhere(flipping_on_indexes == next_activity)
-                    # TODO: disabling for now. All activities will
-                    # count toward any relevant trackers.
-                    if False:
-                        if self.should_this_activity_trigger_be_used_once(next_act_ind):
-                            flipping_on_indexes = np.delete(
-                                flipping_on_indexes, next_act_ind
-                            )
-                elif next_next_activity in flipping_on_indexes and tracker["can_skip"]:
-                    # Keep track of skipped steps
-                    self.add_skipped_granular_step(tracker_ind, next_granular_step)
-                    # Increment the granular step twice
-                    self.increment_granular_step(tracker_ind)
-                    self.increment_granular_step(tracker_ind)
-                    self.conditionally_reset_irrational_trackers(tracker, skip=True)
-                    self.trackers[tracker_ind]["can_skip"] = False
-                    # Each activity activation can only be used once.
-                    # Delete activity from flipping_on_indexes
-                    next_next_act_ind = np.argwhere(
-                        flipping_on_indexes == next_next_activity
+    def process_new_confidences_batch(self, activity_confs):
+        """
+        Batched equivalent of ``process_new_confidences``.
+
+        All threshold comparisons for the ``[n_frames, n_acts]`` block are
+        computed at once and the activation counters are advanced with boolean
+        masks (see ``batch_engine``). Trackers are then only stepped through
+        the per-frame update on frames where an activity they depend on flips;
+        on all other frames their history is extended in bulk.
+
+        The resulting tracker and activation state is identical to calling
+        ``process_new_confidences`` on the same block.
+        """
+        activity_confs = np.asarray(activity_confs, dtype=float)
+        flips = self._advance_activations(activity_confs)
+        return self._apply_flip_masks(flips, activity_confs)
+
+    def _advance_activations(self, activity_confs: np.ndarray) -> FlipMasks:
+        """
+        Advance the strong and weak activation counters over a block of
+        confidences, returning which activities flipped on each frame.
+        """
+        num_activities = len(self.activated_activities)
+
+        masks = compute_threshold_masks(
+            activity_confs,
+            self.avg_probs,
+            num_activities,
+            self.threshold_multiplier,
+            self.deactivate_thresh_mult,
+            self.threshold_multiplier_weak,
+            self.deactivate_weak_thresh_mult,
+        )
+        active = self.activated_activities[:, 0] == 1
+        count = self.activated_activities[:, 1].astype(np.int64)
+        weak_active = self.weak_activated_activities[:, 0] == 1
+        weak_count = self.weak_activated_activities[:, 1].astype(np.int64)
+        flips = advance_activation_states(
+            masks,
+            active,
+            count,
+            weak_active,
+            weak_count,
+            self.threshold_frame_count,
+            self.deactivate_thresh_frame_count,
+            self.threshold_frame_count_weak,
+            self.deactivate_thresh_frame_count_weak,
+        )
+        self.activated_activities[:, 0] = active
+        self.activated_activities[:, 1] = count
+        self.weak_activated_activities[:, 0] = weak_active
+        self.weak_activated_activities[:, 1] = weak_count
+        return flips
+
+    def _apply_flip_masks(
+        self, flips: FlipMasks, activity_confs: np.ndarray
+    ) -> List[RecipeTracker]:
+        """
+        Step the trackers through a block of frames given the activation flips
+        computed for it, and record the block in the history.
+
+        :param flips: Per-frame flip masks of shape ``[n_frames, n_acts]``.
+        :param activity_confs: The ``[n_frames, n_classes]`` confidences the
+            flips were computed from.
+        """
+        n_frames = len(activity_confs)
+        on_frames = event_frames_per_activity(flips.on)
+        off_frames = event_frames_per_activity(flips.off)
+        weak_on_frames = event_frames_per_activity(flips.weak_on)
+
+        frame = 0
+        while frame < n_frames:
+            # Find the next frame on which any active tracker could change.
+            event_frame = n_frames
+            for tracker in self.trackers:
+                if not tracker.active:
+                    continue
+                step = tracker.current_granular_step
+                last_step = tracker.table.total_num_granular_steps - 1
+                step_to_act = tracker.table.granular_step_to_activity_id
+                if step == last_step:
+                    event_frame = first_frame_at_or_after(
+                        off_frames, step_to_act[step], frame, event_frame
                     )
-                    # TODO: disabling for now. All activities will
-                    # count toward any relevant trackers.
-                    if False:
-                        if self.should_this_activity_trigger_be_used_once(
-                            next_next_act_ind
-                        ):
-                            flipping_on_indexes = np.delete(
-                                flipping_on_indexes, next_next_act_ind
-                            )
-                if next_activity in flipping_on_weak_indexes:
-                    self.trackers[tracker_ind]["can_skip"] = True
-
-                # TODO: Try requiring that previous step is de-activated
-
-                # Add current preds to this tracker's prediction history
-                self.record_history(
-                    tracker_ind,
-                    tracker["current_granular_step"],
-                    tracker["current_broad_step"],
+                    continue
+                next_act = step_to_act[step + 1]
+                next_next_act = step_to_act[min(step + 2, last_step)]
+                event_frame = first_frame_at_or_after(
+                    on_frames, next_act, frame, event_frame
                 )
+                event_frame = first_frame_at_or_after(
+                    on_frames, next_next_act, frame, event_frame
+                )
+                event_frame = first_frame_at_or_after(
+                    weak_on_frames, next_act, frame, event_frame
+                )
+
+            # Nothing changes until then, so only history is recorded. Trackers
+            # on their last step do not record history.
+            num_quiet = event_frame - frame
+            if num_quiet:
+                for tracker_ind, tracker in enumerate(self.trackers):
+                    if tracker.active and not tracker.is_on_last_step:
+                        self.record_history(
+                            tracker_ind,
+                            tracker.current_granular_step,
+                            tracker.current_broad_step,
+                            num_frames=num_quiet,
+                        )
+            if event_frame == n_frames:
+                break
+
+            self._update_trackers_from_flips(
+                np.flatnonzero(flips.on[event_frame]),
+                np.flatnonzero(flips.off[event_frame]),
+                np.flatnonzero(flips.weak_on[event_frame]),
+            )
+            frame = event_frame + 1
+
         # Update the current_frame
-        self.current_frame += len(activity_confs)
+        self.current_frame += n_frames
 
-        self.activity_conf_history = np.append(
-            self.activity_conf_history, activity_confs, axis=0
-        )
+        self._activity_conf_history.append(activity_confs)
 
         return self.trackers
 
+    def _update_trackers_from_flips(
+        self, flipping_on_indexes, flipping_off_indexes, flipping_on_weak_indexes
+    ):
+        """
+        Advance every active tracker by one frame given the activity ids that
+        flipped on, off and weakly on during that frame, and record each
+        tracker's prediction history.
+        """
+        # Now, go through ACTIVE trackers and see which corresponds to "flipping_on_indexes."
+        # If a tracker's last step is ACTIVE and its last step is in "flipping_off_indexes",
+        # then deactivate the tracker.
+        for tracker_ind, tracker in enumerate(self.trackers):
+            if not tracker.active:
+                continue
+
+            # TODO: For now the tracker can jump 1 or 2 steps, if base
+            # jump criteria is met. Add "weak" threshold too.
+            step_to_act = tracker.table.granular_step_to_activity_id
+            current_granular_step = tracker.current_granular_step
+            current_activity = step_to_act[current_granular_step]
+            if tracker.is_on_last_step:
+                if current_activity in flipping_off_indexes:
+                    tracker.active = False
+                continue
+
+            next_granular_step = current_granular_step + 1
+            next_next_granular_step = min(
+                next_granular_step + 1, tracker.table.total_num_granular_steps - 1
+            )
+            next_activity = step_to_act[next_granular_step]
+            next_next_activity = step_to_act[next_next_granular_step]
+
+            # TODO: prioritize a 1-step jump over a 2-step jump. Create a
+            # second loop just for the 2-step jumps, after this loop has completed
+            # searching for one-step jumps.
+            if next_activity in flipping_on_indexes:
+                self.increment_granular_step(tracker_ind)
+                self.conditionally_reset_irrational_trackers(tracker)
+                tracker.can_skip = False
+                # Each activity activation can only be used once.
+                # Delete activity from flipping_on_indexes
+                next_act_ind = np.argwhere(flipping_on_indexes == next_activity)
+                # TODO: disabling for now. All activities will
+                # count toward any relevant trackers.
+                if False:
+                    if self.should_this_activity_trigger_be_used_once(next_act_ind):
+                        flipping_on_indexes = np.delete(
+                            flipping_on_indexes, next_act_ind
+                        )
+            elif next_next_activity in flipping_on_indexes and tracker.can_skip:
+                # Keep track of skipped steps
+                self.add_skipped_granular_step(tracker_ind, next_granular_step)
+                # Increment the granular step twice
+                self.increment_granular_step(tracker_ind)
+                self.increment_granular_step(tracker_ind)
+                self.conditionally_reset_irrational_trackers(tracker, skip=True)
+                tracker.can_skip = False
+                # Each activity activation can only be used once.
+                # Delete activity from flipping_on_indexes
+                next_next_act_ind = np.argwhere(
+                    flipping_on_indexes == next_next_activity
+                )
+                # TODO: disabling for now. All activities will
+                # count toward any relevant trackers.
+                if False:
+                    if self.should_this_activity_trigger_be_used_once(
+                        next_next_act_ind
+                    ):
+                        flipping_on_indexes = np.delete(
+                            flipping_on_indexes, next_next_act_ind
+                        )
+            if next_activity in flipping_on_weak_indexes:
+                tracker.can_skip = True
+
+            # TODO: Try requiring that previous step is de-activated
+
+            # Add current preds to this tracker's prediction history
+            self.record_history(
+                tracker_ind,
+                tracker.current_granular_step,
+                tracker.current_broad_step,
+            )
+
     def find_trackers_by_recipe(self, recipe):
         tracker_index_list = []
         for tracker_ind, tracker in enumerate(self.trackers):
-            if tracker["recipe"] == recipe:
+            if tracker.recipe == recipe:
                 tracker_index_list.append(tracker_ind)
         return tracker_index_list
 
@@ -706,8 +834,8 @@ class GlobalStepPredictor:
         if not skip:
             for recipe in resetter_granular_step:
                 if (
-                    tracker["recipe"] == recipe
-                    and tracker["current_granular_step"]
+                    tracker.recipe == recipe
+                    and tracker.current_granular_step
                     == resetter_granular_step[recipe][0]
                 ):
                     print("reset condition hit!!")
@@ -715,10 +843,10 @@ class GlobalStepPredictor:
                         resetter_granular_step[recipe][1]
                     ):
                         if (
-                            self.trackers[tracker_ind]["current_granular_step"]
-                            < resetter_granular_step[
-                                self.trackers[tracker_ind]["recipe"]
-                            ][0]
+                            self.trackers[tracker_ind].current_granular_step
+                            < resetter_granular_step[self.trackers[tracker_ind].recipe][
+                                0
+                            ]
                         ):
                             self.reset_one_tracker(tracker_ind)
         else:
@@ -728,17 +856,17 @@ class GlobalStepPredictor:
                     resetter_granular_step[recipe][0] + 1,
                 ]
                 if (
-                    tracker["recipe"] == recipe
-                    and tracker["current_granular_step"] in granular_steps
+                    tracker.recipe == recipe
+                    and tracker.current_granular_step in granular_steps
                 ):
                     for tracker_ind in self.find_trackers_by_recipe(
                         resetter_granular_step[recipe][1]
                     ):
                         if (
-                            self.trackers[tracker_ind]["current_granular_step"]
-                            < resetter_granular_step[
-                                self.trackers[tracker_ind]["recipe"]
-                            ][0]
+                            self.trackers[tracker_ind].current_granular_step
+                            < resetter_granular_step[self.trackers[tracker_ind].recipe][
+                                0
+                            ]
                         ):
                             self.reset_one_tracker(tracker_ind)
 
@@ -762,39 +890,42 @@ class GlobalStepPredictor:
         return True
 
     def add_skipped_granular_step(self, tracker_ind, granular_step):
-        self.trackers[tracker_ind]["skipped_granular_steps"].append(granular_step)
+        self.trackers[tracker_ind].skipped_granular_steps.append(granular_step)
 
     def get_skipped_steps_one_tracker(self, tracker_ind):
         tracker = self.trackers[tracker_ind]
         skipped_steps = []
-        for granular_step in tracker["skipped_granular_steps"]:
+        for granular_step in tracker.skipped_granular_steps:
+            activity_id, activity_str = self.get_activity_from_granular_step(
+                tracker, granular_step
+            )
             skipped_steps.append(
                 {
-                    "recipe": tracker["recipe"],
+                    "recipe": tracker.recipe,
                     "granular": granular_step,
                     "part_of_broad": self.granular_to_broad_step(
                         tracker, granular_step
                     ),
-                    "activity_id": self.get_activity_from_granular_step(
-                        tracker, granular_step
-                    )[0],
-                    "activity_str": self.get_activity_from_granular_step(
-                        tracker, granular_step
-                    )[1],
+                    "activity_id": activity_id,
+                    "activity_str": activity_str,
                 }
             )
         return skipped_steps
 
     def get_activity_from_granular_step(self, tracker, granular_step):
-        activity_id = tracker["granular_step_to_activity_id"][granular_step]
+        activity_id = int(tracker.table.granular_step_to_activity_id[granular_step])
         activity_str = self.get_activity_str_from_id(activity_id)
 
         return activity_id, activity_str
 
     def get_activity_str_from_id(self, activity_id):
-        for activity in self.activity_config["labels"]:
-            if activity["id"] == activity_id:
-                return activity["full_str"]
+        """
+        Get the full string of an activity id, or None if the id is not in the
+        activity config.
+        """
+        if 0 <= activity_id < len(self._activity_id_to_full_str):
+            return self._activity_id_to_full_str[activity_id]
+        return None
 
     def get_skipped_steps_all_trackers(self):
         skipped_steps_all_trackers = []
@@ -804,14 +935,19 @@ class GlobalStepPredictor:
             )
         return skipped_steps_all_trackers
 
-    def record_history(self, tracker_ind, current_granular_step, current_broad_step):
-        self.trackers[tracker_ind]["broad_step_prediction_history"] = np.append(
-            self.trackers[tracker_ind]["broad_step_prediction_history"],
-            current_broad_step,
+    def record_history(
+        self, tracker_ind, current_granular_step, current_broad_step, num_frames=1
+    ):
+        """
+        Append the given steps to a tracker's prediction history, repeated for
+        ``num_frames`` frames.
+        """
+        tracker = self.trackers[tracker_ind]
+        tracker.broad_step_prediction_buffer.append(
+            np.full(num_frames, current_broad_step)
         )
-        self.trackers[tracker_ind]["granular_step_prediction_history"] = np.append(
-            self.trackers[tracker_ind]["granular_step_prediction_history"],
-            current_granular_step,
+        tracker.granular_step_prediction_buffer.append(
+            np.full(num_frames, current_granular_step)
         )
 
     def plot_gt_vs_predicted_one_recipe(
@@ -965,29 +1101,24 @@ class GlobalStepPredictor:
         Increment to the first granular step of the next broad step.
         """
         tracker = self.trackers[tracker_index]
-        num_broad_steps = tracker["total_num_broad_steps"] - 1
-        current_broad_step = tracker["current_broad_step"]
+        num_broad_steps = tracker.table.total_num_broad_steps - 1
+        current_broad_step = tracker.current_broad_step
 
         if current_broad_step < num_broad_steps:
-            self.trackers[tracker_index]["current_broad_step"] += 1
-            self.trackers[tracker_index]["current_granular_step"] = (
-                tracker["last_granular_step_per_broad_step"][
-                    tracker["current_broad_step"] - 1
+            tracker.current_broad_step += 1
+            tracker.current_granular_step = (
+                tracker.table.last_granular_step_per_broad_step[
+                    tracker.current_broad_step - 1
                 ]
                 + 1
             )
-        elif (
-            current_broad_step == num_broad_steps
-            and self.trackers[tracker_ind]["active"] == True
-        ):
-            self.trackers[tracker_ind]["current_granular_step"] = (
-                self.trackers[tracker_ind]["total_num_granular_steps"] - 1
-            )
-            self.trackers[tracker_ind]["active"] = False
+        elif current_broad_step == num_broad_steps and tracker.active:
+            tracker.current_granular_step = tracker.table.total_num_granular_steps - 1
+            tracker.active = False
         else:
             raise Exception(
-                f"Tried to increment tracker #{tracker_ind}: "
-                f"{tracker['recipe']} past last step."
+                f"Tried to increment tracker #{tracker_index}: "
+                f"{tracker.recipe} past last step."
             )
 
         self.conditionally_reset_irrational_trackers(tracker)
@@ -998,22 +1129,24 @@ class GlobalStepPredictor:
         Decrement to the first granular step of the previous broad step.
         """
         tracker = self.trackers[tracker_index]
-        num_broad_steps = tracker["total_num_broad_steps"] - 1
-        current_broad_step = tracker["current_broad_step"]
+        num_broad_steps = tracker.table.total_num_broad_steps - 1
+        current_broad_step = tracker.current_broad_step
 
-        if current_broad_step == num_broad_steps and not tracker["active"]:
-            self.trackers[tracker_ind]["active"] = True
+        if current_broad_step == num_broad_steps and not tracker.active:
+            tracker.active = True
             return self.trackers
 
         if current_broad_step > 0:
-            self.trackers[tracker_index]["current_broad_step"] -= 1
-            self.trackers[tracker_index]["current_granular_step"] = tracker[
-                "last_granular_step_per_broad_step"
-            ][tracker["current_broad_step"]]
+            tracker.current_broad_step -= 1
+            tracker.current_granular_step = (
+                tracker.table.last_granular_step_per_broad_step[
+                    tracker.current_broad_step
+                ]
+            )
         else:
             raise Exception(
-                f"Tried to decrement tracker #{tracker_ind}: "
-                f"{tracker['recipe']} already on step 0."
+                f"Tried to decrement tracker #{tracker_index}: "
+                f"{tracker.recipe} already on step 0."
             )
 
         return self.trackers
@@ -1106,6 +1239,53 @@ class GlobalStepPredictor:
         )
 
 
+def compute_average_TP_activations(
+    coco_preds: kwcoco.CocoDataset,
+    coco_truth: kwcoco.CocoDataset,
+) -> np.ndarray:
+    """
+    For each activity, get the average predicted probability of that activity
+    over the frames in which the ground truth says it is happening.
+
+    :param coco_preds: Predictions, with one annotation per image holding the
+        class-wise probabilities in its "prob" field.
+    :param coco_truth: Ground truth activity annotations for the same images.
+
+    :returns: Average true positive probability, indexed by activity id.
+        Activities without ground truth frames are NaN.
+    """
+    all_activity_ids = coco_preds.categories().get("id")
+    print(f"all_activity_ids: {all_activity_ids}")
+
+    # create a mapping of all the annots ids to image ids in the training set
+    tr_aid_to_gid = coco_preds.annots().get("image_id", keepid=True)
+    print(f"training set annotations: {len(tr_aid_to_gid)}")
+
+    all_vid_ids = coco_preds.videos().get("id")
+    print(
+        f"Computing average true positive activations for {len(all_vid_ids)} video(s)."
+    )
+
+    # Collect the true positive probabilities of every activity in a single
+    # pass over the ground truth, in annotation order.
+    tp_probs_per_activity = {activity_id: [] for activity_id in all_activity_ids}
+    for ann in coco_truth.index.anns.values():
+        activity_id = ann["category_id"]
+        if activity_id not in tp_probs_per_activity:
+            continue
+        pred_aids = coco_preds.index.gid_to_aids[ann["image_id"]]
+        assert len(pred_aids) == 1
+        pred_ann = coco_preds.index.anns[next(iter(pred_aids))]
+        tp_probs_per_activity[activity_id].append(pred_ann["prob"][activity_id])
+
+    # Don't use len() here... There might be skipped indexes.
+    avg_probs = np.zeros(max(all_activity_ids) + 1)
+    for activity_id, tp_probs in tp_probs_per_activity.items():
+        avg_probs[activity_id] = np.mean(np.array(tp_probs, dtype=float))
+
+    return avg_probs
+
+
 def plot_positive_GT_conf_distributions(activity_confs, activity_gt):
     """
     plot_TP_conf_distributions:
@@ -1222,6 +1402,9 @@ def bilateralFtr1D(y, sSpatial=5, sIntensity=1):
 
     calc gaussian kernel size as: filterSize = (2 * radius) + 1; radius = floor (2 * sigma_spatial)
     y - input data
+
+    See bilateral_filter.bilateral_filter_1d for a vectorized equivalent, and
+    bilateral_filter.StreamingBilateralFilter for an online one.
     """
 
     # gaussian filter and parameters
@@ -0,0 +1,454 @@
+"""
+Parallel hyper-parameter sweep for the GlobalStepPredictor.
+
+Every configuration of a parameter grid is run on every test video over a
+process pool. The activity confidences and ground truth granular steps of all
+videos are placed once in shared memory, so tasks only carry a configuration
+index and a video index instead of pickled kwcoco subsets.
+
+Results are streamed to a CSV table with one row per configuration, written as
+soon as all of that configuration's videos are done: the swept parameter
+values, the frame-level granular step accuracy, the mean per-video accuracy
+and the granular step confusion matrix (JSON encoded, rows are ground truth).
+
+Example::
+
+    python -m angel_system.global_step_prediction.param_sweep \\
+        r18 truth.mscoco.json test_activity_preds.mscoco.json sweep.csv \\
+        -p threshold_multiplier=0.5,0.6,0.7,0.8 \\
+        -p threshold_frame_count=4,8 \\
+        -p deactivate_thresh_frame_count=10,20
+"""
+import contextlib
+import csv
+import io
+import itertools
+import json
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import click
+import kwcoco
+import numpy as np
+import yaml
+
+from angel_system.global_step_prediction.global_step_predictor import (
+    GlobalStepPredictor,
+)
+from angel_system.global_step_prediction.tp_activation_cache import (
+    DEFAULT_CACHE_DIR,
+    TPActivationCache,
+)
+
+
+# GlobalStepPredictor constructor arguments that may be swept.
+SWEEPABLE_PARAMS = (
+    "max_step_jump",
+    "threshold_multiplier",
+    "threshold_multiplier_weak",
+    "threshold_frame_count",
+    "threshold_frame_count_weak",
+    "deactivate_thresh_mult",
+    "deactivate_thresh_frame_count",
+    "deactivate_weak_thresh_mult",
+    "deactivate_thresh_frame_count_weak",
+)
+
+
+class SharedArray(NamedTuple):
+    """
+    Description of a numpy array in shared memory, enough to attach to it from
+    another process.
+    """
+
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+    @classmethod
+    def create(cls, arr: np.ndarray) -> Tuple["SharedArray", SharedMemory]:
+        """
+        Copy an array into a new shared memory block.
+
+        :returns: The description of the shared array, and the block, which
+            the caller must ``close`` and ``unlink`` when done.
+        """
+        arr = np.ascontiguousarray(arr)
+        shm = SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, arr.dtype, buffer=shm.buf)[...] = arr
+        return cls(shm.name, arr.shape, arr.dtype.str), shm
+
+    def attach(self) -> Tuple[np.ndarray, SharedMemory]:
+        """
+        Attach to the shared array, read-only. The returned block must be kept
+        alive as long as the array is used.
+        """
+        shm = SharedMemory(name=self.name)
+        arr = np.ndarray(self.shape, np.dtype(self.dtype), buffer=shm.buf)
+        arr.flags.writeable = False
+        return arr, shm
+
+
+class SweepVideos(NamedTuple):
+    """
+    Test videos of a sweep, concatenated along the frame axis.
+    """
+
+    video_ids: List[int]
+    # Frame offset of each video, with the total frame count appended.
+    offsets: np.ndarray
+    # [n_frames, n_classes] activity confidences.
+    confs: np.ndarray
+    # [n_frames] ground truth granular step.
+    gt_steps: np.ndarray
+    # Index of the tracker following each video's recipe.
+    tracker_inds: List[int]
+
+
+def expand_grid(grid: Dict[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    """
+    All combinations of the parameter values of a grid.
+
+    >>> expand_grid({"a": [1, 2], "b": [0.5]})
+    [{'a': 1, 'b': 0.5}, {'a': 2, 'b': 0.5}]
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+def predicted_granular_steps(gsp: GlobalStepPredictor, tracker_ind: int, n: int):
+    """
+    Per-frame granular step prediction of a tracker over the last ``n``
+    frames. A tracker that reached its last step stops recording history, it
+    is then considered to stay on that step.
+    """
+    tracker = gsp.trackers[tracker_ind]
+    history = tracker.granular_step_prediction_history[-n:].astype(np.int64)
+    pred = np.full(n, tracker.current_granular_step, dtype=np.int64)
+    pred[: len(history)] = history
+    return pred
+
+
+def evaluate_config(
+    predictor_kwargs: Dict[str, Any],
+    avg_probs: np.ndarray,
+    confs: np.ndarray,
+    gt_steps: np.ndarray,
+    tracker_ind: int,
+    num_steps: int,
+) -> np.ndarray:
+    """
+    Run one predictor configuration on one video.
+
+    :param predictor_kwargs: GlobalStepPredictor constructor arguments.
+    :param avg_probs: Average true positive activations.
+    :param confs: [n_frames, n_classes] activity confidences of the video.
+    :param gt_steps: [n_frames] ground truth granular steps of the video.
+    :param tracker_ind: Index of the tracker to evaluate.
+    :param num_steps: Size of the confusion matrix.
+
+    :returns: Flattened ``[num_steps, num_steps]`` confusion matrix counts,
+        rows being the ground truth step.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        gsp = GlobalStepPredictor(**predictor_kwargs)
+        gsp.get_average_TP_activations_from_array(avg_probs)
+        gsp.process_new_confidences_batch(confs)
+    pred = predicted_granular_steps(gsp, tracker_ind, len(confs))
+    return np.bincount(gt_steps * num_steps + pred, minlength=num_steps * num_steps)
+
+
+# Per worker process state, set by _init_worker.
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(
+    confs: SharedArray,
+    gt_steps: SharedArray,
+    offsets: np.ndarray,
+    tracker_inds: List[int],
+    configs: List[Dict[str, Any]],
+    avg_probs: np.ndarray,
+    num_steps: int,
+) -> None:
+    _worker["confs"], _worker["confs_shm"] = confs.attach()
+    _worker["gt_steps"], _worker["gt_steps_shm"] = gt_steps.attach()
+    _worker.update(
+        offsets=offsets,
+        tracker_inds=tracker_inds,
+        configs=configs,
+        avg_probs=avg_probs,
+        num_steps=num_steps,
+    )
+
+
+def _run_task(task: Tuple[int, int]) -> Tuple[int, int, np.ndarray]:
+    config_ind, video_ind = task
+    start, stop = _worker["offsets"][video_ind : video_ind + 2]
+    confusion = evaluate_config(
+        _worker["configs"][config_ind],
+        _worker["avg_probs"],
+        _worker["confs"][start:stop],
+        _worker["gt_steps"][start:stop],
+        _worker["tracker_inds"][video_ind],
+        _worker["num_steps"],
+    )
+    return config_ind, video_ind, confusion
+
+
+def run_sweep(
+    grid: Dict[str, Sequence[Any]],
+    base_kwargs: Dict[str, Any],
+    avg_probs: np.ndarray,
+    videos: SweepVideos,
+    num_steps: int,
+    out_fpath: Path,
+    n_workers: Optional[int] = None,
+) -> None:
+    """
+    Run every configuration of a parameter grid on every video in parallel,
+    streaming one result row per configuration to a CSV file.
+
+    :param grid: Values to sweep per GlobalStepPredictor parameter.
+    :param base_kwargs: GlobalStepPredictor arguments common to all
+        configurations (recipes, activity config).
+    :param avg_probs: Average true positive activations.
+    :param videos: Test videos to evaluate on.
+    :param num_steps: Number of granular steps, for the confusion matrices.
+    :param out_fpath: CSV file to write.
+    :param n_workers: Number of worker processes, all CPUs by default.
+    """
+    configs = [{**base_kwargs, **params} for params in expand_grid(grid)]
+    n_videos = len(videos.video_ids)
+    tasks = [(c, v) for c in range(len(configs)) for v in range(n_videos)]
+
+    shared_confs, confs_shm = SharedArray.create(videos.confs)
+    shared_gts, gts_shm = SharedArray.create(videos.gt_steps)
+    try:
+        with Pool(
+            n_workers,
+            initializer=_init_worker,
+            initargs=(
+                shared_confs,
+                shared_gts,
+                videos.offsets,
+                videos.tracker_inds,
+                configs,
+                np.asarray(avg_probs),
+                num_steps,
+            ),
+        ) as pool, open(out_fpath, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(
+                list(grid) + ["accuracy", "mean_video_accuracy", "confusion"]
+            )
+            pending = {c: {} for c in range(len(configs))}
+            for config_ind, video_ind, confusion in pool.imap_unordered(
+                _run_task, tasks
+            ):
+                pending[config_ind][video_ind] = confusion
+                if len(pending[config_ind]) < n_videos:
+                    continue
+                per_video = pending.pop(config_ind)
+                total = np.sum(list(per_video.values()), axis=0)
+                total = total.reshape(num_steps, num_steps)
+                video_acc = [
+                    np.trace(c.reshape(num_steps, num_steps)) / max(c.sum(), 1)
+                    for c in per_video.values()
+                ]
+                writer.writerow(
+                    [configs[config_ind][name] for name in grid]
+                    + [
+                        np.trace(total) / max(total.sum(), 1),
+                        np.mean(video_acc),
+                        json.dumps(total.tolist()),
+                    ]
+                )
+                f.flush()
+    finally:
+        for shm in (confs_shm, gts_shm):
+            shm.close()
+            shm.unlink()
+
+
+def load_videos(
+    gsp: GlobalStepPredictor,
+    coco_test: kwcoco.CocoDataset,
+    coco_truth: kwcoco.CocoDataset,
+) -> SweepVideos:
+    """
+    Gather the confidences and ground truth granular steps of every test
+    video whose recipe can be determined.
+    """
+    video_ids, confs, gt_steps, tracker_inds = [], [], [], []
+    for vid_id in np.unique(np.asarray(coco_test.images().lookup("video_id"))):
+        image_ids = coco_test.index.vidid_to_gids[vid_id]
+        test_video_dset = coco_test.subset(gids=image_ids, copy=True)
+        truth_video_dset = coco_truth.subset(gids=image_ids, copy=True)
+        activity_gts = truth_video_dset.annots().get("category_id")
+        recipe_type = gsp.determine_recipe_from_gt_first_activity(activity_gts)
+        if recipe_type == "unknown_recipe_type":
+            print(f"Skipping video {vid_id}, unknown recipe.")
+            continue
+        granular_step_gts = gsp.get_gt_steps_from_gt_activities(
+            truth_video_dset, gsp.recipe_configs[recipe_type]
+        )[0]
+        video_ids.append(int(vid_id))
+        confs.append(np.asarray(test_video_dset.annots().get("prob"), dtype=float))
+        gt_steps.append(np.asarray(granular_step_gts, dtype=np.int64))
+        tracker_inds.append(gsp.find_trackers_by_recipe(recipe_type)[0])
+    return SweepVideos(
+        video_ids=video_ids,
+        offsets=np.cumsum([0] + [len(c) for c in confs]),
+        confs=np.concatenate(confs),
+        gt_steps=np.concatenate(gt_steps),
+        tracker_inds=tracker_inds,
+    )
+
+
+def parse_param(
+    ctx: click.Context, param: click.Parameter, values: Sequence[str]
+) -> Dict[str, List[Any]]:
+    """
+    Parse ``NAME=V1,V2,...`` options into a parameter grid.
+    """
+    grid = {}
+    for value in values:
+        name, _, options = value.partition("=")
+        if name not in SWEEPABLE_PARAMS or not options:
+            raise click.BadParameter(
+                f"Expected NAME=V1,V2,... with NAME one of {SWEEPABLE_PARAMS}, "
+                f"got '{value}'."
+            )
+        grid[name] = [yaml.safe_load(v) for v in options.split(",")]
+    return grid
+
+
+@click.command(context_settings={"help_option_names": ["-h", "--help"]})
+@click.argument("medical_task", type=str)
+@click.argument(
+    "coco_truth",
+    type=click.Path(exists=True, dir_okay=False, readable=True, path_type=Path),
+)
+@click.argument(
+    "coco_test",
+    type=click.Path(exists=True, dir_okay=False, readable=True, path_type=Path),
+)
+@click.argument("out_file", type=click.Path(dir_okay=False, path_type=Path))
+@click.option(
+    "-p",
+    "--param",
+    "grid",
+    multiple=True,
+    callback=parse_param,
+    help="Parameter values to sweep, as NAME=V1,V2,... May be given multiple times.",
+)
+@click.option(
+    "--model_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="Average true positive activations (.npy). Either this or "
+    "--coco_train is required.",
+)
+@click.option(
+    "--coco_train",
+    type=click.Path(exists=True, dir_okay=False, readable=True, path_type=Path),
+    default=None,
+    help="The kwcoco file with the activity predictions of training videos, "
+    "with ground truth in COCO_TRUTH, to compute average true positive "
+    "activations from through the activation cache. These must not be the "
+    "test videos, as the sweep would then be scored on the data it was fit to.",
+)
+@click.option(
+    "--cache_dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=DEFAULT_CACHE_DIR,
+    help="Directory caching average activations computed for given inputs",
+)
+@click.option(
+    "--code_dir",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    default=".",
+    help="The path to the code directory",
+)
+@click.option(
+    "-j",
+    "--workers",
+    type=int,
+    default=None,
+    help="Number of worker processes. All CPUs by default.",
+)
+def main(
+    medical_task: str,
+    coco_truth: Path,
+    coco_test: Path,
+    out_file: Path,
+    grid: Dict[str, List[Any]],
+    model_file: Optional[Path],
+    coco_train: Optional[Path],
+    cache_dir: Path,
+    code_dir: Path,
+    workers: Optional[int],
+) -> None:
+    """
+    Sweep GlobalStepPredictor parameters for a medical task.
+
+    \b
+    Positional Arguments:
+        medical_task: The medical task to sweep on (e.g. r18, m2, m3)
+        coco_truth: The kwcoco file with the activity ground truth
+        coco_test: The kwcoco file with the activity predictions
+        out_file: The CSV file to write the results table to
+    """
+    if not grid:
+        raise click.UsageError("No parameters to sweep, see --param.")
+    if (model_file is None) == (coco_train is None):
+        raise click.UsageError(
+            "Exactly one of --model_file or --coco_train is required."
+        )
+    if coco_train is not None and coco_train.resolve() == coco_test.resolve():
+        raise click.UsageError(
+            "--coco_train must not be the test set, average activations would "
+            "be fit to the videos the sweep is scored on."
+        )
+    act_path = code_dir / "config/activity_labels/medical" / f"{medical_task}.yaml"
+    base_kwargs = dict(
+        recipe_types=[medical_task],
+        recipe_config_dict={
+            medical_task: (
+                code_dir / "config/tasks/medical" / f"{medical_task}.yaml"
+            ).as_posix()
+        },
+        activity_config_fpath=act_path.as_posix(),
+    )
+
+    dset_truth = kwcoco.CocoDataset(coco_truth)
+    dset_test = kwcoco.CocoDataset(coco_test)
+    if model_file is not None:
+        avg_probs = np.load(model_file)
+    else:
+        avg_probs = TPActivationCache(cache_dir).get_or_compute(
+            coco_train, coco_truth, act_path, coco_truth=dset_truth
+        )
+
+    gsp = GlobalStepPredictor(**base_kwargs)
+    videos = load_videos(gsp, dset_test, dset_truth)
+    num_steps = max(t.table.total_num_granular_steps for t in gsp.trackers)
+    n_configs = len(expand_grid(grid))
+    print(
+        f"Sweeping {n_configs} configuration(s) over {len(videos.video_ids)} "
+        f"video(s), writing to {out_file}"
+    )
+    run_sweep(grid, base_kwargs, avg_probs, videos, num_steps, out_file, workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Session-keyed pool of GlobalStepPredictors, for monitoring the task progress
+of several users from a single process.
+
+Each session owns a full :class:`GlobalStepPredictor` (trackers, histories),
+but the strong and weak activation counters of all sessions are stored stacked
+in two ``[max_sessions, n_acts, 2]`` arrays. Every session's
+``activated_activities`` and ``weak_activated_activities`` are views into its
+row of those arrays, so :meth:`GlobalStepPredictorPool.process_new_confidences`
+can advance the counters of many sessions in one vectorized pass, leaving only
+the (event driven) tracker update per session.
+
+Each session has its own lock. Work on one session does not block work on any
+other session, though adding, removing and processing sessions wait for the
+locks of sessions being removed or processed to be taken. Locks are always
+taken registry first, then sessions, so pool methods must not be called while
+holding a session lock.
+"""
+from contextlib import ExitStack
+from threading import RLock
+from typing import Any
+from typing import Dict
+from typing import Hashable
+from typing import List
+from typing import Mapping
+
+import numpy as np
+
+from angel_system.global_step_prediction.batch_engine import (
+    FlipMasks,
+    advance_activation_states,
+    compute_threshold_masks,
+)
+from angel_system.global_step_prediction.global_step_predictor import (
+    GlobalStepPredictor,
+)
+from angel_system.global_step_prediction.recipe_tracker import RecipeTracker
+
+
+class PredictorSession:
+    """
+    A predictor in a :class:`GlobalStepPredictorPool`, with the lock guarding
+    it.
+    """
+
+    __slots__ = ("session_id", "slot", "predictor", "lock")
+
+    def __init__(self, session_id: Hashable, slot: int, predictor: GlobalStepPredictor):
+        self.session_id = session_id
+        # Row of the pool's stacked activation arrays owned by this session.
+        self.slot = slot
+        self.predictor = predictor
+        self.lock = RLock()
+
+
+class GlobalStepPredictorPool:
+    """
+    Holds one GlobalStepPredictor per session, all sharing the same task and
+    threshold configuration.
+    """
+
+    def __init__(
+        self,
+        avg_probs: np.ndarray,
+        max_sessions: int = 64,
+        **predictor_kwargs: Any,
+    ):
+        """
+        :param avg_probs: Average true-positive activation per activity class,
+            given to every session's predictor.
+        :param max_sessions: Maximum number of concurrent sessions. Storage for
+            the activation counters of this many sessions is allocated up
+            front, so that adding sessions never moves the arrays other
+            sessions are working on.
+        :param predictor_kwargs: Keyword arguments for each session's
+            GlobalStepPredictor.
+        """
+        if max_sessions < 1:
+            raise ValueError(f"max_sessions must be positive, got {max_sessions}.")
+        self.avg_probs = np.asarray(avg_probs)
+        self.max_sessions = max_sessions
+        self.predictor_kwargs = predictor_kwargs
+
+        # Guards the session registry, not the sessions themselves.
+        self._lock = RLock()
+        self._sessions: Dict[Hashable, PredictorSession] = {}
+        self._free_slots = list(range(max_sessions - 1, -1, -1))
+        # Allocated with the first session, once the number of activities is
+        # known.
+        self._activated = None
+        self._weak_activated = None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: Hashable) -> bool:
+        return session_id in self._sessions
+
+    @property
+    def session_ids(self) -> List[Hashable]:
+        with self._lock:
+            return list(self._sessions)
+
+    def add_session(self, session_id: Hashable) -> GlobalStepPredictor:
+        """
+        Create a new predictor for the given session.
+
+        :param session_id: Key of the new session.
+
+        :returns: The session's predictor.
+        """
+        with self._lock:
+            if session_id in self._sessions:
+                raise KeyError(f"Session '{session_id}' already exists.")
+            if not self._free_slots:
+                raise RuntimeError(
+                    f"Cannot add session '{session_id}', the pool is full "
+                    f"({self.max_sessions} sessions)."
+                )
+            predictor = GlobalStepPredictor(**self.predictor_kwargs)
+            predictor.get_average_TP_activations_from_array(self.avg_probs)
+            if self._activated is None:
+                shape = (self.max_sessions,) + predictor.activated_activities.shape
+                self._activated = np.zeros(shape)
+                self._weak_activated = np.zeros(shape)
+            slot = self._free_slots.pop()
+            self._activated[slot] = predictor.activated_activities
+            self._weak_activated[slot] = predictor.weak_activated_activities
+            predictor.activated_activities = self._activated[slot]
+            predictor.weak_activated_activities = self._weak_activated[slot]
+            self._sessions[session_id] = PredictorSession(session_id, slot, predictor)
+            return predictor
+
+    def remove_session(self, session_id: Hashable) -> None:
+        """
+        Drop a session, freeing its slot for reuse.
+        """
+        with self._lock:
+            session = self._sessions.pop(session_id)
+            with session.lock:
+                # Detach the predictor from the shared storage in case it is
+                # still referenced elsewhere.
+                predictor = session.predictor
+                predictor.activated_activities = predictor.activated_activities.copy()
+                predictor.weak_activated_activities = (
+                    predictor.weak_activated_activities.copy()
+                )
+                self._activated[session.slot] = 0
+                self._weak_activated[session.slot] = 0
+            self._free_slots.append(session.slot)
+
+    def get(self, session_id: Hashable) -> GlobalStepPredictor:
+        """
+        Get the predictor of a session. Access to it should be guarded by
+        :meth:`session_lock`.
+        """
+        return self._sessions[session_id].predictor
+
+    def session_lock(self, session_id: Hashable) -> RLock:
+        """
+        Get the lock guarding a session's predictor.
+        """
+        return self._sessions[session_id].lock
+
+    def process_new_confidences(
+        self, confs_by_session: Mapping[Hashable, np.ndarray]
+    ) -> Dict[Hashable, List[RecipeTracker]]:
+        """
+        Process a block of new activity confidences for each of several
+        sessions.
+
+        Sessions given the same number of frames have their activation
+        counters advanced together in a single vectorized pass. The trackers
+        of each session are then updated from that session's activation flips.
+        The result for each session is identical to calling its predictor's
+        ``process_new_confidences_batch`` with its block.
+
+        :param confs_by_session: Mapping of session id to a ``[n_frames,
+            n_classes]`` array of confidences for that session.
+
+        :returns: Mapping of session id to that session's trackers.
+        """
+        results = {}
+        with ExitStack() as stack:
+            # The session locks are taken while holding the registry lock, as
+            # `remove_session` does, so that no session can be removed, and
+            # its slot reused, between being looked up and being locked.
+            with self._lock:
+                sessions = [self._sessions[sid] for sid in confs_by_session]
+                for session in sessions:
+                    stack.enter_context(session.lock)
+
+            by_length: Dict[int, List[PredictorSession]] = {}
+            confs = {}
+            for session in sessions:
+                block = np.asarray(confs_by_session[session.session_id], dtype=float)
+                confs[session.session_id] = block
+                by_length.setdefault(len(block), []).append(session)
+
+            for group in by_length.values():
+                flips = self._advance_activations(
+                    group, np.stack([confs[s.session_id] for s in group], axis=1)
+                )
+                for i, session in enumerate(group):
+                    results[session.session_id] = session.predictor._apply_flip_masks(
+                        FlipMasks(*(mask[:, i] for mask in flips)),
+                        confs[session.session_id],
+                    )
+        return results
+
+    def _advance_activations(
+        self, sessions: List[PredictorSession], activity_confs: np.ndarray
+    ) -> FlipMasks:
+        """
+        Advance the activation counters of several sessions at once.
+
+        :param sessions: Sessions to advance, with their locks held.
+        :param activity_confs: Confidences of shape ``[n_frames, n_sessions,
+            n_classes]``.
+
+        :returns: Flip masks of shape ``[n_frames, n_sessions, n_acts]``.
+        """
+        # All sessions share their thresholds.
+        ref = sessions[0].predictor
+        slots = np.array([s.slot for s in sessions])
+        num_activities = self._activated.shape[1]
+
+        masks = compute_threshold_masks(
+            activity_confs,
+            np.stack([s.predictor.avg_probs for s in sessions]),
+            num_activities,
+            ref.threshold_multiplier,
+            ref.deactivate_thresh_mult,
+            ref.threshold_multiplier_weak,
+            ref.deactivate_weak_thresh_mult,
+        )
+        activated = self._activated[slots]
+        weak_activated = self._weak_activated[slots]
+        active = activated[..., 0] == 1
+        count = activated[..., 1].astype(np.int64)
+        weak_active = weak_activated[..., 0] == 1
+        weak_count = weak_activated[..., 1].astype(np.int64)
+        flips = advance_activation_states(
+            masks,
+            active,
+            count,
+            weak_active,
+            weak_count,
+            ref.threshold_frame_count,
+            ref.deactivate_thresh_frame_count,
+            ref.threshold_frame_count_weak,
+            ref.deactivate_thresh_frame_count_weak,
+        )
+        self._activated[slots, :, 0] = active
+        self._activated[slots, :, 1] = count
+        self._weak_activated[slots, :, 0] = weak_active
+        self._weak_activated[slots, :, 1] = weak_count
+        return flips
@@ -0,0 +1,192 @@
+"""
+Compiled recipe tables and tracker state for the GlobalStepPredictor.
+
+A :class:`RecipeTable` is built once per recipe configuration and holds the
+step structure of that recipe as integer arrays, so that step/activity
+conversions in the predictor's hot loop are O(1) array lookups.
+
+A :class:`RecipeTracker` holds the mutable state of one tracker instance. It
+also acts as a read-only mapping using the key names of the original tracker
+dictionaries (e.g. ``tracker["current_granular_step"]``), so that consumers
+such as the ROS task monitoring node can keep treating trackers as dicts.
+"""
+from collections.abc import Mapping
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+import numpy as np
+
+from angel_system.utils.history_buffer import HistoryBuffer
+
+
+class RecipeTable:
+    """
+    Immutable, array-backed step structure of a single recipe.
+    """
+
+    __slots__ = (
+        "recipe",
+        "broad_steps",
+        "broad_step_to_activity_ids",
+        "broad_step_to_label",
+        "broad_step_to_full_str",
+        "last_granular_step_per_broad_step",
+        "granular_step_to_activity_id",
+        "granular_step_to_broad_step",
+        "granular_step_to_full_str",
+        "total_num_broad_steps",
+        "total_num_granular_steps",
+    )
+
+    def __init__(
+        self,
+        recipe: str,
+        broad_steps: List[Dict[str, Any]],
+        broad_step_to_activity_ids: List[List[int]],
+        last_granular_step_per_broad_step: List[int],
+        granular_step_to_activity_id: Sequence[int],
+        granular_step_to_full_str: List[str],
+    ):
+        """
+        :param recipe: Name of the recipe.
+        :param broad_steps: Broad step entries from the recipe config, with
+            the background step at index 0.
+        :param broad_step_to_activity_ids: Unique activity ids, in order, for
+            each broad step.
+        :param last_granular_step_per_broad_step: Index of the last granular
+            step of each broad step.
+        :param granular_step_to_activity_id: Activity id of each granular step.
+        :param granular_step_to_full_str: Activity description of each
+            granular step.
+        """
+        self.recipe = recipe
+        self.broad_steps = broad_steps
+        self.broad_step_to_activity_ids = broad_step_to_activity_ids
+        self.broad_step_to_label = [step["label"] for step in broad_steps]
+        self.broad_step_to_full_str = [step["full_str"] for step in broad_steps]
+        self.last_granular_step_per_broad_step = last_granular_step_per_broad_step
+        self.granular_step_to_activity_id = np.asarray(
+            granular_step_to_activity_id, dtype=np.int64
+        )
+        self.granular_step_to_full_str = granular_step_to_full_str
+        self.total_num_broad_steps = len(broad_steps)
+        self.total_num_granular_steps = len(self.granular_step_to_activity_id)
+        # A granular step belongs to the broad step given by the number of
+        # broad steps that end strictly before it.
+        self.granular_step_to_broad_step = np.count_nonzero(
+            np.asarray(last_granular_step_per_broad_step)[None, :]
+            < np.arange(self.total_num_granular_steps)[:, None],
+            axis=1,
+        ).astype(np.int64)
+
+
+class RecipeTracker(Mapping):
+    """
+    Mutable state of one recipe tracker, referencing its compiled
+    :class:`RecipeTable`.
+
+    Tracker state is accessed as attributes by the predictor. For
+    compatibility, the tracker may also be read like the tracker dictionaries
+    it replaces; see :data:`RecipeTracker.KEYS`.
+    """
+
+    __slots__ = (
+        "table",
+        "current_broad_step",
+        "current_granular_step",
+        "active",
+        "can_skip",
+        "skipped_granular_steps",
+        "broad_step_prediction_buffer",
+        "granular_step_prediction_buffer",
+    )
+
+    # Keys of the dictionary view, in the order of the original tracker dicts.
+    KEYS = (
+        "last_granular_step_per_broad_step",
+        "recipe",
+        "current_broad_step",
+        "current_granular_step",
+        "total_num_broad_steps",
+        "total_num_granular_steps",
+        "skipped_granular_steps",
+        "broad_step_to_activity_ids",
+        "granular_step_to_activity_id",
+        "broad_step_to_label",
+        "broad_step_to_full_str",
+        "granular_step_to_full_str",
+        "broad_step_prediction_history",
+        "granular_step_prediction_history",
+        "active",
+        "broad_steps",
+        "can_skip",
+    )
+    # Keys that may be assigned through the dictionary view.
+    MUTABLE_KEYS = frozenset(
+        ["current_broad_step", "current_granular_step", "active", "can_skip"]
+    )
+
+    def __init__(self, table: RecipeTable, history_max_len: Optional[int] = None):
+        """
+        :param table: Compiled recipe this tracker follows.
+        :param history_max_len: Optional maximum number of most recent frames
+            of step prediction history to retain.
+        """
+        self.table = table
+        self.current_broad_step = 0
+        self.current_granular_step = 0
+        self.active = True
+        self.can_skip = False
+        self.skipped_granular_steps: List[int] = []
+        self.broad_step_prediction_buffer = HistoryBuffer(max_len=history_max_len)
+        self.granular_step_prediction_buffer = HistoryBuffer(max_len=history_max_len)
+
+    @property
+    def recipe(self) -> str:
+        return self.table.recipe
+
+    @property
+    def broad_step_prediction_history(self) -> np.ndarray:
+        return self.broad_step_prediction_buffer.view()
+
+    @property
+    def granular_step_prediction_history(self) -> np.ndarray:
+        return self.granular_step_prediction_buffer.view()
+
+    @property
+    def is_on_last_step(self) -> bool:
+        return self.current_granular_step == self.table.total_num_granular_steps - 1
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.KEYS:
+            raise KeyError(key)
+        if hasattr(RecipeTracker, key):
+            return getattr(self, key)
+        return getattr(self.table, key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in self.MUTABLE_KEYS:
+            raise KeyError(f"Tracker key '{key}' cannot be assigned.")
+        setattr(self, key, value)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.KEYS)
+
+    def __len__(self) -> int:
+        return len(self.KEYS)
+
+    # Trackers are stateful objects, compare them by identity rather than by
+    # the Mapping contents (which contain arrays).
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(recipe={self.recipe!r}, "
+            f"current_granular_step={self.current_granular_step}, "
+            f"current_broad_step={self.current_broad_step}, active={self.active})"
+        )
@@ -13,6 +13,10 @@ from sklearn.metrics import confusion_matrix
 from angel_system.global_step_prediction.global_step_predictor import (
     GlobalStepPredictor,
 )
+from angel_system.global_step_prediction.tp_activation_cache import (
+    DEFAULT_CACHE_DIR,
+    TPActivationCache,
+)
 
 
 def run_inference_all_vids(
@@ -24,6 +28,7 @@ def run_inference_all_vids(
     medical_task="r18",
     code_dir=Path("."),
     out_file=Path("./confusion_mat_gsp.png"),
+    cache_dir=DEFAULT_CACHE_DIR,
 ) -> None:
     """
     Run inference on all data in the train set
@@ -53,9 +58,15 @@ def run_inference_all_vids(
         if avg_probs is not None:
             step_predictor.get_average_TP_activations_from_array(avg_probs)
         else:
-            avg_probs = step_predictor.compute_average_TP_activations(
-                coco_train, coco_test
+            # Only computed if not cached for these exact inputs before.
+            avg_probs = TPActivationCache(cache_dir).get_or_compute(
+                coco_train.fpath,
+                coco_test.fpath,
+                act_path,
+                coco_preds=coco_train,
+                coco_truth=coco_test,
             )
+            step_predictor.get_average_TP_activations_from_array(avg_probs)
             save_file = (
                 code_dir
                 / "model_files"
@@ -86,7 +97,7 @@ def run_inference_all_vids(
 
         print(f"unique activities: {get_unique(activity_gts)}")
 
-        step_predictor.process_new_confidences(activity_confs)
+        step_predictor.process_new_confidences_batch(activity_confs)
 
         recipe_type = step_predictor.determine_recipe_from_gt_first_activity(
             activity_gts
@@ -154,6 +165,12 @@ def run_inference_all_vids(
     default="./confusion_mat_gsp.png",
     help="The path to where to save the output file",
 )
+@click.option(
+    "--cache_dir",
+    type=click.Path(file_okay=False, resolve_path=True, path_type=Path),
+    default=DEFAULT_CACHE_DIR,
+    help="Directory caching average activations computed for given inputs",
+)
 def run_expirement(
     medical_task: str,
     coco_truth: Path,
@@ -161,6 +178,7 @@ def run_expirement(
     coco_test: Path,
     code_dir: Path,
     out_file: Path,
+    cache_dir: Path,
 ) -> None:
     """
     Runs the experiment for the given medical task
@@ -176,6 +194,7 @@ def run_expirement(
     Optional Arguments:
         code_dir: Path: The path to the code directory
         out_file: Path: The path to where to save the output file
+        cache_dir: Path: Directory caching computed average activations
     """
     recipe_config = {f"{medical_task}": f"config/tasks/medical/{medical_task}.yaml"}
 
@@ -193,6 +212,7 @@ def run_expirement(
         medical_task=medical_task,
         code_dir=code_dir,
         out_file=out_file,
+        cache_dir=cache_dir,
     )
 
 
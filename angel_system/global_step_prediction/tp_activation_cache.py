@@ -0,0 +1,179 @@
+"""
+Content-addressed on-disk cache of average true positive activation profiles
+(see ``compute_average_TP_activations``).
+
+Profiles are keyed by the SHA-256 of the prediction and truth kwcoco files and
+of the activity config they were computed for, so they are recomputed only
+when one of those inputs changes, regardless of file names or locations.
+Cached profiles are loaded memory-mapped.
+
+File digests are themselves remembered, by path, size and modification time,
+so that a cache hit does not need to re-read large kwcoco files.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from threading import RLock
+from typing import Dict
+from typing import Optional
+from typing import Union
+
+import kwcoco
+import numpy as np
+
+from angel_system.global_step_prediction.global_step_predictor import (
+    compute_average_TP_activations,
+)
+
+
+# Bump when the computation of the profiles changes, invalidating old entries.
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = Path("~/.cache/angel_system/tp_activations").expanduser()
+
+PathLike = Union[str, Path]
+
+
+def file_digest(fpath: PathLike, chunk_size: int = 1 << 20) -> str:
+    """
+    SHA-256 hex digest of a file's contents.
+    """
+    h = hashlib.sha256()
+    with open(fpath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class TPActivationCache:
+    """
+    Cache of average true positive activation profiles in a directory.
+
+    >>> import tempfile
+    >>> cache = TPActivationCache(tempfile.mkdtemp())
+    >>> key = "0" * 64
+    >>> cache.load(key) is None
+    True
+    >>> cache.save(key, np.array([0.5, 0.25]))
+    >>> cache.load(key)
+    memmap([0.5 , 0.25])
+    """
+
+    DIGESTS_FNAME = "file_digests.json"
+
+    def __init__(self, cache_dir: PathLike = DEFAULT_CACHE_DIR):
+        """
+        :param cache_dir: Directory holding the cached profiles. Created if it
+            does not exist.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = RLock()
+        self._digests = self._load_digests()
+
+    def path_for(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npy"
+
+    def digest(self, fpath: PathLike) -> str:
+        """
+        Content digest of a file, reusing the remembered digest if the file's
+        size and modification time have not changed.
+        """
+        fpath = Path(fpath).resolve()
+        stat = fpath.stat()
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        with self._lock:
+            entry = self._digests.get(fpath.as_posix())
+            if entry is not None and entry["stamp"] == stamp:
+                return entry["sha256"]
+            digest = file_digest(fpath)
+            self._digests[fpath.as_posix()] = {"stamp": stamp, "sha256": digest}
+            self._save_digests()
+            return digest
+
+    def key(
+        self,
+        preds_fpath: PathLike,
+        truth_fpath: PathLike,
+        activity_config_fpath: PathLike,
+    ) -> str:
+        """
+        Cache key of the profile computed from the given inputs.
+        """
+        h = hashlib.sha256(f"tp_activations_v{CACHE_VERSION}".encode())
+        for fpath in (preds_fpath, truth_fpath, activity_config_fpath):
+            h.update(self.digest(fpath).encode())
+        return h.hexdigest()
+
+    def load(self, key: str) -> Optional[np.ndarray]:
+        """
+        Load a cached profile, memory-mapped read-only.
+
+        :returns: The profile, or None if it is not cached.
+        """
+        path = self.path_for(key)
+        if not path.is_file():
+            return None
+        return np.load(path, mmap_mode="r")
+
+    def save(self, key: str, avg_probs: np.ndarray) -> None:
+        """
+        Store a profile. The file appears atomically, so concurrent readers
+        never see a partial profile.
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".npy.tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.asarray(avg_probs, dtype=float))
+            os.replace(tmp, self.path_for(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def get_or_compute(
+        self,
+        preds_fpath: PathLike,
+        truth_fpath: PathLike,
+        activity_config_fpath: PathLike,
+        coco_preds: Optional[kwcoco.CocoDataset] = None,
+        coco_truth: Optional[kwcoco.CocoDataset] = None,
+    ) -> np.ndarray:
+        """
+        Get the profile for the given inputs, computing and caching it on a
+        miss.
+
+        :param preds_fpath: Path to the prediction kwcoco file.
+        :param truth_fpath: Path to the ground truth kwcoco file.
+        :param activity_config_fpath: Path to the activity label config.
+        :param coco_preds: Optional already loaded ``preds_fpath`` dataset,
+            used on a miss instead of loading it.
+        :param coco_truth: Optional already loaded ``truth_fpath`` dataset.
+
+        :returns: Read-only, memory-mapped average true positive activations.
+        """
+        key = self.key(preds_fpath, truth_fpath, activity_config_fpath)
+        avg_probs = self.load(key)
+        if avg_probs is not None:
+            return avg_probs
+        if coco_preds is None:
+            coco_preds = kwcoco.CocoDataset(preds_fpath)
+        if coco_truth is None:
+            coco_truth = kwcoco.CocoDataset(truth_fpath)
+        self.save(key, compute_average_TP_activations(coco_preds, coco_truth))
+        return self.load(key)
+
+    def _load_digests(self) -> Dict[str, Dict]:
+        path = self.cache_dir / self.DIGESTS_FNAME
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Missing or corrupt, digests will be recomputed.
+            return {}
+
+    def _save_digests(self) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".json.tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self._digests, f)
+        os.replace(tmp, self.cache_dir / self.DIGESTS_FNAME)
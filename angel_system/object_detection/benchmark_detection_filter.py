@@ -0,0 +1,154 @@
+"""
+Benchmark filtering the detections of a frame by label white-list, comparing
+per-detection label string lookups against the vectorized class mask of
+``detection_filter``.
+
+Detections are held in ``array.array`` fields, as in ROS
+``ObjectDetection2dSet`` messages.
+
+Example::
+
+    python -m angel_system.object_detection.benchmark_detection_filter \\
+        --num-detections 300 --num-detections 1000 --max-per-class 3
+"""
+import array
+import time
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Set
+
+import click
+import numpy as np
+
+from angel_system.object_detection.detection_filter import class_mask
+from angel_system.object_detection.detection_filter import select_detections
+
+
+def make_frame(
+    rng: np.random.Generator, n_dets: int, n_classes: int
+) -> Dict[str, array.array]:
+    """
+    Make the detection fields of a frame, with one non-zero confidence per
+    detection as from the object detector.
+    """
+    conf_mat = np.zeros((n_dets, n_classes))
+    conf_mat[np.arange(n_dets), rng.integers(0, n_classes, n_dets)] = rng.random(n_dets)
+    frame = {
+        k: array.array("f", rng.random(n_dets).astype(np.float32).tobytes())
+        for k in ("left", "right", "top", "bottom")
+    }
+    frame["label_confidences"] = array.array("d", conf_mat.tobytes())
+    return frame
+
+
+def filter_per_detection(
+    frame: Dict[str, array.array], label_vec: List[str], whitelist: Set[str]
+) -> Dict[str, list]:
+    """
+    Filter as by looking up the label string of each detection, and slicing
+    through Python lists.
+    """
+    n_classes = len(label_vec)
+    conf_mat = np.asarray(frame["label_confidences"]).reshape(-1, n_classes)
+    max_labels = np.asarray(label_vec)[conf_mat.argmax(axis=1)]
+    det_indices = []
+    for det_i, max_label in enumerate(max_labels):
+        if max_label in whitelist:
+            det_indices.append(det_i)
+    ret = {
+        k: np.asarray(frame[k])[det_indices].tolist()
+        for k in ("left", "right", "top", "bottom")
+    }
+    ret["label_confidences"] = conf_mat[det_indices, :].ravel().tolist()
+    return ret
+
+
+def filter_vectorized(
+    frame: Dict[str, array.array],
+    n_classes: int,
+    classes: np.ndarray,
+    conf_threshold: float,
+    max_per_class: int,
+) -> Dict[str, array.array]:
+    """
+    Filter with a precomputed class mask and boolean indexing, writing back
+    into ``array.array`` buffers.
+    """
+    conf_mat = np.asarray(frame["label_confidences"]).reshape(-1, n_classes)
+    class_idxs = conf_mat.argmax(axis=1)
+    confs = conf_mat[np.arange(len(class_idxs)), class_idxs]
+    keep = select_detections(class_idxs, confs, classes, conf_threshold, max_per_class)
+    ret = {}
+    for k in ("left", "right", "top", "bottom"):
+        ret[k] = array.array("f")
+        ret[k].frombytes(np.asarray(frame[k])[keep].tobytes())
+    ret["label_confidences"] = array.array("d")
+    ret["label_confidences"].frombytes(conf_mat[keep].tobytes())
+    return ret
+
+
+def time_us(fn: Callable[[], object], n_iters: int) -> float:
+    """
+    Mean latency of a function over some calls, in microseconds.
+    """
+    s = time.perf_counter()
+    for _ in range(n_iters):
+        fn()
+    return 1e6 * (time.perf_counter() - s) / n_iters
+
+
+@click.command(context_settings={"help_option_names": ["-h", "--help"]})
+@click.option(
+    "--num-detections",
+    "n_dets_list",
+    type=int,
+    multiple=True,
+    default=(100, 300, 1000),
+    show_default=True,
+    help="Numbers of detections per frame to benchmark.",
+)
+@click.option("--num-classes", type=int, default=40, show_default=True)
+@click.option(
+    "--whitelist-fraction",
+    type=float,
+    default=0.5,
+    show_default=True,
+    help="Fraction of the labels in the white-list.",
+)
+@click.option("--conf-threshold", type=float, default=0.0, show_default=True)
+@click.option("--max-per-class", type=int, default=0, show_default=True)
+@click.option("--iters", type=int, default=1000, show_default=True)
+def main(
+    n_dets_list: List[int],
+    num_classes: int,
+    whitelist_fraction: float,
+    conf_threshold: float,
+    max_per_class: int,
+    iters: int,
+):
+    """
+    Compare per-detection and vectorized detection filtering latency.
+    """
+    rng = np.random.default_rng(0)
+    label_vec = [f"label_{i}" for i in range(num_classes)]
+    whitelist = set(label_vec[: int(num_classes * whitelist_fraction)])
+    classes = class_mask(label_vec, whitelist)
+
+    print(f"{'dets':>6} {'per-det (us)':>13} {'vectorized (us)':>16} {'speedup':>8}")
+    for n_dets in n_dets_list:
+        frame = make_frame(rng, n_dets, num_classes)
+        t_base = time_us(
+            lambda: filter_per_detection(frame, label_vec, whitelist), iters
+        )
+        t_vec = time_us(
+            lambda: filter_vectorized(
+                frame, num_classes, classes, conf_threshold, max_per_class
+            ),
+            iters,
+        )
+        print(f"{n_dets:>6} {t_base:>13.1f} {t_vec:>16.1f} {t_base / t_vec:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmark the per-frame latency of object and hand detection on CPU when the
+two models run back to back versus concurrently, with the torch intra-op
+threads partitioned between them.
+
+Example::
+
+    python -m angel_system.object_detection.benchmark_object_and_hand \\
+        --model-objects model_files/object_det_model.pt \\
+        --model-hands model_files/hands_model.pt \\
+        --threads 8
+"""
+import time
+from pathlib import Path
+from typing import Callable
+from typing import Optional
+
+import click
+import cv2
+import numpy as np
+import torch
+from ultralytics import YOLO as YOLOv8
+from yolov7.detect_ptg import load_model
+
+from angel_system.object_detection.object_and_hand_predictor import (
+    ObjectAndHandPredictor,
+)
+from angel_system.object_detection.yolov7_batch import letterbox_images
+from angel_system.object_detection.yolov7_batch import predict_images
+from angel_system.object_detection.yolov8_detect import predict_hands_batch
+
+
+def time_frames(fn: Callable[[], object], n_frames: int, n_warmup: int) -> np.ndarray:
+    """
+    Time repeated calls of a function.
+
+    :returns: Latency of each timed call in milliseconds.
+    """
+    for _ in range(n_warmup):
+        fn()
+    latencies = np.empty(n_frames)
+    for i in range(n_frames):
+        s = time.perf_counter()
+        fn()
+        latencies[i] = 1e3 * (time.perf_counter() - s)
+    return latencies
+
+
+@click.command(context_settings={"help_option_names": ["-h", "--help"]})
+@click.option(
+    "--model-objects",
+    "objs_model_ckpt",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    required=True,
+    help="Model checkpoint for the Yolo v7 object detector.",
+)
+@click.option(
+    "--model-hands",
+    "hand_model_ckpt",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    required=True,
+    help="Model checkpoint for the Yolo v8 hand detector.",
+)
+@click.option(
+    "--image",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="Image to detect over. A random 1280x720 image by default.",
+)
+@click.option(
+    "--img-size",
+    type=int,
+    default=768,
+    show_default=True,
+    help="Inference size of both models.",
+)
+@click.option(
+    "--threads",
+    type=int,
+    default=0,
+    show_default=True,
+    help="Total torch intra-op threads. 0 for the torch default.",
+)
+@click.option("--n-frames", type=int, default=50, show_default=True)
+@click.option("--n-warmup", type=int, default=5, show_default=True)
+def main(
+    objs_model_ckpt: Path,
+    hand_model_ckpt: Path,
+    image: Optional[Path],
+    img_size: int,
+    threads: int,
+    n_frames: int,
+    n_warmup: int,
+):
+    """
+    Compare sequential and concurrent object and hand detection on CPU.
+
+    Each model is also timed alone. Concurrent latency should approach the
+    larger of the two rather than their sum.
+    """
+    if threads:
+        torch.set_num_threads(threads)
+    threads = torch.get_num_threads()
+
+    device, object_model, stride, imgsz = load_model("cpu", objs_model_ckpt, img_size)
+    hand_model = YOLOv8(hand_model_ckpt, task="detect")
+    if image is not None:
+        img0 = cv2.imread(image.as_posix())
+    else:
+        img0 = np.random.default_rng(0).integers(0, 255, (720, 1280, 3), np.uint8)
+    imgs0 = [img0]
+
+    def make_predictor(concurrent: bool) -> ObjectAndHandPredictor:
+        return ObjectAndHandPredictor(
+            object_model,
+            device,
+            stride,
+            imgsz,
+            False,
+            0.2,
+            0.35,
+            False,
+            hand_model,
+            img_size,
+            concurrent=concurrent,
+        )
+
+    sequential = make_predictor(False)
+    concurrent = make_predictor(True)
+    print(
+        f"{threads} torch threads, letterbox shared: "
+        f"{sequential.can_share_letterbox(letterbox_images(imgs0, imgsz, stride))}"
+    )
+
+    cases = {
+        "objects": lambda: predict_images(
+            imgs0,
+            device,
+            object_model,
+            stride,
+            imgsz,
+            False,
+            False,
+            0.2,
+            0.35,
+            None,
+            False,
+        ),
+        "hands": lambda: predict_hands_batch(hand_model, imgs0, device, imgsz=img_size),
+        "sequential": lambda: sequential.predict(imgs0),
+        "concurrent": lambda: concurrent.predict(imgs0),
+    }
+
+    print(f"{'mode':>12} {'mean (ms)':>10} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+    for name, fn in cases.items():
+        lat = time_frames(fn, n_frames, n_warmup)
+        print(
+            f"{name:>12} {lat.mean():>10.1f} {np.percentile(lat, 50):>9.1f} "
+            f"{np.percentile(lat, 95):>9.1f}"
+        )
+    concurrent.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+On-disk cache of raw detection model outputs, for reprocessing the same
+images with different post-processing without running the model again.
+
+Entries are keyed by a hash of the image file content, under a directory
+keyed by a hash of the model checkpoint content and the inference settings.
+Each entry stores the boxes, scores and classes of an image as separate
+arrays, with all detections down to a low confidence floor, so thresholds
+above that floor can be applied after the fact.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+from typing import Any
+from typing import Dict
+from typing import NamedTuple
+from typing import Optional
+from typing import Union
+
+import numpy as np
+import numpy.typing as npt
+
+
+# Bytes read at once when hashing files.
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def hash_bytes(data: bytes) -> str:
+    """
+    Hex digest identifying some content, e.g. that of an image file.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: Union[str, Path]) -> str:
+    """
+    Hex digest of a file's content, as :func:`hash_bytes` would give.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class CachedDetections(NamedTuple):
+    """
+    Detections of one image, as columns.
+    """
+
+    # Boxes in xyxy format, of shape [n, 4].
+    xyxy: npt.NDArray[np.float32]
+    # Confidence of each box, of shape [n].
+    scores: npt.NDArray[np.float32]
+    # Class index of each box, of shape [n].
+    classes: npt.NDArray[np.int32]
+
+    @classmethod
+    def from_arrays(
+        cls, xyxy: npt.ArrayLike, scores: npt.ArrayLike, classes: npt.ArrayLike
+    ) -> "CachedDetections":
+        return cls(
+            np.asarray(xyxy, dtype=np.float32).reshape(-1, 4),
+            np.asarray(scores, dtype=np.float32).reshape(-1),
+            np.asarray(classes, dtype=np.int32).reshape(-1),
+        )
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def select(self, conf_threshold: float) -> "CachedDetections":
+        """
+        Get the detections with a score of at least some threshold.
+        """
+        keep = self.scores >= conf_threshold
+        return CachedDetections(self.xyxy[keep], self.scores[keep], self.classes[keep])
+
+
+class DetectionCache:
+    """
+    Cache of the detections of one model with fixed inference settings.
+
+    Entries are written atomically, one file per image, so several processes
+    may share a cache directory.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], model_key: str):
+        """
+        :param cache_dir: Root directory of the cache, shared between models.
+        :param model_key: Key of the model and its settings, as from
+            :meth:`make_model_key`.
+        """
+        self.dpath = Path(cache_dir) / model_key
+        self.dpath.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def make_model_key(ckpt_path: Union[str, Path], **settings: Any) -> str:
+        """
+        Make a key from the content of a model checkpoint file and the
+        settings that change its outputs, e.g. inference size and confidence
+        floor.
+
+        :param ckpt_path: Path to the model checkpoint file.
+        :param settings: JSON serializable settings.
+        """
+        desc = json.dumps(
+            {"checkpoint": hash_file(ckpt_path), **settings}, sort_keys=True
+        )
+        return hash_bytes(desc.encode())[:32]
+
+    def _entry_path(self, image_hash: str) -> Path:
+        # Two levels, so directories don't grow to a whole dataset of files.
+        return self.dpath / image_hash[:2] / f"{image_hash}.npz"
+
+    def __contains__(self, image_hash: str) -> bool:
+        return self._entry_path(image_hash).is_file()
+
+    def get(self, image_hash: str) -> Optional[CachedDetections]:
+        """
+        Get the cached detections of an image, if any.
+
+        :param image_hash: Hash of the image file content, as from
+            :func:`hash_bytes`.
+        """
+        path = self._entry_path(image_hash)
+        try:
+            with np.load(path) as npz:
+                dets = CachedDetections(npz["xyxy"], npz["scores"], npz["classes"])
+        except FileNotFoundError:
+            with self._stats_lock:
+                self.misses += 1
+            return None
+        with self._stats_lock:
+            self.hits += 1
+        return dets
+
+    def put(self, image_hash: str, dets: CachedDetections) -> None:
+        """
+        Cache the detections of an image.
+
+        :param image_hash: Hash of the image file content, as from
+            :func:`hash_bytes`.
+        :param dets: Detections, with nothing thresholded above the
+            confidence floor of the cache.
+        """
+        path = self._entry_path(image_hash)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_name(f".{path.stem}.{os.getpid()}.tmp.npz")
+        np.savez(tmp_path, **dets._asdict())
+        os.replace(tmp_path, path)
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,71 @@
+"""
+Vectorized selection of object detections by class, confidence and per-class
+count.
+"""
+from typing import Iterable
+from typing import Optional
+from typing import Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+
+def class_mask(label_vec: Sequence[str], labels: Iterable[str]) -> npt.NDArray[bool]:
+    """
+    Make a boolean mask over a label vector of the labels in a set.
+
+    >>> class_mask(["a", "b", "c"], {"c", "a", "z"}).tolist()
+    [True, False, True]
+
+    :param label_vec: Labels, as indexed by detection class indices.
+    :param labels: Labels to mask as ``True``.
+
+    :returns: Mask of the same length as ``label_vec``.
+    """
+    labels = set(labels)
+    return np.fromiter((lbl in labels for lbl in label_vec), bool, len(label_vec))
+
+
+def select_detections(
+    class_idxs: npt.ArrayLike,
+    confs: npt.ArrayLike,
+    classes: Optional[npt.NDArray[bool]] = None,
+    conf_threshold: float = 0.0,
+    max_per_class: int = 0,
+) -> npt.NDArray[bool]:
+    """
+    Select detections by their most confident class and its confidence, in a
+    single pass over the detections.
+
+    :param class_idxs: Index of the most confident class of each detection.
+    :param confs: Confidence of the most confident class of each detection.
+    :param classes: Optional boolean mask, as from :func:`class_mask`, of the
+        class indices to keep detections of.
+    :param conf_threshold: Keep only detections with a confidence of at least
+        this.
+    :param max_per_class: If positive, keep at most this many of the most
+        confident detections of each class, after the other criteria. Of equal
+        confidences, earlier detections are kept.
+
+    :returns: Boolean mask of the detections to keep.
+    """
+    class_idxs = np.asarray(class_idxs, dtype=np.intp)
+    confs = np.asarray(confs)
+    keep = np.ones(class_idxs.shape, dtype=bool)
+    if classes is not None:
+        keep &= classes[class_idxs]
+    if conf_threshold > 0:
+        keep &= confs >= conf_threshold
+    if max_per_class > 0 and keep.any():
+        kept = np.flatnonzero(keep)
+        # Order kept detections by class, then by descending confidence.
+        order = kept[np.lexsort((-confs[kept], class_idxs[kept]))]
+        sorted_classes = class_idxs[order]
+        # Rank of each detection within its class, from the start of its run.
+        run_starts = np.flatnonzero(
+            np.r_[True, sorted_classes[1:] != sorted_classes[:-1]]
+        )
+        run_lengths = np.diff(np.r_[run_starts, len(order)])
+        ranks = np.arange(len(order)) - np.repeat(run_starts, run_lengths)
+        keep[order[ranks >= max_per_class]] = False
+    return keep
@@ -0,0 +1,160 @@
+"""
+Resumable, sharded storage of offline detection results.
+
+Detecting over a whole dataset is split by video across processes, or
+"shards". As each video is finished, its annotations are written to a part
+file of its own in a shared work directory, so an interrupted shard resumes
+by skipping the videos that already have a part file. Once every video has
+a part file, the parts are merged into a single kwcoco dataset, which any
+shard finding no parts missing may do.
+"""
+import heapq
+import json
+import os
+from pathlib import Path
+from typing import Dict
+from typing import Hashable
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import kwcoco
+
+
+def shard_video_ids(
+    video_sizes: Dict[Hashable, int], num_shards: int, shard_index: int
+) -> List[Hashable]:
+    """
+    Get the videos a shard is to process, balancing the number of images
+    between shards.
+
+    Videos are assigned, largest first, to the shard with the fewest images
+    so far. This is deterministic for the same input, so every process
+    derives the same assignment independently.
+
+    >>> sizes = {1: 100, 2: 60, 3: 50, 4: 10}
+    >>> shard_video_ids(sizes, 2, 0), shard_video_ids(sizes, 2, 1)
+    ([1, 4], [2, 3])
+
+    :param video_sizes: Number of images of each video.
+    :param num_shards: Total number of shards.
+    :param shard_index: Index of the shard, in ``[0, num_shards)``.
+
+    :returns: Video IDs of the shard, in the order they were assigned.
+    """
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(
+            f"Shard index {shard_index} is out of range for {num_shards} shards."
+        )
+    # Sort on the string of IDs as a tie-breaker, as these may be None.
+    order = sorted(video_sizes, key=lambda v: (-video_sizes[v], str(v)))
+    # Heap of (number of images, shard index).
+    loads: List[Tuple[int, int]] = [(0, i) for i in range(num_shards)]
+    ret = []
+    for vid in order:
+        load, i = heapq.heappop(loads)
+        if i == shard_index:
+            ret.append(vid)
+        heapq.heappush(loads, (load + video_sizes[vid], i))
+    return ret
+
+
+def part_path(work_dir: Path, video_id: Optional[Hashable]) -> Path:
+    """
+    Path of the part file of a video's results.
+
+    :param work_dir: Directory shared by all shards.
+    :param video_id: ID of the video, or None for images not in a video.
+    """
+    return work_dir / f"video_{video_id}.json"
+
+
+def write_part(
+    path: Path, categories: Sequence[dict], annotations: Sequence[dict]
+) -> None:
+    """
+    Write the results of a video to a part file.
+
+    The file is written to a temporary path first and then moved into place,
+    so a part file only exists once it is complete.
+
+    :param path: Part file path, as from :func:`part_path`.
+    :param categories: kwcoco categories annotations may refer to.
+    :param annotations: kwcoco annotations of the video's images, without
+        IDs.
+    """
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"categories": categories, "annotations": annotations}, f)
+    os.replace(tmp_path, path)
+
+
+def missing_parts(work_dir: Path, video_ids: Iterable[Hashable]) -> List[Hashable]:
+    """
+    Get the videos that do not have a part file yet.
+    """
+    return [vid for vid in video_ids if not part_path(work_dir, vid).is_file()]
+
+
+def merge_parts(
+    guiding_dset: kwcoco.CocoDataset,
+    work_dir: Path,
+    video_ids: Iterable[Hashable],
+) -> kwcoco.CocoDataset:
+    """
+    Merge the part files of videos into a new dataset with the videos and
+    images of the guiding dataset.
+
+    Categories are those of the part files, matched by name and ID.
+    Annotations are given new IDs, in video order.
+
+    :param guiding_dset: Dataset detections were made for.
+    :param work_dir: Directory of the part files.
+    :param video_ids: Videos to merge the part files of.
+
+    :raises FileNotFoundError: A video does not have a part file.
+    """
+    dset = kwcoco.CocoDataset()
+    dset.dataset["videos"] = guiding_dset.dataset["videos"]
+    dset.dataset["images"] = guiding_dset.dataset["images"]
+    categories: Dict[int, dict] = {}
+    annotations = []
+    for vid in video_ids:
+        with open(part_path(work_dir, vid)) as f:
+            part = json.load(f)
+        for cat in part["categories"]:
+            prev = categories.setdefault(cat["id"], cat)
+            if prev["name"] != cat["name"]:
+                raise ValueError(
+                    f"Category {cat['id']} is named both \"{prev['name']}\" "
+                    f"and \"{cat['name']}\" in different parts."
+                )
+        annotations.extend(part["annotations"])
+    for i, ann in enumerate(annotations, start=1):
+        ann["id"] = i
+    dset.dataset["categories"] = [categories[k] for k in sorted(categories)]
+    dset.dataset["annotations"] = annotations
+    dset.index.build(dset)
+    return dset
+
+
+def write_merged(dset: kwcoco.CocoDataset, path: Path) -> None:
+    """
+    Write a merged dataset to its output path.
+
+    As with part files, the dataset is written to a temporary path first and
+    then moved into place. Shards that finish at the same time may then both
+    merge and write the same results without corrupting the output file.
+
+    :param dset: Dataset as from :func:`merge_parts`.
+    :param path: Output kwcoco file path.
+    """
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        dset.dump(tmp_path.as_posix(), newlines=True)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
@@ -0,0 +1,160 @@
+"""
+Joint object and hand detection over batches of images, with the YOLO v7
+object model and the YOLO v8 hand model run either back to back or
+concurrently.
+"""
+from functools import partial
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+import torch
+from ultralytics import YOLO as YOLOv8
+
+from angel_system.object_detection.yolov7_batch import Detections
+from angel_system.object_detection.yolov7_batch import letterbox_images
+from angel_system.object_detection.yolov7_batch import predict_images
+from angel_system.object_detection.yolov8_detect import predict_hands_batch
+from angel_system.utils.concurrent_runner import ConcurrentRunner
+from angel_system.utils.concurrent_runner import partition_threads
+
+
+class ObjectAndHandPredictor:
+    """
+    Run an object model and a hand model over the same images.
+
+    In concurrent mode the two models run side by side on dedicated threads,
+    so the latency of a batch approaches that of the slower model rather than
+    the sum of both. On CPU, the torch intra-op threads are partitioned
+    between the two models so they do not oversubscribe the cores.
+
+    When the hand model input size and stride are compatible with those of
+    the object model, images are letterboxed once and the result is given to
+    both models.
+    """
+
+    def __init__(
+        self,
+        object_model: torch.nn.Module,
+        device: torch.device,
+        stride: int,
+        imgsz: int,
+        half: bool,
+        det_conf_threshold: float,
+        iou_threshold: float,
+        agnostic_nms: bool,
+        hand_model: YOLOv8,
+        hand_imgsz: int,
+        concurrent: bool = False,
+        object_threads: int = 0,
+        hand_threads: int = 0,
+    ):
+        """
+        :param object_model: YOLO v7 object model, as from
+            ``yolov7.detect_ptg.load_model``.
+        :param device: Device the models are on.
+        :param stride: Object model stride.
+        :param imgsz: Object model input size.
+        :param half: If the object model uses half precision.
+        :param det_conf_threshold: Object confidence threshold.
+        :param iou_threshold: IoU threshold for object NMS.
+        :param agnostic_nms: If object NMS is class-agnostic.
+        :param hand_model: YOLO v8 hand model.
+        :param hand_imgsz: Hand model input size.
+        :param concurrent: Run the two models concurrently.
+        :param object_threads: Torch intra-op threads for the object model in
+            concurrent mode on CPU. If 0, half of the available threads.
+        :param hand_threads: Torch intra-op threads for the hand model in
+            concurrent mode on CPU. If 0, half of the available threads.
+        """
+        self.object_model = object_model
+        self.device = device
+        self.stride = stride
+        self.imgsz = imgsz
+        self.half = half
+        self.det_conf_threshold = det_conf_threshold
+        self.iou_threshold = iou_threshold
+        self.agnostic_nms = agnostic_nms
+        self.hand_model = hand_model
+        self.hand_imgsz = hand_imgsz
+
+        try:
+            self._hand_stride: Optional[int] = int(max(hand_model.model.stride))
+        except (AttributeError, TypeError):
+            # e.g. exported models, let the hand model do its own resizing.
+            self._hand_stride = None
+
+        self._runner: Optional[ConcurrentRunner] = None
+        if concurrent:
+            initializers = [None, None]
+            if device.type == "cpu":
+                default_threads = partition_threads(torch.get_num_threads(), 2)
+                initializers = [
+                    partial(torch.set_num_threads, n or dflt)
+                    for n, dflt in zip((object_threads, hand_threads), default_threads)
+                ]
+            self._runner = ConcurrentRunner(2, initializers, name="detector")
+
+    def close(self) -> None:
+        """
+        Stop the concurrent mode worker threads, if any.
+        """
+        if self._runner is not None:
+            self._runner.shutdown()
+
+    def can_share_letterbox(self, letterboxed: Sequence[np.ndarray]) -> bool:
+        """
+        Whether object model letterboxed images may also be used as hand model
+        input.
+        """
+        return (
+            self._hand_stride is not None
+            and self.hand_imgsz == self.imgsz
+            and len({img.shape for img in letterboxed}) == 1
+            and all(d % self._hand_stride == 0 for d in letterboxed[0].shape[1:])
+        )
+
+    def predict(
+        self, imgs0: Sequence[np.ndarray]
+    ) -> Tuple[List[Detections], List[tuple]]:
+        """
+        Detect objects and hands in images.
+
+        :param imgs0: BGR images of shape ``[h, w, 3]``.
+
+        :returns: Object detections as from
+            ``yolov7_batch.predict_images`` and hand detections as from
+            ``yolov8_detect.predict_hands_batch``, per image.
+        """
+        if not imgs0:
+            return [], []
+        letterboxed = letterbox_images(imgs0, self.imgsz, self.stride)
+        predict_objects = partial(
+            predict_images,
+            imgs0,
+            self.device,
+            self.object_model,
+            self.stride,
+            self.imgsz,
+            self.half,
+            False,
+            self.det_conf_threshold,
+            self.iou_threshold,
+            None,
+            self.agnostic_nms,
+            letterboxed=letterboxed,
+        )
+        predict_hands = partial(
+            predict_hands_batch,
+            hand_model=self.hand_model,
+            imgs0=imgs0,
+            device=self.device,
+            letterboxed=letterboxed if self.can_share_letterbox(letterboxed) else None,
+            imgsz=self.hand_imgsz,
+        )
+        if self._runner is None:
+            return predict_objects(), predict_hands()
+        object_results, hand_results = self._runner.run(predict_objects, predict_hands)
+        return object_results, hand_results
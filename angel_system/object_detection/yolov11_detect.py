@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
 
 from collections import defaultdict
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 import logging
 from pathlib import Path
 import random
+import threading
 from typing import Dict
+from typing import Hashable
+from typing import List
+from typing import NamedTuple
 from typing import Optional
 from typing import Sequence
 import warnings
@@ -18,11 +24,25 @@ import torch
 import ubelt as ub
 from ultralytics import YOLO
 
-from angel_system.object_detection.yolov8_detect import predict_hands
+from angel_system.object_detection.detection_cache import CachedDetections
+from angel_system.object_detection.detection_cache import DetectionCache
+from angel_system.object_detection.detection_cache import hash_bytes
+from angel_system.object_detection.detection_shards import merge_parts
+from angel_system.object_detection.detection_shards import missing_parts
+from angel_system.object_detection.detection_shards import part_path
+from angel_system.object_detection.detection_shards import shard_video_ids
+from angel_system.object_detection.detection_shards import write_merged
+from angel_system.object_detection.detection_shards import write_part
+from angel_system.object_detection.yolov8_detect import predict_hands_batch
+from angel_system.utils.prefetch import batched
+from angel_system.utils.prefetch import prefetch_map
 
 
 LOG = logging.getLogger(__name__)
 
+# Labels of the hand detections, as indexed by their cached class index.
+HAND_LABELS = ("hand (left)", "hand (right)")
+
 
 def plot_one_box(xywh, img, color=None, label=None, line_thickness=1) -> None:
     """
@@ -64,6 +84,101 @@ def plot_one_box(xywh, img, color=None, label=None, line_thickness=1) -> None:
         )
 
 
+class Frame(NamedTuple):
+    """
+    An image to detect over.
+    """
+
+    video_id: Optional[Hashable]
+    image_id: int
+    path: Path
+    # If this is the last image of its video to be processed.
+    is_last: bool
+    # Decoded image, or None when not needed because all detections are
+    # cached and no debug image is drawn.
+    img0: Optional[np.ndarray]
+    # Hash of the image file content, when using the detection cache.
+    image_hash: Optional[str] = None
+    # Cached raw object and hand detections, if any.
+    object_dets: Optional[CachedDetections] = None
+    hand_dets: Optional[CachedDetections] = None
+
+
+def group_images_by_video(dset: kwcoco.CocoDataset) -> Dict[Hashable, List[int]]:
+    """
+    Group the images of a dataset by video, in frame order. Images not in a
+    video are grouped under None.
+    """
+    ret: Dict[Hashable, List[int]] = defaultdict(list)
+    for img in dset.dataset["images"]:
+        ret[img.get("video_id")].append(img["id"])
+    for gids in ret.values():
+        gids.sort(key=lambda gid: dset.index.imgs[gid].get("frame_index", 0))
+    return dict(ret)
+
+
+def write_debug_image(
+    img0: np.ndarray,
+    annotations: Sequence[dict],
+    cid_to_label: Dict[int, str],
+    cid_to_color: Dict[int, List[int]],
+    save_path: Path,
+) -> None:
+    """
+    Plot detection annotations onto an image and write it.
+    """
+    for ann in annotations:
+        cid = ann["category_id"]
+        plot_one_box(
+            ann["bbox"],
+            img0,
+            color=cid_to_color[cid],
+            label=f"{cid_to_label[cid]} {ann['score']:.2f}",
+        )
+    if not cv2.imwrite(save_path.as_posix(), img0):
+        raise RuntimeError(f"Failed to write debug image: {save_path}")
+
+
+def finish_video(
+    frame_writes: Sequence[Future],
+    frame_paths: Dict[int, Path],
+    video_save_path: Optional[Path],
+    framerate: Optional[float],
+    part_fpath: Path,
+    categories: Sequence[dict],
+    annotations: Sequence[dict],
+) -> None:
+    """
+    Once the debug images of a video are written, optionally assemble them
+    into a video, then write the part file of the video's results.
+
+    The part file is written last, so that a video with a part file does not
+    need to be processed again when resuming.
+    """
+    for f in frame_writes:
+        f.result()
+    if video_save_path is not None and frame_paths:
+        vid_frames = [p[1].as_posix() for p in sorted(frame_paths.items())]
+        clip = moviepy.video.io.ImageSequenceClip.ImageSequenceClip(
+            vid_frames, fps=framerate
+        )
+        clip.write_videofile(video_save_path.as_posix(), logger=None)
+        LOG.info(f"Saved video to: {video_save_path}")
+    write_part(part_fpath, categories, annotations)
+
+
+def run_inline(fn, *args) -> Future:
+    """
+    Run a function now, on this thread, in place of submitting it to a pool.
+    """
+    f = Future()
+    try:
+        f.set_result(fn(*args))
+    except BaseException as ex:
+        f.set_exception(ex)
+    return f
+
+
 @click.command()
 @click.help_option("-h", "--help")
 @click.option(
@@ -182,6 +297,94 @@ def plot_one_box(xywh, img, color=None, label=None, line_thickness=1) -> None:
         "the directory into which component images are saved."
     ),
 )
+@click.option(
+    "--batch-size",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of images given to the models at once.",
+)
+@click.option(
+    "--decode-workers",
+    type=int,
+    default=4,
+    show_default=True,
+    help=(
+        "Number of threads reading and decoding images ahead of the models. "
+        "If 0, images are decoded on the main thread."
+    ),
+)
+@click.option(
+    "--prefetch",
+    type=int,
+    default=32,
+    show_default=True,
+    help=(
+        "Maximum number of decoded images waiting for the models, and of "
+        "debug images waiting to be written."
+    ),
+)
+@click.option(
+    "--writer-workers",
+    type=int,
+    default=2,
+    show_default=True,
+    help=(
+        "Number of threads plotting and writing debug images and assembling "
+        "videos. If 0, this is done on the main thread."
+    ),
+)
+@click.option(
+    "--num-shards",
+    type=int,
+    default=1,
+    show_default=True,
+    help=(
+        "Split the input videos between this many processes, each run with a "
+        "different --shard-index and the same --work-dir."
+    ),
+)
+@click.option(
+    "--shard-index",
+    type=int,
+    default=0,
+    show_default=True,
+    help="Index of the shard of videos to process, from 0 to --num-shards - 1.",
+)
+@click.option(
+    "--work-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help=(
+        "Directory into which the results of each video are written as they "
+        "complete. Videos with results here are skipped, so an interrupted "
+        "run resumes where it stopped. Once all videos have results, the "
+        "process finding so merges them into the output COCO file. By "
+        "default, a directory next to the output COCO file."
+    ),
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help=(
+        "Optional directory in which to cache raw model detections, keyed by "
+        "image file content, model checkpoint content and inference settings. "
+        "Images with cached detections are not run through the models again, "
+        "so runs differing only by confidence threshold or class exclusion "
+        "skip model inference."
+    ),
+)
+@click.option(
+    "--cache-min-conf",
+    type=float,
+    default=0.01,
+    show_default=True,
+    help=(
+        "Confidence floor of the object detections cached with --cache-dir. "
+        "Cached detections serve any --conf-thresh at or above this."
+    ),
+)
 @torch.inference_mode()
 def yolo_v11_inference_objects(
     input_coco_file: Path,
@@ -197,6 +400,15 @@ def yolo_v11_inference_objects(
     tensorrt: bool,
     save_dir: Optional[Path],
     save_vid: bool,
+    batch_size: int,
+    decode_workers: int,
+    prefetch: int,
+    writer_workers: int,
+    num_shards: int,
+    shard_index: int,
+    work_dir: Optional[Path],
+    cache_dir: Optional[Path],
+    cache_min_conf: float,
 ):
     """
     Script for use in generating object detection results based on an input
@@ -205,6 +417,11 @@ def yolo_v11_inference_objects(
     Expected use-case: generate object detections for video frames (images)
     that we have activity classification truth for.
 
+    Images are decoded on background threads ahead of being given to the
+    models in batches, and debug images are written on background threads.
+    Videos can be split between several processes with --num-shards and
+    --shard-index, which share a --work-dir of per-video results.
+
     \b
     Example:
         python3 yolo_v11_inference_objects \\
@@ -223,8 +440,92 @@ def yolo_v11_inference_objects(
             f"{output_coco_file}"
         )
     output_coco_file.parent.mkdir(parents=True, exist_ok=True)
-    dset = kwcoco.CocoDataset()
+    if work_dir is None:
+        work_dir = output_coco_file.parent / f"{output_coco_file.stem}_parts"
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    video_gids = group_images_by_video(guiding_dset)
+    shard_vids = shard_video_ids(
+        {vid: len(gids) for vid, gids in video_gids.items()}, num_shards, shard_index
+    )
+    todo_vids = missing_parts(work_dir, shard_vids)
+    LOG.info(
+        f"Shard {shard_index} of {num_shards} has {len(shard_vids)} videos, "
+        f"{len(shard_vids) - len(todo_vids)} of which are already done."
+    )
+    if todo_vids:
+        detect_videos(
+            guiding_dset,
+            {vid: video_gids[vid] for vid in todo_vids},
+            work_dir,
+            hand_model_ckpt,
+            objs_model_ckpt,
+            obj_exclude_classes,
+            model_device,
+            obj_img_size,
+            hand_img_size,
+            conf_thresh,
+            tensorrt,
+            save_dir,
+            save_vid,
+            batch_size,
+            decode_workers,
+            prefetch,
+            writer_workers,
+            cache_dir,
+            cache_min_conf,
+        )
+
+    # Whichever shard finishes last merges everyone's results. Shards
+    # finishing at the same time may both merge, which is safe as the output
+    # file is replaced atomically with the same results.
+    remaining = missing_parts(work_dir, video_gids)
+    if remaining:
+        LOG.info(
+            f"{len(remaining)} videos are still to be processed by other "
+            f"shards. Run any shard again once they are done to merge results."
+        )
+        return
+    LOG.info("Merging results of all videos...")
+    dset = merge_parts(guiding_dset, work_dir, video_gids)
     dset.fpath = output_coco_file.as_posix()
+    LOG.info(f"Saving output COCO file... ({output_coco_file})")
+    write_merged(dset, output_coco_file)
+    LOG.info(f"Saved output COCO file: {output_coco_file}")
+
+
+def detect_videos(
+    guiding_dset: kwcoco.CocoDataset,
+    video_gids: Dict[Hashable, List[int]],
+    work_dir: Path,
+    hand_model_ckpt: Path,
+    objs_model_ckpt: Path,
+    obj_exclude_classes: Sequence[str],
+    model_device: str,
+    obj_img_size: int,
+    hand_img_size: int,
+    conf_thresh: float,
+    tensorrt: bool,
+    save_dir: Optional[Path],
+    save_vid: bool,
+    batch_size: int,
+    decode_workers: int,
+    prefetch: int,
+    writer_workers: int,
+    cache_dir: Optional[Path],
+    cache_min_conf: float,
+) -> None:
+    """
+    Detect objects and hands in the images of some videos, writing the
+    results of each video to a part file in the work directory when done.
+
+    Parameters follow the options of :func:`yolo_v11_inference_objects`.
+
+    :param guiding_dset: Dataset of the images to detect over.
+    :param video_gids: Image IDs of each video to process, in frame order.
+    """
+    # Only holds categories, to be written with each part.
+    dset = kwcoco.CocoDataset()
 
     object_model = YOLO(objs_model_ckpt, task="detect")
     LOG.info(
@@ -264,15 +565,6 @@ def yolo_v11_inference_objects(
     cls_names = [p[1] for p in sorted(object_model.names.items())]
     cls_colors = [[random.randint(0, 255) for _ in range(3)] for _ in cls_names]
 
-    # Port over the videos and images sections from the input dataset to the
-    # new one.
-    dset.dataset["videos"] = guiding_dset.dataset["videos"]
-    dset.dataset["images"] = guiding_dset.dataset["images"]
-    dset.index.build(dset)
-    # Equality can later be tested with:
-    #   guiding_dset.index.videos == dset.index.videos
-    #   guiding_dset.index.imgs == dset.index.imgs
-
     # Add categories
     for cls_name in obj_exclude_classes:
         if cls_name not in cls_names:
@@ -290,6 +582,11 @@ def yolo_v11_inference_objects(
     left_hand_cid = dset.ensure_category(name="hand (left)")
     right_hand_cid = dset.ensure_category(name="hand (right)")
     hands_cat_to_cid = {"hand (left)": left_hand_cid, "hand (right)": right_hand_cid}
+    categories = dset.dataset["categories"]
+    cid_to_label = dict(enumerate(cls_names))
+    cid_to_label.update({cid: lbl for lbl, cid in hands_cat_to_cid.items()})
+    cid_to_color = dict(enumerate(cls_colors))
+    cid_to_color.update({cid: [0, 0, 0] for cid in hands_cat_to_cid.values()})
 
     # model warm-up going into the prediction loop
     LOG.info("Warming up models...")
@@ -303,12 +600,6 @@ def yolo_v11_inference_objects(
     # -------------------------------------------------------------------------
     # Generate object/hand predictions
 
-    # Mapping of video_id to the filepath for which component frames have been
-    # written out to.
-    video_image_outputs: Dict[int, Dict[int, str]] = defaultdict(dict)
-    # Dictionary of image output directories per video ID
-    video_id_to_frame_dir: Dict[int, Path] = dict()
-
     object_predict_kwargs = dict(
         conf=conf_thresh,
         device=model_device,
@@ -328,115 +619,217 @@ def yolo_v11_inference_objects(
     if hand_img_size is not None:
         hand_predict_kwargs["imgsz"] = hand_img_size
 
-    for img_id in ub.ProgIter(
-        dset.images(),
+    object_cache: Optional[DetectionCache] = None
+    hand_cache: Optional[DetectionCache] = None
+    if cache_dir is not None:
+        # Cache object detections down to a confidence floor, thresholding
+        # them after the fact.
+        object_predict_kwargs["conf"] = min(cache_min_conf, conf_thresh)
+        object_cache = DetectionCache(
+            cache_dir,
+            DetectionCache.make_model_key(
+                objs_model_ckpt,
+                model="objects",
+                imgsz=obj_img_size,
+                conf=object_predict_kwargs["conf"],
+                half=model_half,
+                tensorrt=tensorrt,
+            ),
+        )
+        hand_cache = DetectionCache(
+            cache_dir,
+            DetectionCache.make_model_key(
+                hand_model_ckpt,
+                model="hands",
+                imgsz=hand_img_size,
+                half=model_half,
+                tensorrt=tensorrt,
+            ),
+        )
+        LOG.info(f"Caching detections in: {object_cache.dpath}, {hand_cache.dpath}")
+
+    def load_frame(item) -> Frame:
+        vid, gid, is_last = item
+        img_path = Path(guiding_dset.get_image_fpath(gid))
+        if object_cache is None:
+            img0 = cv2.imread(img_path.as_posix())
+            if img0 is None:
+                raise RuntimeError(f"Failed to read image file: {img_path}")
+            return Frame(vid, gid, img_path, is_last, img0)
+
+        data = img_path.read_bytes()
+        image_hash = hash_bytes(data)
+        object_dets = object_cache.get(image_hash)
+        hand_dets = hand_cache.get(image_hash)
+        img0 = None
+        if save_dir is not None or object_dets is None or hand_dets is None:
+            img0 = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if img0 is None:
+                raise RuntimeError(f"Failed to decode image file: {img_path}")
+        return Frame(
+            vid, gid, img_path, is_last, img0, image_hash, object_dets, hand_dets
+        )
+
+    items = (
+        (vid, gid, i == len(gids) - 1)
+        for vid, gids in video_gids.items()
+        for i, gid in enumerate(gids)
+    )
+    frames = ub.ProgIter(
+        prefetch_map(load_frame, items, decode_workers, prefetch),
+        total=sum(map(len, video_gids.values())),
         desc="Processing Images",
         verbose=3,
-    ):
-        img_path: Path = dset.get_image_fpath(img_id)
-        img0 = cv2.imread(img_path.as_posix())
-        if img0 is None:
-            raise RuntimeError(f"Failed to read image file: {img_path}")
-
-        # returns list of length=num images, which is always 1 here.
-        object_preds = object_model.predict(source=img0, **object_predict_kwargs)[0]
-
-        hand_boxes, hand_labels, hand_confs = predict_hands(
-            img0=img0,
-            **hand_predict_kwargs,
-        )
+    )
 
-        # YOLO xywh output defines the xy as the cetner point, not the
-        # upper-left as required by the COCO format, thus take the xyxy output
-        # and subtracting out the upper-left.
-        obj_box_xywh = object_preds.boxes.xyxy.cpu()
-        obj_box_xywh[:, 2:] -= obj_box_xywh[:, :2]
-        obj_box_areas = torch.multiply(obj_box_xywh[:, 2], obj_box_xywh[:, 3])
-        for box_xywh, box_cls, box_conf, box_area in zip(
-            obj_box_xywh.tolist(),
-            object_preds.boxes.cls.to(int).tolist(),
-            object_preds.boxes.conf.tolist(),
-            obj_box_areas.tolist(),
-        ):
-            dset.add_annotation(
-                image_id=img_id,
-                category_id=box_cls,
-                bbox=box_xywh,
-                score=box_conf,
-                area=box_area,
-            )
-            if save_dir is not None:
-                plot_one_box(
-                    box_xywh,
-                    img0,
-                    color=cls_colors[box_cls],
-                    label=f"{cls_names[box_cls]} {box_conf:.2f}",
+    writer = ThreadPoolExecutor(writer_workers) if writer_workers > 0 else None
+    submit = writer.submit if writer is not None else run_inline
+    # Bound the debug images waiting to be written, as each holds a decoded
+    # image.
+    pending_writes = threading.BoundedSemaphore(max(prefetch, 1))
+
+    def submit_write(*args) -> Future:
+        pending_writes.acquire()
+        f = submit(write_debug_image, *args)
+        f.add_done_callback(lambda _: pending_writes.release())
+        return f
+
+    # Video finishing tasks, checked for errors at the end.
+    video_tasks: List[Future] = []
+    # Annotations, debug image writing tasks and debug image paths per frame
+    # index of the videos in progress.
+    video_anns: Dict[Hashable, List[dict]] = defaultdict(list)
+    video_frame_writes: Dict[Hashable, List[Future]] = defaultdict(list)
+    video_frame_paths: Dict[Hashable, Dict[int, Path]] = defaultdict(dict)
+
+    try:
+        for batch in batched(frames, batch_size):
+            object_dets_list = [frame.object_dets for frame in batch]
+            todo = [i for i, d in enumerate(object_dets_list) if d is None]
+            if todo:
+                object_preds_list = object_model.predict(
+                    source=[batch[i].img0 for i in todo], **object_predict_kwargs
                 )
-
-        # Convert hand box XYXY coordinates into XYWH where XY is the
-        # upper-left.
-        hand_boxes_xywh = np.asarray(hand_boxes).reshape(-1, 4)
-        hand_boxes_xywh[:, 2:] -= hand_boxes_xywh[:, :2]
-        hand_areas = np.multiply(hand_boxes_xywh[:, 2], hand_boxes_xywh[:, 3])
-        for box_xywh, box_lbl, box_conf, box_area in zip(
-            hand_boxes_xywh.tolist(),
-            hand_labels,
-            hand_confs,
-            hand_areas,
-        ):
-            box_cls = hands_cat_to_cid[box_lbl]
-            dset.add_annotation(
-                image_id=img_id,
-                category_id=box_cls,
-                bbox=box_xywh,
-                score=box_conf,
-                area=box_area,
-            )
-            if save_dir is not None:
-                plot_one_box(
-                    box_xywh,
-                    img0,
-                    color=[0, 0, 0],
-                    label=f"{box_lbl} {box_conf:.2f}",
+                for i, object_preds in zip(todo, object_preds_list):
+                    dets = CachedDetections.from_arrays(
+                        object_preds.boxes.xyxy.cpu().numpy(),
+                        object_preds.boxes.conf.cpu().numpy(),
+                        object_preds.boxes.cls.cpu().numpy(),
+                    )
+                    if object_cache is not None:
+                        object_cache.put(batch[i].image_hash, dets)
+                    object_dets_list[i] = dets
+
+            hand_dets_list = [frame.hand_dets for frame in batch]
+            todo = [i for i, d in enumerate(hand_dets_list) if d is None]
+            if todo:
+                hand_preds_list = predict_hands_batch(
+                    imgs0=[batch[i].img0 for i in todo], **hand_predict_kwargs
                 )
-
-        # Optionally draw object detection results to an image.
-        # If we want to save as a video, also save the paths so we can create
-        # the video after detecting everything.
-        if save_dir is not None:
-            vid_id = dset.index.imgs[img_id]["video_id"]
-            if vid_id not in video_id_to_frame_dir:
-                vid_obj = dset.index.videos[vid_id]
-                save_imgs_dir = save_dir / Path(vid_obj["name"]).stem
-                save_imgs_dir.mkdir(parents=True, exist_ok=True)
-                video_id_to_frame_dir[vid_id] = save_imgs_dir
-            save_path = (video_id_to_frame_dir[vid_id] / img_path.name).as_posix()
-            if not cv2.imwrite(save_path, img0):
-                raise RuntimeError(f"Failed to write debug image: {save_path}")
-            img_obj = dset.index.imgs[img_id]
-            video_image_outputs[vid_id][img_obj["frame_index"]] = save_path
-
-    # If configured, create and save videos of debug images for each video
-    # effectively processed.
-    if save_dir and save_vid:
-        for vid_id, frame_set in ub.ProgIter(
-            video_image_outputs.items(),
-            desc="Creating Videos",
-            verbose=3,
-        ):
-            frame_set: Dict[int, str]
-            vid_obj = dset.index.videos[vid_id]
-            video_save_path = save_dir / f"{Path(vid_obj['name']).stem}-objects.mp4"
-            vid_frames = [p[0] for p in sorted(frame_set.items())]
-            clip = moviepy.video.io.ImageSequenceClip.ImageSequenceClip(
-                vid_frames, fps=vid_obj["framerate"]
-            )
-            clip.write_videofile(video_save_path.as_posix())
-            LOG.info(f"Saved video to: {video_save_path}")
-
-    LOG.info(f"Saving output COCO file... ({output_coco_file})")
-    dset.dump(dset.fpath, newlines=True)
-    LOG.info(f"Saved output COCO file: {output_coco_file}")
+                for i, (hand_boxes, hand_labels, hand_confs) in zip(
+                    todo, hand_preds_list
+                ):
+                    dets = CachedDetections.from_arrays(
+                        hand_boxes,
+                        hand_confs,
+                        [HAND_LABELS.index(lbl) for lbl in hand_labels],
+                    )
+                    if hand_cache is not None:
+                        hand_cache.put(batch[i].image_hash, dets)
+                    hand_dets_list[i] = dets
+
+            for frame, object_dets, hand_dets in zip(
+                batch, object_dets_list, hand_dets_list
+            ):
+                vid = frame.video_id
+                anns = []
+
+                # Detections are XYXY, while the COCO format requires XYWH
+                # where XY is the upper-left, thus subtract out the
+                # upper-left.
+                object_dets = object_dets.select(conf_thresh)
+                for dets, cids in (
+                    (object_dets, object_dets.classes.tolist()),
+                    (
+                        hand_dets,
+                        [hands_cat_to_cid[HAND_LABELS[c]] for c in hand_dets.classes],
+                    ),
+                ):
+                    box_xywh = dets.xyxy.copy()
+                    box_xywh[:, 2:] -= box_xywh[:, :2]
+                    box_areas = box_xywh[:, 2] * box_xywh[:, 3]
+                    for bbox, cid, score, area in zip(
+                        box_xywh.tolist(),
+                        cids,
+                        dets.scores.tolist(),
+                        box_areas.tolist(),
+                    ):
+                        anns.append(
+                            dict(
+                                image_id=frame.image_id,
+                                category_id=cid,
+                                bbox=bbox,
+                                score=score,
+                                area=area,
+                            )
+                        )
+                video_anns[vid].extend(anns)
+
+                # Optionally draw object detection results to an image, off of
+                # the main thread. If we want to save as a video, also save the
+                # paths so we can create the video once the video is done.
+                if save_dir is not None:
+                    save_imgs_dir = save_dir / (
+                        Path(guiding_dset.index.videos[vid]["name"]).stem
+                        if vid is not None
+                        else "no_video"
+                    )
+                    if vid not in video_frame_paths:
+                        save_imgs_dir.mkdir(parents=True, exist_ok=True)
+                    save_path = save_imgs_dir / frame.path.name
+                    video_frame_writes[vid].append(
+                        submit_write(
+                            frame.img0,
+                            anns,
+                            cid_to_label,
+                            cid_to_color,
+                            save_path,
+                        )
+                    )
+                    img_obj = guiding_dset.index.imgs[frame.image_id]
+                    video_frame_paths[vid][img_obj.get("frame_index", 0)] = save_path
+
+                if frame.is_last:
+                    video_save_path = None
+                    framerate = None
+                    if save_dir is not None and save_vid and vid is not None:
+                        vid_obj = guiding_dset.index.videos[vid]
+                        video_save_path = (
+                            save_dir / f"{Path(vid_obj['name']).stem}-objects.mp4"
+                        )
+                        framerate = vid_obj["framerate"]
+                    video_tasks.append(
+                        submit(
+                            finish_video,
+                            video_frame_writes.pop(vid, []),
+                            video_frame_paths.pop(vid, {}),
+                            video_save_path,
+                            framerate,
+                            part_path(work_dir, vid),
+                            categories,
+                            video_anns.pop(vid),
+                        )
+                    )
+    finally:
+        if writer is not None:
+            writer.shutdown(wait=True)
+    for f in video_tasks:
+        f.result()
+    if object_cache is not None:
+        LOG.info(
+            f"Detection cache use: objects {object_cache.stats()}, "
+            f"hands {hand_cache.stats()}"
+        )
 
 
 if __name__ == "__main__":
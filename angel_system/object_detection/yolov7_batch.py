@@ -0,0 +1,107 @@
+"""
+Batched inference for YOLO v7 object detection models, as loaded with
+``yolov7.detect_ptg.load_model``.
+
+Each image is prepared and post-processed the same way as by
+``yolov7.detect_ptg.predict_image``, but images that letterbox to the same
+shape are run through the model together.
+"""
+from collections import defaultdict
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+import torch
+from yolov7.utils.datasets import letterbox
+from yolov7.utils.general import non_max_suppression, scale_coords
+
+
+# Boxes (xyxy), confidences and class IDs of the detections in one image.
+Detections = Tuple[List[List[float]], List[float], List[int]]
+
+
+def letterbox_images(
+    imgs0: Sequence[np.ndarray], imgsz: int, stride: int
+) -> List[np.ndarray]:
+    """
+    Resize and pad images to the model input size, converting them to RGB,
+    channel-first layout.
+
+    :param imgs0: BGR images of shape ``[h, w, 3]``.
+    :param imgsz: Model input size.
+    :param stride: Model stride.
+
+    :returns: Contiguous ``uint8`` arrays of shape ``[3, h', w']``.
+    """
+    ret = []
+    for img0 in imgs0:
+        img = letterbox(img0, imgsz, stride=stride)[0]
+        # BGR to RGB, to 3 x h' x w'
+        ret.append(np.ascontiguousarray(img[:, :, ::-1].transpose(2, 0, 1)))
+    return ret
+
+
+@torch.no_grad()
+def predict_images(
+    imgs0: Sequence[np.ndarray],
+    device: torch.device,
+    model: torch.nn.Module,
+    stride: int,
+    imgsz: int,
+    half: bool,
+    augment: bool,
+    det_conf_threshold: float,
+    iou_threshold: float,
+    filter_classes: Optional[List[int]],
+    agnostic_nms: bool,
+    letterboxed: Optional[Sequence[np.ndarray]] = None,
+) -> List[Detections]:
+    """
+    Detect objects in several images, batching the images that share a
+    letterboxed shape.
+
+    Parameters follow those of ``yolov7.detect_ptg.predict_image``.
+
+    :param letterboxed: Optional output of :func:`letterbox_images` for
+        ``imgs0`` if already computed.
+
+    :returns: Detections for each image, in input order.
+    """
+    if letterboxed is None:
+        letterboxed = letterbox_images(imgs0, imgsz, stride)
+
+    # Indices of input images per letterboxed shape.
+    groups: Dict[Tuple[int, ...], List[int]] = defaultdict(list)
+    for i, img in enumerate(letterboxed):
+        groups[img.shape].append(i)
+
+    results: List[Optional[Detections]] = [None] * len(imgs0)
+    for shape, indices in groups.items():
+        batch = torch.from_numpy(np.stack([letterboxed[i] for i in indices]))
+        batch = batch.to(device)
+        batch = batch.half() if half else batch.float()
+        batch /= 255.0
+
+        pred = model(batch, augment=augment)[0]
+        pred = non_max_suppression(
+            pred,
+            det_conf_threshold,
+            iou_threshold,
+            classes=filter_classes,
+            agnostic=agnostic_nms,
+        )
+
+        for i, det in zip(indices, pred):
+            boxes, confs, classids = [], [], []
+            if len(det):
+                # Rescale boxes from the model input size to the image size
+                det[:, :4] = scale_coords(shape[1:], det[:, :4], imgs0[i].shape).round()
+                for *xyxy, conf, cls_id in reversed(det.tolist()):
+                    boxes.append(xyxy)
+                    confs.append(conf)
+                    classids.append(int(cls_id))
+            results[i] = (boxes, confs, classids)
+    return results
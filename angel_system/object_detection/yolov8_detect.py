@@ -1,7 +1,11 @@
+from typing import List
 from typing import Optional
+from typing import Sequence
 
 import numpy as np
+import torch
 from ultralytics import YOLO as YOLOv8
+from ultralytics.utils.ops import scale_boxes
 
 
 def predict_hands(
@@ -18,18 +22,67 @@ def predict_hands(
     Any additional keyword arguments provided will be passed to the
     `YOLO.predict` method.
     """
-    width, height = img0.shape[:2]
-    hands_preds = hand_model.predict(
+    return predict_hands_batch(hand_model, [img0], device, **kwargs)[0]
+
+
+def predict_hands_batch(
+    hand_model: YOLOv8,
+    imgs0: Sequence[np.array],
+    device: str,
+    letterboxed: Optional[Sequence[np.array]] = None,
+    **kwargs,
+) -> List[tuple]:
+    """Predict hands in several images with one call of a YOLOv8 hand model.
+
+    This is the batched equivalent of `predict_hands`, returning its
+    ``(boxes, labels, confs)`` output for each input image.
+
+    Optionally, the images may be given already letterboxed to the model
+    input size, e.g. when they have been for another model, which skips the
+    model's own resizing. These must be RGB, channel-first ``uint8`` arrays of
+    one shape that is a multiple of the model stride, as made by
+    `angel_system.object_detection.yolov7_batch.letterbox_images`. Boxes are
+    still returned in the coordinates of ``imgs0``.
+
+    Any additional keyword arguments provided will be passed to the
+    `YOLO.predict` method.
+    """
+    if not imgs0:
+        return []
+    if letterboxed is not None:
+        source = torch.from_numpy(np.stack(letterboxed)).float() / 255.0
+    else:
+        source = list(imgs0)
+    hands_preds_list = hand_model.predict(
         conf=0.1,
         **kwargs,
-        source=img0,
+        source=source,
         device=device,
         verbose=False,
-    )[
-        0
-    ]  # list of length=num images
+    )  # list of length=num images
+
+    ret = []
+    for img0, hands_preds in zip(imgs0, hands_preds_list):
+        xyxy = hands_preds.boxes.xyxy
+        if letterboxed is not None:
+            xyxy = scale_boxes(source.shape[2:], xyxy.clone(), img0.shape)
+        ret.append(
+            _label_hands(img0, xyxy.cpu().numpy(), hands_preds.boxes.conf.cpu().numpy())
+        )
+    return ret
+
+
+def _label_hands(img0: np.array, xyxy: np.ndarray, confs: np.ndarray) -> tuple:
+    """
+    Assign left and right hand labels to the hand predictions for an image.
 
-    hand_centers = [center.xywh.tolist()[0][0] for center in hands_preds.boxes][:2]
+    :param img0: The image.
+    :param xyxy: Predicted hand boxes in the image, of shape ``[n, 4]``.
+    :param confs: Confidences of the predicted boxes.
+    """
+    width, height = img0.shape[:2]
+
+    hand_centers = ((xyxy[:2, 0] + xyxy[:2, 2]) / 2).tolist()
     hands_label = []
 
     # Update the hand label to left and right specific labels
@@ -46,15 +99,11 @@ def predict_hands(
         elif hand_centers[0] <= width // 2:
             hands_label.append("hand (left)")
 
-    boxes, labels, confs = [], [], []
-
-    for bbox, hand_cid in zip(hands_preds.boxes, hands_label):
-        xyxy_hand = bbox.xyxy.tolist()[0]
-
-        conf = bbox.conf.item()
+    boxes, labels, hand_confs = [], [], []
 
+    for xyxy_hand, conf, hand_cid in zip(xyxy.tolist(), confs.tolist(), hands_label):
         boxes.append(xyxy_hand)
         labels.append(hand_cid)
-        confs.append(conf)
+        hand_confs.append(conf)
 
-    return boxes, labels, confs
+    return boxes, labels, hand_confs
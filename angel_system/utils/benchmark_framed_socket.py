@@ -0,0 +1,130 @@
+"""
+Benchmark receiving VLC camera frames over a loopback TCP connection,
+comparing the previous relay path, which converted each received chunk to a
+list of Python ints and extended an ``Int32MultiArray``-like int array with
+it, against ``FrameReceiver``'s ``recv_into`` path.
+
+A sender thread sends the same frames for each path, as fast as the receiver
+takes them.
+
+Example::
+
+    python -m angel_system.utils.benchmark_framed_socket \\
+        --frame-size 307200 --frames 500
+"""
+import array
+import socket
+import threading
+import time
+from typing import Callable
+from typing import Optional
+
+import click
+
+from angel_system.utils.framed_socket import encode_frame
+from angel_system.utils.framed_socket import FrameReceiver
+from angel_system.utils.framed_socket import HEADER
+from angel_system.utils.framed_socket import SYNC_PATTERN
+
+
+# Receive size of the previous relay path.
+JUMBO_READ_SIZE = 9000
+
+
+def recv_frame_as_ints(conn: socket.socket) -> Optional[array.array]:
+    """
+    Receive a frame as the previous relay did: in chunks of at most 9000
+    bytes, each converted to a list of ints and extended into a 32-bit int
+    array, as backs ``Int32MultiArray.data``.
+    """
+    data = conn.recv(HEADER.size, socket.MSG_WAITALL)
+    if len(data) < HEADER.size:
+        return None
+    sync, length = HEADER.unpack(data)
+    if sync != SYNC_PATTERN:
+        raise ValueError(f"Invalid sync pattern {sync!r}")
+    ints = array.array("i")
+    bytes_read = 0
+    while bytes_read != length:
+        message = list(conn.recv(min(JUMBO_READ_SIZE, length - bytes_read)))
+        if not message:
+            return None
+        bytes_read += len(message)
+        ints.extend(message)
+    return ints
+
+
+def run_loopback(
+    recv_fn: Callable[[socket.socket], Callable[[], Optional[array.array]]],
+    frame: bytes,
+    n_frames: int,
+) -> float:
+    """
+    Send frames over a loopback connection and receive them.
+
+    :param recv_fn: Function making the function receiving a frame from a
+        connection.
+    :param frame: Encoded frame to send.
+    :param n_frames: Number of frames to send.
+
+    :returns: Seconds taken to receive all the frames.
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+
+    def send():
+        with socket.create_connection(server.getsockname()) as sender:
+            for _ in range(n_frames):
+                sender.sendall(frame)
+
+    sender_t = threading.Thread(target=send, daemon=True)
+    sender_t.start()
+    conn, _ = server.accept()
+    with conn, server:
+        recv_frame = recv_fn(conn)
+        start = time.perf_counter()
+        for _ in range(n_frames):
+            if recv_frame() is None:
+                raise RuntimeError("Connection closed early.")
+        elapsed = time.perf_counter() - start
+    sender_t.join()
+    return elapsed
+
+
+@click.command(context_settings={"help_option_names": ["-h", "--help"]})
+@click.option(
+    "--frame-size",
+    "frame_sizes",
+    type=int,
+    multiple=True,
+    default=(307_200, 1_228_800),
+    show_default=True,
+    help="Frame payload sizes in bytes to benchmark. May be given multiple times.",
+)
+@click.option("--frames", "n_frames", type=int, default=300, show_default=True)
+def main(frame_sizes, n_frames):
+    """
+    Compare the frame receive throughput of the previous relay path and the
+    ``recv_into`` path over loopback TCP.
+    """
+    print(
+        f"{'size (B)':>10} {'ints (MB/s)':>12} {'recv_into (MB/s)':>17} {'speedup':>8}"
+    )
+    for size in frame_sizes:
+        frame = encode_frame(bytes(range(256)) * (size // 256) + bytes(size % 256))
+        t_ints = run_loopback(
+            lambda conn: lambda: recv_frame_as_ints(conn), frame, n_frames
+        )
+        t_into = run_loopback(
+            lambda conn: FrameReceiver(conn).recv_frame, frame, n_frames
+        )
+        mb = size * n_frames / 1e6
+        print(
+            f"{size:>10} {mb / t_ints:>12.1f} {mb / t_into:>17.1f} "
+            f"{t_ints / t_into:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
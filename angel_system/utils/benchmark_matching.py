@@ -0,0 +1,120 @@
+"""
+Benchmark the vectorized timestamp matching of ``angel_system.utils.matching``
+against ``descending_match_with_tolerance`` at bag-scale numbers of messages.
+
+Keys are frame times at 30Hz and values are asynchronous sensor messages (e.g.
+hand or head poses) at a multiple of that rate with jitter.
+
+``descending_match_with_tolerance`` re-wraps its value iterator in another
+``itertools.chain`` for every carried value, which makes it quadratic in
+practice, so it is only run up to ``--max-baseline-keys``.
+
+Example::
+
+    python -m angel_system.utils.benchmark_matching -n 100000 -n 1000000
+"""
+import time
+
+import click
+import numpy as np
+
+from angel_system.utils.matching import descending_match_with_tolerance
+from angel_system.utils.matching import match_exact
+from angel_system.utils.matching import match_nearest_with_tolerance
+from angel_system.utils.matching import select_matches
+
+
+FRAME_PERIOD_NS = 33_333_333
+
+
+def synthetic_times(n_keys: int, values_per_key: float, seed: int):
+    """
+    Generate ascending key and value times.
+
+    :returns: Tuple of the key times and the value times, both int64 arrays.
+    """
+    rng = np.random.default_rng(seed)
+    key_times = np.arange(n_keys, dtype=np.int64) * FRAME_PERIOD_NS
+    n_values = int(n_keys * values_per_key)
+    value_period = FRAME_PERIOD_NS / values_per_key
+    jitter = rng.integers(-value_period // 4, value_period // 4, size=n_values)
+    value_times = (np.arange(n_values) * value_period).astype(np.int64) + jitter
+    return key_times, np.unique(value_times)
+
+
+@click.command(context_settings={"help_option_names": ["-h", "--help"]})
+@click.option(
+    "-n",
+    "--n-keys",
+    type=int,
+    multiple=True,
+    default=[100_000, 1_000_000],
+    show_default=True,
+    help="Numbers of key times to benchmark. May be given multiple times.",
+)
+@click.option(
+    "--values-per-key",
+    type=float,
+    default=2.0,
+    show_default=True,
+    help="Number of value messages per key time.",
+)
+@click.option(
+    "--tol-ns",
+    type=int,
+    default=FRAME_PERIOD_NS // 4,
+    show_default=True,
+    help="Matching tolerance in nanoseconds.",
+)
+@click.option(
+    "--max-baseline-keys",
+    type=int,
+    default=20_000,
+    show_default=True,
+    help="Largest number of keys to run descending_match_with_tolerance for.",
+)
+@click.option("--seed", type=int, default=0, show_default=True)
+def main(n_keys, values_per_key, tol_ns, max_baseline_keys, seed):
+    """
+    Compare vectorized and looping timestamp matching.
+    """
+    print(
+        f"{'keys':>9} {'values':>9} {'descending (ms)':>16} {'nearest (ms)':>13} "
+        f"{'speedup':>8} {'exact (ms)':>11} {'identical':>10}"
+    )
+    for n in n_keys:
+        key_times, value_times = synthetic_times(n, values_per_key, seed)
+        key_list = key_times.tolist()
+        value_list = value_times.tolist()
+
+        s = time.perf_counter()
+        matched = select_matches(
+            value_list, match_nearest_with_tolerance(key_times, value_times, tol_ns)
+        )
+        t_nearest = time.perf_counter() - s
+
+        s = time.perf_counter()
+        match_exact(key_times, value_times)
+        t_exact = time.perf_counter() - s
+
+        if n <= max_baseline_keys:
+            s = time.perf_counter()
+            expected = descending_match_with_tolerance(key_list, value_list, tol_ns)
+            t_descending = time.perf_counter() - s
+            baseline = (
+                f"{1e3 * t_descending:>16.1f}",
+                f"{t_descending / t_nearest:>7.1f}x",
+                f"{str(matched == expected):>10}",
+            )
+        else:
+            baseline = (f"{'-':>16}", f"{'-':>8}", f"{'-':>10}")
+
+        print(
+            f"{n:>9} {len(value_times):>9} {baseline[0]} "
+            f"{1e3 * t_nearest:>13.1f} {baseline[1]} "
+            f"{1e3 * t_exact:>11.1f} {baseline[2]}"
+        )
+
+
+if __name__ == "__main__":
+    main()
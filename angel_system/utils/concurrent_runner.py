@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+
+def partition_threads(n_threads: int, n_parts: int) -> List[int]:
+    """
+    Split a number of threads as evenly as possible into parts of at least one
+    thread each, earlier parts receiving any remainder.
+
+    >>> partition_threads(8, 2), partition_threads(5, 2), partition_threads(1, 2)
+    ([4, 4], [3, 2], [1, 1])
+    """
+    return [
+        max(n_threads // n_parts + (i < n_threads % n_parts), 1) for i in range(n_parts)
+    ]
+
+
+class ConcurrentRunner:
+    """
+    Run a fixed number of functions concurrently, each on its own dedicated
+    worker thread, or "lane".
+
+    Each lane always runs on the same thread, so per-thread runtime settings
+    made by its initializer persist between calls to :meth:`run`. For
+    example, initializing each lane with ``torch.set_num_threads`` partitions
+    the intra-op threads between models running side by side.
+
+    >>> with ConcurrentRunner(2) as runner:
+    ...     runner.run(lambda: 1, lambda: 2)
+    [1, 2]
+    """
+
+    def __init__(
+        self,
+        n_lanes: int,
+        initializers: Optional[Sequence[Optional[Callable[[], Any]]]] = None,
+        name: str = "lane",
+    ):
+        """
+        :param n_lanes: Number of functions run at once.
+        :param initializers: Optional function per lane to call on the lane's
+            thread once, before it runs anything.
+        :param name: Prefix of the lane thread names.
+        """
+        if initializers is None:
+            initializers = [None] * n_lanes
+        if len(initializers) != n_lanes:
+            raise ValueError(
+                f"Expected {n_lanes} lane initializers, got {len(initializers)}."
+            )
+        self._lanes = [
+            ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f"{name}_{i}", initializer=init
+            )
+            for i, init in enumerate(initializers)
+        ]
+
+    def __enter__(self) -> "ConcurrentRunner":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.shutdown()
+
+    @property
+    def n_lanes(self) -> int:
+        return len(self._lanes)
+
+    def run(self, *fns: Callable[[], Any]) -> List[Any]:
+        """
+        Run one function on each lane and wait for all of them to finish.
+
+        :param fns: Functions to run, one per lane, in lane order.
+
+        :raises Exception: The exception raised by the first function, in
+            lane order, that raised one, once all functions have finished.
+
+        :returns: The results of the functions, in lane order.
+        """
+        if len(fns) != len(self._lanes):
+            raise ValueError(f"Expected {len(self._lanes)} functions, got {len(fns)}.")
+        futures = [lane.submit(fn) for lane, fn in zip(self._lanes, fns)]
+        # Wait for everything before raising, so that no lane is still busy
+        # with this call when the next one is made.
+        for f in futures:
+            f.exception()
+        return [f.result() for f in futures]
+
+    def shutdown(self) -> None:
+        for lane in self._lanes:
+            lane.shutdown(wait=True)
@@ -0,0 +1,144 @@
+from collections import Counter
+from collections import deque
+from threading import Condition
+import time
+from typing import Any
+from typing import Callable
+from typing import Deque
+from typing import Hashable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+
+class PendingFrame(NamedTuple):
+    """
+    A frame waiting to be processed in a batch.
+    """
+
+    # Identifier of the stream the frame came from, e.g. the image topic.
+    source: Hashable
+    # The frame itself, e.g. an image message.
+    item: Any
+    # Clock time at which the frame was put into the batcher.
+    arrival_time: float
+
+
+class FrameBatcher:
+    """
+    Thread-safe collection of frames, from one or more sources, into batches
+    for processing.
+
+    Producers call :meth:`put` as frames arrive. A consumer calls
+    :meth:`get_batch`, which returns once ``max_batch_size`` frames are
+    pending, or once the oldest pending frame has waited for ``deadline``
+    seconds, whichever comes first. A larger batch size and deadline trade the
+    latency of individual frames for throughput.
+
+    At most ``max_pending`` frames are held. When a frame arrives while that
+    many are pending, the oldest pending frame is dropped. With a batch size
+    and ``max_pending`` of 1 this only ever processes the latest frame.
+    Received and dropped frames are counted per source.
+
+    >>> b = FrameBatcher(max_batch_size=2, deadline=0.01, max_pending=3)
+    >>> for i in range(4):
+    ...     b.put("cam", i)
+    >>> [f.item for f in b.get_batch()], [f.item for f in b.get_batch()]
+    ([1, 2], [3])
+    >>> b.num_received["cam"], b.num_dropped["cam"]
+    (4, 1)
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = 1,
+        deadline: float = 0.0,
+        max_pending: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param max_batch_size: Maximum number of frames in a batch.
+        :param deadline: Maximum time in seconds to hold a frame while waiting
+            for a batch to fill.
+        :param max_pending: Maximum number of frames to hold, dropping the
+            oldest beyond that. Defaults to ``max_batch_size``.
+        :param clock: Function giving the current time in seconds.
+        """
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be positive, got {max_batch_size}.")
+        if max_pending is None:
+            max_pending = max_batch_size
+        if max_pending < max_batch_size:
+            raise ValueError(
+                f"max_pending ({max_pending}) must be at least max_batch_size "
+                f"({max_batch_size})."
+            )
+        self.max_batch_size = max_batch_size
+        self.deadline = deadline
+        self.max_pending = max_pending
+        self._clock = clock
+        self._cond = Condition()
+        self._pending: Deque[PendingFrame] = deque()
+        self._closed = False
+        self.num_received: Counter = Counter()
+        self.num_dropped: Counter = Counter()
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def put(self, source: Hashable, item: Any) -> None:
+        """
+        Add a newly arrived frame.
+
+        :param source: Identifier of the stream the frame came from.
+        :param item: The frame.
+        """
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                dropped = self._pending.popleft()
+                self.num_dropped[dropped.source] += 1
+            self._pending.append(PendingFrame(source, item, self._clock()))
+            self.num_received[source] += 1
+            self._cond.notify_all()
+
+    def get_batch(self, timeout: Optional[float] = None) -> List[PendingFrame]:
+        """
+        Wait for and take the next batch of frames, oldest first.
+
+        :param timeout: Maximum time in seconds to wait for a frame to arrive.
+            Once a frame is pending, this waits for at most the deadline
+            instead. None waits indefinitely.
+
+        :returns: The batch, which is empty if the timeout passed or the
+            batcher was closed without any frame arriving.
+        """
+        clock = self._clock
+        with self._cond:
+            timeout_time = None if timeout is None else clock() + timeout
+            while not self._closed:
+                now = clock()
+                if self._pending:
+                    if len(self._pending) >= self.max_batch_size:
+                        break
+                    remaining = self._pending[0].arrival_time + self.deadline - now
+                    if remaining <= 0:
+                        break
+                elif timeout_time is None:
+                    remaining = None
+                else:
+                    remaining = timeout_time - now
+                    if remaining <= 0:
+                        break
+                self._cond.wait(remaining)
+            n = min(len(self._pending), self.max_batch_size)
+            return [self._pending.popleft() for _ in range(n)]
+
+    def close(self) -> None:
+        """
+        Wake up any waiting consumer, making it return what is pending. Later
+        calls to :meth:`get_batch` do not wait.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
@@ -0,0 +1,98 @@
+"""
+Receiving of length-prefixed frames from a stream socket, as sent by the
+HoloLens VLC camera TCP servers.
+
+Each frame is an 8 byte header of a 4 byte sync pattern and the big-endian
+32-bit payload length, followed by the payload.
+"""
+import array
+import socket
+import struct
+from typing import Optional
+
+
+SYNC_PATTERN = b"\x1a\xcf\xfc\x1d"
+HEADER = struct.Struct(">4sI")
+
+
+def encode_frame(payload: bytes) -> bytes:
+    """
+    Make a frame of a payload, as a sender would.
+    """
+    return HEADER.pack(SYNC_PATTERN, len(payload)) + payload
+
+
+def recv_exactly_into(conn: socket.socket, view: memoryview) -> bool:
+    """
+    Fill a buffer from a socket, receiving until it is full.
+
+    :param conn: Connected stream socket.
+    :param view: Writable byte view of the buffer to fill.
+
+    :returns: False if the connection was closed before the buffer was full.
+    """
+    n_read = 0
+    n_total = len(view)
+    while n_read < n_total:
+        n = conn.recv_into(view[n_read:])
+        if n == 0:
+            return False
+        n_read += n
+    return True
+
+
+class FrameReceiver:
+    """
+    Receives frames from a socket into a single reused buffer, without any
+    per-byte Python work.
+
+    The buffer is an unsigned byte ``array.array``, so it may be set as the
+    data of ``uint8[]`` ROS message fields without those checking each value.
+
+    >>> a, b = socket.socketpair()
+    >>> a.sendall(encode_frame(b"abc") + encode_frame(b"de"))
+    >>> a.close()
+    >>> receiver = FrameReceiver(b)
+    >>> receiver.recv_frame().tobytes(), receiver.recv_frame().tobytes()
+    (b'abc', b'de')
+    >>> receiver.recv_frame() is None
+    True
+    """
+
+    def __init__(self, conn: socket.socket, sync_pattern: bytes = SYNC_PATTERN):
+        """
+        :param conn: Connected stream socket to receive from.
+        :param sync_pattern: Expected first 4 bytes of each frame header.
+        """
+        self._conn = conn
+        self._sync_pattern = sync_pattern
+        self._header = bytearray(HEADER.size)
+        self.buffer = array.array("B")
+
+    def recv_frame(self) -> Optional[array.array]:
+        """
+        Receive the next frame.
+
+        :raises ValueError: The frame header did not start with the sync
+            pattern, i.e. the stream is out of sync.
+
+        :returns: The frame payload, in the receiver's buffer, which is only
+            valid until the next call. None if the connection was closed.
+        """
+        with memoryview(self._header) as view:
+            if not recv_exactly_into(self._conn, view):
+                return None
+        sync, length = HEADER.unpack(self._header)
+        if sync != self._sync_pattern:
+            raise ValueError(f"Invalid sync pattern {sync!r}")
+
+        buf = self.buffer
+        # Frames are usually of the same size, in which case this is a no-op.
+        if length > len(buf):
+            buf.frombytes(bytes(length - len(buf)))
+        elif length < len(buf):
+            del buf[length:]
+        with memoryview(buf) as view:
+            if not recv_exactly_into(self._conn, view):
+                return None
+        return buf
@@ -1,9 +1,12 @@
 import argparse
 import json
+import math
 import os
 
 import numpy as np
 
+from angel_system.utils.matching import match_nearest_with_tolerance
+
 
 # NOTE: These values were extracted from the projection matrix provided by the
 # Unity main camera with the Windows MR plugin (now deprecated).
@@ -121,28 +124,29 @@ class HandPoseConverter:
         tolerance = (5 / 60.0) * 1e9  # ns
         hand_poses_3d = []
 
-        hand_msg_index = 0
-        for hand_pose in hand_pose_data:
+        # Find the closest headset pose message for each hand msg
+        hand_times_ns = np.array(
+            [p["time_sec"] * 10 ** 9 + p["time_nanosec"] for p in hand_pose_data],
+            dtype=np.int64,
+        )
+        head_times_ns = np.array(
+            [h["time_sec"] * 10 ** 9 + h["time_nanosec"] for h in head_pose_data],
+            dtype=np.int64,
+        )
+        head_order = np.argsort(head_times_ns, kind="stable")
+        # Times are integers, so a difference of at most this is strictly
+        # less than the tolerance.
+        head_match_idx = match_nearest_with_tolerance(
+            hand_times_ns, head_times_ns[head_order], math.ceil(tolerance) - 1
+        )
+
+        for hand_msg_index, (hand_pose, head_idx) in enumerate(
+            zip(hand_pose_data, head_match_idx.tolist())
+        ):
             if hand_msg_index % 100 == 0:
                 print(f"Parsing message {hand_msg_index}")
-            hand_msg_index += 1
-
-            # Find the closest headset pose message for this hand msg
-            hand_time_ns = hand_pose["time_sec"] * 1e9 + hand_pose["time_nanosec"]
-            min_diff = None
-            min_idx = None
-            for idx, h in enumerate(head_pose_data):
-                head_time_ns = h["time_sec"] * 1e9 + h["time_nanosec"]
-
-                diff = abs(head_time_ns - hand_time_ns)
-                if min_diff is None or diff < min_diff:
-                    min_diff = diff
-                    min_idx = idx
-
-            if min_diff < tolerance:
-                matching_head_pose = head_pose_data[min_idx]
 
-            if matching_head_pose is None:
+            if head_idx < 0:
                 print("no match")
                 hand_pose_3d_dict = {
                     "time_sec": hand_pose["time_sec"],
@@ -152,6 +156,7 @@ class HandPoseConverter:
                 }
                 hand_poses_3d.append(hand_pose_3d_dict)
                 continue
+            matching_head_pose = head_pose_data[head_order[head_idx]]
 
             projection_matrix = PROJECTION_MATRIX
             camera_to_world_matrix = convert_1d_4x4_to_2d_matrix(
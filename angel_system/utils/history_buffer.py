@@ -0,0 +1,162 @@
+from typing import Any
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+
+class HistoryBuffer:
+    """
+    Append-only array store with amortized O(1) appends.
+
+    Rows are kept in a preallocated array whose capacity grows geometrically,
+    so appending one frame at a time does not copy the whole history on every
+    call the way ``np.append`` does.
+
+    Optionally, a maximum length may be given to bound memory. Only the most
+    recent ``max_len`` rows are then retained. Capacity is capped at twice that
+    and, once full, the retained window is copied to the front of new storage,
+    which still amortizes to O(1) per appended row.
+
+    The current contents are always available as a contiguous, read-only
+    ``numpy.ndarray`` view via :meth:`view` (or ``np.asarray(buffer)``).
+    Storage rows are never overwritten once they are part of the contents, so
+    a view keeps the values it was taken with across later appends.
+
+    >>> b = HistoryBuffer(initial_capacity=2)
+    >>> b.append(1)
+    >>> b.append([2, 3])
+    >>> b.view()
+    array([1., 2., 3.])
+    >>> b = HistoryBuffer(row_shape=(2,), max_len=2)
+    >>> b.append([[0, 1], [2, 3], [4, 5]])
+    >>> b.view()
+    array([[2., 3.],
+           [4., 5.]])
+    >>> len(b), b.num_dropped
+    (2, 1)
+    """
+
+    def __init__(
+        self,
+        row_shape: Tuple[int, ...] = (),
+        dtype: Any = float,
+        initial_capacity: int = 1024,
+        max_len: Optional[int] = None,
+    ):
+        """
+        :param row_shape: Shape of a single row. An empty tuple stores
+            scalars, giving a 1D history.
+        :param dtype: Data type of the stored values.
+        :param initial_capacity: Number of rows to preallocate.
+        :param max_len: Optional maximum number of most-recent rows to retain.
+            When None, the history is unbounded.
+        """
+        if max_len is not None and max_len < 1:
+            raise ValueError(f"max_len must be positive or None, got {max_len}.")
+        self._row_shape = tuple(row_shape)
+        self._max_len = max_len
+        capacity = max(1, initial_capacity)
+        if max_len is not None:
+            capacity = min(capacity, 2 * max_len)
+        self._data = np.empty((capacity,) + self._row_shape, dtype=dtype)
+        # Valid rows are data[_start:_stop]
+        self._start = 0
+        self._stop = 0
+        # Total rows ever appended, including any dropped due to max_len.
+        self._total = 0
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def __array__(self, dtype=None) -> np.ndarray:
+        if dtype is None:
+            return self.view()
+        return self.view().astype(dtype)
+
+    @property
+    def max_len(self) -> Optional[int]:
+        return self._max_len
+
+    @property
+    def num_dropped(self) -> int:
+        """
+        Number of rows that have been discarded due to ``max_len``.
+        """
+        return self._total - len(self)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return (len(self),) + self._row_shape
+
+    def view(self) -> np.ndarray:
+        """
+        Get a read-only view of the retained rows, oldest first.
+
+        The view does not change with later appends or clears, so it only
+        reflects the rows retained at the time it was taken.
+        """
+        v = self._data[self._start : self._stop]
+        v.flags.writeable = False
+        return v
+
+    def append(self, values: Any) -> None:
+        """
+        Append one row, or a block of rows, to the history.
+
+        :param values: Either a single row of ``row_shape``, or an array of
+            shape ``(n, *row_shape)``.
+        """
+        values = np.asarray(values, dtype=self._data.dtype)
+        if values.shape == self._row_shape:
+            values = values[None]
+        n = len(values)
+        if n == 0:
+            return
+        self._total += n
+        if self._max_len is not None and n >= self._max_len:
+            # The block alone fills the window.
+            self._data = np.empty_like(self._data)
+            self._data[: self._max_len] = values[-self._max_len :]
+            self._start = 0
+            self._stop = self._max_len
+            return
+        self._reserve(n)
+        self._data[self._stop : self._stop + n] = values
+        self._stop += n
+        if self._max_len is not None and len(self) > self._max_len:
+            self._start = self._stop - self._max_len
+
+    def clear(self) -> None:
+        """
+        Drop all retained rows, keeping the allocated capacity.
+        """
+        self._data = np.empty_like(self._data)
+        self._start = self._stop = 0
+        self._total = 0
+
+    def _reserve(self, n: int) -> None:
+        """
+        Make room for ``n`` more rows after the current end.
+        """
+        capacity = len(self._data)
+        if self._stop + n <= capacity:
+            return
+        size = len(self)
+        if self._max_len is not None:
+            # Only the rows that will still be in the window after appending
+            # need to be kept.
+            keep = min(size, self._max_len - n)
+            new_capacity = 2 * self._max_len
+        else:
+            keep = size
+            new_capacity = capacity
+            while new_capacity < size + n:
+                new_capacity *= 2
+        # Always copy into new storage, rather than compacting in place, so
+        # views of the current rows keep their values.
+        data = np.empty((new_capacity,) + self._row_shape, self._data.dtype)
+        data[:keep] = self._data[self._stop - keep : self._stop]
+        self._data = data
+        self._start = 0
+        self._stop = keep
@@ -7,6 +7,9 @@ from typing import Optional
 from typing import Reversible
 from typing import TypeVar
 
+import numpy as np
+import numpy.typing as npt
+
 
 T = TypeVar("T")
 
@@ -31,6 +34,9 @@ def descending_match_with_tolerance(
     use-case is that of nanoseconds and with a tolerance that is significantly
     less than the normal distance between key times.
 
+    For large inputs, see the vectorized :func:`match_nearest_with_tolerance`
+    and :func:`match_exact`.
+
     :param key_times: Integer time values (usually nanoseconds) in ascending
         value order to match against.
     :param values: Reversible values to match against key times.
@@ -92,3 +98,86 @@ def descending_match_with_tolerance(
     # ascending time order.
     match_list.reverse()
     return match_list
+
+
+def match_nearest_with_tolerance(
+    key_times: npt.ArrayLike,
+    value_times: npt.ArrayLike,
+    tol: int,
+) -> npt.NDArray[np.intp]:
+    """
+    Match each key time to the nearest value time that is within a tolerance.
+
+    This is a vectorized alternative to `descending_match_with_tolerance`,
+    using a binary search of the value times per key. Unlike the greedy
+    matching done there, every key is matched independently, so a value may
+    be the match of more than one key. The two agree when the tolerance is
+    less than half the distance between consecutive key times, which is the
+    expected use-case.
+
+    :param key_times: Integer time values (usually nanoseconds) to match. These
+        need not be sorted.
+    :param value_times: Integer time values in ascending order to match
+        against.
+    :param tol: Integer time matching tolerance, inclusive.
+
+    :returns: Array parallel to `key_times` of the index into `value_times` of
+        the match for each key, or -1 where no value is within the tolerance.
+        When two values are equally near a key, the later one is matched.
+    """
+    key_times = np.asarray(key_times, dtype=np.int64)
+    value_times = np.asarray(value_times, dtype=np.int64)
+    n = len(value_times)
+    if n == 0:
+        return np.full(key_times.shape, -1, dtype=np.intp)
+    # The nearest value is either the last one at or before the key, or the
+    # first one after it.
+    after = np.searchsorted(value_times, key_times, side="right")
+    before = np.maximum(after - 1, 0)
+    after = np.minimum(after, n - 1)
+    delta_before = np.abs(key_times - value_times[before])
+    delta_after = np.abs(value_times[after] - key_times)
+    use_after = delta_after <= delta_before
+    idx = np.where(use_after, after, before)
+    delta = np.where(use_after, delta_after, delta_before)
+    return np.where(delta <= tol, idx, -1)
+
+
+def match_exact(
+    key_times: npt.ArrayLike,
+    value_times: npt.ArrayLike,
+) -> npt.NDArray[np.intp]:
+    """
+    Match each key time to a value time that is exactly equal to it.
+
+    :param key_times: Integer time values (usually nanoseconds) to match. These
+        need not be sorted.
+    :param value_times: Integer time values in ascending order to match
+        against.
+
+    :returns: Array parallel to `key_times` of the index into `value_times` of
+        the match for each key, or -1 where there is no equal value.
+    """
+    key_times = np.asarray(key_times, dtype=np.int64)
+    value_times = np.asarray(value_times, dtype=np.int64)
+    idx = np.searchsorted(value_times, key_times)
+    found = idx < len(value_times)
+    found[found] = value_times[idx[found]] == key_times[found]
+    return np.where(found, idx, -1)
+
+
+def select_matches(
+    values: Sequence[T], match_idx: npt.NDArray[np.intp]
+) -> List[Optional[T]]:
+    """
+    Get the matched values from match indices as returned by
+    `match_nearest_with_tolerance` or `match_exact`.
+
+    :param values: Values parallel to the value times that were matched
+        against.
+    :param match_idx: Index of the matched value per key, or -1.
+
+    :returns: List parallel to `match_idx` of the matched values, with None
+        where there was no match.
+    """
+    return [values[i] if i >= 0 else None for i in match_idx.tolist()]
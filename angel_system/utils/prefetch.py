@@ -0,0 +1,80 @@
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable
+from typing import Deque
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import TypeVar
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def prefetch_map(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    n_workers: int = 1,
+    max_prefetch: int = 1,
+) -> Iterator[R]:
+    """
+    Map a function over items on background threads, yielding results in
+    input order while up to ``max_prefetch`` further results are computed
+    ahead of the consumer.
+
+    This suits I/O bound functions like image decoding, which then overlaps
+    with the work done on the results, e.g. model inference. Unlike
+    ``ThreadPoolExecutor.map``, items are only consumed as results are, so
+    memory use stays bounded for long or lazy inputs.
+
+    >>> list(prefetch_map(lambda x: x * 2, range(5), n_workers=2, max_prefetch=2))
+    [0, 2, 4, 6, 8]
+
+    :param fn: Function to apply to each item.
+    :param items: Items to apply the function to.
+    :param n_workers: Number of threads applying the function. If 0, the
+        function is applied lazily on the consuming thread.
+    :param max_prefetch: Maximum number of results computed or being computed
+        ahead of the one last yielded. At least 1.
+
+    :raises Exception: Any exception raised by the function, when the result
+        it was computing would have been yielded.
+    """
+    if n_workers <= 0:
+        yield from map(fn, items)
+        return
+    it = iter(items)
+    pending: Deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        try:
+            for item in islice(it, max(max_prefetch, 1)):
+                pending.append(pool.submit(fn, item))
+            while pending:
+                result = pending.popleft().result()
+                for item in islice(it, 1):
+                    pending.append(pool.submit(fn, item))
+                yield result
+        finally:
+            # Don't wait on work whose results won't be consumed, e.g. when
+            # the consumer stopped early or something raised.
+            for f in pending:
+                f.cancel()
+
+
+def batched(items: Iterable[T], n: int) -> Iterator[List[T]]:
+    """
+    Split items into lists of ``n``, the last of which may be shorter.
+
+    >>> list(batched(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+    """
+    if n < 1:
+        raise ValueError(f"Batch size must be at least 1, got {n}.")
+    it = iter(items)
+    batch = list(islice(it, n))
+    while batch:
+        yield batch
+        batch = list(islice(it, n))
@@ -0,0 +1,155 @@
+"""
+Batched computation of the world space rays through image pixels of the
+HoloLens PV camera, and reduction of ray cast hits to the closest hit of each
+ray.
+
+Matrices are the 4x4 world (camera to world) and projection matrices of a
+frame, as given in row-major order by `HeadsetPoseData`.
+"""
+from typing import Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+
+def scale_pixel_coordinates(
+    pixels: npt.ArrayLike, image_width: int, image_height: int
+) -> npt.NDArray[np.float64]:
+    """
+    Scale pixel coordinates to coordinates from -1 to 1 from the image
+    center, with y increasing upwards.
+
+    Adapted from https://github.com/VulcanTechnologies/HoloLensCameraStream
+
+    >>> scale_pixel_coordinates([[0, 0], [50, 75], [200, 100]], 200, 100).tolist()
+    [[-1.0, 1.0], [-0.5, -0.5], [1.0, -1.0]]
+
+    :param pixels: Pixel (x, y) coordinates of shape [n, 2].
+    :param image_width: Width of the image in pixels.
+    :param image_height: Height of the image in pixels.
+    """
+    half_size = np.array([image_width, image_height], dtype=np.float64) / 2.0
+    scaled = (np.asarray(pixels, dtype=np.float64) - half_size) / half_size
+    scaled[:, 1] *= -1.0
+    return scaled
+
+
+def pixels_to_world_points(
+    pixels: npt.ArrayLike,
+    image_width: int,
+    image_height: int,
+    world_matrix: npt.ArrayLike,
+    projection_matrix: npt.ArrayLike,
+    focal_length_x: float,
+    focal_length_y: float,
+) -> npt.NDArray[np.float64]:
+    """
+    Get the world space points at unit depth in front of the camera through
+    each of the given image pixels.
+
+    Adapted from https://github.com/VulcanTechnologies/HoloLensCameraStream
+
+    :param pixels: Pixel (x, y) coordinates of shape [n, 2].
+    :param image_width: Width of the image in pixels.
+    :param image_height: Height of the image in pixels.
+    :param world_matrix: Camera to world matrix of shape [4, 4].
+    :param projection_matrix: Projection matrix of shape [4, 4], of which
+        only the principal point and normalization factor are used.
+    :param focal_length_x: Focal length along x, in scaled coordinates.
+    :param focal_length_y: Focal length along y, in scaled coordinates.
+
+    :returns: World points of shape [n, 3].
+    """
+    scaled = scale_pixel_coordinates(pixels, image_width, image_height)
+    projection_matrix = np.asarray(projection_matrix, dtype=np.float64)
+    norm_factor = projection_matrix[2, 2]
+    center = projection_matrix[:2, 2] / norm_factor
+
+    # NOTE: The negative sign in the z-direction is to convert between the
+    # left-handed Unity coordinates and the right-handed trimesh scene
+    # coordinates.
+    camera_points = np.empty((len(scaled), 3))
+    camera_points[:, :2] = (scaled - center) / [focal_length_x, focal_length_y]
+    camera_points[:, 2] = -1.0 / norm_factor
+    return transform_points(world_matrix, camera_points)
+
+
+def transform_points(
+    matrix: npt.ArrayLike, points: npt.ArrayLike
+) -> npt.NDArray[np.float64]:
+    """
+    Transform 3D points by a 4x4 matrix, as column vectors in homogeneous
+    coordinates, without perspective division.
+
+    :param matrix: Matrix of shape [4, 4].
+    :param points: Points of shape [n, 3].
+
+    :returns: Transformed points of shape [n, 3].
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    return np.asarray(points, dtype=np.float64) @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def camera_rays(
+    pixels: npt.ArrayLike,
+    image_width: int,
+    image_height: int,
+    world_matrix: npt.ArrayLike,
+    projection_matrix: npt.ArrayLike,
+    focal_length_x: float,
+    focal_length_y: float,
+) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    Get the world space rays from the camera through each of the given image
+    pixels, with parameters as for `pixels_to_world_points`.
+
+    :returns: Ray origins, all at the camera position, and ray directions,
+        each of shape [n, 3].
+    """
+    points = pixels_to_world_points(
+        pixels,
+        image_width,
+        image_height,
+        world_matrix,
+        projection_matrix,
+        focal_length_x,
+        focal_length_y,
+    )
+    origin = transform_points(world_matrix, np.zeros((1, 3)))
+    origins = np.repeat(origin, len(points), axis=0)
+    return origins, points - origins
+
+
+def closest_hits(
+    origins: npt.NDArray[np.float64],
+    locations: npt.ArrayLike,
+    index_ray: npt.ArrayLike,
+) -> npt.NDArray[np.float64]:
+    """
+    Reduce ray cast hits, as given by trimesh ray intersectors, to the hit
+    closest to the origin of each ray.
+
+    >>> origins = np.zeros((3, 3))
+    >>> locations = [[0, 0, 2], [0, 0, 1], [1, 0, 0]]
+    >>> closest_hits(origins, locations, [0, 0, 2]).tolist()
+    [[0.0, 0.0, 1.0], [nan, nan, nan], [1.0, 0.0, 0.0]]
+
+    :param origins: Origins of the rays cast, of shape [n, 3].
+    :param locations: Hit locations of shape [k, 3].
+    :param index_ray: Index of the ray of each hit, of shape [k].
+
+    :returns: Location of the closest hit of each ray, of shape [n, 3], with
+        NaNs for rays without hits.
+    """
+    closest = np.full((len(origins), 3), np.nan)
+    index_ray = np.asarray(index_ray, dtype=np.intp)
+    if len(index_ray) == 0:
+        return closest
+    locations = np.asarray(locations, dtype=np.float64)
+    distances = np.linalg.norm(locations - origins[index_ray], axis=1)
+    # Hits ordered by ray, then by distance, so each ray's first is closest.
+    order = np.lexsort((distances, index_ray))
+    sorted_rays = index_ray[order]
+    first = order[np.concatenate([[True], sorted_rays[1:] != sorted_rays[:-1]])]
+    closest[index_ray[first]] = locations[first]
+    return closest
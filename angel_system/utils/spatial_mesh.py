@@ -0,0 +1,141 @@
+"""
+Flat array encoding of spatial mapping meshes, and tracking of which
+surfaces changed since they were last sent.
+
+A mesh of ``n`` vertices and ``m`` triangles is encoded as a float32 vertex
+buffer of ``3 * n`` consecutive (x, y, z) values and a uint32 index buffer of
+``3 * m`` consecutive triangle vertex indices.
+"""
+import hashlib
+from typing import Dict
+from typing import Hashable
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+
+def flatten_mesh(
+    vertices: npt.ArrayLike, triangles: npt.ArrayLike
+) -> Tuple[npt.NDArray[np.float32], npt.NDArray[np.uint32]]:
+    """
+    Encode a mesh as flat vertex and index buffers.
+
+    >>> vb, ib = flatten_mesh([[0, 0, 0, 1], [1, 0, 0, 1], [0, 1, 0, 1]], [[0, 1, 2]])
+    >>> vb.tolist(), ib.tolist()
+    ([0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0, 0.0], [0, 1, 2])
+
+    :param vertices: Vertex positions of shape [n, 3], or of shape [n, 4] in
+        homogeneous coordinates, of which only the first 3 are kept.
+    :param triangles: Triangle vertex indices of shape [m, 3].
+    """
+    vertices = np.asarray(vertices)
+    vertex_buffer = np.ascontiguousarray(vertices[:, :3], dtype=np.float32).ravel()
+    index_buffer = np.ascontiguousarray(triangles, dtype=np.uint32).ravel()
+    return vertex_buffer, index_buffer
+
+
+def unflatten_mesh(
+    vertex_buffer: npt.ArrayLike, index_buffer: npt.ArrayLike
+) -> Tuple[npt.NDArray[np.float32], npt.NDArray[np.uint32]]:
+    """
+    Decode flat vertex and index buffers into vertex positions of shape
+    [n, 3] and triangle vertex indices of shape [m, 3].
+
+    Buffers that support the buffer protocol with the right item type, e.g.
+    the ``array.array`` of ROS message fields, are viewed without copying.
+    """
+    vertices = np.asarray(vertex_buffer, dtype=np.float32).reshape(-1, 3)
+    triangles = np.asarray(index_buffer, dtype=np.uint32).reshape(-1, 3)
+    return vertices, triangles
+
+
+def mesh_fingerprint(
+    vertex_buffer: npt.NDArray[np.float32], index_buffer: npt.NDArray[np.uint32]
+) -> bytes:
+    """
+    Digest of the content of a flat encoded mesh, to tell if it changed.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(vertex_buffer).data)
+    h.update(np.ascontiguousarray(index_buffer).data)
+    return h.digest()
+
+
+def surface_id_and_update_time(surface) -> Tuple[bytes, Optional[int]]:
+    """
+    Get the ID and, if reported, the update time of an observed surface as
+    given by the HL2SS spatial mapping client.
+
+    Depending on the HL2SS version, surfaces are given either as bare 16 byte
+    GUIDs or as info objects with ``id`` and ``update_time`` attributes.
+    """
+    return getattr(surface, "id", surface), getattr(surface, "update_time", None)
+
+
+class SurfaceVersions:
+    """
+    Tracks the version of each surface that was last sent, or received, to
+    tell which surfaces changed since.
+
+    A version is any hashable that changes when the surface does, e.g. its
+    update time or, if that is not known, a fingerprint of its mesh.
+
+    >>> sent = SurfaceVersions()
+    >>> sent.changed(b"a", 1)
+    True
+    >>> sent.update(b"a", 1)
+    >>> sent.changed(b"a", 1), sent.changed(b"a", 2)
+    (False, True)
+    >>> sent.update(b"b", 1)
+    >>> sent.discard_missing([b"b", b"c"])
+    [b'a']
+    """
+
+    def __init__(self):
+        self._versions: Dict[Hashable, Hashable] = {}
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    def __contains__(self, surface_id: Hashable) -> bool:
+        return surface_id in self._versions
+
+    def changed(self, surface_id: Hashable, version: Hashable) -> bool:
+        """
+        If a surface is new, or its version differs from the one last sent.
+        """
+        return self._versions.get(surface_id) != version
+
+    def update(self, surface_id: Hashable, version: Hashable) -> None:
+        """
+        Record the version of a surface that was sent.
+        """
+        self._versions[surface_id] = version
+
+    def discard(self, surface_id: Hashable) -> bool:
+        """
+        Forget a surface, e.g. when it was removed.
+
+        :returns: If the surface was tracked.
+        """
+        return self._versions.pop(surface_id, None) is not None
+
+    def discard_missing(self, surface_ids: Iterable[Hashable]) -> List[Hashable]:
+        """
+        Forget the surfaces that are not among the given ones, e.g. those no
+        longer observed.
+
+        :param surface_ids: IDs of the surfaces still present.
+
+        :returns: IDs of the surfaces forgotten, in the order they were first
+            tracked.
+        """
+        present = set(surface_ids)
+        missing = [i for i in self._versions if i not in present]
+        for i in missing:
+            del self._versions[i]
+        return missing
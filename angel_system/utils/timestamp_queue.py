@@ -0,0 +1,283 @@
+from typing import Generic
+from typing import List
+from typing import Optional
+from typing import TypeVar
+
+import numpy as np
+
+from angel_system.utils.matching import match_exact
+from angel_system.utils.matching import match_nearest_with_tolerance
+
+
+T = TypeVar("T")
+
+
+class TimestampQueue(Generic[T]):
+    """
+    FIFO queue of items keyed by strictly ascending integer timestamps
+    (usually nanoseconds).
+
+    Timestamps are kept in an ``int64`` array parallel to the items so that
+    lookups are binary searches and ranges are slices, instead of converting
+    and scanning every item. Items are appended at the back and dropped from
+    the front. Dropped slots are reclaimed by periodically shifting the live
+    region back to the start of the storage, so appends and drops are both
+    amortized O(1) and the live region is always contiguous: :attr:`times`
+    and :meth:`items` never need to stitch together a wrapped-around range.
+
+    Indices are relative to the oldest item currently in the queue.
+
+    >>> q = TimestampQueue()
+    >>> for t in (10, 20, 30, 40):
+    ...     q.append(t, f"item{t}")
+    >>> q.times
+    array([10, 20, 30, 40])
+    >>> q.index_of(30), q.index_of(35)
+    (2, None)
+    >>> q.index_nearest(34, tol=5), q.index_nearest(35, tol=4)
+    (2, None)
+    >>> q.match(np.array([15, 20, 40]))
+    [None, 'item20', 'item40']
+    >>> q.drop_before(25)
+    2
+    >>> q.items(), q[0]
+    (['item30', 'item40'], 'item30')
+    """
+
+    def __init__(self, initial_capacity: int = 64):
+        """
+        :param initial_capacity: Number of timestamps to preallocate.
+        """
+        self._times = np.empty(max(initial_capacity, 1), dtype=np.int64)
+        self._items: List[T] = []
+        # Live entries are _times[_start:_stop] and _items[_start:].
+        self._start = 0
+        self._stop = 0
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def __getitem__(self, index: int) -> T:
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("TimestampQueue index out of range")
+        return self._items[self._start + index]
+
+    @property
+    def times(self) -> np.ndarray:
+        """
+        Read-only view of the timestamps of the queued items, oldest first.
+
+        The view is invalidated by the next append or drop.
+        """
+        v = self._times[self._start : self._stop]
+        v.flags.writeable = False
+        return v
+
+    def last_time(self) -> int:
+        """
+        :raises IndexError: The queue is empty.
+        """
+        if not len(self):
+            raise IndexError("No items queued.")
+        return int(self._times[self._stop - 1])
+
+    def items(self, start: int = 0, stop: Optional[int] = None) -> List[T]:
+        """
+        Items in the index range ``[start, stop)``, oldest first.
+        """
+        n = len(self)
+        stop = n if stop is None else min(stop, n)
+        start = max(start, 0)
+        return self._items[self._start + start : self._start + stop]
+
+    def append(self, time: int, item: T) -> None:
+        """
+        Append an item. Its timestamp must be after the latest queued one.
+
+        :raises ValueError: The timestamp is not after the latest queued one.
+        """
+        if len(self) and time <= self._times[self._stop - 1]:
+            raise ValueError(
+                f"Timestamp {time} is not after the latest queued timestamp "
+                f"{self._times[self._stop - 1]}."
+            )
+        if self._stop == len(self._times):
+            self._make_room()
+        self._times[self._stop] = time
+        self._items.append(item)
+        self._stop += 1
+
+    def drop_before(self, time: int) -> int:
+        """
+        Drop all items with a timestamp strictly before the given one.
+
+        :returns: Number of items dropped.
+        """
+        n_drop = int(np.searchsorted(self.times, time, side="left"))
+        self._drop(n_drop)
+        return n_drop
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._start = self._stop = 0
+
+    def index_of(self, time: int) -> Optional[int]:
+        """
+        Index of the item with exactly the given timestamp, or None.
+        """
+        times = self.times
+        i = int(np.searchsorted(times, time))
+        if i < len(times) and times[i] == time:
+            return i
+        return None
+
+    def index_nearest(self, time: int, tol: int) -> Optional[int]:
+        """
+        Index of the item with the timestamp nearest to the given one, if it
+        is within a tolerance, or None. Of two equally near, the later one.
+
+        :param time: Integer time to look up.
+        :param tol: Integer time matching tolerance, inclusive.
+        """
+        i = int(match_nearest_with_tolerance([time], self.times, tol)[0])
+        return i if i >= 0 else None
+
+    def match(self, key_times: np.ndarray) -> List[Optional[T]]:
+        """
+        Items whose timestamps exactly equal each of the given times.
+
+        :param key_times: Integer times to look up.
+
+        :returns: List parallel to ``key_times`` of the matching item, or None
+            where no item has that timestamp.
+        """
+        match_idx = match_exact(key_times, self.times)
+        items = self._items
+        offset = self._start
+        return [items[offset + i] if i >= 0 else None for i in match_idx.tolist()]
+
+    def _drop(self, n: int) -> None:
+        # Release dropped items now rather than at the next compaction.
+        self._items[self._start : self._start + n] = [None] * n
+        self._start += n
+        if self._start == self._stop:
+            self.clear()
+
+    def _make_room(self) -> None:
+        """
+        Reclaim dropped slots, or grow the storage if at least half of it is
+        live.
+        """
+        n = len(self)
+        if n * 2 >= len(self._times):
+            times = np.empty(len(self._times) * 2, dtype=np.int64)
+        else:
+            times = self._times
+        times[:n] = self._times[self._start : self._stop]
+        self._times = times
+        del self._items[: self._start]
+        self._start = 0
+        self._stop = n
+
+
+class TimestampHistory(Generic[T]):
+    """
+    Recent items keyed by strictly ascending integer timestamps (usually
+    nanoseconds), looked up by exact or nearest timestamp.
+
+    Items older than a time horizon before the latest item are dropped as
+    items are added. This keeps memory bounded however rarely items are
+    looked up, and lookups never drop items. Lookups are binary searches and
+    are counted as exact hits, nearest hits or misses.
+
+    >>> h = TimestampHistory(horizon=100)
+    >>> [h.add(t, f"item{t}") for t in (0, 50, 100, 150, 150)]
+    [True, True, True, True, False]
+    >>> len(h), h.oldest_time()
+    (3, 50)
+    >>> h.lookup(100), h.lookup(140, tol=10), h.lookup(125, tol=10), h.lookup(0)
+    ('item100', 'item150', None, None)
+    >>> h.n_exact, h.n_nearest, h.n_misses
+    (1, 1, 2)
+    """
+
+    def __init__(self, horizon: int, max_len: Optional[int] = None):
+        """
+        :param horizon: Integer time before the latest item's timestamp from
+            which items are kept, inclusive.
+        :param max_len: Optional maximum number of most recent items to keep,
+            to also bound memory when items come faster than expected.
+        """
+        if horizon < 0:
+            raise ValueError(f"horizon must not be negative, got {horizon}.")
+        if max_len is not None and max_len < 1:
+            raise ValueError(f"max_len must be positive or None, got {max_len}.")
+        self._queue: TimestampQueue[T] = TimestampQueue()
+        self.horizon = horizon
+        self.max_len = max_len
+
+        # Counts of lookups that found an item of exactly the timestamp, that
+        # found the nearest item within the tolerance, and that found none.
+        self.n_exact = 0
+        self.n_nearest = 0
+        self.n_misses = 0
+        # Count of items not added, as their timestamps were not after the
+        # latest item's.
+        self.n_out_of_order = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def oldest_time(self) -> int:
+        """
+        :raises IndexError: The history is empty.
+        """
+        if not len(self._queue):
+            raise IndexError("No items in history.")
+        return int(self._queue.times[0])
+
+    def add(self, time: int, item: T) -> bool:
+        """
+        Add an item, and drop those that are now past the horizon.
+
+        :returns: False if the item was not added as its timestamp is not
+            after the latest item's.
+        """
+        q = self._queue
+        if len(q) and time <= q.last_time():
+            self.n_out_of_order += 1
+            return False
+        q.append(time, item)
+        cutoff = time - self.horizon
+        if self.max_len is not None and len(q) > self.max_len:
+            cutoff = max(cutoff, int(q.times[len(q) - self.max_len]))
+        if q.times[0] < cutoff:
+            q.drop_before(cutoff)
+        return True
+
+    def lookup(self, time: int, tol: int = 0) -> Optional[T]:
+        """
+        Get the item of exactly the given timestamp or, failing that, of the
+        nearest timestamp within a tolerance.
+
+        :param time: Integer time to look up.
+        :param tol: Integer time matching tolerance, inclusive. Only exact
+            matches are looked up if 0.
+
+        :returns: The item found, or None.
+        """
+        q = self._queue
+        i = q.index_of(time)
+        if i is not None:
+            self.n_exact += 1
+            return q[i]
+        if tol > 0:
+            i = q.index_nearest(time, tol)
+            if i is not None:
+                self.n_nearest += 1
+                return q[i]
+        self.n_misses += 1
+        return None
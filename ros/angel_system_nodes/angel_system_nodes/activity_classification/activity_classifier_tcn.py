@@ -8,10 +8,14 @@ import json
 from pathlib import Path
 from threading import Condition, Event, Lock, Thread
 from typing import Callable
+from typing import Dict
+from typing import Iterator
 from typing import List
 from typing import Optional
-import re
+from typing import Sequence
+import time
 from typing import Tuple
+from typing import Union
 
 import kwcoco
 from builtin_interfaces.msg import Time
@@ -21,7 +25,7 @@ from pytorch_lightning.utilities import move_data_to_device
 from rclpy.callback_groups import MutuallyExclusiveCallbackGroup
 from rclpy.node import Node
 import torch
-from torch.utils.data import DataLoader
+from torch.utils.data.dataloader import default_collate
 from tcn_hpl.data.ptg_datamodule import create_dataset_from_hydra
 from tcn_hpl.data.frame_data import (
     FrameData,
@@ -31,13 +35,27 @@ from tcn_hpl.data.frame_data import (
 from tcn_hpl.models.ptg_module import PTGLitModule
 from angel_msgs.msg import ImageMetadata
 
+from angel_system.activity_classification.coco_replay import (
+    CocoReplaySource,
+    ReplayFrame,
+    sliding_windows,
+)
+from angel_system.activity_classification.window_scheduler import (
+    ACTION_DROP,
+    ACTION_PROCESS,
+    WindowDecision,
+    WindowMetrics,
+    WindowScheduler,
+)
 from angel_system.activity_classification.tcn_hpl.predict import (
     ResultsCollector,
+    StreamingResultsCollector,
 )
 from angel_system.data.common.config_structs import load_activity_label_set
 from angel_system.utils.event import WaitAndClearEvent
 from angel_system.utils.simple_timer import SimpleTimer
 
+from std_msgs.msg import String as ros2_string
 from angel_msgs.msg import (
     ObjectDetection2dSet,
     ActivityDetection,
@@ -46,7 +64,7 @@ from angel_msgs.msg import (
 )
 from angel_utils import declare_and_get_parameters, make_default_main, RateTracker
 from angel_utils.activity_classification import InputWindow, InputBuffer
-from angel_utils.conversion import time_to_int
+from angel_utils.conversion import max_class_and_conf, time_to_int
 
 
 # Input ROS topic for RGB Image Metadata
@@ -75,10 +93,22 @@ PARAM_RT_HEARTBEAT = "rt_thread_heartbeat"
 # predictions. If a path is provided, we will accumulate and output at node
 # closure.
 PARAM_OUTPUT_COCO_FILEPATH = "output_predictions_kwcoco"
+# When greater than zero, predictions being output to a COCO file are instead
+# flushed to chunk files next to it (in a ".chunks" directory) every this many
+# predictions, on a background thread, and assembled into the COCO file at
+# node closure. This keeps memory use flat over long sessions and keeps the
+# predictions flushed so far if the node does not close cleanly. If zero,
+# predictions are accumulated in memory.
+PARAM_OUTPUT_COCO_FLUSH_EVERY = "output_predictions_flush_every"
 # Optional input COCO file of video frame object detections to be used as input
 # for activity classification. This should not be used simultaneously when
 # interfacing with ROS-based object detection input - behavior is undefined.
 PARAM_INPUT_COCO_FILEPATH = "input_obj_det_kwcoco"
+# When true, the input COCO file of object detections is replayed by running
+# the model on each frame's window directly, as fast as the model allows,
+# instead of feeding each frame through the input buffer and the runtime loop
+# in lock-step. Predictions are the same either way.
+PARAM_INPUT_COCO_FAST_REPLAY = "input_obj_det_kwcoco_fast_replay"
 # If we should enable additional logging to the info level about when we
 # receive and process data.
 PARAM_TIME_TRACE_LOGGING = "enable_time_trace_logging"
@@ -98,6 +128,25 @@ PARAM_WINDOW_LEADS_WITH_OBJECTS = "window_leads_with_objects"
 # inputs when it decides not to create an activity classification.
 # the format will be csv with a list of the object detections and the pose
 PARAM_DEBUG_FILE = "debug_file"
+# Policy deciding whether the latest window is processed when the runtime loop
+# is free, for when windows become ready faster than they are processed. One
+# of:
+# * "latest": Always process the latest window.
+# * "every_nth": Only process a window led by a frame at least
+#   `window_every_n` frames after the leading frame of the last processed one.
+# * "deadline": Drop, instead of process, a window that has been ready for
+#   longer than `window_deadline_seconds`.
+PARAM_WINDOW_POLICY = "window_policy"
+# Frame interval for the "every_nth" window policy.
+PARAM_WINDOW_EVERY_N = "window_every_n"
+# Maximum seconds a window may wait to be processed, for the "deadline" window
+# policy.
+PARAM_WINDOW_DEADLINE = "window_deadline_seconds"
+# Optional output ROS topic of per-window scheduling metrics, as JSON strings:
+# the queue delay and processing time of each processed or dropped window, the
+# number of frames skipped since the last processed window, and running totals.
+# If no value or an empty string is provided, metrics are not published.
+PARAM_METRICS_TOPIC = "metrics_topic"
 
 
 class NoActivityClassification(Exception):
@@ -115,11 +164,108 @@ def max_det_class_score(
     :param msg: Input message.
     :return: Tuple of index and score.
     """
-    mat_shape = (msg.num_detections, len(msg.label_vec))
-    conf_mat = np.asarray(msg.label_confidences).reshape(mat_shape)
-    max_conf_idxs = conf_mat.argmax(axis=1)
-    max_confs = conf_mat[np.arange(conf_mat.shape[0]), max_conf_idxs]
-    return max_conf_idxs, max_confs
+    return max_class_and_conf(msg)
+
+
+def frame_data_from_msgs(
+    m_dets: Optional[ObjectDetection2dSet],
+    m_pose: Optional[HandJointPosesUpdate],
+    cam_info: ImageMetadata,
+) -> FrameData:
+    """
+    Convert the messages associated with a frame into the structure used by
+    the TCN vectorization dataset.
+
+    :param m_dets: Object detections for the frame, if any.
+    :param m_pose: Patient pose estimation for the frame, if any.
+    :param cam_info: Metadata of the frame's image.
+    """
+    f_dets: Optional[FrameObjectDetections] = None
+    f_pose: Optional[FramePoses] = None
+    if m_dets is not None:
+        # Convert message xyxy into xywh
+        bbox = np.asarray([m_dets.left, m_dets.top, m_dets.right, m_dets.bottom]).T
+        bbox[:, 2:] -= bbox[:, :2]
+        cats, scores = max_det_class_score(m_dets)
+        f_dets = FrameObjectDetections(
+            bbox,
+            cats,
+            scores,
+        )
+    if m_pose is not None:
+        # Turns out, we are storing the confidence as the Z position in the
+        # message.
+        joints = np.array(
+            [
+                (j.pose.position.x, j.pose.position.y, j.pose.position.z)
+                for j in m_pose.joints
+            ]
+        ).reshape(-1, 3)
+        f_pose = FramePoses(
+            # No whole-pose score, so just filling in 1.0 for now.
+            np.array([1.0]),
+            # (x,y) coordinates for each joint for our single pose.
+            # Shape (1, n_joints, 2)
+            joints[None, :, :2],
+            # Confidence for each joint. Shape (1, n_joints)
+            joints[None, :, 2],
+        )
+    return FrameData(
+        f_dets,
+        f_pose,
+        (cam_info.width, cam_info.height),
+    )
+
+
+# Per-frame row of the debug table of a window: frame number, frame time in
+# nanoseconds, and number of object detections and of pose key-points, if any
+# were received for the frame.
+DebugRow = Tuple[int, int, Optional[int], Optional[int]]
+
+
+def debug_window_csv(rows: Sequence[DebugRow]) -> str:
+    """
+    Format the table of a window that did not yield an activity
+    classification as CSV, oldest frame first, as written to the debug file.
+    Missing counts are written as "<NA>".
+    """
+    lines = ["index,frame_number,frame_nsec,detections,poses"]
+    for i, row in enumerate(rows):
+        lines.append(
+            ",".join([str(i)] + ["<NA>" if v is None else str(v) for v in row])
+        )
+    return "\n".join(lines)
+
+
+def frame_data_from_replay(frame: ReplayFrame, n_labels: int) -> FrameData:
+    """
+    Convert a frame of replayed COCO object detections into the structure
+    used by the TCN vectorization dataset, as `frame_data_from_msgs` would
+    from the messages made of the frame to feed through the input buffer.
+
+    :param frame: Replayed frame.
+    :param n_labels: Number of object detection labels.
+    """
+    bbox = frame.ltrb.copy()
+    bbox[:, 2:] -= bbox[:, :2]
+    if len(bbox):
+        conf_mat = frame.confidence_matrix(n_labels)
+        cats = conf_mat.argmax(axis=1)
+        scores = conf_mat[np.arange(len(cats)), cats]
+    else:
+        cats, scores = np.empty(0, dtype=int), np.empty(0)
+    return FrameData(
+        FrameObjectDetections(bbox, cats, scores),
+        None,
+        (frame.width, frame.height),
+    )
+
+
+# Conversion of a frame's messages to FrameData, with the detection and pose
+# messages it was converted from.
+FrameDataCacheEntry = Tuple[
+    Optional[ObjectDetection2dSet], Optional[HandJointPosesUpdate], FrameData
+]
 
 
 class ActivityClassifierTCN(Node):
@@ -148,12 +294,18 @@ class ActivityClassifierTCN(Node):
                 (PARAM_BUFFER_MAX_SIZE_SECONDS, 15),
                 (PARAM_RT_HEARTBEAT, 0.1),
                 (PARAM_OUTPUT_COCO_FILEPATH, ""),
+                (PARAM_OUTPUT_COCO_FLUSH_EVERY, 0),
                 (PARAM_INPUT_COCO_FILEPATH, ""),
+                (PARAM_INPUT_COCO_FAST_REPLAY, False),
                 (PARAM_TIME_TRACE_LOGGING, True),
                 (PARAM_TOPIC, "medical"),
                 (PARAM_POSE_REPEAT_RATE, 0),
                 (PARAM_WINDOW_LEADS_WITH_OBJECTS, False),
                 (PARAM_DEBUG_FILE, ""),
+                (PARAM_WINDOW_POLICY, "latest"),
+                (PARAM_WINDOW_EVERY_N, 1),
+                (PARAM_WINDOW_DEADLINE, 0.0),
+                (PARAM_METRICS_TOPIC, ""),
             ],
         )
         self._img_md_topic = param_values[PARAM_IMG_MD_TOPIC]
@@ -165,6 +317,7 @@ class ActivityClassifierTCN(Node):
         self._act_topic = param_values[PARAM_ACT_TOPIC]
         self._act_config = load_activity_label_set(param_values[PARAM_ACT_CONFIG_FILE])
         self._enable_trace_logging = param_values[PARAM_TIME_TRACE_LOGGING]
+        self._debug_file = param_values[PARAM_DEBUG_FILE]
 
         self._window_lead_with_objects = param_values[PARAM_WINDOW_LEADS_WITH_OBJECTS]
 
@@ -195,7 +348,10 @@ class ActivityClassifierTCN(Node):
         #       detections has completed.
         self._coco_complete_lock = Lock()
         self._coco_load_thread = None
-        if input_coco_path is not None:
+        self._coco_fast_replay = (
+            input_coco_path is not None and param_values[PARAM_INPUT_COCO_FAST_REPLAY]
+        )
+        if input_coco_path is not None and not self._coco_fast_replay:
             self._coco_load_thread = Thread(
                 target=self._thread_populate_from_coco,
                 name="coco_loader",
@@ -207,19 +363,31 @@ class ActivityClassifierTCN(Node):
         # Setup optional results output to a COCO file at end of runtime.
         tmp_str: str = param_values[PARAM_OUTPUT_COCO_FILEPATH]
         self._output_kwcoco_path: Optional[Path] = Path(tmp_str) if tmp_str else None
-        self._results_collector: Optional[ResultsCollector] = None
+        self._results_collector: Optional[
+            Union[ResultsCollector, StreamingResultsCollector]
+        ] = None
         if self._output_kwcoco_path:
             log.info(
                 f"Collecting predictions and outputting to: "
                 f"{self._output_kwcoco_path}"
             )
-            self._results_collector = ResultsCollector(
-                self._output_kwcoco_path,
-                {l.id: l.label for l in self._act_config.labels},
-            )
+            id_to_action = {l.id: l.label for l in self._act_config.labels}
+            flush_every = param_values[PARAM_OUTPUT_COCO_FLUSH_EVERY]
+            if flush_every > 0:
+                self._results_collector = StreamingResultsCollector(
+                    self._output_kwcoco_path, id_to_action, flush_every=flush_every
+                )
+                log.info(
+                    f"Flushing predictions every {flush_every} to: "
+                    f"{self._results_collector.chunk_dir}"
+                )
+            else:
+                self._results_collector = ResultsCollector(
+                    self._output_kwcoco_path, id_to_action
+                )
             # If we are loading from a COCO detections file, it will set the
-            # video in the loading thread.
-            if self._coco_load_thread is None:
+            # video in the loading or replay thread.
+            if input_coco_path is None:
                 self._results_collector.set_video("ROS2 Stream")
 
         # Input data buffer for temporal windowing.
@@ -235,6 +403,10 @@ class ActivityClassifierTCN(Node):
         self._buffer_max_size_nsec = int(
             param_values[PARAM_BUFFER_MAX_SIZE_SECONDS] * 1e9
         )
+        # Converted model inputs of the frames of the most recently processed
+        # window, keyed by frame time in nanoseconds. Only used on the runtime
+        # loop thread.
+        self._frame_data_cache: Dict[int, FrameDataCacheEntry] = {}
 
         # Time of the most recent window extracted from the buffer in the
         # runtime loop.
@@ -290,6 +462,24 @@ class ActivityClassifierTCN(Node):
 
         self._rate_tracker = RateTracker()
 
+        # Scheduling of which windows are processed, with its accounting.
+        # This needs to be initialized before ROS callbacks mark frames as
+        # ready in it.
+        self._window_scheduler = WindowScheduler(
+            param_values[PARAM_WINDOW_POLICY],
+            every_n=param_values[PARAM_WINDOW_EVERY_N],
+            deadline_ns=int(param_values[PARAM_WINDOW_DEADLINE] * 1e9),
+        )
+        log.info(f"Window scheduling policy: {self._window_scheduler.policy}")
+        self._metrics_publisher = None
+        if param_values[PARAM_METRICS_TOPIC]:
+            self._metrics_publisher = self.create_publisher(
+                ros2_string,
+                param_values[PARAM_METRICS_TOPIC],
+                1,
+                callback_group=MutuallyExclusiveCallbackGroup(),
+            )
+
         # Start windowed prediction runtime thread.
         # On/Off Switch for runtime loop, initializing to "on" position.
         # Clear this event to deactivate the runtime loop.
@@ -300,7 +490,15 @@ class ActivityClassifierTCN(Node):
         self._rt_active_heartbeat = param_values[PARAM_RT_HEARTBEAT]
         # Condition that the runtime should perform processing
         self._rt_awake_evt = WaitAndClearEvent()
-        self._rt_thread = Thread(target=self.rt_loop, name="prediction_runtime")
+        if self._coco_fast_replay:
+            log.info(f"Replaying input COCO file: {input_coco_path}")
+            self._rt_thread = Thread(
+                target=self.rt_replay_coco,
+                name="prediction_runtime",
+                args=(input_coco_path,),
+            )
+        else:
+            self._rt_thread = Thread(target=self.rt_loop, name="prediction_runtime")
         self._rt_thread.daemon = True
         # Thread start at bottom of constructor.
 
@@ -421,6 +619,10 @@ class ActivityClassifierTCN(Node):
                     f"Queueing image TS {msg.header.stamp} frame {self._current_frame_number}"
                 )
 
+            # Record when this frame was received, for the scheduler to know
+            # when a window led by it became ready.
+            self._window_scheduler.mark_ready(time_to_int(msg.image_source_stamp))
+
             # If we are configured to prefer the latest image received as the
             # latest image in the processing window, indicate the runtime upon
             # receiving new images that it should try to process a window now.
@@ -445,6 +647,9 @@ class ActivityClassifierTCN(Node):
             # processing window, indicate the runtime upon receiving new object
             # detections received that it should try to process a window now.
             if self._window_lead_with_objects:
+                # A window led by this frame is only ready once both the frame
+                # and its detections are received, in either order.
+                self._window_scheduler.mark_ready(time_to_int(msg.source_stamp))
                 # Let the runtime know we've queued something.
                 self._rt_awake_evt.set()
 
@@ -595,11 +800,20 @@ class ActivityClassifierTCN(Node):
 
                 # log.info(f"if func for window process: {all(fn(window) for fn in window_processing_criterion_fn_list)}")
 
+                # Windows meeting all criterion are then subject to the
+                # scheduling policy.
+                decision: Optional[WindowDecision] = None
                 if all(fn(window) for fn in window_processing_criterion_fn_list):
+                    decision = self._window_scheduler.decide(
+                        window.frames[-1][2], window_time_ns
+                    )
+
+                if decision is not None and decision.action == ACTION_PROCESS:
                     # After validating a window, and before processing it, clear
                     # out older data at and before the first item in the window.
                     self._buffer.clear_before(time_to_int(window.frames[1][0]))
 
+                    processing_start_ns = time.monotonic_ns()
                     try:
                         if enable_time_trace_logging:
                             log.info(
@@ -623,20 +837,50 @@ class ActivityClassifierTCN(Node):
                             "not yield an activity classification for "
                             "publishing."
                         )
-                        if self._debug_file != "":
-                            # save the info for why this window was not processed
-                            repr = window.__repr__()
-                            # clean this output for easier viewing (CSV)
-                            repr = "index" + repr  # add a column for the index
-                            repr = re.sub(" +", ",", repr)  # replace spaces with commas
-                            with open(self._debug_file, "a") as f:
-                                f.write(f"{repr}\n")
+                        # save the info for why this window was not processed
+                        self._write_debug_window(
+                            [
+                                (
+                                    f[2],
+                                    time_to_int(f[0]),
+                                    d.num_detections if d else None,
+                                    len(p.joints) if p else None,
+                                )
+                                for f, d, p in zip(
+                                    window.frames,
+                                    window.obj_dets,
+                                    window.patient_joint_kps,
+                                )
+                            ]
+                        )
 
                     # This window has completed processing - record its leading
                     # timestamp now.
                     self._window_processed_time_ns = window_time_ns
+                    self._publish_window_metrics(
+                        self._window_scheduler.record(
+                            decision, time.monotonic_ns() - processing_start_ns
+                        )
+                    )
                 else:
-                    log.debug("Runtime loop window criterion check(s) failed.")
+                    if decision is None:
+                        log.debug("Runtime loop window criterion check(s) failed.")
+                    elif decision.action == ACTION_DROP:
+                        log.warn(
+                            f"Dropping window with leading frame "
+                            f"{decision.frame_number}: ready for "
+                            f"{decision.queue_delay_ns / 1e9:.3f}s, past the "
+                            f"deadline.",
+                            throttle_duration_sec=1,
+                        )
+                        self._publish_window_metrics(
+                            self._window_scheduler.record(decision)
+                        )
+                    else:
+                        log.debug(
+                            f"Skipping window with leading frame "
+                            f"{decision.frame_number} by window policy."
+                        )
                     with self._buffer:
                         # Clear to at least our maximum buffer size even if we
                         # didn't process anything (if there is anything *in*
@@ -659,6 +903,114 @@ class ActivityClassifierTCN(Node):
 
         log.info("Runtime function end.")
 
+    def _write_debug_window(self, rows: Sequence[DebugRow]) -> None:
+        """
+        Append the table of a window that did not yield an activity
+        classification to the debug file, if we were initialized with one.
+        """
+        if self._debug_file != "":
+            with open(self._debug_file, "a") as f:
+                f.write(f"{debug_window_csv(rows)}\n")
+
+    def _publish_window_metrics(self, metrics: WindowMetrics) -> None:
+        """
+        Publish the scheduling metrics of a window, if we were initialized
+        with a metrics topic.
+        """
+        if self._metrics_publisher is not None:
+            msg = ros2_string()
+            msg.data = json.dumps(metrics._asdict())
+            self._metrics_publisher.publish(msg)
+
+    def rt_replay_coco(self, input_coco_path: Path) -> None:
+        """
+        Activity classification prediction runtime function replaying an
+        input COCO file of object detections.
+
+        Each frame is handled as it would be if fed through the input buffer
+        with `_thread_populate_from_coco` and windowed by `rt_loop`: its image
+        is collected, and once there are enough frames, the window of frames
+        it leads is classified. Frames are converted once and windows are
+        taken directly from the file, so the model runs back to back.
+        """
+        log = self.get_logger()
+        log.info("Replay runtime starting")
+        with SimpleTimer("Loading COCO object detections...", log.info):
+            try:
+                source = CocoReplaySource(input_coco_path)
+            except ValueError as ex:
+                log.error(str(ex))
+                self._rt_active.clear()
+                return
+        if self._results_collector:
+            self._results_collector.set_video(source.videos[0]["name"])
+        n_labels = len(source.labels)
+
+        def converted_frames() -> Iterator[Tuple[ReplayFrame, int, FrameData]]:
+            prev_frame_index: Optional[int] = None
+            # Frames are numbered as they are received, including those then
+            # dropped, as by the image metadata callback.
+            for frame_number, frame in enumerate(source):
+                # The input buffer only queues frames after its latest.
+                if (
+                    prev_frame_index is not None
+                    and frame.frame_index <= prev_frame_index
+                ):
+                    log.warn(
+                        f"Input image frame was NOT after the previous latest: "
+                        f"(prev) {prev_frame_index} !< {frame.frame_index} (new)"
+                    )
+                    continue
+                prev_frame_index = frame.frame_index
+                yield frame, frame_number, frame_data_from_replay(frame, n_labels)
+
+        n_windows = 0
+        with SimpleTimer(f"Replaying {len(source)} frames", log.info):
+            for (frame, _, _), window in sliding_windows(
+                converted_frames(), self._window_size
+            ):
+                if not self._rt_keep_looping():
+                    log.info("Replay stopped before the end of the input.")
+                    break
+                # Arbitrary time for alignment in windowing, as when feeding
+                # the buffer.
+                end_stamp = Time(sec=0, nanosec=frame.frame_index)
+                image_gid = self._collect_image(end_stamp)
+                if len(window) < self._window_size:
+                    continue
+                try:
+                    act_msg = self._predict_window(
+                        [frame_data for _, _, frame_data in window],
+                        Time(sec=0, nanosec=window[0][0].frame_index),
+                        end_stamp,
+                    )
+                except NoActivityClassification:
+                    log.warn(
+                        "Replay window processing did not yield an activity "
+                        "classification for publishing."
+                    )
+                    # No pose key-points are replayed.
+                    self._write_debug_window(
+                        [
+                            (
+                                frame_number,
+                                time_to_int(Time(sec=0, nanosec=f.frame_index)),
+                                len(f.confidences),
+                                None,
+                            )
+                            for f, frame_number, _ in window
+                        ]
+                    )
+                    continue
+                self._collect_results(act_msg, image_gid)
+                act_msg.header.frame_id = "Activity Classification"
+                act_msg.header.stamp = self.get_clock().now().to_msg()
+                self._activity_publisher.publish(act_msg)
+                n_windows += 1
+
+        log.info(f"Completed COCO file replay ({n_windows} windows classified)")
+        self._rt_active.clear()
+
     def _process_window(self, window: InputWindow) -> ActivityDetection:
         """
         Process an input window and output an activity classification message.
@@ -674,56 +1026,50 @@ class ActivityClassifierTCN(Node):
         log.info("processing window...")
 
         # Convert window ROS Messages into something appropriate for setting to
-        # the vectorization dataset.
+        # the vectorization dataset. Consecutive windows overlap by all but
+        # their newest frame, so reuse the conversions from the previous window.
+        prev_cache = self._frame_data_cache
+        frame_data_cache: Dict[int, FrameDataCacheEntry] = {}
         window_data: List[FrameData] = []
-        for m_dets, m_pose, cam_info in zip(
-            window.obj_dets, window.patient_joint_kps, window.camera_info
+        for frame, m_dets, m_pose, cam_info in zip(
+            window.frames,
+            window.obj_dets,
+            window.patient_joint_kps,
+            window.camera_info,
         ):
-            m_dets: Optional[ObjectDetection2dSet]
-            m_pose: Optional[HandJointPosesUpdate]
-            f_dets: Optional[FrameObjectDetections] = None
-            f_pose: Optional[FramePoses] = None
-            if m_dets is not None:
-                # Convert message xyxy into xywh
-                bbox = np.asarray(
-                    [m_dets.left, m_dets.top, m_dets.right, m_dets.bottom]
-                ).T
-                bbox[:, 2:] -= bbox[:, :2]
-                cats, scores = max_det_class_score(m_dets)
-                f_dets = FrameObjectDetections(
-                    bbox,
-                    cats,
-                    scores,
-                )
-            if m_pose is not None:
-                f_pose = FramePoses(
-                    # No whole-pose score, so just filling in 1.0 for now.
-                    np.array([1.0]),
-                    # (x,y) coordinates for each joint for our single pose.
-                    # Shape (1, n_joints, 2)
-                    np.array(
-                        [
-                            [
-                                (j.pose.position.x, j.pose.position.y)
-                                for j in m_pose.joints
-                            ]
-                        ]
-                    ),
-                    # Turns out, we are storing the confidence as the Z
-                    # position in the message.
-                    np.array([[j.pose.position.z for j in m_pose.joints]]),
-                )
-            window_data.append(
-                FrameData(
-                    f_dets,
-                    f_pose,
-                    (cam_info.width, cam_info.height),
-                )
-            )
+            frame_time_ns = time_to_int(frame[0])
+            entry = prev_cache.get(frame_time_ns)
+            # Detections or poses for a frame may be received after the frame
+            # was first converted, so only reuse a conversion of the same
+            # messages.
+            if entry is None or entry[0] is not m_dets or entry[1] is not m_pose:
+                entry = (m_dets, m_pose, frame_data_from_msgs(m_dets, m_pose, cam_info))
+            frame_data_cache[frame_time_ns] = entry
+            window_data.append(entry[2])
+        self._frame_data_cache = frame_data_cache
+
+        return self._predict_window(
+            window_data, window.frames[0][0], window.frames[-1][0]
+        )
 
+    def _predict_window(
+        self, window_data: List[FrameData], start_stamp: Time, end_stamp: Time
+    ) -> ActivityDetection:
+        """
+        Classify the activity of a window of converted frames, making the
+        output activity classification message.
+
+        :param window_data: Frames of the window, oldest to newest.
+        :param start_stamp: Time of the oldest frame of the window.
+        :param end_stamp: Time of the newest frame of the window.
+        """
+        log = self.get_logger()
         self._model_dset.load_data_online(window_data)
-        loader = DataLoader(dataset=self._model_dset, batch_size=1)
-        batch = move_data_to_device(list(loader)[0], device=self._model_device)
+        # Same as the only batch of a DataLoader with a batch size of 1, without
+        # constructing a loader and its iterator for every window.
+        batch = move_data_to_device(
+            default_collate([self._model_dset[0]]), device=self._model_device
+        )
 
         with SimpleTimer("[_process_window] Model processing", log.info):
             with torch.no_grad():
@@ -740,8 +1086,8 @@ class ActivityClassifierTCN(Node):
         # Prepare output message
         activity_msg = ActivityDetection()
         # set the window frames
-        activity_msg.source_stamp_start_frame = window.frames[0][0]
-        activity_msg.source_stamp_end_frame = window.frames[-1][0]
+        activity_msg.source_stamp_start_frame = start_stamp
+        activity_msg.source_stamp_end_frame = end_stamp
 
         # save label vector
         activity_msg.label_vec = self._act_class_names
@@ -1,5 +1,7 @@
 import time
+from collections import OrderedDict
 from threading import Event, Thread
+from typing import Dict
 
 from cv_bridge import CvBridge
 from geometry_msgs.msg import (
@@ -9,11 +11,13 @@ from geometry_msgs.msg import (
 )
 import numpy as np
 from rclpy.node import Node
-from sensor_msgs.msg import Image
-from shape_msgs.msg import (
-    Mesh,
-    MeshTriangle,
+from rclpy.qos import (
+    QoSDurabilityPolicy,
+    QoSHistoryPolicy,
+    QoSProfile,
+    QoSReliabilityPolicy,
 )
+from sensor_msgs.msg import Image
 
 from angel_msgs.msg import (
     HandJointPose,
@@ -25,7 +29,14 @@ from angel_msgs.msg import (
 )
 from angel_utils import declare_and_get_parameters, RateTracker
 from angel_utils import make_default_main
+from angel_utils.conversion import set_mesh_arrays
 from angel_utils.hand import JOINT_LIST
+from angel_system.utils.spatial_mesh import (
+    flatten_mesh,
+    mesh_fingerprint,
+    surface_id_and_update_time,
+    SurfaceVersions,
+)
 from hl2ss.viewer import hl2ss
 
 
@@ -47,6 +58,15 @@ PARAM_PV_WIDTH = "pv_width"
 PARAM_PV_HEIGHT = "pv_height"
 PARAM_PV_FRAMERATE = "pv_framerate"
 PARAM_SM_FREQ = "sm_freq"
+# Depth of the reliable, transient local history of the spatial map publisher.
+# This should be at least the number of surfaces observed, so that no mesh is
+# overwritten before subscribers, including those that join late, receive it.
+PARAM_SM_QOS_DEPTH = "sm_qos_depth"
+# Seconds between republishing the latest mesh of every surface, and recent
+# removals, so that subscribers recover messages they missed despite the
+# publisher's history, e.g. when more surfaces changed than it holds. 0, the
+# default, to never republish, so that nothing is sent once a space is mapped.
+PARAM_SM_RESEND_PERIOD = "sm_resend_period"
 PARAM_RM_DEPTH_AHAT_TOPIC = "rm_depth_AHAT"
 
 # Pass string for any of the ROS topic params to disable that stream
@@ -76,6 +96,8 @@ class HL2SSROSBridge(Node):
                 (PARAM_PV_HEIGHT,),
                 (PARAM_PV_FRAMERATE,),
                 (PARAM_SM_FREQ,),
+                (PARAM_SM_QOS_DEPTH, 1024),
+                (PARAM_SM_RESEND_PERIOD, 0.0),
                 (PARAM_RM_DEPTH_AHAT_TOPIC,),
             ],
         )
@@ -91,6 +113,8 @@ class HL2SSROSBridge(Node):
         self.pv_height = param_values[PARAM_PV_HEIGHT]
         self.pv_framerate = param_values[PARAM_PV_FRAMERATE]
         self.sm_freq = param_values[PARAM_SM_FREQ]
+        self._sm_qos_depth = param_values[PARAM_SM_QOS_DEPTH]
+        self._sm_resend_period = param_values[PARAM_SM_RESEND_PERIOD]
         self._rm_depth_AHAT_topic = param_values[PARAM_RM_DEPTH_AHAT_TOPIC]
 
         # Define HL2SS server ports
@@ -168,9 +192,18 @@ class HL2SSROSBridge(Node):
             self._audio_thread.daemon = True
             self._audio_thread.start()
         if self._sm_topic != DISABLE_TOPIC_STR:
-            # Create the spatial map publisher
+            # Create the spatial map publisher. Meshes are only published
+            # when they change, so none may be dropped, and subscribers that
+            # join late need to receive those published before.
             self.ros_sm_publisher = self.create_publisher(
-                SpatialMesh, self._sm_topic, 1
+                SpatialMesh,
+                self._sm_topic,
+                QoSProfile(
+                    history=QoSHistoryPolicy.KEEP_LAST,
+                    depth=self._sm_qos_depth,
+                    reliability=QoSReliabilityPolicy.RELIABLE,
+                    durability=QoSDurabilityPolicy.TRANSIENT_LOCAL,
+                ),
             )
             self.connect_hl2ss_sm()
             log.info("SM client connected!")
@@ -478,7 +511,12 @@ class HL2SSROSBridge(Node):
         Thread that is responsible for fetching the spatial map data from HL2SS,
         converting the meshes to SpatialMesh ROS messages, and publishing them.
 
-        Spatial meshes are retrieved every 5 seconds.
+        Spatial meshes are retrieved every 5 seconds. Only the meshes of
+        surfaces that changed since they were last published are published
+        again, and surfaces no longer observed are published as removals.
+        If `sm_resend_period` is positive, the latest mesh of every surface,
+        and the removal of recently removed surfaces, are also republished
+        that often.
         """
         log = self.get_logger()
 
@@ -505,14 +543,69 @@ class HL2SSROSBridge(Node):
         volumes.add_box(center, extents)
         self.hl2ss_sm_client.set_volumes(volumes)
 
+        # Version of each surface last published, to not publish again
+        # surfaces that did not change since.
+        published = SurfaceVersions()
+        # Latest message published for each surface, to republish.
+        published_msgs: Dict[bytes, SpatialMesh] = {}
+        # Removal messages of the most recently removed surfaces, to
+        # republish. As many as the publisher's history are kept.
+        removal_msgs: "OrderedDict[bytes, SpatialMesh]" = OrderedDict()
+        last_resend = time.monotonic()
+
         while self._sm_active.wait(0):  # will quickly return false if cleared.
-            ids = self.hl2ss_sm_client.get_observed_surfaces()
+            if (
+                self._sm_resend_period > 0
+                and time.monotonic() - last_resend >= self._sm_resend_period
+            ):
+                for spatial_mesh_msg in removal_msgs.values():
+                    self.ros_sm_publisher.publish(spatial_mesh_msg)
+                for spatial_mesh_msg in published_msgs.values():
+                    self.ros_sm_publisher.publish(spatial_mesh_msg)
+                last_resend = time.monotonic()
+                log.debug(
+                    f"Republished {len(published_msgs)} meshes and "
+                    f"{len(removal_msgs)} removals"
+                )
+
+            surfaces = [
+                surface_id_and_update_time(s)
+                for s in self.hl2ss_sm_client.get_observed_surfaces()
+            ]
+
+            # Surfaces no longer observed are removed from the map.
+            for surface_id in published.discard_missing(s[0] for s in surfaces):
+                published_msgs.pop(surface_id, None)
+                spatial_mesh_msg = SpatialMesh()
+                spatial_mesh_msg.mesh_id = surface_id.hex()
+                spatial_mesh_msg.removal = True
+                self.ros_sm_publisher.publish(spatial_mesh_msg)
+                removal_msgs[surface_id] = spatial_mesh_msg
+                removal_msgs.move_to_end(surface_id)
+                while len(removal_msgs) > self._sm_qos_depth:
+                    removal_msgs.popitem(last=False)
+                log.debug(f"Published removal of surface id {surface_id.hex()}")
+
+            # When the observer reports update times, only the meshes of
+            # surfaces updated since they were last published are requested.
+            # Otherwise, all are requested and compared by content below.
+            ids = []
+            update_times = []
+            for surface_id, update_time in surfaces:
+                if update_time is None or published.changed(surface_id, update_time):
+                    ids.append(surface_id)
+                    update_times.append(update_time)
+            if not ids:
+                time.sleep(self.sm_freq)
+                continue
+
             tasks = hl2ss.sm_mesh_task()
             for i in ids:
                 tasks.add_task(i, tpcm, vpf, tif, vnf, normals)
 
             meshes = self.hl2ss_sm_client.get_meshes(tasks, n_threads)
             log.debug(f"Received {len(meshes)} meshes")
+            n_published = 0
             for index, mesh in meshes.items():
                 id_hex = ids[index].hex()
 
@@ -530,33 +623,44 @@ class HL2SSROSBridge(Node):
                     f" triangles {mesh.vertex_normals.shape[0]} normals"
                 )
 
-                mesh.vertex_positions[:, 0:3] = (
-                    mesh.vertex_positions[:, 0:3] * mesh.vertex_position_scale
+                mesh.vertex_positions[:, 0:3] *= mesh.vertex_position_scale
+                vertex_buffer, index_buffer = flatten_mesh(
+                    mesh.vertex_positions @ mesh.pose, mesh.triangle_indices
                 )
-                mesh.vertex_positions = mesh.vertex_positions @ mesh.pose
-                mesh.vertex_normals = mesh.vertex_normals @ mesh.pose
+
+                version = update_times[index]
+                if version is None:
+                    version = mesh_fingerprint(vertex_buffer, index_buffer)
+                    if not published.changed(ids[index], version):
+                        continue
+                    # Only changed meshes get here, so now is when the
+                    # current mesh was first seen.
+                    update_time = time.time_ns()
+                else:
+                    update_time = int(version)
 
                 # Create the spatial mesh message for this mesh
                 spatial_mesh_msg = SpatialMesh()
                 spatial_mesh_msg.mesh_id = id_hex
-                spatial_mesh_msg.removal = False  # Is this field even used?
-
-                mesh_shape = Mesh()
-                for ind in mesh.triangle_indices:
-                    m_tri = MeshTriangle()
-                    m_tri.vertex_indices = ind
-                    mesh_shape.triangles.append(m_tri)
-                for v in mesh.vertex_positions:
-                    m_v = Point()
-                    m_v.x = float(v[0])
-                    m_v.y = float(v[1])
-                    m_v.z = float(v[2])
-                    mesh_shape.vertices.append(m_v)
-
-                spatial_mesh_msg.mesh = mesh_shape
+                spatial_mesh_msg.removal = False
+                spatial_mesh_msg.update_time = update_time
+                set_mesh_arrays(
+                    spatial_mesh_msg,
+                    vertex_buffer.reshape(-1, 3),
+                    index_buffer.reshape(-1, 3),
+                )
 
                 # Publish!
                 self.ros_sm_publisher.publish(spatial_mesh_msg)
+                published.update(ids[index], version)
+                published_msgs[ids[index]] = spatial_mesh_msg
+                # Observed again after being removed.
+                removal_msgs.pop(ids[index], None)
+                n_published += 1
+
+            log.debug(
+                f"Published {n_published} changed meshes of {len(surfaces)} surfaces"
+            )
 
             time.sleep(self.sm_freq)
 
@@ -4,8 +4,9 @@ import time
 import threading
 
 from rclpy.node import Node
-from std_msgs.msg import ByteMultiArray, Int32MultiArray
+from std_msgs.msg import UInt8MultiArray
 
+from angel_system.utils.framed_socket import FrameReceiver
 from angel_utils import make_default_main
 
 
@@ -37,7 +38,7 @@ class VLCPublisher(Node):
         self.topic = topic
         self.port = PORT_MAP[self.topic]
 
-        self.publisher_ = self.create_publisher(Int32MultiArray, self.topic, 10)
+        self.publisher_ = self.create_publisher(UInt8MultiArray, self.topic, 10)
 
         self.server_t = threading.Thread(target=self.server_thread)
         self.server_t.daemon = True
@@ -63,21 +64,24 @@ class VLCPublisher(Node):
 
         frames_recvd = 0
         prev_time = -1
-        prev_screenshot_data = []
-        idx = 0
 
-        ros_msg = Int32MultiArray()
+        # Frames are received into a single reused byte buffer that is set as
+        # the message data directly. Publishing serializes the message before
+        # returning, so the buffer may be refilled for the next frame.
+        receiver = FrameReceiver(conn)
+        ros_msg = UInt8MultiArray()
 
         while True:
             # wait for a message
             try:
-                data = conn.recv(8)
-            except:
+                frame = receiver.recv_frame()
+            except ValueError as ex:
+                print(ex)
                 break
-
-            if data[0:4] != b"\x1a\xcf\xfc\x1d":
-                print("Invalid sync pattern", data[0:4])
-                print(data[0:4].decode())
+            except OSError:
+                break
+            if frame is None:
+                print("Connection closed", self.topic)
                 break
 
             frames_recvd += 1
@@ -88,53 +92,8 @@ class VLCPublisher(Node):
                 frames_recvd = 0
                 prev_time = time.time()
 
-            total_message_length = list(bytes(data[4:8]))
-            total_message_length = (
-                (total_message_length[0] << 24)
-                | (total_message_length[1] << 16)
-                | (total_message_length[2] << 8)
-                | (total_message_length[3] << 0)
-            )
-
-            # print("message length", total_message_length)
-
-            # read the rest of the message from the socket using the given length
-            # screenshot_data = []
-            bytes_read = 0
-            default_read_size = 9000  # jumbo packet size
-            while bytes_read != total_message_length:
-                bytes_remaining = total_message_length - bytes_read
-
-                if default_read_size > bytes_remaining:
-                    read_size = bytes_remaining
-                elif default_read_size > total_message_length:
-                    read_size = total_message_length
-                else:
-                    read_size = default_read_size
-
-                message = list(conn.recv(read_size))
-                # message = conn.recv(read_size).split()
-                # print(message)
-
-                bytes_read += len(message)
-                # screenshot_data.extend(message)
-                ros_msg.data.extend(message)
-
-            # publish the message
-            # print(screenshot_data[0:10])
-            # print(type(screenshot_data[0]))
-
-            # start = time.time()
-            # ros_msg.data = [bytes(x) for x in screenshot_data]
-            # ros_msg.data = screenshot_data
-            # end = time.time()
-            # print("Time to make msg", (end - start))
-
-            # start = time.time()
+            ros_msg.data = frame
             self.publisher_.publish(ros_msg)
-            # end = time.time()
-            # print("Time to publish msg", (end - start))
-            ros_msg.data = []
 
 
 def main():
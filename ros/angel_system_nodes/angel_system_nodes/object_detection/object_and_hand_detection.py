@@ -1,5 +1,7 @@
 from pathlib import Path
-from threading import Event, Lock, Thread
+from threading import Event, Thread
+import time
+from typing import List
 from typing import Union
 
 from cv_bridge import CvBridge
@@ -9,19 +11,22 @@ from rclpy.callback_groups import MutuallyExclusiveCallbackGroup, ReentrantCallb
 from rclpy.node import Node, ParameterDescriptor, Parameter
 from sensor_msgs.msg import Image
 
-from yolov7.detect_ptg import load_model, predict_image
-from angel_system.object_detection.yolov8_detect import predict_hands
+from yolov7.detect_ptg import load_model
+from angel_system.object_detection.object_and_hand_predictor import (
+    ObjectAndHandPredictor,
+)
 from yolov7.models.experimental import attempt_load
 import yolov7.models.yolo
 from yolov7.utils.torch_utils import TracedModel
 from ultralytics import YOLO as YOLOv8
 
-from angel_system.utils.event import WaitAndClearEvent
+from angel_system.utils.frame_batcher import FrameBatcher, PendingFrame
 from angel_system.utils.simple_timer import SimpleTimer
 
 from angel_msgs.msg import ObjectDetection2dSet
 from angel_utils import declare_and_get_parameters, RateTracker  # , DYNAMIC_TYPE
 from angel_utils import make_default_main
+from angel_utils.conversion import set_label_confidences
 
 
 BRIDGE = CvBridge()
@@ -31,6 +36,15 @@ class ObjectAndHandDetector(Node):
     """
     ROS node that runs the yolov7 object detector model and outputs
     `ObjectDetection2dSet` messages.
+
+    Images may be received from one or more topics. Received images are
+    collected into batches of up to `batch_size` images, waiting at most
+    `batch_deadline_ms` for a batch to fill, and the models are run over each
+    batch together. A detection set is published for every processed image,
+    stamped with that image's source stamp. When images arrive faster than
+    they can be processed, the oldest pending images beyond
+    `max_pending_frames` are dropped. The defaults process only the latest
+    image received, one at a time.
     """
 
     def __init__(self):
@@ -62,9 +76,39 @@ class ObjectAndHandDetector(Node):
                 ("enable_time_trace_logging", False),
                 # Name of the background class to check for.
                 ("object_background_class_name", "background"),
+                # Comma-separated list of image topics to detect over in
+                # addition to `image_topic`.
+                ("additional_image_topics", ""),
+                # Maximum number of images to process together.
+                ("batch_size", 1),
+                # Maximum time in milliseconds to hold an image while waiting
+                # for a batch to fill.
+                ("batch_deadline_ms", 30.0),
+                # Maximum number of images to hold for processing, beyond which
+                # the oldest are dropped. Values less than `batch_size` mean
+                # `batch_size`.
+                ("max_pending_frames", 0),
+                # Run the object and hand models concurrently instead of one
+                # after the other.
+                ("concurrent_models", False),
+                # Torch intra-op threads for each model when running them
+                # concurrently on CPU. Zero means half of the available
+                # threads.
+                ("object_model_threads", 0),
+                ("hand_model_threads", 0),
+                # If positive, publish only this many highest label
+                # confidences per detection, using the sparse top-k encoding
+                # of ObjectDetection2dSet. Each detection only has one
+                # non-zero confidence, so 1 loses nothing. Otherwise, publish
+                # the dense confidence matrix.
+                ("label_confidences_topk", 0),
             ],
         )
-        self._image_topic = param_values["image_topic"]
+        self._image_topics = [param_values["image_topic"]] + [
+            t.strip()
+            for t in param_values["additional_image_topics"].split(",")
+            if t.strip()
+        ]
         self._det_topic = param_values["det_topic"]
 
         self._object_model_ckpt_fp = Path(param_values["object_net_checkpoint"])
@@ -78,6 +122,7 @@ class ObjectAndHandDetector(Node):
         self._agnostic_nms = param_values["agnostic_nms"]
 
         self._enable_trace_logging = param_values["enable_time_trace_logging"]
+        self._label_confidences_topk = param_values["label_confidences_topk"]
 
         ##########################################
         # Object Model
@@ -144,26 +189,49 @@ class ObjectAndHandDetector(Node):
 
         log.info("Hand Detector initialized")
 
+        self._predictor = ObjectAndHandPredictor(
+            self.object_model,
+            self.device,
+            self.stride,
+            self.imgsz,
+            self.half,
+            self._det_conf_thresh,
+            self._iou_thr,
+            self._agnostic_nms,
+            self.hand_model,
+            self._inference_img_size,
+            concurrent=param_values["concurrent_models"],
+            object_threads=param_values["object_model_threads"],
+            hand_threads=param_values["hand_model_threads"],
+        )
+
         ##########################################
         # Other stateful properties
 
-        # Single slot for latest image message to process detection over.
-        # This should be written by the image topic subscriber callback, and
-        # read from the runtime loop once per iteration.
-        self._cur_image_msg: Image = None
-        self._cur_image_msg_lock = Lock()
+        # Images pending detection. This is written by the image topic
+        # subscriber callbacks, and batches are taken from it by the runtime
+        # loop.
+        batch_size = param_values["batch_size"]
+        self._batcher = FrameBatcher(
+            max_batch_size=batch_size,
+            deadline=param_values["batch_deadline_ms"] / 1e3,
+            max_pending=max(param_values["max_pending_frames"], batch_size),
+        )
 
         self._rate_tracker = RateTracker()
 
         ##########################################
         # Initialize ROS hooks
-        self._subscription = self.create_subscription(
-            Image,
-            self._image_topic,
-            self.listener_callback,
-            1,
-            callback_group=MutuallyExclusiveCallbackGroup(),
-        )
+        self._image_subscriptions = [
+            self.create_subscription(
+                Image,
+                topic,
+                lambda image, topic=topic: self.listener_callback(image, topic),
+                1,
+                callback_group=MutuallyExclusiveCallbackGroup(),
+            )
+            for topic in self._image_topics
+        ]
         self._det_publisher = self.create_publisher(
             ObjectDetection2dSet,
             self._det_topic,
@@ -180,23 +248,20 @@ class ObjectAndHandDetector(Node):
         # seconds to occasionally time out of the wait condition for the loop
         # to check if it is supposed to still be alive.
         self._rt_active_heartbeat = param_values["rt_thread_heartbeat"]
-        # Condition that the runtime should perform processing
-        self._rt_awake_evt = WaitAndClearEvent()
         self._rt_thread = Thread(target=self.rt_loop, name="prediction_runtime")
         self._rt_thread.daemon = True
         self._rt_thread.start()
 
-    def listener_callback(self, image: Image):
+    def listener_callback(self, image: Image, topic: str):
         """
-        Callback function for image messages. Runs the berkeley object detector
-        on the image and publishes an ObjectDetectionSet2d message for the image.
+        Callback function for image messages. Queues the image for the runtime
+        loop to detect objects and hands over it and publish an
+        ObjectDetectionSet2d message for it.
         """
         log = self.get_logger()
         if self._enable_trace_logging:
-            log.info(f"Received image with TS: {image.header.stamp}")
-        with self._cur_image_msg_lock:
-            self._cur_image_msg = image
-            self._rt_awake_evt.set()
+            log.info(f"Received image with TS: {image.header.stamp} on {topic}")
+        self._batcher.put(topic, image)
 
     def rt_alive(self) -> bool:
         """
@@ -214,6 +279,7 @@ class ObjectAndHandDetector(Node):
         Indicate that the runtime loop should cease.
         """
         self._rt_active.clear()
+        self._batcher.close()  # intentionally second
 
     def rt_loop(self):
         log = self.get_logger()
@@ -238,94 +304,116 @@ class ObjectAndHandDetector(Node):
             "hand (right)": right_hand_cid,
         }
         while self._rt_active.wait(0):  # will quickly return false if cleared.
-            if self._rt_awake_evt.wait_and_clear(self._rt_active_heartbeat):
-                with self._cur_image_msg_lock:
-                    if self._cur_image_msg is None:
-                        continue
-                    image = self._cur_image_msg
-                    self._cur_image_msg = None
-
-                if enable_trace_logging:
-                    log.info(f"[rt-loop] Processing image TS={image.header.stamp}")
-
-                # Convert ROS img msg to CV2 image
-                img0 = BRIDGE.imgmsg_to_cv2(image, desired_encoding="bgr8")
-                print(f"img0: {img0.shape}")
-                print(f"img0 type: {type(img0)}")
-
-                msg = ObjectDetection2dSet()
-                # note: setting metdata right before publishing below
-
-                n_dets = 0
-                dflt_conf_vec = np.zeros(n_classes, dtype=np.float64)
-
-                # Detect hands
-                # with SimpleTimer("predict_hands", log_func=log.info):
-                hand_boxes, hand_labels, hand_confs = predict_hands(
-                    hand_model=self.hand_model,
-                    img0=img0,
-                    device=self.device,
-                    imgsz=self._inference_img_size,
+            batch = self._batcher.get_batch(timeout=self._rt_active_heartbeat)
+            if not batch:
+                continue
+
+            if enable_trace_logging:
+                log.info(
+                    f"[rt-loop] Processing {len(batch)} images, TS="
+                    f"{[p.item.header.stamp for p in batch]}"
                 )
 
+            # Convert ROS img msgs to CV2 images
+            imgs0 = [
+                BRIDGE.imgmsg_to_cv2(p.item, desired_encoding="bgr8") for p in batch
+            ]
+
+            # Detect objects and hands
+            # with SimpleTimer("predict", log_func=log.info):
+            object_results, hand_results = self._predictor.predict(imgs0)
+
+            latencies = []
+            for pending, hand_result, object_result in zip(
+                batch, hand_results, object_results
+            ):
+                hand_boxes, hand_labels, hand_confs = hand_result
+                object_boxes, object_confs, object_classids = object_result
                 hand_classids = [hand_cid_label_dict[label] for label in hand_labels]
-
-                # Detect objects
-                # with SimpleTimer("predict_objects", log_func=log.info):
-                object_boxes, object_confs, object_classids = predict_image(
-                    img0,
-                    self.device,
-                    self.object_model,
-                    self.stride,
-                    self.imgsz,
-                    self.half,
-                    False,
-                    self._det_conf_thresh,
-                    self._iou_thr,
-                    None,
-                    self._agnostic_nms,
+                msg = self._make_det_msg(
+                    pending,
+                    label_vector,
+                    object_boxes + hand_boxes,
+                    object_confs + hand_confs,
+                    object_classids + hand_classids,
                 )
-
-                object_boxes.extend(hand_boxes)
-                object_confs.extend(hand_confs)
-                object_classids.extend(hand_classids)
-                for xyxy, conf, cls_id in zip(
-                    object_boxes, object_confs, object_classids
-                ):
-                    n_dets += 1
-                    msg.left.append(xyxy[0])
-                    msg.top.append(xyxy[1])
-                    msg.right.append(xyxy[2])
-                    msg.bottom.append(xyxy[3])
-
-                    # Object and Hand detection class prediction output only
-                    # consists of a single confidence value for the
-                    # most-confident non-background class. Here we slot that
-                    # confidence into the appropriate index of a zeroed array
-                    # and then extend the output messages confidence matrix
-                    # (flattened). The temporary confidence vector is then
-                    # zeroed out again in preparation for the next loop.
-                    dflt_conf_vec[cls_id] = conf
-                    # This extend copies data into msg.label_confidences array
-                    msg.label_confidences.extend(dflt_conf_vec)
-                    # Reset before next passthrough
-                    dflt_conf_vec[cls_id] = 0.0
-
-                msg.num_detections = n_dets
-
-                # set header metadata before publishing to get the correct publish time
-                msg.header.frame_id = image.header.frame_id
-                msg.source_stamp = image.header.stamp
-                msg.label_vec[:] = label_vector
-                msg.header.stamp = self.get_clock().now().to_msg()
                 self._det_publisher.publish(msg)
+                latencies.append(time.monotonic() - pending.arrival_time)
 
                 self._rate_tracker.tick()
                 log.info(
-                    f"Objects Detection Rate: {self._rate_tracker.get_rate_avg()} Hz, Num objects detected: {n_dets}\nnum of hands: {len(hand_boxes)}, other objects: {n_dets - len(hand_boxes)}]"
+                    f"Objects Detection Rate: {self._rate_tracker.get_rate_avg()} Hz, Num objects detected: {msg.num_detections}\nnum of hands: {len(hand_boxes)}, other objects: {len(object_boxes)}]"
                 )
                 log.info(f"msg: {msg}")
 
+            self._log_batch_stats(latencies)
+
+    def _make_det_msg(
+        self,
+        pending: PendingFrame,
+        label_vector: List[str],
+        boxes: List[List[float]],
+        confs: List[float],
+        classids: List[int],
+    ) -> ObjectDetection2dSet:
+        """
+        Create the detection set message for an image.
+
+        :param pending: Batched image message the detections are for.
+        :param label_vector: Class labels of the object and hand classes.
+        :param boxes: Detection boxes in xyxy format.
+        :param confs: Confidence of each detection.
+        :param classids: Class index of each detection in `label_vector`.
+        """
+        image: Image = pending.item
+        msg = ObjectDetection2dSet()
+        # note: setting metdata right before publishing below
+
+        n_classes = len(label_vector)
+        n_dets = len(boxes)
+        if n_dets:
+            xyxy = np.asarray(boxes, dtype=np.float64).reshape(n_dets, 4)
+            msg.left.extend(xyxy[:, 0])
+            msg.top.extend(xyxy[:, 1])
+            msg.right.extend(xyxy[:, 2])
+            msg.bottom.extend(xyxy[:, 3])
+
+            # Object and Hand detection class prediction output only consists
+            # of a single confidence value for the most-confident
+            # non-background class. Here we slot that confidence into the
+            # appropriate index of a zeroed matrix and then extend the output
+            # messages confidence matrix (flattened), or its top-k.
+            conf_mat = np.zeros((n_dets, n_classes), dtype=np.float64)
+            conf_mat[np.arange(n_dets), classids] = confs
+            set_label_confidences(msg, conf_mat, self._label_confidences_topk)
+
+        msg.num_detections = n_dets
+
+        # set header metadata before publishing to get the correct publish time
+        msg.header.frame_id = image.header.frame_id
+        msg.source_stamp = image.header.stamp
+        msg.label_vec[:] = label_vector
+        msg.header.stamp = self.get_clock().now().to_msg()
+        return msg
+
+    def _log_batch_stats(self, latencies: List[float]) -> None:
+        """
+        Log the latency of the images of a processed batch, from their receipt
+        to the publishing of their detections, and the running drop counts per
+        image topic.
+        """
+        b = self._batcher
+        drops = ", ".join(
+            f"{topic}: {b.num_dropped[topic]}/{b.num_received[topic]}"
+            for topic in self._image_topics
+        )
+        self.get_logger().info(
+            f"Batch of {len(latencies)} images, latency (ms) "
+            f"mean: {1e3 * np.mean(latencies):.1f}, "
+            f"max: {1e3 * np.max(latencies):.1f}; "
+            f"dropped/received images [{drops}]"
+        )
+
     def destroy_node(self):
         print("Stopping runtime")
         self.rt_stop()
@@ -333,6 +421,7 @@ class ObjectAndHandDetector(Node):
         self._rt_active.clear()  # make RT active flag "False"
         self._rt_thread.join()
         print("Shutting down runtime thread... Done")
+        self._predictor.close()
         super().destroy_node()
 
 
@@ -1,8 +1,14 @@
+from typing import List
+from typing import Optional
 from typing import Set
 
 import numpy as np
 
 from angel_system.data.common.config_structs import load_object_label_set
+from angel_system.object_detection.detection_filter import (
+    class_mask,
+    select_detections,
+)
 
 from rclpy.callback_groups import MutuallyExclusiveCallbackGroup
 from rclpy.node import Node
@@ -10,7 +16,8 @@ from rclpy.node import Node
 from angel_msgs.msg import ObjectDetection2dSet
 from angel_utils import declare_and_get_parameters, RateTracker
 from angel_utils import make_default_main
-from angel_utils.object_detection import max_labels_and_confs
+from angel_utils.conversion import max_class_and_conf
+from angel_utils.conversion import take_detections
 
 
 # The filepath to the object labels config that defines the labels to let
@@ -20,6 +27,12 @@ PARAM_CONFIG_FP = "object_labels_config"
 PARAM_TOPIC_INPUT = "topic_input"
 # Output topic name
 PARAM_TOPIC_OUTPUT = "topic_output"
+# Drop detections whose most confident label has a lower confidence than this.
+# No detections are dropped by confidence when 0.
+PARAM_CONF_THRESHOLD = "conf_threshold"
+# Keep at most this many of the most confident detections of each label.
+# Unlimited when 0.
+PARAM_MAX_PER_CLASS = "max_per_class"
 
 
 class ObjectDetectionFilterNode(Node):
@@ -37,6 +50,8 @@ class ObjectDetectionFilterNode(Node):
                 (PARAM_CONFIG_FP,),
                 (PARAM_TOPIC_INPUT,),
                 (PARAM_TOPIC_OUTPUT,),
+                (PARAM_CONF_THRESHOLD, 0.0),
+                (PARAM_MAX_PER_CLASS, 0),
             ),
         )
 
@@ -44,6 +59,13 @@ class ObjectDetectionFilterNode(Node):
         # detections by.
         object_label_set = load_object_label_set(param_vales[PARAM_CONFIG_FP])
         self._label_whitelist: Set[str] = {ol.label for ol in object_label_set.labels}
+        self._conf_threshold: float = param_vales[PARAM_CONF_THRESHOLD]
+        self._max_per_class: int = param_vales[PARAM_MAX_PER_CLASS]
+
+        # Mask of the white-listed label indices, for the label vector it was
+        # last made for. Remade only when input messages change label vector.
+        self._mask_label_vec: Optional[List[str]] = None
+        self._class_mask = np.empty(0, dtype=bool)
 
         self._rt = RateTracker()
 
@@ -67,44 +89,29 @@ class ObjectDetectionFilterNode(Node):
         Filter messages and push them back out.
         """
         log = self.get_logger()
-        label_whitelist_set = self._label_whitelist
 
-        det_indices = []
-        all_max_labels = max_labels_and_confs(msg)[0]
-        for det_i, max_label in enumerate(all_max_labels):
-            if max_label in label_whitelist_set:
-                det_indices.append(det_i)
+        if msg.label_vec != self._mask_label_vec:
+            self._mask_label_vec = list(msg.label_vec)
+            self._class_mask = class_mask(msg.label_vec, self._label_whitelist)
+
+        class_idxs, confs = max_class_and_conf(msg)
+        keep = select_detections(
+            class_idxs,
+            confs,
+            self._class_mask,
+            self._conf_threshold,
+            self._max_per_class,
+        )
+        n_kept = np.count_nonzero(keep)
 
-        if len(det_indices) != msg.num_detections:
+        if n_kept != msg.num_detections:
             log.info(
-                f"Filtering input detections from {all_max_labels.tolist()} "
-                f"to {all_max_labels[det_indices].tolist()}"
+                f"Filtering input detections from {msg.num_detections} to {n_kept}"
             )
 
             # Create a new message only containing the detections with labels in
-            # the white-list set.
-            new_msg = ObjectDetection2dSet()
-            new_msg.header = msg.header
-            new_msg.source_stamp = msg.source_stamp
-            new_msg.label_vec = msg.label_vec
-
-            new_msg.num_detections = len(det_indices)
-
-            # Only array slice if there is anything left post-filtering.
-            if new_msg.num_detections > 0:
-                new_msg.left = np.asarray(msg.left)[det_indices].tolist()
-                new_msg.right = np.asarray(msg.right)[det_indices].tolist()
-                new_msg.top = np.asarray(msg.top)[det_indices].tolist()
-                new_msg.bottom = np.asarray(msg.bottom)[det_indices].tolist()
-                new_msg.label_confidences = (
-                    np.asarray(msg.label_confidences)
-                    .reshape(msg.num_detections, len(msg.label_vec))[det_indices, :]
-                    .ravel()
-                    .tolist()
-                )
-
-            msg = new_msg
-
+            # the white-list set, passing the other criteria.
+            msg = take_detections(msg, keep)
         else:
             log.info(
                 "All input detections passed filter, simply forwarding input "
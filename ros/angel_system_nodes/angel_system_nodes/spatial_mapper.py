@@ -1,8 +1,15 @@
 import time
+from typing import Dict
 
 import numpy as np
 import rclpy
 from rclpy.node import Node
+from rclpy.qos import (
+    QoSDurabilityPolicy,
+    QoSHistoryPolicy,
+    QoSProfile,
+    QoSReliabilityPolicy,
+)
 from angel_msgs.msg import (
     ObjectDetection2dSet,
     ObjectDetection3dSet,
@@ -10,8 +17,13 @@ from angel_msgs.msg import (
     HeadsetPoseData,
 )
 from angel_msgs.srv import QueryImageSize
+from angel_system.utils.ray_casting import camera_rays
+from angel_system.utils.ray_casting import closest_hits
+from angel_system.utils.ray_casting import pixels_to_world_points
+from angel_system.utils.spatial_mesh import SurfaceVersions
+from angel_system.utils.timestamp_queue import TimestampHistory
 from angel_utils import make_default_main
-from angel_utils.conversion import to_confidence_matrix
+from angel_utils.conversion import max_class_and_conf, time_to_int, to_mesh_arrays
 from geometry_msgs.msg import Point
 
 import trimesh
@@ -27,6 +39,52 @@ FOCAL_LENGTH_X = 1.6304
 FOCAL_LENGTH_Y = 2.5084
 
 
+class MeshRayCaster:
+    """
+    Casts batches of rays against a set of meshes, merged into one mesh whose
+    ray acceleration structure is kept until the meshes change.
+
+    With Embree available, as with trimesh's "easy" extras, the structure is
+    an Embree BVH over all the triangles, so each batch is cast in a single
+    call whatever the number of meshes.
+    """
+
+    def __init__(self, meshes: Dict[str, trimesh.Trimesh]):
+        """
+        :param meshes: Meshes to cast against. The caster must be
+            invalidated whenever these change.
+        """
+        self._meshes = meshes
+        self._intersector = None
+
+    def invalidate(self) -> None:
+        """
+        Have the acceleration structure rebuilt when next casting, e.g. as
+        the meshes changed.
+        """
+        self._intersector = None
+
+    def cast(self, origins: np.ndarray, directions: np.ndarray) -> np.ndarray:
+        """
+        Cast rays against the meshes.
+
+        :param origins: Ray origins of shape [n, 3].
+        :param directions: Ray directions of shape [n, 3].
+
+        :returns: Location of the closest hit of each ray, of shape [n, 3],
+            with NaNs for rays without hits.
+        """
+        if self._intersector is None:
+            if not self._meshes:
+                return np.full((len(origins), 3), np.nan)
+            merged = trimesh.util.concatenate(list(self._meshes.values()))
+            self._intersector = merged.ray
+        locations, index_ray, _ = self._intersector.intersects_location(
+            origins, directions, multiple_hits=False
+        )
+        return closest_hits(origins, locations, index_ray)
+
+
 class SpatialMapSubscriber(Node):
     def __init__(self):
         super().__init__(self.__class__.__name__)
@@ -51,15 +109,81 @@ class SpatialMapSubscriber(Node):
             .get_parameter_value()
             .string_value
         )
+        # Depth of the reliable history of the spatial map subscription. This
+        # should be at least the number of surfaces, as meshes are only
+        # published when they change.
+        self._spatial_map_qos_depth = (
+            self.declare_parameter("spatial_map_qos_depth", 1024)
+            .get_parameter_value()
+            .integer_value
+        )
+        # Request the meshes published before subscribing, as the HL2SS
+        # bridge keeps them. Only enable this when subscribing to the bridge,
+        # as volatile publishers, such as the datahub, do not match a
+        # transient local subscription.
+        self._spatial_map_transient_local = (
+            self.declare_parameter("spatial_map_transient_local", False)
+            .get_parameter_value()
+            .bool_value
+        )
+        # Cast the rays of all box corners of a detection set in one batch
+        # against the merged spatial mesh, instead of one at a time against
+        # each surface mesh.
+        self._batch_ray_casting = (
+            self.declare_parameter("batch_ray_casting", True)
+            .get_parameter_value()
+            .bool_value
+        )
+        # Add the camera axes, rays, detection boxes and image edges to the
+        # scene for each detection set, for viewing with `show_plot`. This is
+        # slow, and the scene grows with every detection set.
+        self._debug_scene = (
+            self.declare_parameter("debug_scene", False)
+            .get_parameter_value()
+            .bool_value
+        )
+        # Seconds of headset poses, before the latest one, to keep for looking
+        # up the pose of detections' frames.
+        self._pose_history_seconds = (
+            self.declare_parameter("pose_history_seconds", 10.0)
+            .get_parameter_value()
+            .double_value
+        )
+        # Seconds within which the pose nearest to a detection's frame is used
+        # if no pose is of exactly the frame's time. Only exact matches are
+        # used if 0.
+        self._pose_tolerance_seconds = (
+            self.declare_parameter("pose_tolerance_seconds", 0.0)
+            .get_parameter_value()
+            .double_value
+        )
 
         log = self.get_logger()
         log.info(f"Spatial map topic: {self._spatial_map_topic}")
         log.info(f"Detection topic: {self._det_topic}")
         log.info(f"Detection3d topic: {self._det_3d_topic}")
         log.info(f"Pose topic: {self._headset_pose_topic}")
+        log.info(f"Spatial map QoS depth: {self._spatial_map_qos_depth}")
+        log.info(f"Spatial map transient local: {self._spatial_map_transient_local}")
+        log.info(f"Batch ray casting: {self._batch_ray_casting}")
+        log.info(f"Debug scene: {self._debug_scene}")
+        log.info(f"Pose history seconds: {self._pose_history_seconds}")
+        log.info(f"Pose tolerance seconds: {self._pose_tolerance_seconds}")
 
         self._spatial_mesh_subscription = self.create_subscription(
-            SpatialMesh, self._spatial_map_topic, self.spatial_map_callback, 100
+            SpatialMesh,
+            self._spatial_map_topic,
+            self.spatial_map_callback,
+            QoSProfile(
+                history=QoSHistoryPolicy.KEEP_LAST,
+                depth=self._spatial_map_qos_depth,
+                reliability=QoSReliabilityPolicy.RELIABLE,
+                durability=(
+                    QoSDurabilityPolicy.TRANSIENT_LOCAL
+                    if self._spatial_map_transient_local
+                    else QoSDurabilityPolicy.VOLATILE
+                ),
+            ),
         )
 
         self._detection_subscription = self.create_subscription(
@@ -75,11 +199,21 @@ class SpatialMapSubscriber(Node):
         )
 
         self.prev_time = -1
+        # Surface meshes keyed by surface ID, which is also the name of their
+        # geometry in the scene.
         self.meshes = {}
+        # Version of each surface mesh in `meshes`, to not re-index meshes
+        # that are received again unchanged.
+        self._mesh_versions = SurfaceVersions()
+        self._ray_caster = MeshRayCaster(self.meshes)
 
         self.scene = trimesh.Scene()
 
-        self.poses = []
+        # Recent headset poses keyed by their header stamp in nanoseconds.
+        self.poses: TimestampHistory[HeadsetPoseData] = TimestampHistory(
+            int(self._pose_history_seconds * 1e9)
+        )
+        self._pose_tolerance_ns = int(self._pose_tolerance_seconds * 1e9)
 
         # setup the image size query client and make sure the service is running
         self.image_size_client = self.create_client(QueryImageSize, "query_image_size")
@@ -116,28 +250,45 @@ class SpatialMapSubscriber(Node):
 
     def spatial_map_callback(self, msg):
         log = self.get_logger()
+        mesh_id = msg.mesh_id
+
+        if msg.removal:
+            if self.meshes.pop(mesh_id, None) is not None:
+                self.scene.delete_geometry(mesh_id)
+                self._ray_caster.invalidate()
+            self._mesh_versions.discard(mesh_id)
+            log.debug(f"Removed surface {mesh_id}")
+            return
 
-        # extract the vertices into np arrays
-        vertices = np.array([[v.x, v.y, v.z] for v in msg.mesh.vertices])
+        # Meshes of unknown version are always taken as changed.
+        if msg.update_time and not self._mesh_versions.changed(
+            mesh_id, msg.update_time
+        ):
+            log.debug(f"Surface {mesh_id} is unchanged")
+            return
 
-        # extract the triangles into np arrays
-        triangles = np.array(
-            [
-                [t.vertex_indices[0], t.vertex_indices[1], t.vertex_indices[2]]
-                for t in msg.mesh.triangles
-            ]
-        )
+        vertices, triangles = to_mesh_arrays(msg)
 
         mesh = trimesh.Trimesh(vertices=vertices, faces=triangles)
-        self.meshes[msg.mesh_id] = mesh
-        self.scene.add_geometry(mesh)
+        if mesh_id in self.meshes:
+            self.scene.delete_geometry(mesh_id)
+        self.meshes[mesh_id] = mesh
+        self.scene.add_geometry(mesh, geom_name=mesh_id, node_name=mesh_id)
+        self._ray_caster.invalidate()
+        self._mesh_versions.update(mesh_id, msg.update_time)
+        log.debug(f"Updated surface {mesh_id} ({len(self.meshes)} surfaces)")
 
         # self.scene.show()
 
     def headset_pose_callback(self, pose):
         log = self.get_logger()
         log.debug(f"pose stamp: {pose.header.stamp}")
-        self.poses.append(pose)
+        if not self.poses.add(time_to_int(pose.header.stamp), pose):
+            log.warn(
+                f"Dropped pose of stamp {pose.header.stamp} not after the latest "
+                f"({self.poses.n_out_of_order} so far)",
+                throttle_duration_sec=1,
+            )
 
     def detection_callback(self, detection):
         log = self.get_logger()
@@ -146,77 +297,34 @@ class SpatialMapSubscriber(Node):
             log.debug("No detections for this image")
             return
 
-        # locate the headset poses for this detection using
+        # locate the headset pose for this detection using
         # the detection source timestamp
-        world_matrix_1d = None
-        projection_matrix_1d = None
-
-        # print(detection.source_stamp)
-
-        # TODO: maybe implement a more efficient binary search here
-        for i in reversed(range(len(self.poses))):
-            if detection.source_stamp == self.poses[i].header.stamp:
-                world_matrix_1d = self.poses[i].world_matrix
-                projection_matrix_1d = self.poses[i].projection_matrix
-
-                log.debug(
-                    f"time stamps: {self.poses[i].header.stamp} {detection.source_stamp}"
-                )
-
-                # can clear out our pose list now assuming we won't get
-                # image frame detections out of order
-                self.poses = self.poses[i:]
-                break
-
-        if world_matrix_1d == None or projection_matrix_1d == None:
-            log.info(f"Did not get world or projection matrix.")
+        pose = self.poses.lookup(
+            time_to_int(detection.source_stamp), self._pose_tolerance_ns
+        )
+        if pose is None:
+            log.info(
+                f"Did not get world or projection matrix. Pose lookups: "
+                f"{self.poses.n_exact} exact, {self.poses.n_nearest} nearest, "
+                f"{self.poses.n_misses} missed"
+            )
             return
+        log.debug(f"time stamps: {pose.header.stamp} {detection.source_stamp}")
+        world_matrix_1d = pose.world_matrix
+        projection_matrix_1d = pose.projection_matrix
 
         # get world matrix from detection
         world_matrix_2d = self.convert_1d_4x4_to_2d_matrix(world_matrix_1d)
-        log.info(f"world matrix {world_matrix_2d}")
+        log.debug(f"world matrix {world_matrix_2d}")
 
         # get position of the camera at the time of the frame
         camera_origin = self.get_world_position(
             world_matrix_2d, np.array([0.0, 0.0, 0.0])
         ).reshape((1, 3))
-        log.info(f"origin {camera_origin}")
-
-        # compute the x, y, and z axes for this image
-        x_dir = self.get_world_position(
-            world_matrix_2d, np.array([1.0, 0.0, 0.0])
-        ).flatten()
-
-        y_dir = self.get_world_position(
-            world_matrix_2d, np.array([0.0, 1.0, 0.0])
-        ).flatten()
-
-        z_dir = self.get_world_position(
-            world_matrix_2d, np.array([0.0, 0.0, 1.0])
-        ).flatten()
-
-        # plot the x, y, and z axes on the scene
-        vs = np.array([camera_origin[0], x_dir])
-        el = trimesh.path.entities.Line([0, 1])
-        path = trimesh.path.Path3D(
-            entities=[el], vertices=vs, colors=np.array([255, 0, 0, 255]).reshape(1, 4)
-        )
-        self.scene.add_geometry(path)
-
-        vs = np.array([camera_origin[0], y_dir])
-        el = trimesh.path.entities.Line([0, 1])
-        path = trimesh.path.Path3D(
-            entities=[el], vertices=vs, colors=np.array([0, 255, 0, 255]).reshape(1, 4)
-        )
-        self.scene.add_geometry(path)
+        log.debug(f"origin {camera_origin}")
 
-        vs = np.array([camera_origin[0], z_dir])
-        el = trimesh.path.entities.Line([0, 1])
-        path = trimesh.path.Path3D(
-            entities=[el], vertices=vs, colors=np.array([0, 0, 255, 255]).reshape(1, 4)
-        )
-        self.scene.add_geometry(path)
-        # self.scene.show()
+        if self._debug_scene:
+            self.add_debug_axes(world_matrix_2d, camera_origin)
 
         # get projection matrix from detection
         projection_matrix_2d = self.convert_1d_4x4_to_2d_matrix(projection_matrix_1d)
@@ -227,138 +335,134 @@ class SpatialMapSubscriber(Node):
         det_3d_set_msg.header.frame_id = detection.header.frame_id
         det_3d_set_msg.source_stamp = detection.source_stamp
 
-        det_conf_mat = to_confidence_matrix(detection)
-        for i in range(detection.num_detections):
-            object_type = sorted(zip(det_conf_mat[i], detection.label_vec))[-1][1]
-
-            # get pixel positions of detected object box and form into box corners
-            min_vertex0 = detection.left[i]
-            min_vertex1 = detection.top[i]
-            max_vertex0 = detection.right[i]
-            max_vertex1 = detection.bottom[i]
-            image_min_vertex0 = 0
-            image_min_vertex1 = 0
-            image_max_vertex0 = self.image_width
-            image_max_vertex1 = self.image_height
-
-            corners_screen_pos = [
-                [min_vertex0, min_vertex1],
-                [min_vertex0, max_vertex1],
-                [max_vertex0, max_vertex1],
-                [max_vertex0, min_vertex1],
-            ]
-
-            # convert detection screen pixel coordinates to world coordinates
-            corners_world_pos = []
-            for p in corners_screen_pos:
+        # Pixel positions of the corners of each detected object box, in the
+        # order of the left, top, right and bottom points of 3D detections.
+        left = np.asarray(detection.left, dtype=np.float64)
+        top = np.asarray(detection.top, dtype=np.float64)
+        right = np.asarray(detection.right, dtype=np.float64)
+        bottom = np.asarray(detection.bottom, dtype=np.float64)
+        corners_screen_pos = np.stack(
+            [
+                np.stack([left, top], axis=1),
+                np.stack([left, bottom], axis=1),
+                np.stack([right, bottom], axis=1),
+                np.stack([right, top], axis=1),
+            ],
+            axis=1,
+        ).reshape(-1, 2)
+
+        # convert detection screen pixel coordinates to world coordinates
+        if self._batch_ray_casting:
+            origins, directions = camera_rays(
+                corners_screen_pos,
+                self.image_width,
+                self.image_height,
+                world_matrix_2d,
+                projection_matrix_2d,
+                FOCAL_LENGTH_X,
+                FOCAL_LENGTH_Y,
+            )
+            corners_world_pos = self._ray_caster.cast(origins, directions)
+        else:
+            corners_world_pos = np.full((len(corners_screen_pos), 3), np.nan)
+            for i, p in enumerate(corners_screen_pos.tolist()):
                 point_3d = self.convert_pixel_coord_to_world_coord(
                     world_matrix_2d, projection_matrix_2d, p, camera_origin
                 )
-                log.info(f"point 3d: {point_3d}")
                 if point_3d is None:
-                    log.info(f"No point found!")
-                    # self.scene.show()
-                    return
-                corners_world_pos.append(point_3d)
-
-            log.info(f"Drawing box for {object_type}")
-            vs = np.array(
-                [
-                    corners_world_pos[0],
-                    corners_world_pos[1],
-                    corners_world_pos[2],
-                    corners_world_pos[3],
-                ]
-            )
-            el = trimesh.path.entities.Line([0, 1, 2, 3, 0])
-            path = trimesh.path.Path3D(entities=[el], vertices=vs)
-            self.scene.add_geometry(path)
+                    break
+                corners_world_pos[i] = point_3d
+        corners_world_pos = corners_world_pos.reshape(-1, 4, 3)
 
-            # draw the image edges
-            bounds_screen_pos = [
-                [image_min_vertex0, image_min_vertex1],
-                [image_min_vertex0, image_max_vertex1],
-                [image_max_vertex0, image_max_vertex1],
-                [image_max_vertex0, image_min_vertex1],
-            ]
-            image_corners_world_pos = []
-            for p in bounds_screen_pos:
-                scaled_point = self.scale_pixel_coordinates(p)
-
-                # see note with these constants for why we are not using the
-                # focal length values from the projection matrix
-                focal_length_x = FOCAL_LENGTH_X
-                focal_length_y = FOCAL_LENGTH_Y
-
-                center_x = projection_matrix_2d[0][2]
-                center_y = projection_matrix_2d[1][2]
-
-                norm_factor = projection_matrix_2d[2][2]
-                center_x = center_x / norm_factor  # 0
-                center_y = center_y / norm_factor  # 0
-
-                # convert to camera space
-                # NOTE: The negative sign in the z-direction is to convert
-                # between the left-handed Unity coordinates and the right-handed
-                # trimesh scene coordinates.
-                dir_ray = np.array(
-                    [
-                        (scaled_point[0] - center_x) / focal_length_x,
-                        (scaled_point[1] - center_y) / focal_length_y,
-                        -1.0 / norm_factor,
-                    ]
-                ).reshape((1, 3))
-
-                # project camera space onto world position
-                direction = self.get_world_position(
-                    world_matrix_2d, dir_ray[0]
-                ).reshape((1, 3))
-
-                image_corners_world_pos.append(direction[0])
-
-            vs = np.array(
-                [
-                    image_corners_world_pos[0],
-                    image_corners_world_pos[1],
-                    image_corners_world_pos[2],
-                    image_corners_world_pos[3],
-                ]
-            )
-            el = trimesh.path.entities.Line([0, 1, 2, 3, 0])
-            path = trimesh.path.Path3D(
-                entities=[el],
-                vertices=vs,
-                colors=np.array([255, 0, 255, 255]).reshape(1, 4),
-            )
-            self.scene.add_geometry(path)
+        # All of the detections' corners must be found to publish any.
+        if np.isnan(corners_world_pos).any():
+            log.info(f"No point found!")
+            return
+
+        det_max_class_idxs = max_class_and_conf(detection)[0]
+        for i in range(detection.num_detections):
+            object_type = detection.label_vec[det_max_class_idxs[i]]
 
             # since we were able to find this object's 3D position,
             # add it to 3d detection message
             det_3d_set_msg.object_labels.append(object_type)
             det_3d_set_msg.num_objects += 1
 
-            for p in range(4):
-                point_3d = Point()
-
-                log.info(f"scene position {corners_world_pos[p]}")
-                point_3d.x = corners_world_pos[p][0]
-                point_3d.y = corners_world_pos[p][1]
-                point_3d.z = corners_world_pos[p][2]
-
-                if p == 0:
-                    det_3d_set_msg.left.append(point_3d)
-                elif p == 1:
-                    det_3d_set_msg.top.append(point_3d)
-                elif p == 2:
-                    det_3d_set_msg.right.append(point_3d)
-                elif p == 3:
-                    det_3d_set_msg.bottom.append(point_3d)
+            for corner, points in zip(
+                corners_world_pos[i],
+                (
+                    det_3d_set_msg.left,
+                    det_3d_set_msg.top,
+                    det_3d_set_msg.right,
+                    det_3d_set_msg.bottom,
+                ),
+            ):
+                log.debug(f"scene position {corner}")
+                points.append(
+                    Point(x=float(corner[0]), y=float(corner[1]), z=float(corner[2]))
+                )
 
         # form and publish the 3d object detection message
         self._object_3d_publisher.publish(det_3d_set_msg)
 
-        # uncomment this to visualize the scene
-        # self.scene.show()
+        if self._debug_scene:
+            self.add_debug_boxes(
+                world_matrix_2d, projection_matrix_2d, corners_world_pos
+            )
+            # uncomment this to visualize the scene
+            # self.scene.show()
+
+    def add_debug_axes(self, world_matrix_2d, camera_origin):
+        """
+        Add the x, y and z axes of the camera to the scene.
+        """
+        for axis, color in zip(
+            np.eye(3), ([255, 0, 0, 255], [0, 255, 0, 255], [0, 0, 255, 255])
+        ):
+            axis_end = self.get_world_position(world_matrix_2d, axis).flatten()
+            vs = np.array([camera_origin[0], axis_end])
+            el = trimesh.path.entities.Line([0, 1])
+            path = trimesh.path.Path3D(
+                entities=[el], vertices=vs, colors=np.array(color).reshape(1, 4)
+            )
+            self.scene.add_geometry(path)
+
+    def add_debug_boxes(self, world_matrix_2d, projection_matrix_2d, corners_world_pos):
+        """
+        Add the 3D boxes of detections, and the edges of the image at unit
+        depth, to the scene.
+
+        :param corners_world_pos: World position of the corners of each
+            detection's box, of shape [nDets x 4 x 3].
+        """
+        for corners in corners_world_pos:
+            el = trimesh.path.entities.Line([0, 1, 2, 3, 0])
+            path = trimesh.path.Path3D(entities=[el], vertices=corners)
+            self.scene.add_geometry(path)
+
+        # draw the image edges
+        bounds_screen_pos = [
+            [0, 0],
+            [0, self.image_height],
+            [self.image_width, self.image_height],
+            [self.image_width, 0],
+        ]
+        image_corners_world_pos = pixels_to_world_points(
+            bounds_screen_pos,
+            self.image_width,
+            self.image_height,
+            world_matrix_2d,
+            projection_matrix_2d,
+            FOCAL_LENGTH_X,
+            FOCAL_LENGTH_Y,
+        )
+        el = trimesh.path.entities.Line([0, 1, 2, 3, 0])
+        path = trimesh.path.Path3D(
+            entities=[el],
+            vertices=image_corners_world_pos,
+            colors=np.array([255, 0, 255, 255]).reshape(1, 4),
+        )
+        self.scene.add_geometry(path)
 
     def show_plot(self):
         try:
@@ -432,14 +536,15 @@ class SpatialMapSubscriber(Node):
         # project camera space onto world position
         direction = self.get_world_position(world_matrix_2d, dir_ray[0]).reshape((1, 3))
 
-        vs = np.array([camera_origin[0], direction[0]])
-        el = trimesh.path.entities.Line([0, 1])
-        path = trimesh.path.Path3D(
-            entities=[el],
-            vertices=vs,
-            colors=np.array([255, 255, 0, 255]).reshape(1, 4),
-        )
-        self.scene.add_geometry(path)
+        if self._debug_scene:
+            vs = np.array([camera_origin[0], direction[0]])
+            el = trimesh.path.entities.Line([0, 1])
+            path = trimesh.path.Path3D(
+                entities=[el],
+                vertices=vs,
+                colors=np.array([255, 255, 0, 255]).reshape(1, 4),
+            )
+            self.scene.add_geometry(path)
 
         # self.scene.show()
         log.info(f"direction: {direction}")
@@ -2,6 +2,7 @@ from pathlib import Path
 from threading import RLock
 from typing import Dict
 from typing import List
+from typing import Mapping
 from typing import Optional
 
 from builtin_interfaces.msg import Time
@@ -26,6 +27,10 @@ from angel_utils import make_default_main
 from angel_system.global_step_prediction.global_step_predictor import (
     GlobalStepPredictor,
 )
+from angel_system.global_step_prediction.tp_activation_cache import (
+    DEFAULT_CACHE_DIR,
+    TPActivationCache,
+)
 
 
 PARAM_CONFIG_FILE = "config_file"
@@ -36,7 +41,14 @@ PARAM_SYSTEM_TEXT_TOPIC = "system_text_topic"
 PARAM_SYS_CMD_TOPIC = "system_command_topic"
 PARAM_QUERY_TASK_GRAPH_TOPIC = "query_task_graph_topic"
 PARAM_DET_TOPIC = "det_topic"
+# Average true positive activations of the activity classifier. Either a
+# ``.npy`` profile, or a kwcoco file of activity predictions to compute the
+# profile from against the ground truth in ``model_truth_file``. Computed
+# profiles are cached in ``model_cache_dir``, keyed by the contents of the
+# input files.
 PARAM_MODEL_FILE = "model_file"
+PARAM_MODEL_TRUTH_FILE = "model_truth_file"
+PARAM_MODEL_CACHE_DIR = "model_cache_dir"
 PARAM_THRESH_FRAME_COUNT = "thresh_frame_count"
 PARAM_DEACTIVATE_THRESH_FRAME_COUNT = "deactivate_thresh_frame_count"
 PARAM_THRESH_MULTIPLIER_WEAK = "threshold_multiplier_weak"
@@ -53,6 +65,9 @@ PARAM_START_PAUSED = "start_paused"
 PARAM_GT_ACT_COCO = "gt_activity_mscoco"
 PARAM_GT_VIDEO_ID = "gt_video_id"
 PARAM_GT_OUTPUT_DIR = "gt_output_dir"  # output directory override.
+# Maximum number of most recent frames of confidence and step prediction
+# history to retain in the GSP. Non-positive values retain the full history.
+PARAM_HISTORY_MAX_FRAMES = "history_max_frames"
 
 
 VALID_STEP_MODES = {"broad", "granular"}
@@ -85,6 +100,8 @@ class GlobalStepPredictorNode(Node):
                 (PARAM_QUERY_TASK_GRAPH_TOPIC,),
                 (PARAM_DET_TOPIC,),
                 (PARAM_MODEL_FILE,),
+                (PARAM_MODEL_TRUTH_FILE, ""),
+                (PARAM_MODEL_CACHE_DIR, DEFAULT_CACHE_DIR.as_posix()),
                 (PARAM_THRESH_MULTIPLIER_WEAK,),
                 (PARAM_THRESH_FRAME_COUNT,),
                 (PARAM_THRESH_FRAME_COUNT_WEAK,),
@@ -94,6 +111,7 @@ class GlobalStepPredictorNode(Node):
                 (PARAM_GT_VIDEO_ID, -1),
                 (PARAM_GT_OUTPUT_DIR, "outputs"),
                 (PARAM_START_PAUSED, False),
+                (PARAM_HISTORY_MAX_FRAMES, -1),
             ],
         )
         self._config_file = param_values[PARAM_CONFIG_FILE]
@@ -105,6 +123,8 @@ class GlobalStepPredictorNode(Node):
         self._query_task_graph_topic = param_values[PARAM_QUERY_TASK_GRAPH_TOPIC]
         self._det_topic = param_values[PARAM_DET_TOPIC]
         self._model_file = param_values[PARAM_MODEL_FILE]
+        self._model_truth_file = param_values[PARAM_MODEL_TRUTH_FILE]
+        self._model_cache_dir = param_values[PARAM_MODEL_CACHE_DIR]
         self._threshold_multiplier_weak = param_values[PARAM_THRESH_MULTIPLIER_WEAK]
         self._thresh_frame_count = param_values[PARAM_THRESH_FRAME_COUNT]
         self._threshold_frame_count_weak = param_values[PARAM_THRESH_FRAME_COUNT_WEAK]
@@ -112,6 +132,7 @@ class GlobalStepPredictorNode(Node):
             PARAM_DEACTIVATE_THRESH_FRAME_COUNT
         ]
         self._step_mode = param_values[PARAM_STEP_MODE]
+        self._history_max_frames = param_values[PARAM_HISTORY_MAX_FRAMES]
 
         if self._step_mode not in VALID_STEP_MODES:
             raise ValueError(
@@ -133,6 +154,10 @@ class GlobalStepPredictorNode(Node):
         # Time is represented as the ROS Time message
         self._latest_act_classification_end_time = None
 
+        # Average true positive activations, loaded once and shared by each
+        # GSP instance (re)loaded.
+        self._avg_probs = self._load_avg_probs()
+
         # The GSP Instance, which we'll load now.
         self._gsp_lock = RLock()  # Control access to GSP
         log.info(
@@ -194,6 +219,32 @@ class GlobalStepPredictorNode(Node):
             )
             log.info("GT params specified, initializing data... Done")
 
+    def _load_avg_probs(self) -> np.ndarray:
+        """
+        Load the average true positive activations given by the model file
+        parameters, memory-mapped.
+
+        A kwcoco model file has its profile taken from the cache, only being
+        computed if no profile for the same input contents was cached before.
+        """
+        log = self.get_logger()
+        if Path(self._model_file).suffix == ".npy":
+            return np.load(self._model_file, mmap_mode="r")
+        if not self._model_truth_file:
+            raise ValueError(
+                f"Model file '{self._model_file}' is not a .npy file, the "
+                f"'{PARAM_MODEL_TRUTH_FILE}' parameter is required to compute "
+                f"average activations from it."
+            )
+        log.info(
+            "Getting average true positive activations of "
+            f"'{self._model_file}' (cache '{self._model_cache_dir}')"
+        )
+        cache = TPActivationCache(self._model_cache_dir)
+        return cache.get_or_compute(
+            self._model_file, self._model_truth_file, self._activity_config_file
+        )
+
     def _reload_gsp(self) -> None:
         """
         (Re)Load the GSP instance from input configuration parameters.
@@ -228,10 +279,13 @@ class GlobalStepPredictorNode(Node):
                 recipe_types=recipe_types,
                 recipe_config_dict=recipe_config_dict,
                 activity_config_fpath=self._activity_config_file,
+                history_max_len=(
+                    self._history_max_frames if self._history_max_frames > 0 else None
+                ),
             )
 
             # model_file = pre-computed averages of TP activations
-            self.gsp.get_average_TP_activations_from_file(self._model_file)
+            self.gsp.get_average_TP_activations_from_array(self._avg_probs)
             log.info("Global state predictor (re)loaded")
 
             # Load default values into our stateful mappings.
@@ -405,7 +459,7 @@ class GlobalStepPredictorNode(Node):
             if not self._gsp_active:
                 return
 
-            tracker_dict_list = self.gsp.process_new_confidences(conf_array)
+            tracker_dict_list = self.gsp.process_new_confidences_batch(conf_array)
 
             print(f"conf_array: {conf_array}")
 
@@ -500,14 +554,15 @@ class GlobalStepPredictorNode(Node):
 
     def publish_task_state_message(
         self,
-        task_state: Dict,
+        task_state: Mapping,
         result_ts: Time,
     ) -> None:
         """
         Forms and sends a `angel_msgs/TaskUpdate` message to the
         TaskUpdates topic.
 
-        :param task_state: TODO
+        :param task_state: Tracker state, as a tracker mapping from the
+            GlobalStepPredictor.
         :param result_ts: Time of the latest frame input that went into
             estimation of the current task state.
         """
@@ -1,10 +1,7 @@
-from collections import deque
 from dataclasses import dataclass, field
-import itertools
 from threading import RLock
 from typing import Any
 from typing import Callable
-from typing import Deque
 from typing import List
 from typing import Optional
 from typing import Tuple
@@ -22,7 +19,7 @@ from angel_msgs.msg import (
     ImageMetadata,
 )
 
-from angel_system.utils.matching import descending_match_with_tolerance
+from angel_system.utils.timestamp_queue import TimestampQueue
 from angel_utils.conversion import time_to_int
 
 
@@ -109,8 +106,10 @@ class InputBuffer:
     Object detection outputs are known to correlate strictly with an image
     frame via the timestamp value.
 
-    Contained deques are in ascending time order (later indices are farther
-    ahead in time).
+    Contained queues are in ascending time order (later indices are farther
+    ahead in time). Each keeps the integer nanosecond timestamps of its
+    messages in an array alongside them, so windows are extracted by slicing
+    and binary search rather than by walking and converting messages.
 
     NOTE: `__post_init__` is a thing if we need it.
 
@@ -126,29 +125,32 @@ class InputBuffer:
     get_logger_fn: Callable[[], Any]  # don't know where to get the type for this...
 
     # Buffer of RGB image matrices and the associated timestamp
-    frames: Deque[Tuple[Time, npt.NDArray, int]] = field(
-        default_factory=deque, init=False, repr=False
+    frames: TimestampQueue[Tuple[Time, npt.NDArray, int]] = field(
+        default_factory=TimestampQueue, init=False, repr=False
     )
     # Buffer of left-hand pose messages
-    hand_pose_left: Deque[HandJointPosesUpdate] = field(
-        default_factory=deque, init=False, repr=False
+    hand_pose_left: TimestampQueue[HandJointPosesUpdate] = field(
+        default_factory=TimestampQueue, init=False, repr=False
     )
     # Buffer of right-hand pose messages
-    hand_pose_right: Deque[HandJointPosesUpdate] = field(
-        default_factory=deque, init=False, repr=False
+    hand_pose_right: TimestampQueue[HandJointPosesUpdate] = field(
+        default_factory=TimestampQueue, init=False, repr=False
     )
-    # Buffer of object detection predictions
-    obj_dets: Deque[ObjectDetection2dSet] = field(
-        default_factory=deque, init=False, repr=False
+    # Buffer of object detection predictions, keyed by the stamp of the image
+    # they were computed on.
+    obj_dets: TimestampQueue[ObjectDetection2dSet] = field(
+        default_factory=TimestampQueue, init=False, repr=False
     )
 
-    patient_joint_kps: Deque[HandJointPosesUpdate] = field(
-        default_factory=deque, init=False, repr=False
+    # Buffer of patient pose estimations, keyed by the stamp of the image they
+    # were computed on.
+    patient_joint_kps: TimestampQueue[HandJointPosesUpdate] = field(
+        default_factory=TimestampQueue, init=False, repr=False
     )
 
-    # buffer for camera info
-    camera_info: Deque[ImageMetadata] = field(
-        default_factory=deque, init=False, repr=False
+    # buffer for camera info, parallel to `frames`.
+    camera_info: TimestampQueue[ImageMetadata] = field(
+        default_factory=TimestampQueue, init=False, repr=False
     )
 
     __state_lock: RLock = field(default_factory=RLock, init=False, repr=False)
@@ -179,7 +181,7 @@ class InputBuffer:
         """
         # NOTE: Only considering `frames` for timestamps.
         with self.__state_lock:
-            if not self.frames:
+            if not len(self.frames):
                 raise RuntimeError("No data buffered for there to be a latest time.")
             return self.frames[-1][0]
 
@@ -196,25 +198,66 @@ class InputBuffer:
         """
         # get the timestamp from the image header
         img_header_stamp = img_meta_msg.image_source_stamp
-        # self.get_logger_fn().info(f"image header stamp: {img_header_stamp}")
-        # self.get_logger_fn().info(f"self.frames[-1][0] header stamp: {self.frames[-1][0]}")
+        img_time_ns = time_to_int(img_header_stamp)
         with self.__state_lock:
             # before the current lead frame?
-            if self.frames and time_to_int(img_header_stamp) <= time_to_int(
-                self.frames[-1][0]
-            ):
+            if len(self.frames) and img_time_ns <= self.frames.last_time():
                 self.get_logger_fn().warn(
                     f"Input image frame was NOT after the previous latest: "
-                    f"(prev) {time_to_int(self.frames[-1][0])} "
-                    f"!< {time_to_int(img_header_stamp)} (new)"
+                    f"(prev) {self.frames.last_time()} "
+                    f"!< {img_time_ns} (new)"
                 )
                 return False
             # save the image frame
-            self.frames.append((img_header_stamp, img_mat, image_frame_number))
+            self.frames.append(
+                img_time_ns, (img_header_stamp, img_mat, image_frame_number)
+            )
             # save the camera info
-            self.camera_info.append(img_meta_msg)
+            self.camera_info.append(img_time_ns, img_meta_msg)
+            return True
+
+    def _queue_msg(
+        self,
+        queue: TimestampQueue,
+        msg: Any,
+        time_ns: int,
+        order_time_ns: int,
+        what: str,
+    ) -> bool:
+        """
+        Queue a message if it is temporally after the latest message already in
+        the given queue, both by order time and by the time it is keyed by.
+
+        :param queue: Queue to add to.
+        :param msg: Message to add.
+        :param time_ns: Time the message is keyed by in the queue.
+        :param order_time_ns: Time that must be after that of the latest
+            queued message.
+        :param what: Description of the message for logging.
+        """
+        with self.__state_lock:
+            if len(queue):
+                prev_time_ns = self._queue_order_time(queue)
+                if order_time_ns <= prev_time_ns:
+                    self.get_logger_fn().warn(
+                        f"Input {what} was NOT after the previous latest: "
+                        f"(prev) {prev_time_ns} !< {order_time_ns} (new)"
+                    )
+                    return False
+                prev_key_ns = queue.last_time()
+                if time_ns <= prev_key_ns:
+                    self.get_logger_fn().warn(
+                        f"Input {what} was NOT keyed after the previous latest: "
+                        f"(prev key) {prev_key_ns} !< {time_ns} (new key)"
+                    )
+                    return False
+            queue.append(time_ns, msg)
             return True
 
+    @staticmethod
+    def _queue_order_time(queue: TimestampQueue) -> int:
+        return time_to_int(queue[-1].header.stamp)
+
     def queue_hand_pose(self, msg: HandJointPosesUpdate) -> bool:
         """
         Input hand pose may be of the left or right hand, as indicated by
@@ -222,61 +265,39 @@ class InputBuffer:
         :returns: True if the message was queued, otherwise false because it was
             not newer than the current latest message.
         """
-        hand_list: Deque[HandJointPosesUpdate]
+        hand_list: TimestampQueue[HandJointPosesUpdate]
         if msg.hand == "Right":
             hand_list = self.hand_pose_right
         elif msg.hand == "Left":
             hand_list = self.hand_pose_left
         else:
             raise ValueError(f"Input hand pose for hand '{msg.hand}'? What?")
-        with self.__state_lock:
-            # before the current lead pose?
-            if hand_list and time_to_int(msg.header.stamp) <= time_to_int(
-                hand_list[-1].header.stamp
-            ):
-                self.get_logger_fn().warn(
-                    f"Input hand pose was NOT after the previous latest: "
-                    f"(prev) {hand_list[-1].header.stamp} !< {msg.header.stamp} (new)"
-                )
-                return False
-            hand_list.append(msg)
-            return True
+        time_ns = self._hand_msg_to_time_ns(msg)
+        return self._queue_msg(hand_list, msg, time_ns, time_ns, "hand pose")
 
     def queue_object_detections(self, msg: ObjectDetection2dSet) -> bool:
         """
         Queue up an object detection set for the
         """
-        with self.__state_lock:
-            # before the current lead pose?
-            if self.obj_dets and time_to_int(msg.header.stamp) <= time_to_int(
-                self.obj_dets[-1].header.stamp
-            ):
-
-                self.get_logger_fn().warn(
-                    f"Input object detection result was NOT after the previous latest: "
-                    f"(prev) {self.obj_dets[-1].header.stamp} !< {msg.header.stamp} (new)"
-                )
-                return False
-            self.obj_dets.append(msg)
-            return True
+        return self._queue_msg(
+            self.obj_dets,
+            msg,
+            self._objdet_msg_to_time_ns(msg),
+            time_to_int(msg.header.stamp),
+            "object detection result",
+        )
 
     def queue_joint_keypoints(self, msg: HandJointPosesUpdate) -> bool:
         """
         Queue up an object detection set for the
         """
-
-        with self.__state_lock:
-            # before the current lead pose?
-            if self.patient_joint_kps and time_to_int(msg.header.stamp) <= time_to_int(
-                self.patient_joint_kps[-1].header.stamp
-            ):
-                self.get_logger_fn().warn(
-                    f"Input pose estimation results was NOT after the previous latest: "
-                    f"(prev) {self.patient_joint_kps[-1].header.stamp} !< {msg.header.stamp} (new)"
-                )
-                return False
-            self.patient_joint_kps.append(msg)
-            return True
+        return self._queue_msg(
+            self.patient_joint_kps,
+            msg,
+            self._joints_msg_to_time_ns(msg),
+            time_to_int(msg.header.stamp),
+            "pose estimation results",
+        )
 
     @staticmethod
     def _hand_msg_to_time_ns(msg: HandJointPosesUpdate):
@@ -318,30 +339,23 @@ class InputBuffer:
         #   timestamp *exactly*.
 
         with self.__state_lock:
-            # Normally, we consider frames for the window starting with the
-            # most recent frame. When the frames deque is reverse iterated,
-            # this would be indexed zero.
-            window_frame_start_idx = 0
+            # Normally, the window ends with the most recent frame.
+            window_stop = len(self.frames)
 
             if have_leading_object:
-                # Determine the slice of `window_frames` to use such that the
-                # most recent frame of the window is the same frame for which
-                # our most recent object detections are for.
+                # Determine the slice of `frames` to use such that the most
+                # recent frame of the window is the same frame for which our
+                # most recent object detections are for.
 
                 # If `obj_dets` is empty, return empty window.
-                if not self.obj_dets:
+                if not len(self.obj_dets):
                     return InputWindow(
                         frames=[], obj_dets=[], patient_joint_kps=[], camera_info=[]
                     )
 
-                # Use the last object detection to get a timestamp. Find that
-                # timestamp in the `frames` deque, traversing backwards.
-                last_det_ts = self._objdet_msg_to_time_ns(self.obj_dets[-1])
-                last_det_frame_idx = None
-                for i, frame in enumerate(reversed(self.frames)):
-                    if time_to_int(frame[0]) == last_det_ts:
-                        last_det_frame_idx = i
-                        break
+                # Find the frame with the timestamp of the last object
+                # detection.
+                last_det_frame_idx = self.frames.index_of(self.obj_dets.last_time())
                 if last_det_frame_idx is None:
                     # Failed to find a queued frame for the object detection.
                     # This is not expected, but can technically happen.
@@ -349,52 +363,19 @@ class InputBuffer:
                     return InputWindow(
                         frames=[], obj_dets=[], patient_joint_kps=[], camera_info=[]
                     )
-                # Update the window frame start index to the
-                window_frame_start_idx = last_det_frame_idx
-
-            # This window's frame in ascending time order.
-            # `deque` instances don't support slicing, so we use
-            # `itertools.islice` of the reverse iterator of the frames deque to
-            # slice backwards from the most recent frame (or specified starting
-            # index).
-            # The `window_size` is increased by the starting index so that we
-            # actually get a `window_size` list back regardless of where we are
-            # starting.
-            # Finally, the extracted slice is reversed in order again so that
-            # the final list is in temporally ascending order.
-            window_frames = list(
-                itertools.islice(
-                    reversed(self.frames),
-                    window_frame_start_idx,
-                    window_size + window_frame_start_idx,
-                )
-            )[::-1]
-            window_frame_times: List[Time] = [wf[0] for wf in window_frames]
-            window_frame_times_ns: List[int] = [
-                time_to_int(wft) for wft in window_frame_times
-            ]
-
-            window_dets = descending_match_with_tolerance(
-                window_frame_times_ns,
-                self.obj_dets,
-                0,  # we expect exact matches for object detections.
-                time_from_value_fn=self._objdet_msg_to_time_ns,
-            )
+                window_stop = last_det_frame_idx + 1
 
-            # print(f"Window window detections: {window_dets}")
-
-            window_joint_kps = descending_match_with_tolerance(
-                window_frame_times_ns,
-                self.patient_joint_kps,
-                0,  # we expect exact matches for object detections.
-                time_from_value_fn=self._joints_msg_to_time_ns,
-            )
+            # This window's frames in ascending time order.
+            window_start = max(window_stop - window_size, 0)
+            window_frame_times_ns = self.frames.times[window_start:window_stop]
 
+            # Object detections and poses are expected to match their frame
+            # timestamps exactly.
             output = InputWindow(
-                frames=window_frames,
-                obj_dets=window_dets,
-                patient_joint_kps=window_joint_kps,
-                camera_info=[ci for ci in self.camera_info],
+                frames=self.frames.items(window_start, window_stop),
+                obj_dets=self.obj_dets.match(window_frame_times_ns),
+                patient_joint_kps=self.patient_joint_kps.match(window_frame_times_ns),
+                camera_info=self.camera_info.items(window_start, window_stop),
             )
             return output
 
@@ -403,33 +384,10 @@ class InputBuffer:
         Clear content in the buffer that is strictly older than the given
         timestamp.
         """
-        # for each deque, traverse from the left (the earliest time) and pop if
-        # the ts is < the given.
         with self.__state_lock:
-            while self.frames and time_to_int(self.frames[0][0]) < time_nsec:
-                self.frames.popleft()
-            while (
-                self.hand_pose_left
-                and time_to_int(self.hand_pose_left[0].header.stamp) < time_nsec
-            ):
-                self.hand_pose_left.popleft()
-            while (
-                self.hand_pose_right
-                and time_to_int(self.hand_pose_right[0].header.stamp) < time_nsec
-            ):
-                self.hand_pose_right.popleft()
-            while (
-                self.obj_dets and time_to_int(self.obj_dets[0].source_stamp) < time_nsec
-            ):
-                self.obj_dets.popleft()
-
-            while (
-                self.patient_joint_kps
-                and time_to_int(self.patient_joint_kps[0].source_stamp) < time_nsec
-            ):
-                self.patient_joint_kps.popleft()
-            while (
-                self.camera_info
-                and time_to_int(self.camera_info[0].header.stamp) < time_nsec
-            ):
-                self.camera_info.popleft()
+            self.frames.drop_before(time_nsec)
+            self.hand_pose_left.drop_before(time_nsec)
+            self.hand_pose_right.drop_before(time_nsec)
+            self.obj_dets.drop_before(time_nsec)
+            self.patient_joint_kps.drop_before(time_nsec)
+            self.camera_info.drop_before(time_nsec)
@@ -18,7 +18,9 @@ import cv2
 import numpy as np
 import numpy.typing as npt
 
-from angel_msgs.msg import HandJointPosesUpdate, ObjectDetection2dSet
+from angel_msgs.msg import HandJointPosesUpdate, ObjectDetection2dSet, SpatialMesh
+from angel_system.utils.spatial_mesh import flatten_mesh
+from angel_system.utils.spatial_mesh import unflatten_mesh
 from smqtk_detection.utils.bbox import AxisAlignedBoundingBox
 
 
@@ -151,17 +153,234 @@ def from_detect_image_objects_result(
     return msg
 
 
+def has_topk_confidences(msg: ObjectDetection2dSet) -> bool:
+    """
+    If the message uses the sparse top-k encoding of label confidences instead
+    of the dense confidence matrix.
+    """
+    return len(msg.label_topk_indices) > 0
+
+
 def to_confidence_matrix(msg: ObjectDetection2dSet) -> np.ndarray:
     """
     Get the detection predicted confidences as a 2D matrix.
+
+    This reads either the dense or the sparse top-k encoding.
+
     :param msg: Message to get the matrix confidences from.
     :return: New numpy ndarray of 2 dimensions with shape [nDets x nClasses].
     """
-    return np.asarray(msg.label_confidences).reshape(
-        (msg.num_detections, len(msg.label_vec))
+    mat_shape = (msg.num_detections, len(msg.label_vec))
+    if not has_topk_confidences(msg):
+        return np.asarray(msg.label_confidences).reshape(mat_shape)
+    topk_idxs, topk_confs = to_topk_confidences(msg)
+    conf_mat = np.zeros(mat_shape)
+    np.put_along_axis(conf_mat, topk_idxs, topk_confs, axis=1)
+    return conf_mat
+
+
+def topk_from_confidence_matrix(
+    conf_mat: np.ndarray, k: int
+) -> Tuple[npt.NDArray[np.int32], npt.NDArray[np.float32]]:
+    """
+    Get the `k` highest confidences of each detection from a confidence
+    matrix, in descending order. Of equal confidences, that of the lowest
+    label index comes first.
+
+    :param conf_mat: Confidence matrix of shape [nDets x nClasses].
+    :param k: Number of confidences to keep per detection. At most nClasses
+        are kept.
+    :return: Label indices and confidences, each of shape [nDets x k].
+    """
+    conf_mat = np.asarray(conf_mat)
+    k = min(k, conf_mat.shape[1])
+    if k == 1:
+        idxs = conf_mat.argmax(axis=1)[:, None]
+    else:
+        idxs = np.argsort(-conf_mat, axis=1, kind="stable")[:, :k]
+    confs = np.take_along_axis(conf_mat, idxs, axis=1)
+    return idxs.astype(np.int32), confs.astype(np.float32)
+
+
+def to_topk_confidences(
+    msg: ObjectDetection2dSet,
+) -> Tuple[npt.NDArray[np.int32], npt.NDArray[np.float32]]:
+    """
+    Get the label indices and confidences of the sparse top-k encoding as 2D
+    matrices.
+
+    :param msg: Message using the top-k encoding.
+    :return: Label indices and confidences, each of shape [nDets x k].
+    """
+    n = msg.num_detections
+    idxs = np.asarray(msg.label_topk_indices, dtype=np.int32)
+    confs = np.asarray(msg.label_topk_confidences, dtype=np.float32)
+    if n == 0:
+        return idxs.reshape(0, 0), confs.reshape(0, 0)
+    return idxs.reshape(n, -1), confs.reshape(n, -1)
+
+
+def max_class_and_conf(
+    msg: ObjectDetection2dSet,
+) -> Tuple[npt.NDArray[int], npt.NDArray[float]]:
+    """
+    Get the label index and confidence of the maximally confident class of
+    each detection, reading either confidence encoding without expanding the
+    top-k encoding into a dense matrix.
+
+    :param msg: Input 2D object detection set message.
+    :return: Label indices and confidences, each of shape [nDets].
+    """
+    if has_topk_confidences(msg):
+        topk_idxs, topk_confs = to_topk_confidences(msg)
+        col = topk_confs.argmax(axis=1)[:, None]
+        return (
+            np.take_along_axis(topk_idxs, col, axis=1)[:, 0].astype(int),
+            np.take_along_axis(topk_confs, col, axis=1)[:, 0].astype(np.float64),
+        )
+    if msg.num_detections == 0:
+        return np.empty(0, dtype=int), np.empty(0)
+    conf_mat = to_confidence_matrix(msg)
+    max_conf_idxs = conf_mat.argmax(axis=1)
+    max_confs = conf_mat[np.arange(conf_mat.shape[0]), max_conf_idxs]
+    return max_conf_idxs, max_confs
+
+
+def set_label_confidences(
+    msg: ObjectDetection2dSet, conf_mat: np.ndarray, topk: int = 0
+) -> None:
+    """
+    Set the label confidences of a message from a confidence matrix, either
+    densely or with the sparse top-k encoding.
+
+    The message's `num_detections` and `label_vec` should correspond to the
+    shape of the given matrix.
+
+    :param msg: Message to set the confidences of.
+    :param conf_mat: Confidence matrix of shape [nDets x nClasses].
+    :param topk: If positive, only set this many highest confidences per
+        detection with the top-k encoding. Otherwise, set the dense matrix.
+    """
+    conf_mat = np.asarray(conf_mat, dtype=np.float64)
+    if topk > 0 and conf_mat.size:
+        idxs, confs = topk_from_confidence_matrix(conf_mat, topk)
+        msg.label_confidences = []
+        msg.label_topk_indices = idxs.ravel().tolist()
+        msg.label_topk_confidences = confs.ravel().tolist()
+    else:
+        msg.label_confidences = conf_mat.ravel().tolist()
+        msg.label_topk_indices = []
+        msg.label_topk_confidences = []
+
+
+def _take_array(
+    values: npt.ArrayLike, indices: np.ndarray, typecode: str
+) -> array.array:
+    """
+    Take rows of an array into an `array.array`, the type message array
+    fields hold, without going through a Python list.
+    """
+    taken = np.asarray(values, dtype=np.dtype(typecode))[indices]
+    out = array.array(typecode)
+    out.frombytes(np.ascontiguousarray(taken).tobytes())
+    return out
+
+
+def take_detections(
+    msg: ObjectDetection2dSet, det_indices: npt.ArrayLike
+) -> ObjectDetection2dSet:
+    """
+    Create a new message with a subset of the detections of another, keeping
+    its confidence encoding.
+
+    :param msg: Message to take detections from.
+    :param det_indices: Indices of the detections to take, or a boolean mask
+        over the detections.
+    :return: New message with the same header, source stamp and labels.
+    """
+    new_msg = ObjectDetection2dSet()
+    new_msg.header = msg.header
+    new_msg.source_stamp = msg.source_stamp
+    new_msg.label_vec = msg.label_vec
+
+    det_indices = np.asarray(det_indices)
+    if det_indices.dtype == bool:
+        det_indices = np.flatnonzero(det_indices)
+    new_msg.num_detections = len(det_indices)
+
+    # Only array slice if there is anything left post-filtering.
+    if new_msg.num_detections > 0:
+        new_msg.left = _take_array(msg.left, det_indices, "f")
+        new_msg.right = _take_array(msg.right, det_indices, "f")
+        new_msg.top = _take_array(msg.top, det_indices, "f")
+        new_msg.bottom = _take_array(msg.bottom, det_indices, "f")
+        if has_topk_confidences(msg):
+            topk_idxs, topk_confs = to_topk_confidences(msg)
+            new_msg.label_topk_indices = _take_array(topk_idxs, det_indices, "i")
+            new_msg.label_topk_confidences = _take_array(topk_confs, det_indices, "f")
+        else:
+            new_msg.label_confidences = _take_array(
+                to_confidence_matrix(msg), det_indices, "d"
+            )
+    return new_msg
+
+
+def has_flat_mesh(msg: SpatialMesh) -> bool:
+    """
+    If the message uses the flat buffer encoding of its mesh instead of the
+    shape message.
+    """
+    return len(msg.vertex_buffer) > 0
+
+
+def to_mesh_arrays(
+    msg: SpatialMesh,
+) -> Tuple[npt.NDArray[np.floating], npt.NDArray[np.uint32]]:
+    """
+    Get the mesh of a message as arrays.
+
+    This reads either the flat buffer or the shape message encoding, with
+    vertices in the precision of the encoding: single for flat buffers, which
+    are viewed without copying, and double for shape messages.
+
+    :param msg: Message to get the mesh of.
+    :return: Vertex positions of shape [nVertices x 3] and triangle vertex
+        indices of shape [nTriangles x 3].
+    """
+    if has_flat_mesh(msg):
+        return unflatten_mesh(msg.vertex_buffer, msg.index_buffer)
+    vertices = msg.mesh.vertices
+    triangles = msg.mesh.triangles
+    return (
+        np.fromiter(
+            itertools.chain.from_iterable((v.x, v.y, v.z) for v in vertices),
+            dtype=np.float64,
+            count=3 * len(vertices),
+        ).reshape(-1, 3),
+        np.fromiter(
+            itertools.chain.from_iterable(t.vertex_indices for t in triangles),
+            dtype=np.uint32,
+            count=3 * len(triangles),
+        ).reshape(-1, 3),
     )
 
 
+def set_mesh_arrays(
+    msg: SpatialMesh, vertices: npt.ArrayLike, triangles: npt.ArrayLike
+) -> None:
+    """
+    Set the mesh of a message from arrays, with the flat buffer encoding.
+
+    :param msg: Message to set the mesh of.
+    :param vertices: Vertex positions of shape [nVertices x 3], or of shape
+        [nVertices x 4] in homogeneous coordinates.
+    :param triangles: Triangle vertex indices of shape [nTriangles x 3].
+    """
+    vertex_buffer, index_buffer = flatten_mesh(vertices, triangles)
+    msg.vertex_buffer = array.array("f", vertex_buffer.tobytes())
+    msg.index_buffer = array.array("I", index_buffer.tobytes())
+
+
 def convert_nv12_to_rgb(nv12_image: array.array, height: int, width: int) -> np.ndarray:
     """
     Converts an image in NV12 format to RGB.
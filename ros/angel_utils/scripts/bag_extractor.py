@@ -31,7 +31,7 @@ from angel_msgs.msg import (
     TaskUpdate,
 )
 from sensor_msgs.msg import Image
-from angel_utils.conversion import convert_nv12_to_rgb
+from angel_utils.conversion import convert_nv12_to_rgb, to_mesh_arrays
 
 from cv_bridge import CvBridge
 
@@ -469,18 +469,13 @@ class BagConverter(Node):
 
         # TODO: should we add a std_msgs/Header to this message?
         """
+        vertices, triangles = to_mesh_arrays(msg)
         d = {
             "mesh_id": msg.mesh_id,
             "removal": msg.removal,
-            "triangles": [
-                [
-                    int(t.vertex_indices[0]),
-                    int(t.vertex_indices[1]),
-                    int(t.vertex_indices[2]),
-                ]
-                for t in msg.mesh.triangles
-            ],
-            "vertices": [[v.x, v.y, v.z] for v in msg.mesh.vertices],
+            "update_time": msg.update_time,
+            "triangles": triangles.tolist(),
+            "vertices": vertices.tolist(),
         }
         return d
 
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Compare the serialized size and the encode, serialize, deserialize and decode
+latency of ObjectDetection2dSet messages using the dense label confidence
+matrix versus the sparse top-k encoding.
+
+Example running (inside ROS environment):
+ros2 run angel_utils benchmark_detection_encoding.py \
+  --num-classes 100 --num-detections 10 50 --topk 1 3
+"""
+import argparse
+import time
+from typing import Callable
+from typing import Dict
+
+import numpy as np
+from rclpy.serialization import deserialize_message
+from rclpy.serialization import serialize_message
+
+from angel_msgs.msg import ObjectDetection2dSet
+from angel_utils.conversion import max_class_and_conf
+from angel_utils.conversion import set_label_confidences
+
+
+def make_conf_mat(rng: np.random.Generator, n_dets: int, n_classes: int) -> np.ndarray:
+    """
+    Make a confidence matrix like that of the object detector, with a single
+    non-zero confidence per detection.
+    """
+    conf_mat = np.zeros((n_dets, n_classes))
+    conf_mat[np.arange(n_dets), rng.integers(0, n_classes, n_dets)] = rng.random(n_dets)
+    return conf_mat
+
+
+def time_ms(fn: Callable[[], object], n_iters: int) -> float:
+    """
+    Mean latency of a function over some calls, in milliseconds.
+    """
+    s = time.perf_counter()
+    for _ in range(n_iters):
+        fn()
+    return 1e3 * (time.perf_counter() - s) / n_iters
+
+
+def benchmark(conf_mat: np.ndarray, topk: int, n_iters: int) -> Dict[str, float]:
+    """
+    Benchmark one encoding of a confidence matrix.
+
+    :param conf_mat: Confidence matrix of shape [nDets x nClasses].
+    :param topk: Top-k encoding size, or 0 for the dense encoding.
+    :param n_iters: Number of times each step is timed.
+    :return: Serialized message size in bytes and the mean latency of each
+        step in milliseconds.
+    """
+    n_dets, n_classes = conf_mat.shape
+    msg = ObjectDetection2dSet()
+    msg.label_vec = [f"label_{i}" for i in range(n_classes)]
+    msg.num_detections = n_dets
+    msg.left = msg.top = [0.0] * n_dets
+    msg.right = msg.bottom = [1.0] * n_dets
+
+    set_label_confidences(msg, conf_mat, topk)
+    data = serialize_message(msg)
+    return {
+        "bytes": len(data),
+        "encode": time_ms(lambda: set_label_confidences(msg, conf_mat, topk), n_iters),
+        "serialize": time_ms(lambda: serialize_message(msg), n_iters),
+        "deserialize": time_ms(
+            lambda: deserialize_message(data, ObjectDetection2dSet), n_iters
+        ),
+        "decode": time_ms(lambda: max_class_and_conf(msg), n_iters),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--num-classes",
+        type=int,
+        default=100,
+        help="Number of labels in the label vector.",
+    )
+    parser.add_argument(
+        "--num-detections",
+        type=int,
+        nargs="+",
+        default=[10, 50],
+        help="Numbers of detections per message to benchmark.",
+    )
+    parser.add_argument(
+        "--topk",
+        type=int,
+        nargs="+",
+        default=[1, 3],
+        help="Top-k encoding sizes to compare against the dense encoding.",
+    )
+    parser.add_argument(
+        "--iters",
+        type=int,
+        default=1000,
+        help="Number of times each step is timed.",
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(
+        f"{'dets':>5} {'encoding':>9} {'bytes':>8} {'encode':>9} "
+        f"{'serialize':>10} {'deserialize':>12} {'decode':>9}  (ms)"
+    )
+    for n_dets in args.num_detections:
+        conf_mat = make_conf_mat(rng, n_dets, args.num_classes)
+        for topk in [0] + args.topk:
+            r = benchmark(conf_mat, topk, args.iters)
+            name = f"top-{topk}" if topk else "dense"
+            print(
+                f"{n_dets:>5} {name:>9} {r['bytes']:>8} {r['encode']:>9.4f} "
+                f"{r['serialize']:>10.4f} {r['deserialize']:>12.4f} "
+                f"{r['decode']:>9.4f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import json
+from threading import Event
+from threading import Thread
+
+import kwcoco
+import pytest
+
+from angel_system.activity_classification.tcn_hpl import predict
+from angel_system.activity_classification.tcn_hpl.predict import (
+    assemble_results_chunks,
+    ResultsCollector,
+    StreamingResultsCollector,
+)
+
+
+ID_TO_ACTION = {0: "background", 1: "step_1", 2: "step_2"}
+
+
+def _collect(rc, n_frames: int) -> None:
+    rc.set_video("video_a")
+    for i in range(n_frames):
+        gid = rc.add_image(frame_index=i, name=f"frame-{i}")
+        # Repeated frames are not added again.
+        assert rc.add_image(frame_index=i, name=f"frame-{i}") == -1
+        conf_vec = [0.1 * i, 0.5, 1.0 / (i + 1)]
+        rc.collect(gid, i % 3, conf_vec)
+    rc.set_video("video_b")
+    gid = rc.add_image(frame_index=0, name="b-frame-0")
+    rc.collect(gid, 2, [0.2, 0.3, 0.5])
+
+
+def _load_sorted(path):
+    dset = kwcoco.CocoDataset(str(path))
+    return {
+        k: sorted(dset.dataset[k], key=lambda x: x["id"])
+        for k in ("categories", "videos", "images", "annotations")
+    }, dset.dataset["info"]
+
+
+@pytest.mark.parametrize("flush_every", [1, 4, 1000])
+def test_streaming_matches_in_memory(tmp_path, flush_every) -> None:
+    ref_path = tmp_path / "ref.json"
+    ref = ResultsCollector(ref_path, ID_TO_ACTION)
+    _collect(ref, 10)
+    ref.write_file()
+
+    out_path = tmp_path / "out.json"
+    rc = StreamingResultsCollector(out_path, ID_TO_ACTION, flush_every=flush_every)
+    _collect(rc, 10)
+    rc.write_file()
+
+    ref_sections, ref_info = _load_sorted(ref_path)
+    out_sections, out_info = _load_sorted(out_path)
+    assert out_sections == ref_sections
+    assert out_info == json.loads(json.dumps(ref_info))
+
+
+def test_streaming_flushes_in_background(tmp_path) -> None:
+    rc = StreamingResultsCollector(tmp_path / "out.json", ID_TO_ACTION, flush_every=2)
+    _collect(rc, 5)
+    rc._write_queue.join()
+    # 5 + 1 annotations at 2 per flush: 3 chunks written, none buffered.
+    assert len(list(rc.chunk_dir.glob("chunk_*.jsonl"))) == 3
+    assert not rc._records
+
+
+def test_assemble_partial_session(tmp_path) -> None:
+    """
+    Chunks flushed by a session that never wrote its output can still be
+    assembled.
+    """
+    rc = StreamingResultsCollector(tmp_path / "out.json", ID_TO_ACTION, flush_every=3)
+    _collect(rc, 7)
+    rc._write_queue.join()
+
+    recovered = tmp_path / "recovered.json"
+    assemble_results_chunks(rc.chunk_dir, recovered)
+    dset = kwcoco.CocoDataset(str(recovered))
+    # The last 2 annotations were not flushed yet.
+    assert len(dset.anns) == 6
+    assert all(len(a["prob"]) == 3 for a in dset.anns.values())
+
+    with pytest.raises(FileExistsError):
+        StreamingResultsCollector(tmp_path / "out.json", ID_TO_ACTION)
+
+
+def test_restart_after_write(tmp_path) -> None:
+    """
+    A new session may write to the same output after one that wrote its
+    results, as the chunks are removed once assembled.
+    """
+    out_path = tmp_path / "out.json"
+    rc = StreamingResultsCollector(out_path, ID_TO_ACTION, flush_every=2)
+    _collect(rc, 5)
+    rc.write_file()
+    assert not rc.chunk_dir.exists()
+    assert len(kwcoco.CocoDataset(str(out_path)).anns) == 6
+    with pytest.raises(RuntimeError):
+        rc.write_file()
+
+    rc = StreamingResultsCollector(out_path, ID_TO_ACTION, flush_every=2)
+    _collect(rc, 3)
+    rc.write_file()
+    assert len(kwcoco.CocoDataset(str(out_path)).anns) == 4
+
+
+def test_restart_after_assembly_before_removal(tmp_path) -> None:
+    """
+    Chunks left over after they were assembled do not prevent a new session,
+    unlike chunks that were not.
+    """
+    out_path = tmp_path / "out.json"
+    rc = StreamingResultsCollector(out_path, ID_TO_ACTION, flush_every=2)
+    _collect(rc, 5)
+    rc._write_queue.join()
+    assemble_results_chunks(rc.chunk_dir, out_path)
+
+    rc = StreamingResultsCollector(out_path, ID_TO_ACTION, flush_every=2)
+    assert not list(rc.chunk_dir.glob("chunk_*"))
+
+
+def test_pending_chunks_bound(tmp_path) -> None:
+    rc = StreamingResultsCollector(
+        tmp_path / "out.json", ID_TO_ACTION, flush_every=1, max_pending_chunks=2
+    )
+    assert rc._write_queue.maxsize == 2
+    _collect(rc, 20)
+    rc.write_file()
+    assert len(kwcoco.CocoDataset(str(tmp_path / "out.json")).anns) == 21
+
+
+def test_stuck_writer_does_not_block_collect(tmp_path, monkeypatch) -> None:
+    write_chunk = predict.write_results_chunk
+    unstuck = Event()
+
+    def stuck_write_chunk(*args) -> None:
+        unstuck.wait()
+        write_chunk(*args)
+
+    monkeypatch.setattr(predict, "write_results_chunk", stuck_write_chunk)
+    rc = StreamingResultsCollector(
+        tmp_path / "out.json", ID_TO_ACTION, flush_every=1, max_pending_chunks=2
+    )
+    try:
+        t = Thread(target=_collect, args=(rc, 20), daemon=True)
+        t.start()
+        t.join(timeout=10)
+        assert not t.is_alive()
+        assert rc._n_deferred_flushes > 0
+    finally:
+        unstuck.set()
+    # Deferred results are flushed once writing catches up.
+    rc.write_file()
+    assert len(kwcoco.CocoDataset(str(tmp_path / "out.json")).anns) == 21
+
+
+def test_recent_images_bound(tmp_path) -> None:
+    rc = StreamingResultsCollector(tmp_path / "out.json", ID_TO_ACTION, recent_images=2)
+    rc.set_video("v")
+    for i in range(3):
+        assert rc.add_image(frame_index=i, name=f"f{i}") == i + 1
+    assert rc.add_image(frame_index=2, name="f2") == -1
+    # Forgotten, so added again.
+    assert rc.add_image(frame_index=0, name="f0") == 4
@@ -0,0 +1,85 @@
+import json
+
+import kwcoco
+import numpy as np
+import pytest
+
+from angel_system.activity_classification.coco_replay import CocoReplaySource
+from angel_system.activity_classification.coco_replay import sliding_windows
+
+
+def _make_dset(rng: np.random.Generator, n_frames: int = 50) -> kwcoco.CocoDataset:
+    dset = kwcoco.CocoDataset()
+    for cid in range(5):
+        dset.add_category(name=f"cat_{cid}", id=cid)
+    vid = dset.add_video(name="video")
+    for frame_index in rng.permutation(n_frames):
+        gid = dset.add_image(
+            name=f"frame_{frame_index}",
+            video_id=vid,
+            frame_index=int(frame_index),
+            width=640,
+            height=480,
+        )
+        for _ in range(rng.integers(0, 8)):
+            dset.add_annotation(
+                image_id=gid,
+                category_id=int(rng.integers(0, 5)),
+                bbox=(rng.random(4) * 300).tolist(),
+                confidence=float(rng.random()),
+            )
+    # Annotations out of ID order, with sparse IDs.
+    anns = dset.dataset["annotations"]
+    rng.shuffle(anns)
+    for ann, aid in zip(anns, rng.permutation(100_000)[: len(anns)] + 1):
+        ann["id"] = int(aid)
+    return dset
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_replay_matches_kwcoco_index(tmp_path, seed) -> None:
+    """
+    Frames come in frame order, with detections in the order the kwcoco index
+    gives them.
+    """
+    path = tmp_path / "dets.json"
+    with open(path, "w") as f:
+        json.dump(_make_dset(np.random.default_rng(seed)).dataset, f)
+    dset = kwcoco.CocoDataset(str(path))
+    src = CocoReplaySource(path)
+
+    assert src.labels == dset.categories().name
+    expected_gids = sorted(dset.imgs, key=lambda gid: dset.imgs[gid]["frame_index"])
+    frames = list(src)
+    assert [f.image_id for f in frames] == expected_gids
+    for frame in frames:
+        annots = dset.annots(dset.index.gid_to_aids[frame.image_id])
+        assert frame.category_ids.tolist() == list(annots.get("category_id"))
+        assert frame.confidences.tolist() == list(annots.get("confidence"))
+        expected_ltrb = np.asarray(annots.boxes.to_ltrb().data, dtype=np.float32)
+        np.testing.assert_array_equal(frame.ltrb, expected_ltrb.reshape(-1, 4))
+        conf_mat = frame.confidence_matrix(len(src.labels))
+        assert conf_mat.shape == (len(annots), 5)
+        np.testing.assert_array_equal(conf_mat.max(axis=1), frame.confidences)
+
+
+def test_replay_requires_one_video(tmp_path) -> None:
+    dset = _make_dset(np.random.default_rng(0), n_frames=2)
+    dset.add_video(name="other")
+    path = tmp_path / "dets.json"
+    with open(path, "w") as f:
+        json.dump(dset.dataset, f)
+    with pytest.raises(ValueError):
+        CocoReplaySource(path)
+
+
+def test_sliding_windows() -> None:
+    windows = list(sliding_windows("abcde", 3))
+    assert [item for item, _ in windows] == list("abcde")
+    assert [w for _, w in windows] == [
+        ("a",),
+        ("a", "b"),
+        ("a", "b", "c"),
+        ("b", "c", "d"),
+        ("c", "d", "e"),
+    ]
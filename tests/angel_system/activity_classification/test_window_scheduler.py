@@ -0,0 +1,117 @@
+from typing import List
+
+import pytest
+
+from angel_system.activity_classification.window_scheduler import (
+    ACTION_DROP,
+    ACTION_PROCESS,
+    ACTION_SKIP,
+    POLICY_DEADLINE,
+    POLICY_EVERY_NTH,
+    POLICY_LATEST,
+    WindowMetrics,
+    WindowScheduler,
+)
+
+
+MS = 1_000_000
+
+
+def simulate(
+    sched: WindowScheduler,
+    n_frames: int,
+    frame_period_ns: int,
+    processing_ns: int,
+) -> List[WindowMetrics]:
+    """
+    Simulate a runtime loop that, whenever free, considers the window led by
+    the latest frame received, with frames received at a fixed period and a
+    fixed processing time per window.
+    """
+    for i in range(n_frames):
+        sched.mark_ready(frame_time_ns=i, ready_ns=i * frame_period_ns)
+    metrics = []
+    now = 0
+    last_considered = -1
+    while True:
+        latest = min(now // frame_period_ns, n_frames - 1)
+        if latest == last_considered:
+            if latest == n_frames - 1:
+                return metrics
+            # Idle until the next frame is received.
+            now = (latest + 1) * frame_period_ns
+            continue
+        last_considered = latest
+        decision = sched.decide(latest, latest, now_ns=now)
+        if decision.action == ACTION_PROCESS:
+            now += processing_ns
+            metrics.append(sched.record(decision, processing_ns))
+        elif decision.action == ACTION_DROP:
+            metrics.append(sched.record(decision))
+
+
+def test_latest_accounts_for_coalesced_frames() -> None:
+    # Processing takes 2.5 frame periods, so frames received in the
+    # meantime never lead a window.
+    sched = WindowScheduler(POLICY_LATEST)
+    metrics = simulate(sched, 30, 10 * MS, 25 * MS)
+    assert all(m.action == ACTION_PROCESS for m in metrics)
+    assert sched.total_processed + sched.total_skipped == 30
+    assert metrics[-1].total_skipped == sched.total_skipped > 0
+    assert max(m.queue_delay_ms for m in metrics) <= 10
+
+
+def test_every_nth() -> None:
+    sched = WindowScheduler(POLICY_EVERY_NTH, every_n=3)
+    metrics = simulate(sched, 30, 10 * MS, 1 * MS)
+    assert [m.frame_number for m in metrics] == list(range(0, 30, 3))
+    assert all(m.skipped == 2 for m in metrics[1:])
+    # Skipped windows are not reported individually.
+    assert sched.decide(28, 28).action == ACTION_SKIP
+
+
+def test_deadline_bounds_queue_delay() -> None:
+    """
+    When frames are considered late, e.g. after a stall, windows past the
+    deadline are dropped so only fresh windows are processed.
+    """
+    sched = WindowScheduler(POLICY_DEADLINE, deadline_ns=5 * MS)
+    for i in range(10):
+        sched.mark_ready(i, ready_ns=i * 10 * MS)
+    # Considered 8ms after being ready: past the deadline.
+    drop = sched.decide(3, 3, now_ns=38 * MS)
+    assert drop.action == ACTION_DROP
+    assert sched.record(drop).total_dropped == 1
+    ok = sched.decide(4, 4, now_ns=42 * MS)
+    assert ok.action == ACTION_PROCESS
+    metrics = sched.record(ok, 3 * MS)
+    assert metrics.queue_delay_ms == pytest.approx(2)
+    assert metrics.processing_ms == pytest.approx(3)
+    assert (metrics.total_processed, metrics.total_dropped) == (1, 1)
+    # Windows of unknown ready time are processed.
+    assert sched.decide(100, 100, now_ns=10 ** 12).action == ACTION_PROCESS
+
+
+def test_mark_ready_keeps_latest() -> None:
+    """
+    A frame is ready when the last of its data, e.g. its detections, is
+    received.
+    """
+    sched = WindowScheduler(max_tracked_frames=2)
+    sched.mark_ready(1, ready_ns=10)
+    sched.mark_ready(1, ready_ns=30)
+    sched.mark_ready(1, ready_ns=20)
+    assert sched.decide(0, 1, now_ns=35).queue_delay_ns == 5
+    sched.mark_ready(2, ready_ns=40)
+    sched.mark_ready(3, ready_ns=50)
+    # Frame 1 is no longer tracked.
+    assert sched.decide(0, 1, now_ns=60).queue_delay_ns is None
+
+
+def test_invalid_policy() -> None:
+    with pytest.raises(ValueError):
+        WindowScheduler("oldest")
+    with pytest.raises(ValueError):
+        WindowScheduler(POLICY_EVERY_NTH, every_n=0)
+    with pytest.raises(ValueError):
+        WindowScheduler(POLICY_DEADLINE)
@@ -0,0 +1,89 @@
+import kwcoco
+import numpy as np
+
+from angel_system.data.common.annotation_table import AnnotationTable
+from angel_system.data.common.annotation_table import lookup_array
+from angel_system.data.common.annotation_table import replace_annotations
+
+
+def _make_dset() -> kwcoco.CocoDataset:
+    dset = kwcoco.CocoDataset()
+    cids = [dset.add_category(name=n) for n in ("a", "b", "c")]
+    for i in range(3):
+        gid = dset.add_image(file_name=f"{i}.png")
+        for j in range(3):
+            dset.add_annotation(
+                image_id=gid,
+                category_id=cids[(i + j) % 3],
+                bbox=[i, j, 1, 1],
+                confidence=0.1 + 0.3 * j,
+                keypoints=[float(i), float(j)] * j,
+                extra=f"{i}_{j}",
+            )
+    return dset
+
+
+def test_lookup_array() -> None:
+    np.testing.assert_array_equal(lookup_array({}, [0, 2]), [-1, -1])
+    np.testing.assert_array_equal(lookup_array({5: 0}, [5, 0], missing=-2), [0, -2])
+
+
+def test_from_kwcoco_columns() -> None:
+    dset = _make_dset()
+    table = AnnotationTable.from_kwcoco(dset)
+    assert len(table) == dset.n_annots == 9
+    for i, ann in enumerate(dset.dataset["annotations"]):
+        assert table.aid[i] == ann["id"]
+        assert table.image_id[i] == ann["image_id"]
+        assert table.category_id[i] == ann["category_id"]
+        assert table.confidence[i] == ann["confidence"]
+        np.testing.assert_array_equal(table.bbox[i], ann["bbox"])
+        np.testing.assert_array_equal(table.keypoints_of(i), ann["keypoints"])
+
+
+def test_missing_fields() -> None:
+    table = AnnotationTable.from_annotations(
+        [
+            {"id": 1, "image_id": 1, "category_id": 1, "score": 0.5},
+            {"id": 2, "image_id": 1, "category_id": 1},
+        ]
+    )
+    assert table.confidence[0] == 0.5
+    assert np.isnan(table.confidence[1])
+    assert np.isnan(table.bbox).all()
+    assert len(table.keypoints_of(1)) == 0
+
+
+def test_take_keeps_rows_aligned() -> None:
+    dset = _make_dset()
+    table = AnnotationTable.from_kwcoco(dset)
+    sub = table.take(table.confidence > 0.2).take([3, 0])
+    for i, row in enumerate(sub.row.tolist()):
+        ann = dset.dataset["annotations"][row]
+        assert sub.aid[i] == ann["id"]
+        np.testing.assert_array_equal(sub.keypoints_of(i), ann["keypoints"])
+    assert len(table.take([])) == 0
+
+
+def test_replace_annotations() -> None:
+    dset = _make_dset()
+    table = AnnotationTable.from_kwcoco(dset)
+    keep = table.category_id != dset.index.name_to_cat["b"]["id"]
+    remapped = table.take(keep)
+    remapped = remapped.replace(category_id=np.full(len(remapped), 1))
+    replace_annotations(dset, remapped)
+
+    assert dset.n_annots == 6
+    assert set(dset.index.cid_to_aids[1]) == set(dset.index.anns)
+    # Other fields are carried over.
+    assert {ann["extra"] for ann in dset.dataset["annotations"]} == {
+        "0_0",
+        "0_2",
+        "1_1",
+        "1_2",
+        "2_0",
+        "2_1",
+    }
+
+    replace_annotations(dset, AnnotationTable.from_kwcoco(dset), renumber=True)
+    assert sorted(dset.index.anns) == list(range(1, 7))
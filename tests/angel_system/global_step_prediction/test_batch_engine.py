@@ -0,0 +1,116 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from angel_system.global_step_prediction.global_step_predictor import (
+    GlobalStepPredictor,
+)
+from angel_system.utils.history_buffer import HistoryBuffer
+
+
+REPO_ROOT = Path(__file__).parents[3]
+COOKING_RECIPES = {
+    "coffee": "recipe_coffee.yaml",
+    "tea": "recipe_tea.yaml",
+    "pinwheel": "recipe_pinwheel.yaml",
+    "oatmeal": "recipe_oatmeal.yaml",
+    "dessert_quesadilla": "recipe_dessertquesadilla.yaml",
+}
+
+
+def make_predictor() -> GlobalStepPredictor:
+    gsp = GlobalStepPredictor(
+        recipe_types=list(COOKING_RECIPES),
+        recipe_config_dict={
+            r: (REPO_ROOT / "config/tasks/cooking" / f).as_posix()
+            for r, f in COOKING_RECIPES.items()
+        },
+        activity_config_fpath=(
+            REPO_ROOT / "config/activity_labels/cooking/all_recipe_labels.yaml"
+        ).as_posix(),
+    )
+    n_classes = gsp.activity_conf_history.shape[1]
+    gsp.get_average_TP_activations_from_array(np.full(n_classes, 0.5))
+    return gsp
+
+
+def make_confidences(gsp: GlobalStepPredictor, n_frames: int, seed: int):
+    """
+    Synthetic confidence stream that walks through recipe activities in order
+    with noise, random dwell times and the occasional out-of-order activity.
+    """
+    rng = np.random.default_rng(seed)
+    n_classes = gsp.activity_conf_history.shape[1]
+    order = np.concatenate(
+        [t["granular_step_to_activity_id"] for t in gsp.trackers]
+    ).astype(int)
+    confs = rng.uniform(0, 0.2, size=(n_frames, n_classes))
+    i = 0
+    pos = 0
+    while i < n_frames:
+        dwell = int(rng.integers(1, 30))
+        if rng.uniform() < 0.2:
+            act = int(rng.integers(0, n_classes))
+        else:
+            act = order[pos % len(order)]
+            pos += 1
+        confs[i : i + dwell, act] = rng.uniform(
+            0.3, 1.0, size=len(confs[i : i + dwell])
+        )
+        i += dwell
+    return confs
+
+
+def assert_same_state(a: GlobalStepPredictor, b: GlobalStepPredictor) -> None:
+    np.testing.assert_array_equal(a.activated_activities, b.activated_activities)
+    np.testing.assert_array_equal(
+        a.weak_activated_activities, b.weak_activated_activities
+    )
+    np.testing.assert_array_equal(a.activity_conf_history, b.activity_conf_history)
+    assert a.current_frame == b.current_frame
+    assert a.tracker_resets == b.tracker_resets
+    assert len(a.trackers) == len(b.trackers)
+    for ta, tb in zip(a.trackers, b.trackers):
+        assert ta.keys() == tb.keys()
+        for k in ta:
+            if isinstance(ta[k], HistoryBuffer):
+                # Compared through the "*_history" views.
+                continue
+            if isinstance(ta[k], np.ndarray):
+                np.testing.assert_array_equal(ta[k], tb[k])
+                assert ta[k].dtype == tb[k].dtype
+            else:
+                assert ta[k] == tb[k], k
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_batch_matches_per_frame_single_block(seed: int) -> None:
+    """
+    Processing one long block in batch mode gives identical state to the
+    per-frame loop.
+    """
+    per_frame = make_predictor()
+    batch = make_predictor()
+    confs = make_confidences(per_frame, 3000, seed)
+
+    per_frame.process_new_confidences(confs)
+    batch.process_new_confidences_batch(confs)
+
+    assert any(t["current_granular_step"] > 0 for t in per_frame.trackers)
+    assert_same_state(per_frame, batch)
+
+
+def test_batch_matches_per_frame_chunked() -> None:
+    """
+    State carried over between calls of varying block size stays identical.
+    """
+    per_frame = make_predictor()
+    batch = make_predictor()
+    confs = make_confidences(per_frame, 2000, 3)
+
+    bounds = [0, 1, 2, 50, 51, 400, 1000, 1001, 2000]
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        per_frame.process_new_confidences(confs[start:stop])
+        batch.process_new_confidences_batch(confs[start:stop])
+        assert_same_state(per_frame, batch)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from angel_system.global_step_prediction.bilateral_filter import (
+    StreamingBilateralFilter,
+    bilateral_filter_1d,
+)
+from angel_system.global_step_prediction.global_step_predictor import bilateralFtr1D
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 9, 10, 11, 300])
+@pytest.mark.parametrize("s_spatial,s_intensity", [(5, 1), (2.3, 0.5), (0.4, 1)])
+def test_offline_matches_reference(n: int, s_spatial: float, s_intensity: float):
+    y = 10 * np.random.default_rng(n).uniform(size=n) - 5
+    np.testing.assert_allclose(
+        bilateral_filter_1d(y, s_spatial, s_intensity),
+        bilateralFtr1D(y, s_spatial, s_intensity),
+        rtol=1e-12,
+        atol=1e-12,
+    )
+
+
+def test_offline_multichannel() -> None:
+    y = np.random.default_rng(0).uniform(size=(5000, 4))
+    out = bilateral_filter_1d(y)
+    assert out.shape == y.shape
+    for c in range(y.shape[1]):
+        np.testing.assert_allclose(out[:, c], bilateralFtr1D(y[:, c]), rtol=1e-12)
+
+
+@pytest.mark.parametrize("s_spatial", [5, 1, 0.4])
+def test_streaming_matches_offline(s_spatial: float) -> None:
+    confs = np.random.default_rng(1).uniform(size=(200, 3))
+    f = StreamingBilateralFilter(s_spatial=s_spatial)
+
+    outputs = []
+    for i, conf_vec in enumerate(confs):
+        out = f.push(conf_vec)
+        # Outputs lag the input by a fixed delay.
+        assert len(out) == (1 if i >= f.delay else 0)
+        outputs.append(out)
+    outputs.append(f.flush())
+
+    np.testing.assert_allclose(
+        np.concatenate(outputs), bilateral_filter_1d(confs, s_spatial), rtol=1e-12
+    )
+    # The filter can be reused for a new stream.
+    out = np.concatenate([f.push(v) for v in confs[:50, 0]] + [f.flush()])
+    np.testing.assert_allclose(out, bilateralFtr1D(confs[:50, 0], s_spatial))
@@ -0,0 +1,72 @@
+import csv
+import json
+from pathlib import Path
+
+import numpy as np
+
+from angel_system.global_step_prediction.param_sweep import SharedArray
+from angel_system.global_step_prediction.param_sweep import SweepVideos
+from angel_system.global_step_prediction.param_sweep import evaluate_config
+from angel_system.global_step_prediction.param_sweep import run_sweep
+
+from .test_batch_engine import COOKING_RECIPES
+from .test_batch_engine import REPO_ROOT
+from .test_batch_engine import make_confidences
+from .test_batch_engine import make_predictor
+
+
+def test_shared_array_roundtrip() -> None:
+    arr = np.arange(12.0).reshape(3, 4)
+    shared, shm = SharedArray.create(arr)
+    try:
+        view, view_shm = shared.attach()
+        np.testing.assert_array_equal(view, arr)
+        assert not view.flags.writeable
+        view_shm.close()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_run_sweep_matches_serial(tmp_path: Path) -> None:
+    gsp = make_predictor()
+    base_kwargs = dict(
+        recipe_types=list(COOKING_RECIPES),
+        recipe_config_dict={
+            r: (REPO_ROOT / "config/tasks/cooking" / f).as_posix()
+            for r, f in COOKING_RECIPES.items()
+        },
+        activity_config_fpath=(
+            REPO_ROOT / "config/activity_labels/cooking/all_recipe_labels.yaml"
+        ).as_posix(),
+    )
+    num_steps = max(t.table.total_num_granular_steps for t in gsp.trackers)
+    rng = np.random.default_rng(0)
+    confs = [make_confidences(gsp, n, seed) for seed, n in enumerate([300, 500])]
+    gt_steps = [rng.integers(0, 5, size=len(c)) for c in confs]
+    videos = SweepVideos(
+        video_ids=[1, 2],
+        offsets=np.array([0, 300, 800]),
+        confs=np.concatenate(confs),
+        gt_steps=np.concatenate(gt_steps),
+        tracker_inds=[0, 1],
+    )
+    grid = {"threshold_multiplier": [0.5, 0.8], "threshold_frame_count": [2, 8]}
+
+    out = tmp_path / "sweep.csv"
+    run_sweep(grid, base_kwargs, gsp.avg_probs, videos, num_steps, out, n_workers=2)
+
+    with open(out, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 4
+    for row in rows:
+        params = {k: float(row[k]) for k in grid}
+        params["threshold_frame_count"] = int(params["threshold_frame_count"])
+        expected = sum(
+            evaluate_config(
+                {**base_kwargs, **params}, gsp.avg_probs, c, g, t, num_steps
+            )
+            for c, g, t in zip(confs, gt_steps, videos.tracker_inds)
+        ).reshape(num_steps, num_steps)
+        np.testing.assert_array_equal(json.loads(row["confusion"]), expected)
+        assert float(row["accuracy"]) == np.trace(expected) / expected.sum()
@@ -0,0 +1,154 @@
+import threading
+
+import numpy as np
+import pytest
+
+from angel_system.global_step_prediction.predictor_pool import (
+    GlobalStepPredictorPool,
+)
+
+from .test_batch_engine import COOKING_RECIPES
+from .test_batch_engine import REPO_ROOT
+from .test_batch_engine import assert_same_state
+from .test_batch_engine import make_confidences
+from .test_batch_engine import make_predictor
+
+
+def make_pool(max_sessions: int = 4) -> GlobalStepPredictorPool:
+    reference = make_predictor()
+    return GlobalStepPredictorPool(
+        avg_probs=reference.avg_probs,
+        max_sessions=max_sessions,
+        recipe_types=list(COOKING_RECIPES),
+        recipe_config_dict={
+            r: (REPO_ROOT / "config/tasks/cooking" / f).as_posix()
+            for r, f in COOKING_RECIPES.items()
+        },
+        activity_config_fpath=(
+            REPO_ROOT / "config/activity_labels/cooking/all_recipe_labels.yaml"
+        ).as_posix(),
+    )
+
+
+def test_pool_matches_independent_predictors() -> None:
+    """
+    Sessions advanced together, with blocks of differing sizes, end up in the
+    same state as independently run predictors.
+    """
+    pool = make_pool()
+    session_ids = ["a", "b", "c"]
+    independent = {sid: make_predictor() for sid in session_ids}
+    for sid in session_ids:
+        pool.add_session(sid)
+    confs = {
+        sid: make_confidences(independent[sid], 1500, seed)
+        for seed, sid in enumerate(session_ids)
+    }
+
+    # Session "c" falls out of step with the others half way through.
+    bounds = {
+        "a": [0, 1, 2, 300, 301, 900, 1500],
+        "b": [0, 1, 2, 300, 301, 900, 1500],
+        "c": [0, 1, 2, 300, 700, 701, 1500],
+    }
+    for step in range(6):
+        block = {}
+        for sid in session_ids:
+            start, stop = bounds[sid][step : step + 2]
+            block[sid] = confs[sid][start:stop]
+            independent[sid].process_new_confidences_batch(block[sid])
+        pool.process_new_confidences(block)
+        for sid in session_ids:
+            assert_same_state(independent[sid], pool.get(sid))
+
+    assert any(
+        t.current_granular_step > 0
+        for sid in session_ids
+        for t in pool.get(sid).trackers
+    )
+
+
+def test_pool_session_slots() -> None:
+    pool = make_pool(max_sessions=2)
+    a = pool.add_session("a")
+    pool.add_session("b")
+    with pytest.raises(RuntimeError):
+        pool.add_session("c")
+    with pytest.raises(KeyError):
+        pool.add_session("a")
+
+    n_classes = a.activity_conf_history.shape[1]
+    pool.process_new_confidences({"a": np.ones((20, n_classes))})
+    assert a.activated_activities[:, 0].any()
+
+    # A removed session keeps its state, and its slot is reused fresh.
+    pool.remove_session("a")
+    assert "a" not in pool
+    assert a.activated_activities[:, 0].any()
+    c = pool.add_session("c")
+    assert not c.activated_activities.any()
+    assert len(pool) == 2
+
+
+class GatedLock:
+    """
+    Lock whose first acquisition waits for a gate to open, to pause the
+    thread acquiring it at the point it starts to.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.waiting = threading.Event()
+        self.gate = threading.Event()
+        self._first = True
+
+    def __enter__(self):
+        if self._first:
+            self._first = False
+            self.waiting.set()
+            self.gate.wait()
+        return self._lock.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._lock.__exit__(*exc_info)
+
+
+def test_pool_concurrent_remove_add() -> None:
+    """
+    A session being removed, and its slot reused by a new session, while it
+    is being processed, does not get the new session advanced.
+    """
+    pool = make_pool(max_sessions=1)
+    a = pool.add_session("a")
+    n_classes = a.activity_conf_history.shape[1]
+    initial = a.activated_activities.copy()
+    lock = pool._sessions["a"].lock = GatedLock()
+
+    # Paused as it is about to lock session "a".
+    processor = threading.Thread(
+        target=pool.process_new_confidences,
+        args=({"a": np.ones((20, n_classes))},),
+        daemon=True,
+    )
+    added = {}
+
+    def replace_session():
+        pool.remove_session("a")
+        added["b"] = pool.add_session("b")
+
+    replacer = threading.Thread(target=replace_session, daemon=True)
+    try:
+        processor.start()
+        assert lock.waiting.wait(5)
+        replacer.start()
+        # The replacement must wait for the processing to finish.
+        replacer.join(0.2)
+        assert replacer.is_alive()
+    finally:
+        lock.gate.set()
+        processor.join(5)
+        replacer.join(5)
+    assert not processor.is_alive() and not replacer.is_alive()
+    # The removed session was processed, and the new one is fresh.
+    assert a.activated_activities[:, 0].any()
+    np.testing.assert_array_equal(added["b"].activated_activities, initial)
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from angel_system.global_step_prediction.recipe_tracker import RecipeTracker
+
+from .test_batch_engine import make_predictor
+
+
+def test_granular_to_broad_step_table() -> None:
+    """
+    The compiled granular-to-broad step table matches the search over the
+    last granular step of each broad step.
+    """
+    gsp = make_predictor()
+    for tracker in gsp.trackers:
+        lgspbs = np.array(tracker["last_granular_step_per_broad_step"])
+        for granular_step in range(tracker["total_num_granular_steps"]):
+            expected = len(np.nonzero(lgspbs < granular_step)[0])
+            assert gsp.granular_to_broad_step(tracker, granular_step) == expected
+
+
+def test_trackers_share_compiled_table() -> None:
+    gsp = make_predictor()
+    recipe = gsp.trackers[0].recipe
+    gsp.initialize_new_recipe_tracker(recipe)
+    assert gsp.trackers[-1].table is gsp.trackers[0].table
+    assert gsp.trackers[-1] != gsp.trackers[0]
+
+
+def test_tracker_mapping_view() -> None:
+    gsp = make_predictor()
+    tracker = gsp.trackers[0]
+    assert isinstance(tracker, RecipeTracker)
+    assert list(tracker) == list(RecipeTracker.KEYS)
+    # The history buffers are internal, only their views are keys.
+    assert "broad_step_prediction_buffer" not in tracker
+    assert "broad_step_prediction_history" in tracker
+    assert tracker["recipe"] == tracker.recipe
+    assert tracker["granular_step_to_activity_id"] is (
+        tracker.table.granular_step_to_activity_id
+    )
+
+    tracker["current_granular_step"] = 2
+    assert tracker.current_granular_step == 2
+    with pytest.raises(KeyError):
+        tracker["total_num_granular_steps"] = 3
+    with pytest.raises(KeyError):
+        tracker["not_a_key"]
+
+
+def test_activity_str_lookup() -> None:
+    gsp = make_predictor()
+    for label in gsp.activity_config["labels"]:
+        assert gsp.get_activity_str_from_id(label["id"]) is not None
+    assert gsp.get_activity_str_from_id(-1) is None
+    assert gsp.get_activity_str_from_id(10 ** 6) is None
@@ -0,0 +1,77 @@
+from pathlib import Path
+
+import kwcoco
+import numpy as np
+import pytest
+
+from angel_system.global_step_prediction import tp_activation_cache
+from angel_system.global_step_prediction.tp_activation_cache import (
+    TPActivationCache,
+)
+
+
+def make_datasets(tmp_path: Path, seed: int = 0):
+    """
+    Write a small pair of prediction and truth kwcoco files.
+    """
+    rng = np.random.default_rng(seed)
+    n_classes = 4
+    preds = kwcoco.CocoDataset()
+    truth = kwcoco.CocoDataset()
+    for dset in (preds, truth):
+        for cid in range(n_classes):
+            dset.add_category(name=f"c{cid}", id=cid)
+        dset.add_video(name="vid", id=1)
+    expected = [[] for _ in range(n_classes)]
+    for gid in range(1, 41):
+        for dset in (preds, truth):
+            dset.add_image(file_name=f"{gid}.png", id=gid, video_id=1, frame_index=gid)
+        gt = int(rng.integers(0, n_classes))
+        prob = rng.uniform(size=n_classes)
+        preds.add_annotation(
+            image_id=gid, category_id=int(prob.argmax()), prob=list(prob)
+        )
+        truth.add_annotation(image_id=gid, category_id=gt)
+        expected[gt].append(prob[gt])
+    preds.fpath = (tmp_path / "preds.json").as_posix()
+    truth.fpath = (tmp_path / "truth.json").as_posix()
+    preds.dump(preds.fpath)
+    truth.dump(truth.fpath)
+    act_config = tmp_path / "activities.yaml"
+    act_config.write_text("labels: []\n")
+    return preds, truth, act_config, np.array([np.mean(e) for e in expected])
+
+
+def test_cache_miss_then_hit(tmp_path: Path, monkeypatch) -> None:
+    preds, truth, act_config, expected = make_datasets(tmp_path)
+    cache = TPActivationCache(tmp_path / "cache")
+
+    avg_probs = cache.get_or_compute(preds.fpath, truth.fpath, act_config)
+    np.testing.assert_allclose(avg_probs, expected)
+    assert isinstance(avg_probs, np.memmap)
+
+    # A hit, from a fresh cache object, does not recompute.
+    def fail(*_):
+        raise AssertionError("recomputed on a cache hit")
+
+    monkeypatch.setattr(tp_activation_cache, "compute_average_TP_activations", fail)
+    cache = TPActivationCache(tmp_path / "cache")
+    np.testing.assert_array_equal(
+        cache.get_or_compute(preds.fpath, truth.fpath, act_config), avg_probs
+    )
+
+    # Changing any input's content is a miss.
+    act_config.write_text("labels: [] # changed\n")
+    with pytest.raises(AssertionError):
+        cache.get_or_compute(preds.fpath, truth.fpath, act_config)
+
+
+def test_key_is_content_addressed(tmp_path: Path) -> None:
+    preds, truth, act_config, _ = make_datasets(tmp_path)
+    cache = TPActivationCache(tmp_path / "cache")
+    key = cache.key(preds.fpath, truth.fpath, act_config)
+
+    moved = tmp_path / "moved_preds.json"
+    moved.write_bytes(Path(preds.fpath).read_bytes())
+    assert cache.key(moved, truth.fpath, act_config) == key
+    assert cache.key(truth.fpath, preds.fpath, act_config) != key
@@ -0,0 +1,52 @@
+import numpy as np
+
+from angel_system.object_detection.detection_cache import CachedDetections
+from angel_system.object_detection.detection_cache import DetectionCache
+from angel_system.object_detection.detection_cache import hash_bytes
+from angel_system.object_detection.detection_cache import hash_file
+
+
+def test_model_key(tmp_path) -> None:
+    ckpt = tmp_path / "model.pt"
+    ckpt.write_bytes(b"weights")
+    assert hash_file(ckpt) == hash_bytes(b"weights")
+    key = DetectionCache.make_model_key(ckpt, imgsz=640, conf=0.01)
+    # Stable, and independent of settings order.
+    assert key == DetectionCache.make_model_key(ckpt, conf=0.01, imgsz=640)
+    assert key != DetectionCache.make_model_key(ckpt, imgsz=768, conf=0.01)
+    ckpt.write_bytes(b"other weights")
+    assert key != DetectionCache.make_model_key(ckpt, imgsz=640, conf=0.01)
+
+
+def test_cache_round_trip(tmp_path) -> None:
+    cache = DetectionCache(tmp_path, "model")
+    image_hash = hash_bytes(b"image")
+    assert cache.get(image_hash) is None
+    assert image_hash not in cache
+
+    dets = CachedDetections.from_arrays(
+        [[0, 0, 10, 10], [5, 5, 20, 30], [1, 2, 3, 4]], [0.9, 0.05, 0.3], [2, 0, 2]
+    )
+    cache.put(image_hash, dets)
+    assert image_hash in cache
+    # Nothing else left in the cache directory.
+    assert [p.name for p in tmp_path.rglob("*") if p.is_file()] == [f"{image_hash}.npz"]
+
+    got = DetectionCache(tmp_path, "model").get(image_hash)
+    for a, b in zip(got, dets):
+        np.testing.assert_array_equal(a, b)
+        assert a.dtype == b.dtype
+    assert cache.stats() == {"hits": 0, "misses": 1}
+
+    sel = got.select(0.3)
+    np.testing.assert_array_equal(sel.classes, [2, 2])
+    np.testing.assert_array_equal(sel.xyxy, [[0, 0, 10, 10], [1, 2, 3, 4]])
+
+
+def test_cache_empty_detections(tmp_path) -> None:
+    cache = DetectionCache(tmp_path, "model")
+    cache.put("ab", CachedDetections.from_arrays([], [], []))
+    got = cache.get("ab")
+    assert len(got) == 0
+    assert got.xyxy.shape == (0, 4)
+    assert cache.stats() == {"hits": 1, "misses": 0}
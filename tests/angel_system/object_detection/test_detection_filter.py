@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from angel_system.object_detection.detection_filter import class_mask
+from angel_system.object_detection.detection_filter import select_detections
+
+
+def _brute_force_select(class_idxs, confs, classes, conf_threshold, max_per_class):
+    """
+    Reference per-detection selection.
+    """
+    keep = [
+        bool(classes[c]) and conf >= conf_threshold
+        for c, conf in zip(class_idxs, confs)
+    ]
+    if max_per_class > 0:
+        for c in set(class_idxs):
+            idxs = [i for i in range(len(keep)) if keep[i] and class_idxs[i] == c]
+            # Stable, so earlier detections win ties.
+            idxs.sort(key=lambda i: -confs[i])
+            for i in idxs[max_per_class:]:
+                keep[i] = False
+    return keep
+
+
+def test_class_mask() -> None:
+    np.testing.assert_array_equal(
+        class_mask(["a", "b", "c", "a"], ["a", "d"]), [True, False, False, True]
+    )
+    assert class_mask([], {"a"}).shape == (0,)
+
+
+@pytest.mark.parametrize("conf_threshold", [0.0, 0.5])
+@pytest.mark.parametrize("max_per_class", [0, 1, 3])
+def test_select_detections_brute_force(conf_threshold, max_per_class) -> None:
+    rng = np.random.default_rng(max_per_class)
+    n_classes = 7
+    classes = rng.random(n_classes) < 0.7
+    class_idxs = rng.integers(0, n_classes, 300)
+    # Coarse confidences, so there are ties.
+    confs = rng.integers(0, 10, 300) / 10
+
+    np.testing.assert_array_equal(
+        select_detections(class_idxs, confs, classes, conf_threshold, max_per_class),
+        _brute_force_select(
+            class_idxs.tolist(), confs.tolist(), classes, conf_threshold, max_per_class
+        ),
+    )
+
+
+def test_select_detections_defaults() -> None:
+    assert select_detections([2, 0, 1], [0.1, 0.2, 0.3]).all()
+    assert select_detections([], [], np.ones(3, dtype=bool), 0.5, 1).shape == (0,)
+    np.testing.assert_array_equal(
+        select_detections([0, 0, 1], [0.2, 0.9, 0.1], max_per_class=1),
+        [False, True, True],
+    )
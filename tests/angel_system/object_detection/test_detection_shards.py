@@ -0,0 +1,76 @@
+import kwcoco
+import pytest
+
+from angel_system.object_detection.detection_shards import merge_parts
+from angel_system.object_detection.detection_shards import missing_parts
+from angel_system.object_detection.detection_shards import part_path
+from angel_system.object_detection.detection_shards import shard_video_ids
+from angel_system.object_detection.detection_shards import write_merged
+from angel_system.object_detection.detection_shards import write_part
+
+
+def test_shard_video_ids_partition() -> None:
+    sizes = {vid: (vid * 37) % 101 for vid in range(50)}
+    shards = [shard_video_ids(sizes, 4, i) for i in range(4)]
+    assert sorted(v for s in shards for v in s) == list(range(50))
+    loads = [sum(sizes[v] for v in s) for s in shards]
+    assert max(loads) - min(loads) <= max(sizes.values())
+    with pytest.raises(ValueError):
+        shard_video_ids(sizes, 4, 4)
+
+
+def test_parts_resume_and_merge(tmp_path) -> None:
+    guiding = kwcoco.CocoDataset()
+    for vid in (1, 2):
+        guiding.add_video(name=f"video_{vid}", id=vid)
+        for i in range(3):
+            guiding.add_image(file_name=f"{vid}_{i}.png", video_id=vid, frame_index=i)
+    vid_gids = {vid: list(guiding.index.vidid_to_gids[vid]) for vid in (1, 2)}
+    categories = [{"id": 0, "name": "cup"}, {"id": 3, "name": "hand (left)"}]
+
+    assert missing_parts(tmp_path, [1, 2]) == [1, 2]
+    write_part(
+        part_path(tmp_path, 2),
+        categories,
+        [
+            dict(image_id=gid, category_id=0, bbox=[0, 0, 1, 1], score=0.5, area=1)
+            for gid in vid_gids[2]
+        ],
+    )
+    assert missing_parts(tmp_path, [1, 2]) == [1]
+    write_part(
+        part_path(tmp_path, 1),
+        categories,
+        [
+            dict(
+                image_id=vid_gids[1][0],
+                category_id=3,
+                bbox=[0, 0, 2, 2],
+                score=1,
+                area=4,
+            )
+        ],
+    )
+    assert missing_parts(tmp_path, [1, 2]) == []
+    # No temporary files remain.
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "video_1.json",
+        "video_2.json",
+    ]
+
+    dset = merge_parts(guiding, tmp_path, [1, 2])
+    assert dset.index.videos == guiding.index.videos
+    assert dset.index.imgs == guiding.index.imgs
+    assert sorted(dset.index.cats) == [0, 3]
+    assert dset.n_annots == 4
+    assert sorted(dset.index.anns) == [1, 2, 3, 4]
+    assert len(dset.index.gid_to_aids[vid_gids[1][0]]) == 1
+
+    out_path = tmp_path / "out.mscoco.json"
+    dset.fpath = out_path.as_posix()
+    write_merged(dset, out_path)
+    # Merging again, as a shard finishing at the same time would, replaces
+    # the output with the same results.
+    write_merged(merge_parts(guiding, tmp_path, [1, 2]), out_path)
+    assert not list(tmp_path.glob(".*.tmp"))
+    assert kwcoco.CocoDataset(out_path).n_annots == 4
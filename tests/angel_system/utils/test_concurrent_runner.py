@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from angel_system.utils.concurrent_runner import ConcurrentRunner, partition_threads
+
+
+def test_partition_threads() -> None:
+    assert partition_threads(7, 3) == [3, 2, 2]
+    assert sum(partition_threads(16, 2)) == 16
+    assert partition_threads(0, 2) == [1, 1]
+
+
+def test_concurrent_runner_runs_concurrently() -> None:
+    """
+    Functions run side by side, taking about as long as the slowest.
+    """
+    with ConcurrentRunner(2) as runner:
+        s = time.monotonic()
+        assert runner.run(lambda: time.sleep(0.2) or "a", lambda: time.sleep(0.2)) == [
+            "a",
+            None,
+        ]
+        assert time.monotonic() - s < 0.35
+
+
+def test_concurrent_runner_lane_state_persists() -> None:
+    """
+    Each lane keeps running on the thread its initializer ran on.
+    """
+    local = threading.local()
+
+    def make_init(v):
+        def init():
+            local.value = v
+
+        return init
+
+    with ConcurrentRunner(2, [make_init("x"), make_init("y")]) as runner:
+        for _ in range(3):
+            assert runner.run(lambda: local.value, lambda: local.value) == ["x", "y"]
+
+
+def test_concurrent_runner_raises_after_all_finish() -> None:
+    done = threading.Event()
+
+    def slow():
+        time.sleep(0.1)
+        done.set()
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with ConcurrentRunner(2) as runner:
+        with pytest.raises(RuntimeError, match="boom"):
+            runner.run(fail, slow)
+        assert done.is_set()
+        with pytest.raises(ValueError):
+            runner.run(slow)
+    with pytest.raises(ValueError):
+        ConcurrentRunner(2, [None])
@@ -0,0 +1,65 @@
+from threading import Thread
+import time
+
+import pytest
+
+from angel_system.utils.frame_batcher import FrameBatcher
+
+
+def test_frame_batcher_full_batch_returns_immediately() -> None:
+    b = FrameBatcher(max_batch_size=3, deadline=10.0)
+    for i in range(3):
+        b.put("a", i)
+    s = time.monotonic()
+    batch = b.get_batch()
+    assert time.monotonic() - s < 1.0
+    assert [f.item for f in batch] == [0, 1, 2]
+    assert len(b) == 0
+
+
+def test_frame_batcher_deadline() -> None:
+    """
+    A partial batch is returned once its oldest frame has waited for the
+    deadline.
+    """
+    b = FrameBatcher(max_batch_size=8, deadline=0.05)
+    b.put("a", 0)
+    b.put("b", 1)
+    s = time.monotonic()
+    batch = b.get_batch()
+    assert time.monotonic() - s >= 0.04
+    assert [(f.source, f.item) for f in batch] == [("a", 0), ("b", 1)]
+
+
+def test_frame_batcher_timeout_and_close() -> None:
+    b = FrameBatcher(max_batch_size=2, deadline=0.01)
+    assert b.get_batch(timeout=0.01) == []
+
+    t = Thread(target=lambda: (time.sleep(0.05), b.close()))
+    t.start()
+    assert b.get_batch() == []
+    t.join()
+
+
+def test_frame_batcher_wakes_on_put() -> None:
+    b = FrameBatcher(max_batch_size=2, deadline=10.0)
+    t = Thread(target=lambda: [b.put("a", i) for i in range(2)])
+    t.start()
+    assert [f.item for f in b.get_batch(timeout=10.0)] == [0, 1]
+    t.join()
+
+
+def test_frame_batcher_drops_oldest() -> None:
+    b = FrameBatcher()
+    for i in range(5):
+        b.put("a" if i % 2 else "b", i)
+    assert [f.item for f in b.get_batch()] == [4]
+    assert b.num_received == {"a": 2, "b": 3}
+    assert b.num_dropped == {"a": 2, "b": 2}
+
+
+def test_frame_batcher_invalid() -> None:
+    with pytest.raises(ValueError):
+        FrameBatcher(max_batch_size=0)
+    with pytest.raises(ValueError):
+        FrameBatcher(max_batch_size=4, max_pending=2)
@@ -0,0 +1,57 @@
+import socket
+import threading
+
+import pytest
+
+from angel_system.utils.framed_socket import encode_frame
+from angel_system.utils.framed_socket import FrameReceiver
+
+
+def _send_in_pieces(conn: socket.socket, data: bytes, piece_size: int) -> None:
+    def send():
+        with conn:
+            for i in range(0, len(data), piece_size):
+                conn.sendall(data[i : i + piece_size])
+
+    threading.Thread(target=send, daemon=True).start()
+
+
+def test_recv_frames_of_varying_size() -> None:
+    payloads = [bytes([i]) * n for i, n in enumerate((1000, 50_000, 10, 0, 50_000))]
+    a, b = socket.socketpair()
+    # Frames split across sends, with headers split too.
+    _send_in_pieces(a, b"".join(map(encode_frame, payloads)), 777)
+    with b:
+        receiver = FrameReceiver(b)
+        for payload in payloads:
+            frame = receiver.recv_frame()
+            assert frame is not None
+            assert frame.typecode == "B"
+            assert frame.tobytes() == payload
+        assert receiver.recv_frame() is None
+
+
+def test_recv_frame_reuses_buffer() -> None:
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(encode_frame(b"abcd") + encode_frame(b"efgh"))
+        receiver = FrameReceiver(b)
+        first = receiver.recv_frame()
+        assert receiver.recv_frame() is first
+        assert first.tobytes() == b"efgh"
+
+
+def test_recv_frame_closed_mid_frame() -> None:
+    a, b = socket.socketpair()
+    with b:
+        with a:
+            a.sendall(encode_frame(b"abcdef")[:-2])
+        assert FrameReceiver(b).recv_frame() is None
+
+
+def test_recv_frame_bad_sync() -> None:
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(b"\x00" * 8)
+        with pytest.raises(ValueError):
+            FrameReceiver(b).recv_frame()
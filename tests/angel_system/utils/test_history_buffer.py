@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from angel_system.utils.history_buffer import HistoryBuffer
+
+
+def test_history_buffer_matches_np_append() -> None:
+    """
+    Appending single rows and blocks gives the same contents as repeatedly
+    calling ``np.append``.
+    """
+    rng = np.random.default_rng(0)
+    b = HistoryBuffer(row_shape=(3,), initial_capacity=1)
+    expected = np.empty((0, 3))
+    for _ in range(200):
+        rows = rng.uniform(size=(int(rng.integers(0, 5)), 3))
+        b.append(rows)
+        expected = np.append(expected, rows, axis=0)
+        np.testing.assert_array_equal(b.view(), expected)
+    assert b.num_dropped == 0
+    assert b.shape == expected.shape
+
+
+def test_history_buffer_max_len() -> None:
+    """
+    Only the most recent `max_len` rows are retained and storage stays
+    bounded.
+    """
+    b = HistoryBuffer(max_len=10, initial_capacity=1)
+    all_values = []
+    for i in range(100):
+        block = list(range(i * 3, i * 3 + (i % 4)))
+        b.append(block)
+        all_values.extend(block)
+        np.testing.assert_array_equal(b.view(), all_values[-10:])
+        assert len(b._data) <= 20
+    assert b.num_dropped == len(all_values) - 10
+    # A block larger than the window keeps only its tail.
+    b.append(np.arange(25))
+    np.testing.assert_array_equal(b.view(), np.arange(15, 25))
+
+
+def test_history_buffer_views_keep_values() -> None:
+    """
+    Views taken before appends that compact the storage, or before a clear,
+    keep the values they were taken with.
+    """
+    b = HistoryBuffer(max_len=4, initial_capacity=1)
+    views = []
+    for i in range(30):
+        b.append([i, i + 100][: 1 + i % 2])
+        views.append((b.view(), b.view().copy()))
+    b.append(np.arange(10))
+    b.clear()
+    b.append([-1, -1, -1])
+    for v, expected in views:
+        np.testing.assert_array_equal(v, expected)
+
+
+def test_history_buffer_view_read_only() -> None:
+    b = HistoryBuffer()
+    b.append([1, 2])
+    with pytest.raises(ValueError):
+        b.view()[0] = 5
+    assert np.asarray(b).tolist() == [1.0, 2.0]
+
+
+def test_history_buffer_invalid_max_len() -> None:
+    with pytest.raises(ValueError):
+        HistoryBuffer(max_len=0)
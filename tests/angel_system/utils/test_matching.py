@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from angel_system.utils.matching import descending_match_with_tolerance
+from angel_system.utils.matching import match_exact
+from angel_system.utils.matching import match_nearest_with_tolerance
+from angel_system.utils.matching import select_matches
+
+
+def _brute_force_nearest(key_times, value_times, tol):
+    """
+    Reference O(N*M) nearest matching, preferring the later value on ties.
+    """
+    ret = []
+    for kt in key_times:
+        best = -1
+        for i, vt in enumerate(value_times):
+            d = abs(kt - vt)
+            if d <= tol and (best < 0 or d <= abs(kt - value_times[best])):
+                best = i
+        ret.append(best)
+    return ret
+
+
+@pytest.mark.parametrize("tol", [0, 3, 10, 1000])
+def test_match_nearest_with_tolerance_brute_force(tol) -> None:
+    rng = np.random.default_rng(tol)
+    key_times = rng.integers(0, 500, size=200)
+    value_times = np.unique(rng.integers(0, 500, size=60))
+    np.testing.assert_array_equal(
+        match_nearest_with_tolerance(key_times, value_times, tol),
+        _brute_force_nearest(key_times, value_times, tol),
+    )
+
+
+def test_match_nearest_with_tolerance_descending_match() -> None:
+    """
+    With a tolerance less than half the key spacing, matching agrees with
+    ``descending_match_with_tolerance``.
+    """
+    rng = np.random.default_rng(0)
+    key_times = np.arange(0, 100_000, 100)
+    value_times = np.sort(
+        rng.choice(np.arange(-1000, 101_000), size=3000, replace=False)
+    )
+    tol = 20
+    expected = descending_match_with_tolerance(
+        key_times.tolist(), value_times.tolist(), tol
+    )
+    match_idx = match_nearest_with_tolerance(key_times, value_times, tol)
+    assert select_matches(value_times.tolist(), match_idx) == expected
+
+
+def test_match_exact() -> None:
+    value_times = np.array([10, 20, 30])
+    np.testing.assert_array_equal(
+        match_exact([5, 10, 25, 30, 35], value_times), [-1, 0, -1, 2, -1]
+    )
+    np.testing.assert_array_equal(match_exact([1, 2], []), [-1, -1])
+
+
+def test_match_empty() -> None:
+    np.testing.assert_array_equal(match_nearest_with_tolerance([1, 2], [], 5), [-1, -1])
+    assert match_nearest_with_tolerance([], [1, 2], 5).shape == (0,)
+    assert select_matches(["a"], np.array([0, -1])) == ["a", None]
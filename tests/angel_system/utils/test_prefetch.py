@@ -0,0 +1,59 @@
+import threading
+import time
+
+import pytest
+
+from angel_system.utils.prefetch import batched
+from angel_system.utils.prefetch import prefetch_map
+
+
+@pytest.mark.parametrize("n_workers", [0, 1, 4])
+def test_prefetch_map_order(n_workers) -> None:
+    def slow_square(x):
+        # Later items finish first.
+        time.sleep(0.001 * (20 - x))
+        return x * x
+
+    assert list(prefetch_map(slow_square, range(20), n_workers, 8)) == [
+        x * x for x in range(20)
+    ]
+
+
+def test_prefetch_map_bounded() -> None:
+    """
+    Items are consumed no further than the prefetch limit ahead of results.
+    """
+    consumed = []
+    lock = threading.Lock()
+
+    def items():
+        for i in range(100):
+            with lock:
+                consumed.append(i)
+            yield i
+
+    it = prefetch_map(lambda x: x, items(), n_workers=2, max_prefetch=3)
+    assert next(it) == 0
+    assert next(it) == 1
+    # The first result, the second and three ahead of it.
+    assert len(consumed) == 5
+    it.close()
+
+
+def test_prefetch_map_raises() -> None:
+    def fail_on_3(x):
+        if x == 3:
+            raise RuntimeError("boom")
+        return x
+
+    it = prefetch_map(fail_on_3, range(10), n_workers=2, max_prefetch=4)
+    assert [next(it) for _ in range(3)] == [0, 1, 2]
+    with pytest.raises(RuntimeError, match="boom"):
+        next(it)
+
+
+def test_batched() -> None:
+    assert list(batched([], 3)) == []
+    assert list(batched(range(6), 3)) == [[0, 1, 2], [3, 4, 5]]
+    with pytest.raises(ValueError):
+        list(batched(range(3), 0))
@@ -0,0 +1,112 @@
+import numpy as np
+
+from angel_system.utils.ray_casting import camera_rays
+from angel_system.utils.ray_casting import closest_hits
+from angel_system.utils.ray_casting import pixels_to_world_points
+
+
+IMAGE_WIDTH = 1280
+IMAGE_HEIGHT = 720
+FOCAL_LENGTH_X = 1.6304
+FOCAL_LENGTH_Y = 2.5084
+
+
+def _pose():
+    rng = np.random.default_rng(0)
+    # Rotation about a random axis, then translation.
+    axis = rng.normal(size=3)
+    axis /= np.linalg.norm(axis)
+    k = np.array(
+        [[0, -axis[2], axis[1]], [axis[2], 0, -axis[0]], [-axis[1], axis[0], 0]]
+    )
+    world = np.eye(4)
+    world[:3, :3] = np.eye(3) + np.sin(0.7) * k + (1 - np.cos(0.7)) * k @ k
+    world[:3, 3] = [0.5, 1.6, -2.0]
+    projection = np.eye(4)
+    projection[0, 2] = 0.01
+    projection[1, 2] = -0.02
+    projection[2, 2] = -1.004
+    return world, projection
+
+
+def _world_point_one_by_one(world, projection, p):
+    """
+    World point through a pixel as computed one pixel at a time by the
+    spatial mapper node.
+    """
+    half_width = IMAGE_WIDTH / 2.0
+    half_height = IMAGE_HEIGHT / 2.0
+    x = (p[0] - half_width) / half_width
+    y = (p[1] - half_height) / half_height * -1.0
+    norm_factor = projection[2][2]
+    center_x = projection[0][2] / norm_factor
+    center_y = projection[1][2] / norm_factor
+    dir_ray = np.array(
+        [
+            (x - center_x) / FOCAL_LENGTH_X,
+            (y - center_y) / FOCAL_LENGTH_Y,
+            -1.0 / norm_factor,
+        ]
+    )
+    return np.matmul(world, np.append(dir_ray, 1.0).reshape(4, 1))[:3, 0]
+
+
+def test_pixels_to_world_points_matches_one_by_one() -> None:
+    world, projection = _pose()
+    pixels = [[0, 0], [0, IMAGE_HEIGHT], [640, 360], [1000.5, 20.25]]
+    points = pixels_to_world_points(
+        pixels,
+        IMAGE_WIDTH,
+        IMAGE_HEIGHT,
+        world,
+        projection,
+        FOCAL_LENGTH_X,
+        FOCAL_LENGTH_Y,
+    )
+    expected = [_world_point_one_by_one(world, projection, p) for p in pixels]
+    np.testing.assert_allclose(points, expected)
+
+
+def test_camera_rays() -> None:
+    world, projection = _pose()
+    pixels = np.array([[10, 20], [300, 400], [1200, 700]])
+    origins, directions = camera_rays(
+        pixels,
+        IMAGE_WIDTH,
+        IMAGE_HEIGHT,
+        world,
+        projection,
+        FOCAL_LENGTH_X,
+        FOCAL_LENGTH_Y,
+    )
+    assert origins.shape == directions.shape == (3, 3)
+    np.testing.assert_allclose(origins, np.tile(world[:3, 3], (3, 1)))
+    np.testing.assert_allclose(
+        origins + directions,
+        [_world_point_one_by_one(world, projection, p) for p in pixels],
+    )
+
+
+def test_closest_hits() -> None:
+    origins = np.array([[0.0, 0, 0], [0, 0, 1], [5, 5, 5], [0, 0, 0]])
+    # Hits out of order, with several per ray.
+    index_ray = [1, 0, 3, 1, 0, 1]
+    locations = [
+        [0, 0, 4],
+        [0, 0, 3],
+        [0, 2, 0],
+        [0, 0, 2],
+        [0, 0, -1],
+        [0, 0, 3],
+    ]
+    hits = closest_hits(origins, locations, index_ray)
+    np.testing.assert_array_equal(hits[0], [0, 0, -1])
+    np.testing.assert_array_equal(hits[1], [0, 0, 2])
+    assert np.isnan(hits[2]).all()
+    np.testing.assert_array_equal(hits[3], [0, 2, 0])
+
+
+def test_closest_hits_none() -> None:
+    hits = closest_hits(np.zeros((2, 3)), np.empty((0, 3)), [])
+    assert hits.shape == (2, 3)
+    assert np.isnan(hits).all()
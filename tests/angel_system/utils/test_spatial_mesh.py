@@ -0,0 +1,91 @@
+import array
+from types import SimpleNamespace
+
+import numpy as np
+
+from angel_system.utils.spatial_mesh import flatten_mesh
+from angel_system.utils.spatial_mesh import mesh_fingerprint
+from angel_system.utils.spatial_mesh import surface_id_and_update_time
+from angel_system.utils.spatial_mesh import SurfaceVersions
+from angel_system.utils.spatial_mesh import unflatten_mesh
+
+
+def _mesh(seed: int = 0):
+    rng = np.random.default_rng(seed)
+    # Homogeneous vertex positions, as HL2SS gives them.
+    vertices = np.concatenate(
+        [rng.random((20, 3), dtype=np.float32), np.ones((20, 1), np.float32)],
+        axis=1,
+    )
+    triangles = rng.integers(0, 20, (30, 3)).astype(np.uint32)
+    return vertices, triangles
+
+
+def test_flatten_round_trip() -> None:
+    vertices, triangles = _mesh()
+    vertex_buffer, index_buffer = flatten_mesh(vertices, triangles)
+    assert vertex_buffer.dtype == np.float32 and vertex_buffer.shape == (60,)
+    assert index_buffer.dtype == np.uint32 and index_buffer.shape == (90,)
+
+    # As set into, and read back from, message array fields.
+    out_vertices, out_triangles = unflatten_mesh(
+        array.array("f", vertex_buffer.tobytes()),
+        array.array("I", index_buffer.tobytes()),
+    )
+    np.testing.assert_array_equal(out_vertices, vertices[:, :3])
+    np.testing.assert_array_equal(out_triangles, triangles)
+
+
+def test_unflatten_empty() -> None:
+    vertices, triangles = unflatten_mesh(array.array("f"), array.array("I"))
+    assert vertices.shape == (0, 3)
+    assert triangles.shape == (0, 3)
+
+
+def test_fingerprint() -> None:
+    buffers = flatten_mesh(*_mesh())
+    assert mesh_fingerprint(*buffers) == mesh_fingerprint(*flatten_mesh(*_mesh()))
+    assert mesh_fingerprint(*buffers) != mesh_fingerprint(*flatten_mesh(*_mesh(1)))
+    # Same vertices, one triangle flipped.
+    vertex_buffer, index_buffer = buffers
+    flipped = index_buffer.copy()
+    flipped[:2] = flipped[1::-1]
+    assert mesh_fingerprint(vertex_buffer, flipped) != mesh_fingerprint(*buffers)
+
+
+def test_surface_id_and_update_time() -> None:
+    guid = bytes(range(16))
+    assert surface_id_and_update_time(guid) == (guid, None)
+    info = SimpleNamespace(id=guid, update_time=1234)
+    assert surface_id_and_update_time(info) == (guid, 1234)
+
+
+def test_surface_versions() -> None:
+    sent = SurfaceVersions()
+    assert b"a" not in sent
+    assert sent.changed(b"a", 1)
+    sent.update(b"a", 1)
+    sent.update(b"b", b"digest")
+    assert len(sent) == 2 and b"a" in sent
+    assert not sent.changed(b"a", 1)
+    assert not sent.changed(b"b", b"digest")
+    assert sent.changed(b"a", 2)
+    sent.update(b"a", 2)
+    assert not sent.changed(b"a", 2)
+
+
+def test_surface_versions_discard() -> None:
+    sent = SurfaceVersions()
+    for surface_id in (b"a", b"b", b"c"):
+        sent.update(surface_id, 1)
+    assert sent.discard(b"b")
+    assert not sent.discard(b"b")
+    assert b"b" not in sent
+    # A discarded surface is new again.
+    assert sent.changed(b"b", 1)
+
+    assert sent.discard_missing([b"c", b"d"]) == [b"a"]
+    assert len(sent) == 1 and b"c" in sent
+    assert sent.discard_missing(iter([b"c"])) == []
+    assert sent.discard_missing([]) == [b"c"]
+    assert len(sent) == 0
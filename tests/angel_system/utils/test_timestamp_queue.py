@@ -0,0 +1,176 @@
+import numpy as np
+import pytest
+
+from angel_system.utils.matching import descending_match_with_tolerance
+from angel_system.utils.timestamp_queue import TimestampHistory
+from angel_system.utils.timestamp_queue import TimestampQueue
+
+
+def test_timestamp_queue_append_drop_matches_list() -> None:
+    """
+    Interleaved appends and drops keep the same contents as a plain list,
+    across compactions and growth of the storage.
+    """
+    rng = np.random.default_rng(0)
+    q = TimestampQueue(initial_capacity=1)
+    expected = []
+    t = 0
+    for _ in range(500):
+        for _ in range(int(rng.integers(0, 4))):
+            t += int(rng.integers(1, 10))
+            q.append(t, f"item{t}")
+            expected.append(t)
+        if rng.uniform() < 0.3:
+            cut = t - int(rng.integers(0, 30))
+            n_drop = q.drop_before(cut)
+            assert n_drop == sum(e < cut for e in expected)
+            expected = [e for e in expected if e >= cut]
+        assert len(q) == len(expected)
+        np.testing.assert_array_equal(q.times, expected)
+        assert q.items() == [f"item{e}" for e in expected]
+    # Storage stays proportional to what is live.
+    assert len(q._times) <= 4 * max(len(q), 1) + 64
+
+
+def test_timestamp_queue_rejects_out_of_order() -> None:
+    q = TimestampQueue()
+    q.append(10, "a")
+    with pytest.raises(ValueError):
+        q.append(10, "b")
+    with pytest.raises(ValueError):
+        q.append(5, "b")
+    assert q.items() == ["a"]
+    assert q.last_time() == 10
+
+
+def test_timestamp_queue_indexing() -> None:
+    q = TimestampQueue()
+    with pytest.raises(IndexError):
+        q.last_time()
+    for t in range(5):
+        q.append(t, t)
+    q.drop_before(2)
+    assert q[0] == 2
+    assert q[-1] == 4
+    assert q.items(1, 2) == [3]
+    with pytest.raises(IndexError):
+        q[3]
+    assert q.index_of(3) == 1
+    assert q.index_of(1) is None
+    assert not q.times.flags.writeable
+    q.clear()
+    assert len(q) == 0
+    assert q.items() == []
+
+
+def test_timestamp_queue_match_is_descending_match() -> None:
+    """
+    Exact matching gives the same association as
+    ``descending_match_with_tolerance`` with zero tolerance.
+    """
+    rng = np.random.default_rng(1)
+    frame_times = np.cumsum(rng.integers(1, 5, size=100))
+    det_times = np.sort(rng.choice(frame_times, size=40, replace=False))
+    det_times = np.union1d(det_times, frame_times[-1] + np.arange(1, 4))
+    q = TimestampQueue()
+    for t in det_times:
+        q.append(int(t), int(t))
+
+    expected = descending_match_with_tolerance(
+        frame_times.tolist(), det_times.tolist(), 0
+    )
+    assert q.match(frame_times) == expected
+
+
+def test_timestamp_queue_index_nearest() -> None:
+    q = TimestampQueue()
+    assert q.index_nearest(10, tol=100) is None
+    for t in (10, 20, 40):
+        q.append(t, t)
+    assert q.index_nearest(10, tol=0) == 0
+    assert q.index_nearest(14, tol=5) == 0
+    # Equally near, so the later one.
+    assert q.index_nearest(30, tol=10) == 2
+    assert q.index_nearest(30, tol=9) is None
+    assert q.index_nearest(0, tol=10) == 0
+    assert q.index_nearest(100, tol=60) == 2
+    q.drop_before(15)
+    assert q.index_nearest(10, tol=10) == 0
+
+
+def test_timestamp_history_matches_linear_scan() -> None:
+    """
+    Lookups find the same items as scanning everything ever added for the
+    nearest within the horizon, while only keeping what is within it.
+    """
+    rng = np.random.default_rng(2)
+    horizon = 200
+    tol = 3
+    h = TimestampHistory(horizon)
+    added = []
+    t = 0
+    for _ in range(1000):
+        t += int(rng.integers(1, 10))
+        assert h.add(t, f"pose{t}")
+        added.append(t)
+        key = t - int(rng.integers(0, horizon + 50))
+        live = [a for a in added if a >= t - horizon]
+        candidates = [a for a in live if abs(a - key) <= tol]
+        if key in live:
+            expected = key
+        elif candidates:
+            # Nearest, the later of two equally near.
+            expected = min(candidates, key=lambda a: (abs(a - key), -a))
+        else:
+            expected = None
+        found = h.lookup(key, tol)
+        assert found == (None if expected is None else f"pose{expected}")
+        assert len(h) == len(live)
+        assert h.oldest_time() == live[0]
+    assert h.n_exact + h.n_nearest + h.n_misses == 1000
+    assert h.n_exact and h.n_nearest and h.n_misses
+
+
+def test_timestamp_history_exact_only() -> None:
+    h = TimestampHistory(horizon=10)
+    h.add(5, "a")
+    assert h.lookup(6) is None
+    assert h.lookup(5) == "a"
+    assert (h.n_exact, h.n_nearest, h.n_misses) == (1, 0, 1)
+
+
+def test_timestamp_history_bounded() -> None:
+    """
+    Memory stays bounded without any lookups, by the horizon and by the
+    maximum length.
+    """
+    h = TimestampHistory(horizon=1000, max_len=50)
+    for t in range(10_000):
+        h.add(t, t)
+    assert len(h) == 50
+    assert h.oldest_time() == 9950
+    assert len(h._queue._times) <= 4 * 50 + 64
+
+    h = TimestampHistory(horizon=0)
+    for t in range(100):
+        h.add(t, t)
+    assert len(h) == 1
+    with pytest.raises(IndexError):
+        TimestampHistory(horizon=0).oldest_time()
+
+
+def test_timestamp_history_out_of_order() -> None:
+    h = TimestampHistory(horizon=100)
+    assert h.add(10, "a")
+    assert not h.add(10, "b")
+    assert not h.add(5, "c")
+    assert h.n_out_of_order == 2
+    assert h.lookup(10) == "a"
+    assert len(h) == 1
+
+
+def test_timestamp_history_invalid() -> None:
+    with pytest.raises(ValueError):
+        TimestampHistory(horizon=-1)
+    with pytest.raises(ValueError):
+        TimestampHistory(horizon=10, max_len=0)